@@ -0,0 +1,166 @@
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime
+
+import models, schemas
+from crud import (
+    _price_ranges, _stock_prices_query, _latest_prices_query, _stock_sentiments_query, _latest_sentiments_query,
+    STOCK_PRICE_COLUMNS, BULK_INSERT_CHUNK_SIZE, STOCK_PRICE_STAGING_SQL, STOCK_PRICE_STAGING_MERGE_SQL,
+    _dedupe_prices, _price_records, _price_upsert_statements, _notify_prices,
+    _dedupe_sentiments, _sentiment_upsert_statements, _notify_sentiments,
+    MODEL_INPUT_ROWS_SQL, _model_input_params, SENTIMENTS_SINCE_SQL, _sentiments_since_params, _model_input_sequences,
+    LATEST_SENTIMENT_DATES_SQL, _latest_sentiment_dates_params, PRICE_SYMBOLS_SQL,
+    ORDER_SYNC_STATE, ORDER_SYNC_WATERMARK_SQL, _watermark_upsert_statement, MIRRORED_POSITIONS_SQL, _order_records, _order_upsert_statement, _position_statements,
+    _unsettled_orders_query, _mirrored_orders_query, _orders_page,
+)
+from window_store import WINDOW_STORE
+import price_storage
+
+# Asynchrone Gegenstücke zu den Funktionen in crud.py (gleiche Namen und Rückgabewerte),
+# für FastAPI-Handler und die Bot-Schleife, damit DB-Abfragen den Event-Loop nicht blockieren.
+
+async def create_stock_price(db: AsyncSession, price: schemas.StockPriceCreate):
+    db_price = models.StockPrice(**price.model_dump())
+    await price_storage.ensure_partitions_async(db, db_price.timestamp, db_price.timestamp)
+    db.add(db_price)
+    await db.flush()
+    await price_storage.refresh_rollups_async(db, _price_ranges(db_price))
+    await db.commit()
+    await db.refresh(db_price)
+    WINDOW_STORE.on_prices([db_price.symbol], [db_price.timestamp], [db_price.close])
+    return db_price
+
+async def get_stock_prices(db: AsyncSession, symbol: str, start_date: datetime, end_date: datetime, limit: int = 1000):
+    return (await db.execute(_stock_prices_query(symbol, start_date, end_date, limit))).scalars().all()
+
+async def get_latest_stock_prices_for_sequence(db: AsyncSession, symbol: str, sequence_length: int):
+    """Holt die letzten 'sequence_length' Schlusskurse für ein Symbol (neueste zuerst)."""
+    return (await db.execute(_latest_prices_query(symbol, sequence_length))).all()
+
+async def create_stock_sentiment(db: AsyncSession, sentiment: schemas.StockSentimentCreate):
+    db_sentiment = models.StockSentiment(**sentiment.model_dump())
+    db.add(db_sentiment)
+    await db.commit()
+    await db.refresh(db_sentiment)
+    WINDOW_STORE.on_sentiment(db_sentiment.symbol, db_sentiment.date, db_sentiment.sentiment_score)
+    return db_sentiment
+
+async def get_stock_sentiments(db: AsyncSession, symbol: str, start_date: date, end_date: date, limit: int = 100):
+    return (await db.execute(_stock_sentiments_query(symbol, start_date, end_date, limit))).scalars().all()
+
+async def get_latest_sentiments_for_sequence(db: AsyncSession, symbol: str, sequence_length: int):
+    """Holt die letzten 'sequence_length' Sentiment-Scores für ein Symbol (neueste zuerst)."""
+    return (await db.execute(_latest_sentiments_query(symbol, sequence_length))).all()
+
+# --- Massen-Ingestion ---
+
+async def bulk_upsert_stock_prices(db: AsyncSession, prices_df: pd.DataFrame, use_copy: bool = True) -> int:
+    """Asynchrone Variante von crud.bulk_upsert_stock_prices (COPY über asyncpg, sonst Multi-Row-INSERT)."""
+    if prices_df.empty:
+        return 0
+    prices_df = _dedupe_prices(prices_df)
+    timestamps = pd.to_datetime(prices_df['timestamp'], utc=True)
+    await price_storage.ensure_partitions_async(db, timestamps.min(), timestamps.max())
+
+    if use_copy and db.get_bind().dialect.driver == 'asyncpg':
+        await _copy_upsert_stock_prices(db, prices_df)
+    else:
+        for stmt in _price_upsert_statements(prices_df):
+            await db.execute(stmt)
+    await price_storage.refresh_rollups_async(db, price_storage.affected_ranges(prices_df))
+    await db.commit()
+    _notify_prices(prices_df)
+    return len(prices_df)
+
+async def _copy_upsert_stock_prices(db: AsyncSession, prices_df: pd.DataFrame):
+    records = [tuple(r[c] for c in STOCK_PRICE_COLUMNS) for r in _price_records(prices_df)]
+    await db.execute(text("DROP TABLE IF EXISTS stock_prices_staging"))
+    await db.execute(text(STOCK_PRICE_STAGING_SQL))
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        'stock_prices_staging', records=records, columns=STOCK_PRICE_COLUMNS,
+    )
+    await db.execute(text(STOCK_PRICE_STAGING_MERGE_SQL))
+
+async def bulk_upsert_stock_sentiments(db: AsyncSession, sentiments_df: pd.DataFrame) -> int:
+    """Asynchrone Variante von crud.bulk_upsert_stock_sentiments."""
+    if sentiments_df.empty:
+        return 0
+    sentiments_df = _dedupe_sentiments(sentiments_df)
+    for stmt in _sentiment_upsert_statements(sentiments_df):
+        await db.execute(stmt)
+    await db.commit()
+    _notify_sentiments(sentiments_df)
+    return len(sentiments_df)
+
+async def get_latest_sentiment_dates(db: AsyncSession, symbols: list[str], source: str) -> dict:
+    """Asynchrone Variante von crud.get_latest_sentiment_dates."""
+    if not symbols:
+        return {}
+    return dict((await db.execute(LATEST_SENTIMENT_DATES_SQL, _latest_sentiment_dates_params(symbols, source))).all())
+
+async def get_price_symbols(db: AsyncSession) -> list[str]:
+    """Asynchrone Variante von crud.get_price_symbols."""
+    return list((await db.execute(PRICE_SYMBOLS_SQL)).scalars())
+
+# --- Modell-Eingaben ---
+
+async def get_model_input_rows(db: AsyncSession, symbols: list[str], sequence_length: int, since_by_symbol: dict | None = None):
+    """Asynchrone Variante von crud.get_model_input_rows."""
+    if not symbols:
+        return []
+    return (await db.execute(MODEL_INPUT_ROWS_SQL, _model_input_params(symbols, sequence_length, since_by_symbol))).all()
+
+async def get_model_input_sequences(db: AsyncSession, symbols: list[str], sequence_length: int) -> dict:
+    """Asynchrone Variante von crud.get_model_input_sequences."""
+    return _model_input_sequences(await get_model_input_rows(db, symbols, sequence_length), sequence_length)
+
+async def get_sentiments_since(db: AsyncSession, since_by_symbol: dict):
+    """Asynchrone Variante von crud.get_sentiments_since."""
+    if not since_by_symbol:
+        return []
+    return (await db.execute(SENTIMENTS_SINCE_SQL, _sentiments_since_params(since_by_symbol))).all()
+
+# --- Alpaca-Spiegel ---
+
+async def upsert_mirrored_orders(db: AsyncSession, orders: list[dict]) -> int:
+    """Asynchrone Variante von crud.upsert_mirrored_orders."""
+    records = _order_records(orders)
+    for start in range(0, len(records), BULK_INSERT_CHUNK_SIZE):
+        await db.execute(_order_upsert_statement(records[start:start + BULK_INSERT_CHUNK_SIZE]))
+    await db.commit()
+    return len(records)
+
+async def replace_mirrored_positions(db: AsyncSession, positions: list[dict]) -> int:
+    """Asynchrone Variante von crud.replace_mirrored_positions."""
+    for statement in _position_statements(positions):
+        await db.execute(statement)
+    await db.commit()
+    return len(positions)
+
+async def get_order_sync_watermark(db: AsyncSession):
+    """Asynchrone Variante von crud.get_order_sync_watermark."""
+    return (await db.execute(ORDER_SYNC_WATERMARK_SQL, {'name': ORDER_SYNC_STATE})).scalar()
+
+async def set_order_sync_watermark(db: AsyncSession, watermark: datetime):
+    """Asynchrone Variante von crud.set_order_sync_watermark."""
+    await db.execute(_watermark_upsert_statement(watermark))
+    await db.commit()
+
+async def get_unsettled_orders(db: AsyncSession, terminal_statuses, limit: int = 100) -> dict:
+    """Asynchrone Variante von crud.get_unsettled_orders."""
+    return dict((await db.execute(_unsettled_orders_query(terminal_statuses, limit))).all())
+
+async def get_mirrored_orders(db: AsyncSession, symbol: str | None = None, statuses=None, exclude_statuses=None,
+                              since: datetime | None = None, until: datetime | None = None,
+                              cursor: tuple | None = None, limit: int = 50, direction: str = 'desc') -> tuple[list[dict], tuple | None]:
+    """Asynchrone Variante von crud.get_mirrored_orders."""
+    query = _mirrored_orders_query(symbol, statuses, exclude_statuses, since, until, cursor, limit, direction)
+    return _orders_page((await db.execute(query)).all(), limit)
+
+async def get_mirrored_positions(db: AsyncSession) -> tuple[list[dict], datetime | None]:
+    """Asynchrone Variante von crud.get_mirrored_positions."""
+    rows = (await db.execute(MIRRORED_POSITIONS_SQL)).all()
+    return [row.raw for row in rows], max((row.synced_at for row in rows), default=None)
@@ -0,0 +1,274 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+import crud
+from database import SessionLocal
+from ml_utils import load_model_components_from_disk, scaler_affine_params, SEQ_LENGTH_DEFAULT
+
+# Walk-Forward-Backtest der Modellsignale über die gespeicherte Kurs- und Sentiment-Historie.
+# Pro Symbol wird die Historie einmal geladen, alle Fenster werden als Views gebildet und in großen
+# Batches vorhergesagt (parallel über Prozesse); danach simuliert simulate_portfolio die Regeln aus bot_loop
+# (nur Käufe bis zum Zielwert je Symbol, keine Verkäufe, wie im Live-Bot).
+
+BACKTEST_BATCH_SIZE = int(os.getenv("BACKTEST_BATCH_SIZE", "2048")) # Fenster pro Forward-Pass
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_INITIAL_CASH = 100000.0
+DEFAULT_CASH_BUFFER = 10000 # Wie in bot_loop: dieser Betrag wird nie investiert
+MIN_TOTAL_STRENGTH = 0.0001 # Wie in bot_loop: darunter werden keine Käufe platziert
+PERIODS_PER_YEAR = 252 # Handelstage, für Tagesdaten
+# Kursquelle: '1d' liest das Tages-Rollup (ein Balken pro Tag, auch wenn stock_prices Intraday-Balken enthält,
+# und deutlich weniger Zeilen), 'raw' die Rohdaten; siehe price_storage.py
+BACKTEST_RESOLUTION = os.getenv("BACKTEST_RESOLUTION", "1d")
+
+def predict_symbol_history(symbol: str, start=None, end=None, batch_size: int = BACKTEST_BATCH_SIZE,
+                           inference_mode: str = "eager", resolution: str = BACKTEST_RESOLUTION) -> dict:
+    """
+    Sagt für jeden Zeitpunkt der Historie eines Symbols den Schlusskurs des ersten Horizont-Tages vorher.
+    Gibt {'symbol', 'timestamps', 'close', 'predicted', 'buy_threshold', 'sell_threshold'} ab 'start' zurück;
+    'predicted' ist NaN, solange die Historie noch kein volles Fenster hergibt.
+    """
+    symbol = symbol.upper()
+    components = load_model_components_from_disk(symbol, "cpu", inference_mode)
+    config = components['config']
+    seq_length = config.get('sequence_length', SEQ_LENGTH_DEFAULT)
+
+    with SessionLocal() as db:
+        history_df = crud.get_model_input_history(db, symbol, None, end, resolution=resolution)
+    # Die Fenster der ersten Zeitpunkte ab 'start' reichen in die Historie davor zurück
+    first_index = int(history_df['timestamp'].searchsorted(pd.Timestamp(start, tz="UTC"))) if start else 0
+    history_df = history_df.iloc[max(0, first_index - (seq_length - 1)):].reset_index(drop=True)
+    if len(history_df) < seq_length:
+        raise ValueError(f"Nicht genügend Daten ({len(history_df)} Zeilen, benötigt {seq_length}).")
+    skip = min(first_index, seq_length - 1) # Zeilen vor 'start', die nur als Fensterhistorie dienen
+
+    values = history_df[['close', 'sentiment_score']].to_numpy(dtype=np.float64)
+    # Alle gleitenden Fenster als View ohne Kopie: (n_windows, seq_length, features)
+    windows = sliding_window_view(values, (seq_length, values.shape[1]))[:, 0]
+    scale, offset = scaler_affine_params(components)
+    model = components.get('inference_model') or components['model']
+
+    predicted_scaled = np.empty(len(windows), dtype=np.float64)
+    with torch.inference_mode():
+        for batch_start in range(0, len(windows), batch_size):
+            # Nur der aktuelle Batch wird skaliert (und dabei kopiert)
+            batch = (windows[batch_start:batch_start + batch_size] * scale + offset).astype(np.float32)
+            predicted_scaled[batch_start:batch_start + len(batch)] = model(torch.from_numpy(batch))[:, 0].numpy()
+
+    predicted = np.full(len(values), np.nan)
+    predicted[seq_length - 1:] = (predicted_scaled - offset[0]) / scale[0]
+    return {
+        'symbol': symbol,
+        'timestamps': history_df['timestamp'].to_numpy()[skip:],
+        'close': values[skip:, 0],
+        'predicted': predicted[skip:],
+        'buy_threshold': config.get('prediction_threshold_buy_signal', 0.01),
+        'sell_threshold': config.get('prediction_threshold_sell_signal', 0.01),
+    }
+
+def _init_worker(torch_threads: int):
+    torch.set_num_threads(max(1, torch_threads))
+
+def _predict_symbol_safe(args: tuple) -> dict:
+    symbol = args[0]
+    try:
+        return predict_symbol_history(*args)
+    except Exception as e:
+        return {'symbol': symbol.upper(), 'error': str(e)}
+
+def simulate_portfolio(close: np.ndarray, strength: np.ndarray, buy_threshold: np.ndarray,
+                       initial_cash: float = DEFAULT_INITIAL_CASH, cash_buffer: float = DEFAULT_CASH_BUFFER,
+                       commission: float = 0.0) -> dict:
+    """
+    Simuliert die Handelsregeln aus bot_loop (_plan_buy_orders) auf ausgerichteten Arrays (Zeit x Symbol, NaN = kein
+    Kurs): Kauf bei strength > buy_threshold, Zielwert je Symbol = Kapital (Cash minus Puffer) proportional zur
+    Stärke, gekauft wird nur die Differenz zum gehaltenen Wert in ganzen Stücken. Verkaufssignale lösen wie im
+    Live-Bot keine Order aus. Ausführung zum Schlusskurs des Signalbalkens.
+    Die Zeitschleife ist pfadabhängig (Cash), alle Operationen pro Zeitpunkt sind über die Symbole vektorisiert.
+    """
+    n_times, n_symbols = close.shape
+    with np.errstate(invalid='ignore'):
+        buy_signal = strength > buy_threshold[None, :]
+    positive_strength = np.where(buy_signal, strength, 0.0)
+    total_strength = positive_strength.sum(axis=1)
+    # Bewertung offener Positionen mit dem letzten bekannten Kurs
+    valuation_price = pd.DataFrame(close).ffill().fillna(0.0).to_numpy()
+
+    cash = float(initial_cash)
+    shares = np.zeros(n_symbols)
+    equity = np.empty(n_times)
+    buys = 0
+    for t in range(n_times):
+        price = close[t]
+        if total_strength[t] > MIN_TOTAL_STRENGTH:
+            cash_to_use = cash - cash_buffer
+            if cash_to_use > 0:
+                # Bestehende Positionen zählen auf den Zielwert an (wie held_market_values im Bot)
+                allocation = positive_strength[t] / total_strength[t] * cash_to_use - shares * valuation_price[t]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    qty = np.where((allocation > 1.0) & (price > 0), np.floor(allocation / (price * (1 + commission))), 0.0)
+                qty = np.nan_to_num(qty)
+                if qty.any():
+                    cash -= float((qty * np.nan_to_num(price)).sum()) * (1 + commission)
+                    shares += qty
+                    buys += int((qty > 0).sum())
+
+        equity[t] = cash + float((shares * valuation_price[t]).sum())
+
+    return {'equity': equity, 'cash': cash, 'shares': shares, 'buys': buys}
+
+def equity_stats(equity: np.ndarray, periods_per_year: int = PERIODS_PER_YEAR) -> dict:
+    """Kennzahlen einer Equity-Kurve: Gesamtrendite, CAGR, maximaler Drawdown, Sharpe (annualisiert)."""
+    if len(equity) < 2 or equity[0] <= 0:
+        return {'total_return': 0.0, 'cagr': 0.0, 'max_drawdown': 0.0, 'sharpe': None}
+    returns = np.diff(equity) / equity[:-1]
+    years = len(equity) / periods_per_year
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    std = returns.std()
+    return {
+        'total_return': round(float(equity[-1] / equity[0] - 1), 6),
+        'cagr': round(float((equity[-1] / equity[0]) ** (1 / years) - 1), 6) if equity[-1] > 0 else -1.0,
+        'max_drawdown': round(float(drawdown.min()), 6),
+        'sharpe': round(float(returns.mean() / std * np.sqrt(periods_per_year)), 4) if std > 0 else None,
+    }
+
+def _symbol_signal_stats(close: np.ndarray, strength: np.ndarray, buy_threshold: float, sell_threshold: float) -> dict:
+    """
+    Signalqualität je Symbol, unabhängig von den Regeln des Bots: Rendite einer Long/Flat-Strategie, die bei
+    Kaufsignal voll investiert und bei Verkaufssignal aussteigt (der Live-Bot verkauft nicht).
+    """
+    with np.errstate(invalid='ignore'):
+        signal = np.where(strength > buy_threshold, 1.0, np.where(strength < -sell_threshold, 0.0, np.nan))
+    position = pd.Series(signal).ffill().fillna(0.0).to_numpy()
+    bar_returns = np.zeros_like(close)
+    bar_returns[1:] = np.nan_to_num(close[1:] / close[:-1] - 1)
+    strategy_returns = position[:-1] * bar_returns[1:]
+    return {
+        'buy_signals': int(np.nansum(strength > buy_threshold)),
+        'sell_signals': int(np.nansum(strength < -sell_threshold)),
+        'exposure': round(float(position.mean()), 4),
+        'long_flat_return': round(float(np.prod(1 + strategy_returns) - 1), 6),
+        'buy_and_hold_return': round(float(close[-1] / close[0] - 1), 6),
+    }
+
+def run_backtest(symbols: list[str], start=None, end=None, workers: int = BACKTEST_WORKERS,
+                 batch_size: int = BACKTEST_BATCH_SIZE, buy_threshold: float | None = None,
+                 sell_threshold: float | None = None, initial_cash: float = DEFAULT_INITIAL_CASH,
+                 cash_buffer: float = DEFAULT_CASH_BUFFER, commission: float = 0.0,
+                 inference_mode: str = "eager", include_equity_curve: bool = True,
+                 resolution: str = BACKTEST_RESOLUTION) -> dict:
+    """
+    Backtest über mehrere Symbole. Schwellwerte kommen aus der Modellkonfiguration jedes Symbols,
+    sofern buy_threshold/sell_threshold nicht explizit gesetzt sind. Das Portfolio folgt den Regeln des Live-Bots;
+    sell_threshold wirkt nur auf die Long/Flat-Kennzahlen je Symbol.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    started = time.perf_counter()
+    tasks = [(s, start, end, batch_size, inference_mode, resolution) for s in symbols]
+    workers = max(1, min(workers, len(symbols)))
+    if workers > 1:
+        # "spawn", damit die Worker keine Torch-Threadpools oder DB-Verbindungen des Elternprozesses erben
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(torch_threads,)) as pool:
+            results = list(pool.map(_predict_symbol_safe, tasks))
+    else:
+        results = [_predict_symbol_safe(task) for task in tasks]
+    predicted_at = time.perf_counter()
+
+    errors = [{'symbol': r['symbol'], 'error': r['error']} for r in results if 'error' in r]
+    results = [r for r in results if 'error' not in r]
+    if not results:
+        return {'symbols': symbols, 'errors': errors, 'stats': None, 'per_symbol': [], 'equity_curve': []}
+
+    # Gemeinsame Zeitachse über alle Symbole (Zeit x Symbol)
+    close_df = pd.concat([pd.Series(r['close'], index=r['timestamps'], name=r['symbol']) for r in results], axis=1).sort_index()
+    predicted_df = pd.concat([pd.Series(r['predicted'], index=r['timestamps'], name=r['symbol']) for r in results], axis=1).reindex(close_df.index)
+    close = close_df.to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        strength = np.where(close > 0, (predicted_df.to_numpy() - close) / close, np.nan)
+    buy_thresholds = np.array([r['buy_threshold'] if buy_threshold is None else buy_threshold for r in results], dtype=np.float64)
+    sell_thresholds = np.array([r['sell_threshold'] if sell_threshold is None else sell_threshold for r in results], dtype=np.float64)
+
+    portfolio = simulate_portfolio(close, strength, buy_thresholds, initial_cash, cash_buffer, commission)
+    per_symbol = []
+    for i, r in enumerate(results):
+        valid = ~np.isnan(close[:, i])
+        per_symbol.append({
+            'symbol': r['symbol'],
+            'bars': int(valid.sum()),
+            'buy_threshold': float(buy_thresholds[i]),
+            'sell_threshold': float(sell_thresholds[i]),
+            **_symbol_signal_stats(close[valid, i], strength[valid, i], buy_thresholds[i], sell_thresholds[i]),
+        })
+    finished = time.perf_counter()
+
+    report = {
+        'symbols': symbols,
+        'start': close_df.index[0].isoformat(),
+        'end': close_df.index[-1].isoformat(),
+        'stats': {
+            **equity_stats(portfolio['equity']),
+            'initial_cash': initial_cash,
+            'final_equity': round(float(portfolio['equity'][-1]), 2),
+            'buys': portfolio['buys'],
+        },
+        'per_symbol': per_symbol,
+        'errors': errors,
+        'seconds': {'predict': round(predicted_at - started, 3), 'simulate': round(finished - predicted_at, 3)},
+    }
+    if include_equity_curve:
+        report['equity_curve'] = [
+            {'timestamp': ts.isoformat(), 'equity': round(float(value), 2)}
+            for ts, value in zip(close_df.index, portfolio['equity'])
+        ]
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-Forward-Backtest der Modellsignale über die gespeicherte Historie.")
+    parser.add_argument("symbols", nargs="+", help="Ticker-Symbole mit trainierten Modellen, z.B. AAPL MSFT")
+    parser.add_argument("--start", help="Beginn (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Letzter Tag (YYYY-MM-DD, einschließlich)")
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS, help="Anzahl paralleler Prozesse")
+    parser.add_argument("--batch-size", type=int, default=BACKTEST_BATCH_SIZE)
+    parser.add_argument("--buy-threshold", type=float, help="Überschreibt prediction_threshold_buy_signal")
+    parser.add_argument("--sell-threshold", type=float, help="Überschreibt prediction_threshold_sell_signal (nur Long/Flat-Kennzahlen)")
+    parser.add_argument("--cash", type=float, default=DEFAULT_INITIAL_CASH, help="Startkapital")
+    parser.add_argument("--cash-buffer", type=float, default=DEFAULT_CASH_BUFFER)
+    parser.add_argument("--commission", type=float, default=0.0, help="Gebühr als Anteil des Ordervolumens, z.B. 0.001")
+    parser.add_argument("--inference-mode", choices=["eager", "script", "int8"], default="eager")
+    parser.add_argument("--equity-csv", help="Equity-Kurve als CSV speichern")
+    parser.add_argument("--resolution", choices=["raw", "1h", "1d"], default=BACKTEST_RESOLUTION, help="Kursquelle (Rohdaten oder Rollup)")
+    args = parser.parse_args()
+
+    report = run_backtest(
+        args.symbols, start=args.start, end=args.end, workers=args.workers, batch_size=args.batch_size,
+        buy_threshold=args.buy_threshold, sell_threshold=args.sell_threshold, initial_cash=args.cash,
+        cash_buffer=args.cash_buffer, commission=args.commission, inference_mode=args.inference_mode,
+        resolution=args.resolution,
+    )
+    for error in report['errors']:
+        print(f"{error['symbol']}: FEHLER {error['error']}")
+    if report['stats'] is None:
+        return
+    for row in report['per_symbol']:
+        print(f"{row['symbol']}: {row['bars']} Balken, Signale {row['buy_signals']}/{row['sell_signals']} (Kauf/Verkauf), "
+              f"Long/Flat {row['long_flat_return']:+.2%}, Buy & Hold {row['buy_and_hold_return']:+.2%}")
+    stats = report['stats']
+    sharpe = f"{stats['sharpe']:.2f}" if stats['sharpe'] is not None else "-"
+    print(f"Portfolio {report['start'][:10]} bis {report['end'][:10]}: Endwert {stats['final_equity']:.2f}, "
+          f"Rendite {stats['total_return']:+.2%}, CAGR {stats['cagr']:+.2%}, max. Drawdown {stats['max_drawdown']:.2%}, "
+          f"Sharpe {sharpe}, Käufe {stats['buys']}")
+    print(f"Laufzeit: Vorhersage {report['seconds']['predict']}s, Simulation {report['seconds']['simulate']}s")
+    if args.equity_csv:
+        pd.DataFrame(report['equity_curve']).to_csv(args.equity_csv, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import pandas as pd
+from dotenv import load_dotenv
+
+import async_crud
+from crud import STOCK_PRICE_COLUMNS
+from database import AsyncSessionLocal
+from window_store import WINDOW_STORE
+
+load_dotenv()
+
+# Alpaca Market Data Stream (v2); für Tests z.B. ws://localhost:8765 (stream_replay.py)
+ALPACA_STREAM_URL = os.getenv("ALPACA_STREAM_URL", "wss://stream.data.alpaca.markets/v2/iex")
+ALPACA_API_KEY_ID = os.getenv("ALPACA_API_KEY_ID")
+ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
+# 'trades': Trades selbst zu Balken aggregieren, 'bars': fertige Minutenbalken von Alpaca (ggf. zu größeren Balken zusammengefasst)
+STREAM_CHANNEL = os.getenv("STREAM_CHANNEL", "trades")
+# Intervall der Modell-Eingaben: stock_prices, MODEL_INPUT_ROWS_SQL, Training und Backtest arbeiten mit Tagesbalken
+MODEL_BAR_SECONDS = 86400
+# Tagesbalken beginnen um Mitternacht Börsenzeit, wie die Tageskurse von yfinance und Alpaca
+STREAM_SESSION_TZ = os.getenv("STREAM_SESSION_TZ", "America/New_York")
+# Balkenlänge; nur Balken im Modell-Intervall werden in stock_prices und den WINDOW_STORE geschrieben. Kürzere
+# Balken (z.B. 60 für Minutenbalken) liefert nur die CLI zur Beobachtung, sie würden sonst als Tageskurse gelesen.
+STREAM_BAR_SECONDS = int(os.getenv("STREAM_BAR_SECONDS", str(MODEL_BAR_SECONDS)))
+# So lange nach Balkenende werden verspätete Trades noch dem Balken zugerechnet
+STREAM_BAR_GRACE_SECONDS = float(os.getenv("STREAM_BAR_GRACE_SECONDS", "2"))
+# Geschlossene Balken werden gesammelt und alle N Sekunden bzw. ab M Zeilen in einem Upsert geschrieben
+STREAM_FLUSH_SECONDS = float(os.getenv("STREAM_FLUSH_SECONDS", "5"))
+STREAM_FLUSH_ROWS = int(os.getenv("STREAM_FLUSH_ROWS", "1000"))
+STREAM_MAX_BUFFERED_ROWS = int(os.getenv("STREAM_MAX_BUFFERED_ROWS", "100000")) # Obergrenze, falls die DB länger ausfällt
+STREAM_RECONNECT_MAX_SECONDS = float(os.getenv("STREAM_RECONNECT_MAX_SECONDS", "30"))
+STREAM_SOURCE = "alpaca_stream" # Wert der Spalte 'source' in stock_prices
+
+NS_PER_SECOND = 10**9
+
+class StreamProtocolError(Exception):
+    """Fehlermeldung des Streams (z.B. Authentifizierung fehlgeschlagen, Verbindungslimit erreicht)."""
+
+class BarAggregator:
+    """
+    Fasst Trades (oder kürzere Balken) pro Symbol zu Balken fester Länge zusammen; Tagesbalken (bar_seconds =
+    MODEL_BAR_SECONDS) reichen von Mitternacht bis Mitternacht in session_tz (23 bzw. 25 Stunden an Zeitumstellungen).
+    Ein Balken wird geschlossen, sobald für das Symbol ein Trade aus einem späteren Intervall eintrifft oder
+    die Ereigniszeit (neuester gesehener Zeitstempel, zwischen Nachrichten mit der Wanduhr fortgeschrieben)
+    das Balkenende plus Karenzzeit überschreitet. Spätere Trades für bereits geschlossene Balken werden verworfen.
+    """
+
+    def __init__(self, bar_seconds: int = STREAM_BAR_SECONDS, grace_seconds: float = STREAM_BAR_GRACE_SECONDS,
+                 session_tz: str = STREAM_SESSION_TZ):
+        self.bar_ns = int(bar_seconds * NS_PER_SECOND)
+        self.grace_ns = int(grace_seconds * NS_PER_SECOND)
+        self.session_tz = session_tz if bar_seconds == MODEL_BAR_SECONDS else None
+        self._day_bounds = (0, 0) # Zuletzt berechneter Tag [Beginn, Ende) in ns, spart die Zeitzonen-Umrechnung pro Trade
+        self._open = {} # {symbol: [start_ns, open, high, low, close, volume, trades, end_ns]}
+        self._closed_until = {} # {symbol: Start des zuletzt geschlossenen Balkens}
+        self.watermark_ns = 0
+        self._watermark_monotonic = time.monotonic()
+        self.stats = {'trades': 0, 'bars': 0, 'late_trades': 0}
+
+    def add(self, symbol: str, timestamp_ns: int, open_: float, high: float, low: float, close: float,
+            volume: float, trades: int = 1, end_ns: int | None = None) -> list[dict]:
+        """Nimmt einen Trade (open=high=low=close) oder Balken entgegen; gibt dadurch geschlossene Balken zurück."""
+        self.stats['trades'] += trades
+        start_ns, end_ns_of_bar = self._bar_bounds(timestamp_ns)
+        closed = []
+        bar = self._open.get(symbol)
+        if start_ns <= self._closed_until.get(symbol, -1) or (bar is not None and start_ns < bar[0]):
+            self.stats['late_trades'] += trades
+        else:
+            if bar is not None and start_ns > bar[0]:
+                closed.append(self._close(symbol))
+                bar = None
+            if bar is None:
+                self._open[symbol] = [start_ns, open_, high, low, close, volume, trades, end_ns_of_bar]
+            else:
+                bar[2], bar[3] = max(bar[2], high), min(bar[3], low)
+                bar[4] = close
+                bar[5] += volume
+                bar[6] += trades
+        # Ein fertiger Eingangsbalken belegt sein Intervall vollständig, ein Trade nur seinen Zeitpunkt
+        self._advance_watermark(end_ns if end_ns is not None else timestamp_ns)
+        return closed + self.close_due()
+
+    def _bar_bounds(self, timestamp_ns: int) -> tuple[int, int]:
+        """Beginn und Ende des Balkens, in den timestamp_ns fällt."""
+        if self.session_tz is None:
+            start_ns = timestamp_ns - timestamp_ns % self.bar_ns
+            return start_ns, start_ns + self.bar_ns
+        if not self._day_bounds[0] <= timestamp_ns < self._day_bounds[1]:
+            day_start = pd.Timestamp(timestamp_ns, unit='ns', tz='UTC').tz_convert(self.session_tz).normalize()
+            day_end = (day_start + pd.Timedelta(hours=36)).normalize()
+            self._day_bounds = (day_start.value, day_end.value)
+        return self._day_bounds
+
+    def _advance_watermark(self, timestamp_ns: int):
+        if timestamp_ns > self.watermark_ns:
+            self.watermark_ns = timestamp_ns
+            self._watermark_monotonic = time.monotonic()
+
+    def event_time_ns(self) -> int:
+        """Ereigniszeit: neuester Zeitstempel plus seither vergangene Wanduhrzeit (auch bei Replays verlässlich)."""
+        return self.watermark_ns + int((time.monotonic() - self._watermark_monotonic) * NS_PER_SECOND)
+
+    def close_due(self) -> list[dict]:
+        """Schließt alle Balken, deren Ende plus Karenzzeit vor der Ereigniszeit liegt."""
+        if not self._open or not self.watermark_ns:
+            return []
+        cutoff_ns = self.event_time_ns() - self.grace_ns
+        return [self._close(symbol) for symbol, bar in list(self._open.items()) if bar[7] <= cutoff_ns]
+
+    def _close(self, symbol: str) -> dict:
+        start_ns, open_, high, low, close, volume, trades, end_ns = self._open.pop(symbol)
+        self._closed_until[symbol] = start_ns
+        self.stats['bars'] += 1
+        return {
+            'symbol': symbol, 'timestamp': pd.Timestamp(start_ns, unit='ns', tz='UTC'),
+            'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume, 'trades': trades,
+            'end': pd.Timestamp(end_ns, unit='ns', tz='UTC'),
+        }
+
+class BarWriter:
+    """Sammelt geschlossene Balken und schreibt sie gebündelt per Upsert (COPY) in stock_prices."""
+
+    def __init__(self, flush_seconds: float = STREAM_FLUSH_SECONDS, flush_rows: int = STREAM_FLUSH_ROWS,
+                 max_buffered_rows: int = STREAM_MAX_BUFFERED_ROWS):
+        self.flush_seconds = flush_seconds
+        self.flush_rows = flush_rows
+        self.max_buffered_rows = max_buffered_rows
+        self._buffer = []
+        self._flush_requested = asyncio.Event()
+        self.stats = {'rows_written': 0, 'flushes': 0, 'flush_errors': 0, 'dropped_rows': 0, 'last_flush_seconds': 0.0}
+
+    def add(self, bars: list[dict]):
+        self._buffer.extend(bars)
+        overflow = len(self._buffer) - self.max_buffered_rows
+        if overflow > 0:
+            # DB länger nicht erreichbar: älteste Balken verwerfen (lassen sich per Backfill nachholen)
+            del self._buffer[:overflow]
+            self.stats['dropped_rows'] += overflow
+        if len(self._buffer) >= self.flush_rows:
+            self._flush_requested.set()
+
+    async def run(self):
+        """Schreibt periodisch (bzw. sobald flush_rows erreicht ist), bis der Task abgebrochen wird."""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        bars, self._buffer = self._buffer, []
+        prices_df = pd.DataFrame(bars)
+        prices_df['adj_close'] = None
+        prices_df['source'] = STREAM_SOURCE
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                self.stats['rows_written'] += await async_crud.bulk_upsert_stock_prices(db, prices_df[STOCK_PRICE_COLUMNS])
+            self.stats['flushes'] += 1
+        except Exception as e:
+            self.stats['flush_errors'] += 1
+            self._buffer = bars + self._buffer # Beim nächsten Flush erneut versuchen
+            print(f"FEHLER beim Schreiben von {len(bars)} Stream-Balken: {e}")
+        self.stats['last_flush_seconds'] = round(time.perf_counter() - started, 4)
+
+class BarStream:
+    """
+    Abonniert den Trade- oder Balken-Stream von Alpaca (bzw. des lokalen Replay-Servers), aggregiert zu Balken,
+    schreibt sie gebündelt in die DB und ruft für jede Gruppe geschlossener Balken on_bar_close(bars) auf.
+    Geschlossene Balken gehen sofort in den WINDOW_STORE, damit Signale nicht auf den DB-Flush warten.
+    Balken kürzer als MODEL_BAR_SECONDS werden weder geschrieben noch in den WINDOW_STORE übernommen.
+    Bei Verbindungsabbruch wird mit exponentiellem Backoff neu verbunden.
+    """
+
+    def __init__(self, symbols: list[str], on_bar_close=None, url: str = ALPACA_STREAM_URL,
+                 key_id: str | None = ALPACA_API_KEY_ID, secret_key: str | None = ALPACA_SECRET_KEY,
+                 channel: str = STREAM_CHANNEL, bar_seconds: int = STREAM_BAR_SECONDS,
+                 grace_seconds: float = STREAM_BAR_GRACE_SECONDS, writer: BarWriter | None = None):
+        if channel not in ("trades", "bars"):
+            raise ValueError(f"Unbekannter Stream-Kanal '{channel}' (erlaubt: trades, bars).")
+        self.symbols = [s.upper() for s in symbols]
+        self.on_bar_close = on_bar_close
+        self.url = url
+        self.key_id, self.secret_key = key_id, secret_key
+        self.channel = channel
+        self.aggregator = BarAggregator(bar_seconds, grace_seconds)
+        self.persist = bar_seconds == MODEL_BAR_SECONDS
+        self.writer = writer or BarWriter()
+        self.connected = False
+        self.stats = {'messages': 0, 'connects': 0, 'disconnects': 0, 'callback_errors': 0}
+
+    async def run(self):
+        """Läuft bis zum Abbruch des Tasks; Verbindungsfehler führen zu erneutem Verbinden."""
+        tasks = [asyncio.create_task(self._clock())]
+        if self.persist:
+            tasks.append(asyncio.create_task(self.writer.run()))
+        else:
+            print(f"INFO: Balkenlänge {self.aggregator.bar_ns // NS_PER_SECOND}s ist kürzer als das Modell-Intervall, Balken werden nicht gespeichert.")
+        backoff = 1.0
+        try:
+            while True:
+                try:
+                    await self._session()
+                    backoff = 1.0
+                except StreamProtocolError as e:
+                    print(f"FEHLER im Kursdaten-Stream: {e}")
+                except (OSError, asyncio.TimeoutError, ConnectionError) as e:
+                    print(f"WARNUNG: Kursdaten-Stream nicht erreichbar ({e!r}).")
+                except Exception as e:
+                    # websockets.ConnectionClosed u.a.
+                    print(f"WARNUNG: Kursdaten-Stream unterbrochen ({e!r}).")
+                self.connected = False
+                self.stats['disconnects'] += 1
+                print(f"INFO: Verbinde Kursdaten-Stream in {backoff:.0f}s neu.")
+                await asyncio.sleep(backoff)
+                backoff = min(STREAM_RECONNECT_MAX_SECONDS, backoff * 2)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _session(self):
+        import websockets
+        async with websockets.connect(self.url, max_size=None) as ws:
+            await self._expect(ws, "connected")
+            await ws.send(json.dumps({"action": "auth", "key": self.key_id, "secret": self.secret_key}))
+            await self._expect(ws, "authenticated")
+            await ws.send(json.dumps({"action": "subscribe", self.channel: self.symbols}))
+            self.connected = True
+            self.stats['connects'] += 1
+            print(f"INFO: Kursdaten-Stream verbunden ({self.url}, {self.channel}) für {len(self.symbols)} Symbole.")
+            async for raw_message in ws:
+                await self._handle(json.loads(raw_message))
+
+    @staticmethod
+    async def _expect(ws, expected_msg: str):
+        for message in json.loads(await asyncio.wait_for(ws.recv(), timeout=10)):
+            if message.get("T") == "error":
+                raise StreamProtocolError(f"{message.get('code')}: {message.get('msg')}")
+            if message.get("T") == "success" and message.get("msg") == expected_msg:
+                return
+        raise StreamProtocolError(f"Unerwartete Antwort statt '{expected_msg}'")
+
+    async def _handle(self, messages: list[dict]):
+        closed = []
+        for message in messages:
+            self.stats['messages'] += 1
+            message_type = message.get("T")
+            if message_type == "t": # Trade
+                closed += self.aggregator.add(message["S"], pd.Timestamp(message["t"]).value,
+                                              message["p"], message["p"], message["p"], message["p"], message.get("s", 0))
+            elif message_type == "b": # Minutenbalken
+                start_ns = pd.Timestamp(message["t"]).value
+                closed += self.aggregator.add(message["S"], start_ns, message["o"], message["h"], message["l"], message["c"],
+                                              message.get("v", 0), message.get("n", 1), end_ns=start_ns + 60 * NS_PER_SECOND)
+            elif message_type == "subscription":
+                print(f"INFO: Stream-Abonnement bestätigt: {message.get(self.channel)}")
+            elif message_type == "error":
+                raise StreamProtocolError(f"{message.get('code')}: {message.get('msg')}")
+        await self._emit(closed)
+
+    async def _clock(self):
+        # Schließt Balken auch ohne neue Trades (ruhige Symbole, Handelsende)
+        while True:
+            await asyncio.sleep(0.25)
+            await self._emit(self.aggregator.close_due())
+
+    async def _emit(self, bars: list[dict]):
+        if not bars:
+            return
+        if self.persist:
+            ordered = sorted(bars, key=lambda b: b['timestamp'])
+            WINDOW_STORE.on_prices([b['symbol'] for b in ordered], [b['timestamp'] for b in ordered], [b['close'] for b in ordered])
+            self.writer.add(bars)
+        if self.on_bar_close:
+            try:
+                await self.on_bar_close(bars)
+            except Exception as e:
+                self.stats['callback_errors'] += 1
+                print(f"FEHLER bei der Verarbeitung geschlossener Balken: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            'url': self.url, 'channel': self.channel, 'connected': self.connected, 'symbols': len(self.symbols), 'persist': self.persist,
+            'bar_seconds': self.aggregator.bar_ns // NS_PER_SECOND, 'open_bars': len(self.aggregator._open),
+            **self.stats, 'aggregator': dict(self.aggregator.stats), 'writer': dict(self.writer.stats),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming-Ingestion: Trades/Balken abonnieren und als Balken in stock_prices schreiben.")
+    parser.add_argument("--symbols", required=True, help="Kommagetrennte Symbole, z.B. AAPL,MSFT")
+    parser.add_argument("--url", default=ALPACA_STREAM_URL)
+    parser.add_argument("--channel", default=STREAM_CHANNEL, choices=["trades", "bars"])
+    parser.add_argument("--bar-seconds", type=int, default=STREAM_BAR_SECONDS)
+    parser.add_argument("--duration", type=float, default=None, help="Nach N Sekunden beenden (Standard: unbegrenzt)")
+    args = parser.parse_args()
+
+    async def log_bars(bars):
+        for bar in bars:
+            print(f"STREAM [{bar['symbol']}]: {bar['timestamp'].isoformat()} C={bar['close']:.2f} V={bar['volume']:g} ({bar['trades']} Trades)")
+
+    async def run():
+        stream = BarStream([s.strip() for s in args.symbols.split(",") if s.strip()], on_bar_close=log_bars,
+                           url=args.url, channel=args.channel, bar_seconds=args.bar_seconds)
+        try:
+            await asyncio.wait_for(stream.run(), timeout=args.duration)
+        except asyncio.TimeoutError:
+            pass
+        print(json.dumps(stream.get_stats(), indent=2, default=str))
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
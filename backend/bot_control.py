@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+
+from response_cache import REDIS_URL
+from dashboard_events import DASHBOARD_HUB
+
+# Koordination des Bots über mehrere uvicorn-Worker bzw. Replikate (WEB_CONCURRENCY > 1 oder mehrere Container):
+# Der Soll-Zustand (läuft/gestoppt, Symbol) liegt in Redis, und nur der Inhaber einer Lease ("Leader") führt
+# die Bot-Schleife aus. Alle anderen Worker beantworten nur Anfragen. Stirbt der Leader, läuft seine Lease ab
+# und ein anderer Worker übernimmt beim nächsten Takt.
+# BOT_COORDINATION=local schaltet die Koordination ab (ein Prozess, ohne Redis; Verhalten wie bisher).
+BOT_COORDINATION = os.getenv("BOT_COORDINATION", "redis")
+BOT_LEASE_TTL_SECONDS = float(os.getenv("BOT_LEASE_TTL_SECONDS", "10"))
+BOT_LEASE_RENEW_SECONDS = float(os.getenv("BOT_LEASE_RENEW_SECONDS", "2"))
+BOT_KEY_PREFIX = "dbot:bot:"
+DEFAULT_BOT_SYMBOL = "AAPL"
+
+# Verlängern bzw. Freigeben nur, wenn die Lease noch diesem Worker gehört (atomar in Redis)
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class BotController:
+    """
+    Soll-Zustand des Bots und Leader-Lease in Redis.
+    - set_desired/get_desired: von jedem Worker aus (Start/Stopp-Endpunkte, Status)
+    - run(): Hintergrund-Task in jedem Worker. Hält bzw. bewirbt sich um die Lease, startet/stoppt die lokale
+      Bot-Schleife passend zu Soll-Zustand und Führung und gleicht die letzten Signale zwischen den Workern ab,
+      damit jedes Dashboard (egal an welchem Worker) denselben Stand zeigt.
+    - Kann die Lease nicht verlängert werden (Redis weg, Lease übernommen), stoppt der Leader seine Schleife,
+      bevor die Lease abläuft; so laufen nie zwei Bots gleichzeitig. Die Frist überwacht ein eigener Timer im
+      Event-Loop (bei jeder Verlängerung neu gestellt), nicht die Steuerschleife, die selbst in Redis-Timeouts
+      hängen kann.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL, mode: str = BOT_COORDINATION,
+                 lease_ttl: float = BOT_LEASE_TTL_SECONDS, renew_seconds: float = BOT_LEASE_RENEW_SECONDS):
+        self.redis_url = redis_url
+        self.mode = mode
+        self.lease_ttl = lease_ttl
+        self.renew_seconds = renew_seconds
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = mode == "local"
+        self._lease_valid_until = 0.0 # Event-Loop-Zeit; bis dahin gilt die zuletzt verlängerte Lease sicher
+        self._lease_timer = None # Stoppt den Bot zu _lease_valid_until, falls bis dahin nicht verlängert wurde
+        self._on_lease_lost = None
+        self._local_desired = {'running': False, 'symbol': DEFAULT_BOT_SYMBOL}
+        self._redis = None
+        self._wake = asyncio.Event()
+        self._synced_signal_at = {} # {symbol: Zeitstempel des zuletzt abgeglichenen Signals}
+        self.stats = {'acquired': 0, 'lost': 0, 'redis_errors': 0}
+
+    def _get_redis(self):
+        if self._redis is None:
+            import redis.asyncio as redis_asyncio
+            self._redis = redis_asyncio.from_url(self.redis_url, socket_timeout=1.0, socket_connect_timeout=1.0, decode_responses=True)
+        return self._redis
+
+    # --- Soll-Zustand ---
+    async def get_desired(self) -> dict:
+        if self.mode == "local":
+            return dict(self._local_desired)
+        desired = await self._get_redis().hgetall(BOT_KEY_PREFIX + "desired")
+        return {'running': desired.get('running') == "1", 'symbol': desired.get('symbol') or DEFAULT_BOT_SYMBOL}
+
+    async def set_desired(self, running: bool, symbol: str | None = None):
+        if self.mode == "local":
+            self._local_desired['running'] = running
+            if symbol:
+                self._local_desired['symbol'] = symbol
+        else:
+            mapping = {'running': "1" if running else "0", 'updated_at': str(time.time()), 'updated_by': self.instance_id}
+            if symbol:
+                mapping['symbol'] = symbol
+            await self._get_redis().hset(BOT_KEY_PREFIX + "desired", mapping=mapping)
+        self._wake.set() # Ist dieser Worker Leader, sofort reagieren statt erst beim nächsten Takt
+
+    async def get_state(self) -> dict:
+        """Soll-Zustand plus aktueller Leader (None, solange keiner die Lease hält)."""
+        desired = await self.get_desired()
+        leader = self.instance_id if self.mode == "local" else await self._get_redis().get(BOT_KEY_PREFIX + "leader")
+        return {**desired, 'leader': leader, 'instance': self.instance_id, 'is_leader': self.is_leader}
+
+    # --- Lease ---
+    async def _hold_lease(self):
+        """Bewirbt sich um die Lease bzw. verlängert sie. Bei Redis-Fehlern bleibt die Führung nur bis zum Ablauf."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ttl_ms = int(self.lease_ttl * 1000)
+        try:
+            redis = self._get_redis()
+            if self.is_leader:
+                held = bool(await redis.eval(_RENEW_SCRIPT, 1, BOT_KEY_PREFIX + "leader", self.instance_id, ttl_ms))
+            else:
+                held = bool(await redis.set(BOT_KEY_PREFIX + "leader", self.instance_id, nx=True, px=ttl_ms))
+            if held:
+                # Ab dem Zeitpunkt vor der Anfrage gerechnet, mit einem Takt Sicherheitsabstand für das Abbrechen
+                # der Schleife: lieber früher aufgeben, als mit einem neuen Leader überlappen
+                self._arm_lease_timer(started + self.lease_ttl - self.renew_seconds)
+        except Exception as e:
+            self.stats['redis_errors'] += 1
+            print(f"WARNUNG: Bot-Lease konnte nicht erneuert werden ({e}).")
+            held = self.is_leader and loop.time() < self._lease_valid_until
+
+        if held and not self.is_leader:
+            self.stats['acquired'] += 1
+            print(f"INFO: Bot-Leader ist jetzt dieser Worker ({self.instance_id}).")
+        elif not held and self.is_leader:
+            self.stats['lost'] += 1
+            print(f"WARNUNG: Bot-Lease verloren ({self.instance_id}), lokale Bot-Schleife wird gestoppt.")
+        self.is_leader = held
+        if not held:
+            self._cancel_lease_timer()
+
+    def _arm_lease_timer(self, valid_until: float):
+        self._lease_valid_until = valid_until
+        self._cancel_lease_timer()
+        self._lease_timer = asyncio.get_running_loop().call_at(valid_until, self._lease_expired)
+
+    def _cancel_lease_timer(self):
+        if self._lease_timer is not None:
+            self._lease_timer.cancel()
+            self._lease_timer = None
+
+    def _lease_expired(self):
+        """Frist der Lease abgelaufen, ohne dass sie verlängert wurde: sofort stoppen, unabhängig von der Steuerschleife."""
+        self._lease_timer = None
+        if not self.is_leader:
+            return
+        self.stats['lost'] += 1
+        self.is_leader = False
+        print(f"WARNUNG: Bot-Lease nicht rechtzeitig verlängert ({self.instance_id}), lokale Bot-Schleife wird gestoppt.")
+        if self._on_lease_lost:
+            self._on_lease_lost(True)
+
+    async def release(self):
+        """Gibt die Lease beim Herunterfahren frei, damit ein anderer Worker ohne Wartezeit übernimmt."""
+        if self.mode == "local" or not self.is_leader:
+            return
+        self._cancel_lease_timer()
+        try:
+            await self._get_redis().eval(_RELEASE_SCRIPT, 1, BOT_KEY_PREFIX + "leader", self.instance_id)
+        except Exception as e:
+            print(f"WARNUNG: Bot-Lease konnte nicht freigegeben werden ({e}).")
+        self.is_leader = False
+
+    # --- Signale zwischen Workern ---
+    async def _sync_signals(self):
+        redis = self._get_redis()
+        if self.is_leader:
+            updates = {symbol: json.dumps(signal) for symbol, signal in DASHBOARD_HUB.signals.items()
+                       if signal['at'] > self._synced_signal_at.get(symbol, 0.0)}
+            if updates:
+                await redis.hset(BOT_KEY_PREFIX + "signals", mapping=updates)
+                self._synced_signal_at.update({s: DASHBOARD_HUB.signals[s]['at'] for s in updates})
+        else:
+            for symbol, raw in (await redis.hgetall(BOT_KEY_PREFIX + "signals")).items():
+                signal = json.loads(raw)
+                if signal['at'] > DASHBOARD_HUB.signals.get(symbol, {}).get('at', 0.0):
+                    DASHBOARD_HUB.apply_signal(signal)
+                    self._synced_signal_at[symbol] = signal['at']
+
+    # --- Steuerschleife ---
+    async def run(self, on_start, on_stop, is_running, on_state=None):
+        """
+        on_start(symbol): lokale Bot-Schleife starten; on_stop(lease_lost): stoppen (bei Lease-Verlust sofort,
+        muss wiederholt aufrufbar sein); is_running(): soll die lokale Schleife laufen?; on_state(state): optional,
+        aktueller Zustand für Status-Anzeigen.
+        """
+        print(f"INFO: Bot-Koordination gestartet (Modus: {self.mode}, Worker: {self.instance_id}).")
+        self._on_lease_lost = on_stop
+        while True:
+            try:
+                if self.mode != "local":
+                    await self._hold_lease()
+                state = await self.get_state()
+                if self.is_leader and state['running']:
+                    if not is_running():
+                        on_start(state['symbol'])
+                elif not self.is_leader:
+                    on_stop(True) # Ohne Lease darf hier nichts (mehr) laufen
+                elif is_running():
+                    on_stop(False)
+                if self.mode != "local":
+                    await self._sync_signals()
+                if on_state:
+                    on_state(state)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['redis_errors'] += 1
+                print(f"WARNUNG: Fehler in der Bot-Koordination: {e}")
+                if not self.is_leader:
+                    on_stop(True)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.renew_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def aclose(self):
+        await self.release()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def get_stats(self) -> dict:
+        return {'mode': self.mode, 'instance': self.instance_id, 'is_leader': self.is_leader, **self.stats}
+
+# Prozessweite Steuerung (eine Instanz pro Worker)
+BOT_CONTROL = BotController()
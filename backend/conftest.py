@@ -0,0 +1,60 @@
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import models
+import database
+from http_clients import AsyncHTTPClient, AlpacaClient, FMPClient
+from fake_broker import FakeBroker, create_app as create_broker_app
+from fake_fmp import FakeFMP, create_app as create_fmp_app
+
+# Gemeinsame Fixtures der Tests im Backend (python -m pytest -q im Verzeichnis backend).
+# Broker und FMP laufen als Fake-Apps im Prozess (httpx.ASGITransport), Tests mit Datenbank brauchen ein
+# erreichbares Postgres (POSTGRES_*/DB_HOST wie im Backend) und werden sonst übersprungen.
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def broker():
+    # Ausführung erst nach fill_delay; Tests rufen die Abfragen selbst auf bzw. pollen schnell
+    return FakeBroker(cash=1e9, fill_delay=0.05)
+
+@pytest.fixture
+async def alpaca(broker):
+    """AlpacaClient gegen den Fake-Broker (ohne Ratenbegrenzung auf beiden Seiten)."""
+    http_client = AsyncHTTPClient(transport=httpx.ASGITransport(app=create_broker_app(broker, rate_limit_per_minute=1e6)))
+    yield AlpacaClient("fake", "fake", "http://fake-broker", http_client=http_client)
+    await http_client.aclose()
+
+@pytest.fixture
+def fmp():
+    return FakeFMP(history_days=30)
+
+@pytest.fixture
+async def fmp_client(fmp):
+    """FMPClient gegen den Fake-FMP-Dienst."""
+    http_client = AsyncHTTPClient(transport=httpx.ASGITransport(app=create_fmp_app(fmp, rate_limit_per_minute=1e6)))
+    yield FMPClient("fake", base_url="http://fake-fmp/api/v3", http_client=http_client)
+    await http_client.aclose()
+
+@pytest.fixture
+async def mirror_db():
+    """
+    Eigene Engine pro Test (ohne Pool, da jeder Test einen eigenen Event-Loop hat) mit leeren Spiegel-Tabellen.
+    Gibt (engine, session_factory) zurück.
+    """
+    engine = create_async_engine(database.ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    tables = [models.AlpacaOrderMirror.__table__, models.AlpacaPositionMirror.__table__, models.AlpacaSyncState.__table__]
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(lambda sync_connection: models.Base.metadata.create_all(sync_connection, tables=tables))
+            await connection.execute(text("TRUNCATE alpaca_orders, alpaca_positions, alpaca_sync_state"))
+    except Exception as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres nicht erreichbar: {e}")
+    yield engine, async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    await engine.dispose()
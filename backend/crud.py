@@ -1,4 +1,12 @@
+import io
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, func, select, tuple_
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from window_store import WINDOW_STORE
+import price_storage
 import models, schemas # Diese Imports bleiben vorerst, falls du später andere CRUDs hinzufügst
 from datetime import date, datetime, timedelta
 
@@ -7,48 +15,488 @@ from datetime import date, datetime, timedelta
 
 def create_stock_price(db: Session, price: schemas.StockPriceCreate):
     db_price = models.StockPrice(**price.model_dump())
+    price_storage.ensure_partitions(db, db_price.timestamp, db_price.timestamp)
     db.add(db_price)
+    db.flush()
+    price_storage.refresh_rollups(db, _price_ranges(db_price))
     db.commit()
     db.refresh(db_price)
+    WINDOW_STORE.on_prices([db_price.symbol], [db_price.timestamp], [db_price.close])
     return db_price
 
+def _price_ranges(db_price: models.StockPrice):
+    return price_storage.affected_ranges(pd.DataFrame({'symbol': [db_price.symbol], 'timestamp': [db_price.timestamp]}))
+
+# Abfragen als select()-Ausdrücke, die crud.py und async_crud.py gleichermaßen ausführen
+
+def _stock_prices_query(symbol: str, start_date: datetime, end_date: datetime, limit: int):
+    return (select(models.StockPrice)
+            .filter(models.StockPrice.symbol == symbol.upper())
+            .filter(models.StockPrice.timestamp >= start_date)
+            .filter(models.StockPrice.timestamp <= end_date)
+            .order_by(models.StockPrice.timestamp.asc())
+            .limit(limit))
+
+def _latest_prices_query(symbol: str, sequence_length: int):
+    return (select(models.StockPrice.timestamp, models.StockPrice.close)
+            .filter(models.StockPrice.symbol == symbol.upper())
+            .order_by(models.StockPrice.timestamp.desc())
+            .limit(sequence_length))
+
+def _stock_sentiments_query(symbol: str, start_date: date, end_date: date, limit: int):
+    return (select(models.StockSentiment)
+            .filter(models.StockSentiment.symbol == symbol.upper())
+            .filter(models.StockSentiment.date >= start_date)
+            .filter(models.StockSentiment.date <= end_date)
+            .order_by(models.StockSentiment.date.asc())
+            .limit(limit))
+
+def _latest_sentiments_query(symbol: str, sequence_length: int):
+    return (select(models.StockSentiment.date, models.StockSentiment.sentiment_score)
+            .filter(models.StockSentiment.symbol == symbol.upper())
+            .order_by(models.StockSentiment.date.desc())
+            .limit(sequence_length))
+
 def get_stock_prices(db: Session, symbol: str, start_date: datetime, end_date: datetime, limit: int = 1000):
-    return db.query(models.StockPrice)\
-             .filter(models.StockPrice.symbol == symbol.upper())\
-             .filter(models.StockPrice.timestamp >= start_date)\
-             .filter(models.StockPrice.timestamp <= end_date)\
-             .order_by(models.StockPrice.timestamp.asc())\
-             .limit(limit)\
-             .all()
+    return db.execute(_stock_prices_query(symbol, start_date, end_date, limit)).scalars().all()
 
 def get_latest_stock_prices_for_sequence(db: Session, symbol: str, sequence_length: int):
     """Holt die letzten 'sequence_length' Schlusskurse für ein Symbol."""
-    return db.query(models.StockPrice.timestamp, models.StockPrice.close)\
-             .filter(models.StockPrice.symbol == symbol.upper())\
-             .order_by(models.StockPrice.timestamp.desc())\
-             .limit(sequence_length)\
-             .all() # Gibt eine Liste von Tupeln (timestamp, close) zurück, neueste zuerst
+    # Gibt eine Liste von Tupeln (timestamp, close) zurück, neueste zuerst
+    return db.execute(_latest_prices_query(symbol, sequence_length)).all()
 
 def create_stock_sentiment(db: Session, sentiment: schemas.StockSentimentCreate):
     db_sentiment = models.StockSentiment(**sentiment.model_dump())
     db.add(db_sentiment)
     db.commit()
     db.refresh(db_sentiment)
+    WINDOW_STORE.on_sentiment(db_sentiment.symbol, db_sentiment.date, db_sentiment.sentiment_score)
     return db_sentiment
 
 def get_stock_sentiments(db: Session, symbol: str, start_date: date, end_date: date, limit: int = 100):
-    return db.query(models.StockSentiment)\
-             .filter(models.StockSentiment.symbol == symbol.upper())\
-             .filter(models.StockSentiment.date >= start_date)\
-             .filter(models.StockSentiment.date <= end_date)\
-             .order_by(models.StockSentiment.date.asc())\
-             .limit(limit)\
-             .all()
+    return db.execute(_stock_sentiments_query(symbol, start_date, end_date, limit)).scalars().all()
 
 def get_latest_sentiments_for_sequence(db: Session, symbol: str, sequence_length: int):
     """Holt die letzten 'sequence_length' Sentiment-Scores für ein Symbol."""
-    return db.query(models.StockSentiment.date, models.StockSentiment.sentiment_score)\
-             .filter(models.StockSentiment.symbol == symbol.upper())\
-             .order_by(models.StockSentiment.date.desc())\
-             .limit(sequence_length)\
-             .all() # Gibt eine Liste von Tupeln (date, sentiment_score) zurück, neueste zuerst
\ No newline at end of file
+    # Gibt eine Liste von Tupeln (date, sentiment_score) zurück, neueste zuerst
+    return db.execute(_latest_sentiments_query(symbol, sequence_length)).all()
+
+# --- Massen-Ingestion (COPY / Multi-Row-Insert mit Upsert) ---
+
+STOCK_PRICE_COLUMNS = ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'adj_close', 'volume', 'source']
+STOCK_PRICE_UPDATE_COLUMNS = ['open', 'high', 'low', 'close', 'adj_close', 'volume', 'source']
+BULK_INSERT_CHUNK_SIZE = 5000
+
+def bulk_upsert_stock_prices(db: Session, prices_df: pd.DataFrame, use_copy: bool = True) -> int:
+    """
+    Schreibt viele Preiszeilen auf einmal in stock_prices.
+    prices_df: DataFrame mit den Spalten aus STOCK_PRICE_COLUMNS.
+    Duplikate auf (symbol, timestamp) werden verworfen (letzte Zeile gewinnt), bestehende Zeilen aktualisiert.
+    Mit psycopg2 wird per COPY in eine Staging-Tabelle geladen, sonst per Multi-Row-INSERT.
+    Fehlende Zeit-Partitionen werden vorher angelegt, die 1h/1d-Rollups der betroffenen Tage in derselben
+    Transaktion nachgezogen.
+    Gibt die Anzahl geschriebener Zeilen zurück.
+    """
+    if prices_df.empty:
+        return 0
+    prices_df = _dedupe_prices(prices_df)
+    timestamps = pd.to_datetime(prices_df['timestamp'], utc=True)
+    price_storage.ensure_partitions(db, timestamps.min(), timestamps.max())
+
+    if use_copy and db.get_bind().dialect.driver == 'psycopg2':
+        _copy_upsert_stock_prices(db, prices_df)
+    else:
+        for stmt in _price_upsert_statements(prices_df):
+            db.execute(stmt)
+    price_storage.refresh_rollups(db, price_storage.affected_ranges(prices_df))
+    db.commit()
+    _notify_prices(prices_df)
+    return len(prices_df)
+
+# Gemeinsame Bausteine für bulk_upsert_stock_prices in crud.py und async_crud.py
+
+_STOCK_PRICE_COLUMN_LIST = ", ".join(STOCK_PRICE_COLUMNS)
+STOCK_PRICE_STAGING_SQL = (
+    "CREATE TEMP TABLE stock_prices_staging ON COMMIT DROP AS "
+    f"SELECT {_STOCK_PRICE_COLUMN_LIST} FROM stock_prices WITH NO DATA"
+)
+STOCK_PRICE_STAGING_MERGE_SQL = (
+    f"INSERT INTO stock_prices ({_STOCK_PRICE_COLUMN_LIST}) SELECT {_STOCK_PRICE_COLUMN_LIST} FROM stock_prices_staging "
+    f"ON CONFLICT (symbol, timestamp) DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in STOCK_PRICE_UPDATE_COLUMNS)}"
+)
+
+def _dedupe_prices(prices_df: pd.DataFrame) -> pd.DataFrame:
+    return prices_df[STOCK_PRICE_COLUMNS].drop_duplicates(subset=['symbol', 'timestamp'], keep='last')
+
+def _price_records(prices_df: pd.DataFrame) -> list[dict]:
+    records_df = prices_df.astype(object).where(prices_df.notna(), None)
+    records_df['timestamp'] = list(pd.to_datetime(prices_df['timestamp'], utc=True).dt.to_pydatetime())
+    return records_df.to_dict(orient="records")
+
+def _price_upsert_statements(prices_df: pd.DataFrame):
+    """Multi-Row-INSERTs mit Upsert, je BULK_INSERT_CHUNK_SIZE Zeilen."""
+    records = _price_records(prices_df)
+    for start in range(0, len(records), BULK_INSERT_CHUNK_SIZE):
+        stmt = pg_insert(models.StockPrice).values(records[start:start + BULK_INSERT_CHUNK_SIZE])
+        yield stmt.on_conflict_do_update(
+            index_elements=['symbol', 'timestamp'],
+            set_={c: stmt.excluded[c] for c in STOCK_PRICE_UPDATE_COLUMNS},
+        )
+
+def _notify_prices(prices_df: pd.DataFrame):
+    # In-Memory-Fenster chronologisch fortschreiben (nur für bereits verfolgte Symbole)
+    ordered_df = prices_df.sort_values('timestamp')
+    WINDOW_STORE.on_prices(ordered_df['symbol'], ordered_df['timestamp'], ordered_df['close'])
+
+def _copy_upsert_stock_prices(db: Session, prices_df: pd.DataFrame):
+    csv_buffer = io.StringIO()
+    prices_df.to_csv(csv_buffer, header=False, index=False, na_rep='')
+    csv_buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute("DROP TABLE IF EXISTS stock_prices_staging")
+        cursor.execute(STOCK_PRICE_STAGING_SQL)
+        cursor.copy_expert(f"COPY stock_prices_staging ({_STOCK_PRICE_COLUMN_LIST}) FROM STDIN WITH (FORMAT csv)", csv_buffer)
+        cursor.execute(STOCK_PRICE_STAGING_MERGE_SQL)
+    finally:
+        cursor.close()
+
+STOCK_SENTIMENT_COLUMNS = ['symbol', 'date', 'sentiment_score', 'source']
+
+def bulk_upsert_stock_sentiments(db: Session, sentiments_df: pd.DataFrame) -> int:
+    """
+    Schreibt viele Sentiment-Werte auf einmal in stock_sentiments.
+    sentiments_df: DataFrame mit den Spalten aus STOCK_SENTIMENT_COLUMNS.
+    Bestehende Werte auf (symbol, date, source) werden aktualisiert (Score und fetched_at).
+    Gibt die Anzahl geschriebener Zeilen zurück.
+    """
+    if sentiments_df.empty:
+        return 0
+    sentiments_df = _dedupe_sentiments(sentiments_df)
+    for stmt in _sentiment_upsert_statements(sentiments_df):
+        db.execute(stmt)
+    db.commit()
+    _notify_sentiments(sentiments_df)
+    return len(sentiments_df)
+
+def _dedupe_sentiments(sentiments_df: pd.DataFrame) -> pd.DataFrame:
+    return sentiments_df[STOCK_SENTIMENT_COLUMNS].drop_duplicates(subset=['symbol', 'date', 'source'], keep='last')
+
+def _sentiment_upsert_statements(sentiments_df: pd.DataFrame):
+    records = sentiments_df.to_dict(orient="records")
+    for start in range(0, len(records), BULK_INSERT_CHUNK_SIZE):
+        stmt = pg_insert(models.StockSentiment).values(records[start:start + BULK_INSERT_CHUNK_SIZE])
+        yield stmt.on_conflict_do_update(
+            index_elements=['symbol', 'date', 'source'],
+            set_={'sentiment_score': stmt.excluded.sentiment_score, 'fetched_at': func.now()},
+        )
+
+def _notify_sentiments(sentiments_df: pd.DataFrame):
+    ordered_df = sentiments_df.sort_values('date')
+    for symbol, day, score in zip(ordered_df['symbol'], ordered_df['date'], ordered_df['sentiment_score']):
+        WINDOW_STORE.on_sentiment(symbol, day, score)
+
+LATEST_SENTIMENT_DATES_SQL = text("""
+    SELECT sym.symbol, max(ss.date)
+    FROM unnest(CAST(:symbols AS text[])) AS sym(symbol)
+    LEFT JOIN stock_sentiments ss ON ss.symbol = sym.symbol AND ss.source = :source
+    GROUP BY sym.symbol
+""")
+
+def get_latest_sentiment_dates(db: Session, symbols: list[str], source: str) -> dict:
+    """Letztes gespeichertes Sentiment-Datum je Symbol für eine Quelle ({symbol: date oder None})."""
+    if not symbols:
+        return {}
+    return dict(db.execute(LATEST_SENTIMENT_DATES_SQL, _latest_sentiment_dates_params(symbols, source)).all())
+
+def _latest_sentiment_dates_params(symbols: list[str], source: str) -> dict:
+    return {'symbols': [s.upper() for s in symbols], 'source': source}
+
+PRICE_SYMBOLS_SQL = text("SELECT DISTINCT symbol FROM stock_prices ORDER BY symbol")
+
+def get_price_symbols(db: Session) -> list[str]:
+    """Alle Symbole, für die Kurse gespeichert sind (Ticker-Universum für Ingestion-Jobs)."""
+    return list(db.execute(PRICE_SYMBOLS_SQL).scalars())
+
+
+# --- Modell-Eingaben (Close + Sentiment) in einem einzigen Roundtrip ---
+
+MODEL_INPUT_ROWS_SQL = text("""
+    SELECT sym.symbol, p.timestamp, p.close, COALESCE(s.sentiment_score, 0.0) AS sentiment_score, s.date AS sentiment_date
+    FROM unnest(CAST(:symbols AS text[]), CAST(:since AS timestamptz[])) AS sym(symbol, since)
+    CROSS JOIN LATERAL (
+        SELECT sp.timestamp, sp.close
+        FROM stock_prices sp
+        WHERE sp.symbol = sym.symbol
+          AND (sym.since IS NULL OR sp.timestamp > sym.since)
+        ORDER BY sp.timestamp DESC
+        LIMIT :sequence_length
+    ) p
+    LEFT JOIN LATERAL (
+        -- Forward-Fill: letzter bekannter Sentiment-Wert am oder vor dem Kurstag
+        SELECT ss.sentiment_score, ss.date
+        FROM stock_sentiments ss
+        WHERE ss.symbol = sym.symbol
+          AND ss.date <= CAST(p.timestamp AT TIME ZONE 'UTC' AS date)
+        ORDER BY ss.date DESC, ss.fetched_at DESC
+        LIMIT 1
+    ) s ON TRUE
+    ORDER BY sym.symbol, p.timestamp ASC
+""")
+
+def get_model_input_rows(db: Session, symbols: list[str], sequence_length: int, since_by_symbol: dict | None = None):
+    """
+    Holt für viele Symbole mit einer SQL-Abfrage die letzten 'sequence_length' Kurse samt
+    (vorwärts aufgefülltem) Sentiment, optional nur Kurse nach since_by_symbol[symbol].
+    Gibt Tupel (symbol, timestamp, close, sentiment_score, sentiment_date) zurück, nach Symbol und Zeit sortiert.
+    """
+    if not symbols:
+        return []
+    return db.execute(MODEL_INPUT_ROWS_SQL, _model_input_params(symbols, sequence_length, since_by_symbol)).all()
+
+def _model_input_params(symbols: list[str], sequence_length: int, since_by_symbol: dict | None) -> dict:
+    symbols = [s.upper() for s in symbols]
+    since_by_symbol = since_by_symbol or {}
+    return {
+        'symbols': symbols,
+        'since': [since_by_symbol.get(s) for s in symbols],
+        'sequence_length': sequence_length,
+    }
+
+def get_model_input_sequences(db: Session, symbols: list[str], sequence_length: int) -> dict:
+    """
+    Holt für viele Symbole mit einer SQL-Abfrage die letzten 'sequence_length' Schlusskurse
+    samt (vorwärts aufgefülltem) Sentiment.
+    Gibt {symbol: np.ndarray (sequence_length, 2)} mit Spalten [Close, Sentiment] zurück, älteste Zeile zuerst.
+    Symbole mit weniger als 'sequence_length' Kursen fehlen im Ergebnis.
+    """
+    return _model_input_sequences(get_model_input_rows(db, symbols, sequence_length), sequence_length)
+
+def _model_input_sequences(rows, sequence_length: int) -> dict:
+    """
+    Zerlegt die Zeilen von MODEL_INPUT_ROWS_SQL in {symbol: np.ndarray (sequence_length, 2)}.
+    Gruppiert wird in der Reihenfolge der Abfrage (Symbolwechsel zwischen aufeinanderfolgenden Zeilen), nicht per
+    Sortierung in numpy: ORDER BY symbol folgt der Collation der Datenbank (z.B. en_US.UTF-8 bei 'BRK.B').
+    """
+    if not rows:
+        return {}
+    row_symbols = [r[0] for r in rows]
+    values = np.array([(r[2], r[3]) for r in rows], dtype=np.float32)
+    group_starts = [i for i in range(1, len(row_symbols)) if row_symbols[i] != row_symbols[i - 1]]
+    sequences = {}
+    for start, group in zip([0] + group_starts, np.split(values, group_starts)):
+        if group.shape[0] == sequence_length:
+            sequences[row_symbols[start]] = group
+    return sequences
+
+SENTIMENTS_SINCE_SQL = text("""
+    SELECT ss.symbol, ss.date, ss.sentiment_score
+    FROM unnest(CAST(:symbols AS text[]), CAST(:since AS date[])) AS sym(symbol, since)
+    JOIN stock_sentiments ss ON ss.symbol = sym.symbol AND ss.date >= sym.since
+    ORDER BY ss.symbol, ss.date ASC, ss.fetched_at ASC
+""")
+
+def get_sentiments_since(db: Session, since_by_symbol: dict):
+    """Holt alle Sentiment-Werte ab since_by_symbol[symbol] (inklusive). Gibt Tupel (symbol, date, sentiment_score) zurück."""
+    if not since_by_symbol:
+        return []
+    return db.execute(SENTIMENTS_SINCE_SQL, _sentiments_since_params(since_by_symbol)).all()
+
+def _sentiments_since_params(since_by_symbol: dict) -> dict:
+    symbols = list(since_by_symbol)
+    return {'symbols': [s.upper() for s in symbols], 'since': [since_by_symbol[s] for s in symbols]}
+
+PRICE_HISTORY_SQL = text("""
+    SELECT timestamp, close FROM stock_prices
+    WHERE symbol = :symbol
+      AND (CAST(:start AS timestamptz) IS NULL OR timestamp >= CAST(:start AS timestamptz))
+      AND (CAST(:end_before AS timestamptz) IS NULL OR timestamp < CAST(:end_before AS timestamptz))
+    ORDER BY timestamp ASC
+""")
+
+SENTIMENT_HISTORY_SQL = text("""
+    SELECT date, sentiment_score FROM stock_sentiments
+    WHERE symbol = :symbol AND (CAST(:end_before AS timestamptz) IS NULL OR date < CAST(:end_before AS timestamptz))
+    ORDER BY date ASC, fetched_at ASC
+""")
+
+def get_model_input_history(db: Session, symbol: str, start: datetime | None = None, end: datetime | None = None,
+                            resolution: str = 'raw') -> pd.DataFrame:
+    """
+    Holt die gesamte Kurshistorie eines Symbols (optional ab start bis einschließlich des Tages end) samt
+    vorwärts aufgefülltem Sentiment, mit derselben Zuordnung wie MODEL_INPUT_ROWS_SQL (letzter Score mit date <= Kursdatum in UTC, sonst 0).
+    resolution='1h'/'1d' liest die Schlusskurse aus den Rollups (siehe price_storage.py) statt aus den Rohdaten.
+    Gibt einen DataFrame [timestamp, close, sentiment_score] zurück, älteste Zeile zuerst.
+    """
+    # end ist ein Tag (z.B. '2024-06-30' = Mitternacht): Kurse dieses Tages gehören dazu
+    end_before = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+    params = {'symbol': symbol.upper(), 'start': start, 'end_before': end_before}
+    if resolution == 'raw':
+        prices_df = pd.DataFrame(db.execute(PRICE_HISTORY_SQL, params).all(), columns=['timestamp', 'close'])
+    else:
+        series_end = end_before - pd.Timedelta(microseconds=1) if end_before is not None else None
+        _, series_df = price_storage.get_price_series(db, symbol, start, series_end, resolution=resolution)
+        prices_df = series_df[['timestamp', 'close']]
+    sentiments_df = pd.DataFrame(db.execute(SENTIMENT_HISTORY_SQL, params).all(), columns=['date', 'sentiment_score'])
+    if prices_df.empty:
+        return prices_df.assign(sentiment_score=pd.Series(dtype=float))
+
+    prices_df['timestamp'] = pd.to_datetime(prices_df['timestamp'], utc=True)
+    prices_df['close'] = prices_df['close'].astype(float)
+    if sentiments_df.empty:
+        return prices_df.assign(sentiment_score=0.0)
+
+    # Pro Tag gilt der zuletzt abgerufene Score
+    sentiments_df = sentiments_df.drop_duplicates(subset=['date'], keep='last')
+    sentiments_df['date'] = pd.to_datetime(sentiments_df['date']).astype('datetime64[ns]')
+    prices_df['date'] = prices_df['timestamp'].dt.tz_convert('UTC').dt.tz_localize(None).dt.normalize().astype('datetime64[ns]')
+    merged_df = pd.merge_asof(prices_df, sentiments_df, on='date', direction='backward')
+    merged_df['sentiment_score'] = merged_df['sentiment_score'].fillna(0.0).astype(float)
+    return merged_df[['timestamp', 'close', 'sentiment_score']]
+
+
+# --- Alpaca-Spiegel (Orders und Positionen, gepflegt von order_mirror.py) ---
+
+def _decimal(value):
+    return Decimal(str(value)) if value not in (None, "") else None
+
+def _timestamp(value):
+    return pd.Timestamp(value).to_pydatetime(warn=False) if value else None
+
+def _alpaca_order_record(order: dict) -> dict:
+    return {
+        'id': order['id'], 'client_order_id': order['client_order_id'], 'symbol': order['symbol'],
+        'side': order['side'], 'type': order.get('type') or order.get('order_type'), 'status': order['status'],
+        'qty': _decimal(order.get('qty')), 'filled_qty': _decimal(order.get('filled_qty')),
+        'filled_avg_price': _decimal(order.get('filled_avg_price')),
+        'created_at': _timestamp(order['created_at']), 'submitted_at': _timestamp(order.get('submitted_at')),
+        'updated_at': _timestamp(order.get('updated_at')), 'filled_at': _timestamp(order.get('filled_at')),
+        'raw': order,
+    }
+
+def _order_upsert_statement(records: list[dict]):
+    table = models.AlpacaOrderMirror.__table__
+    stmt = pg_insert(table).values(records)
+    columns = [c for c in records[0] if c != 'id']
+    return stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={**{c: stmt.excluded[c] for c in columns}, 'synced_at': func.now()},
+        # Ältere Stände (z.B. eine verspätete Antwort) überschreiben keinen neueren
+        where=table.c.updated_at.is_(None) | stmt.excluded.updated_at.is_(None) | (stmt.excluded.updated_at >= table.c.updated_at),
+    )
+
+def _order_records(orders: list[dict]) -> list[dict]:
+    """Eine Zeile pro Order-ID (die zuletzt gelieferte), da ON CONFLICT keine Zeile zweimal ändern darf."""
+    return list({order['id']: _alpaca_order_record(order) for order in orders}.values())
+
+def upsert_mirrored_orders(db: Session, orders: list[dict]) -> int:
+    """Schreibt Alpaca-Orders (API-Antworten) in alpaca_orders. Gibt die Anzahl geschriebener Orders zurück."""
+    records = _order_records(orders)
+    for start in range(0, len(records), BULK_INSERT_CHUNK_SIZE):
+        db.execute(_order_upsert_statement(records[start:start + BULK_INSERT_CHUNK_SIZE]))
+    db.commit()
+    return len(records)
+
+def _alpaca_position_record(position: dict) -> dict:
+    return {
+        'symbol': position['symbol'], 'side': position.get('side'), 'qty': _decimal(position['qty']),
+        'avg_entry_price': _decimal(position.get('avg_entry_price')), 'market_value': _decimal(position.get('market_value')),
+        'unrealized_pl': _decimal(position.get('unrealized_pl')), 'raw': position,
+    }
+
+def _position_statements(positions: list[dict]) -> list:
+    """Ersetzt den Positionsbestand: nicht mehr gemeldete Symbole löschen, alle übrigen upserten."""
+    table = models.AlpacaPositionMirror.__table__
+    records = [_alpaca_position_record(p) for p in positions]
+    statements = [table.delete().where(table.c.symbol.notin_([r['symbol'] for r in records]))]
+    if records:
+        stmt = pg_insert(table).values(records)
+        statements.append(stmt.on_conflict_do_update(
+            index_elements=['symbol'],
+            set_={**{c: stmt.excluded[c] for c in records[0] if c != 'symbol'}, 'synced_at': func.now()},
+        ))
+    return statements
+
+def replace_mirrored_positions(db: Session, positions: list[dict]) -> int:
+    """Übernimmt die aktuelle Positionsliste von Alpaca in einer Transaktion nach alpaca_positions."""
+    for statement in _position_statements(positions):
+        db.execute(statement)
+    db.commit()
+    return len(positions)
+
+ORDER_SYNC_STATE = 'orders'
+ORDER_SYNC_WATERMARK_SQL = text("SELECT watermark FROM alpaca_sync_state WHERE name = :name")
+
+def get_order_sync_watermark(db: Session):
+    """Wasserstand des letzten vollständigen Order-Abgleichs (None vor dem ersten)."""
+    return db.execute(ORDER_SYNC_WATERMARK_SQL, {'name': ORDER_SYNC_STATE}).scalar()
+
+def _watermark_upsert_statement(watermark: datetime):
+    table = models.AlpacaSyncState.__table__
+    stmt = pg_insert(table).values(name=ORDER_SYNC_STATE, watermark=watermark)
+    # Der Wasserstand läuft nur vorwärts (z.B. bei zwei Abgleichen kurz nacheinander)
+    return stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'watermark': func.greatest(table.c.watermark, stmt.excluded.watermark), 'updated_at': func.now()},
+    )
+
+def set_order_sync_watermark(db: Session, watermark: datetime):
+    """Schreibt den Wasserstand nach einem vollständigen Abgleich neuer Orders fort."""
+    db.execute(_watermark_upsert_statement(watermark))
+    db.commit()
+
+def _unsettled_orders_query(terminal_statuses, limit: int):
+    table = models.AlpacaOrderMirror.__table__
+    submitted_at = func.coalesce(table.c.submitted_at, table.c.created_at)
+    return (select(table.c.id, submitted_at).where(table.c.status.notin_(list(terminal_statuses)))
+            .order_by(submitted_at).limit(limit))
+
+def get_unsettled_orders(db: Session, terminal_statuses, limit: int = 100) -> dict:
+    """Gespiegelte Orders, die beim letzten Abgleich noch nicht abgeschlossen waren: {id: submitted_at}, älteste zuerst."""
+    return dict(db.execute(_unsettled_orders_query(terminal_statuses, limit)).all())
+
+def _mirrored_orders_query(symbol: str | None = None, statuses=None, exclude_statuses=None,
+                           since: datetime | None = None, until: datetime | None = None,
+                           cursor: tuple | None = None, limit: int = 50, direction: str = 'desc'):
+    table = models.AlpacaOrderMirror.__table__
+    query = select(table.c.raw, table.c.created_at, table.c.id)
+    if symbol:
+        query = query.where(table.c.symbol == symbol.upper())
+    if statuses:
+        query = query.where(table.c.status.in_(list(statuses)))
+    if exclude_statuses:
+        query = query.where(table.c.status.notin_(list(exclude_statuses)))
+    if since:
+        query = query.where(table.c.created_at >= since)
+    if until:
+        query = query.where(table.c.created_at < until)
+    key = tuple_(table.c.created_at, table.c.id)
+    if cursor:
+        query = query.where(key < tuple_(*cursor) if direction == 'desc' else key > tuple_(*cursor))
+    order = (table.c.created_at.desc(), table.c.id.desc()) if direction == 'desc' else (table.c.created_at, table.c.id)
+    # Eine Zeile mehr als angefragt: zeigt an, ob es eine weitere Seite gibt
+    return query.order_by(*order).limit(limit + 1)
+
+def _orders_page(rows, limit: int) -> tuple[list[dict], tuple | None]:
+    rows = list(rows)
+    next_cursor = (rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return [row.raw for row in rows[:limit]], next_cursor
+
+def get_mirrored_orders(db: Session, symbol: str | None = None, statuses=None, exclude_statuses=None,
+                        since: datetime | None = None, until: datetime | None = None,
+                        cursor: tuple | None = None, limit: int = 50, direction: str = 'desc') -> tuple[list[dict], tuple | None]:
+    """
+    Eine Seite gespiegelter Orders (Keyset-Pagination nach (created_at, id)), neueste zuerst bzw. bei
+    direction='asc' älteste zuerst. cursor ist der (created_at, id)-Schlüssel der letzten Order der Vorseite.
+    Gibt (Orders als API-Antworten, Cursor der nächsten Seite oder None) zurück.
+    """
+    query = _mirrored_orders_query(symbol, statuses, exclude_statuses, since, until, cursor, limit, direction)
+    return _orders_page(db.execute(query).all(), limit)
+
+MIRRORED_POSITIONS_SQL = text("SELECT raw, synced_at FROM alpaca_positions ORDER BY symbol")
+
+def get_mirrored_positions(db: Session) -> tuple[list[dict], datetime | None]:
+    """Gespiegelte Positionen (API-Antworten) und Zeitpunkt des letzten Abgleichs."""
+    rows = db.execute(MIRRORED_POSITIONS_SQL).all()
+    return [row.raw for row in rows], max((row.synced_at for row in rows), default=None)
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import asyncio
+
+import numpy as np
+
+from http_clients import alpaca_client
+from response_cache import RESPONSE_CACHE
+
+# Abstand der Alpaca-Abfragen für Konto, Positionen und Orders, solange mindestens ein Dashboard verbunden ist
+DASHBOARD_POLL_SECONDS = float(os.getenv("DASHBOARD_POLL_SECONDS", "5"))
+DASHBOARD_ORDERS_LIMIT = int(os.getenv("DASHBOARD_ORDERS_LIMIT", "20"))
+DASHBOARD_HEARTBEAT_SECONDS = float(os.getenv("DASHBOARD_HEARTBEAT_SECONDS", "15"))
+# Gleichzeitige Aufrufe von /api/v1/dashboard teilen sich in diesem Fenster eine Abfrage pro Teil
+DASHBOARD_COALESCE_SECONDS = float(os.getenv("DASHBOARD_COALESCE_SECONDS", "1.0"))
+DASHBOARD_QUEUE_SIZE = 256 # Ausstehende Nachrichten pro Client; läuft die Queue voll, bekommt er einen neuen Snapshot
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Nicht serialisierbar: {type(value).__name__}")
+
+def encode_event(message: dict) -> str:
+    return json.dumps(message, default=_json_default)
+
+class CoalescingWindow:
+    """
+    Bündelt gleichartige Abfragen: wer innerhalb von window_seconds nach dem Start einer Abfrage mit demselben
+    Schlüssel kommt, wartet auf deren Ergebnis (auch auf deren Fehler), statt eine eigene zu starten.
+    Bricht ein Aufrufer ab, läuft die gemeinsame Abfrage für die übrigen weiter.
+    """
+
+    def __init__(self, window_seconds: float = DASHBOARD_COALESCE_SECONDS, max_entries: int = 256):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._entries = {} # {key: (start (monotonic), Task)}
+        self.stats = {'fetches': 0, 'coalesced': 0}
+
+    async def run(self, key: str, fetch):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and now - entry[0] < self.window_seconds:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(entry[1])
+        task = asyncio.ensure_future(fetch())
+        # Fehler gelten als abgerufen, auch wenn alle Aufrufer vorher abgebrochen haben
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._entries[key] = (now, task)
+        self.stats['fetches'] += 1
+        if len(self._entries) > self.max_entries:
+            self._entries = {k: e for k, e in self._entries.items() if now - e[0] < self.window_seconds}
+        return await asyncio.shield(task)
+
+class DashboardHub:
+    """
+    Zentrale Verteilung des Dashboard-Zustands an alle verbundenen Clients (WebSocket/SSE).
+    - Genau ein Hintergrund-Task fragt Alpaca ab (über den RESPONSE_CACHE), und nur solange Clients verbunden sind;
+      die Upstream-Last ist damit unabhängig von der Anzahl offener Dashboards.
+    - Neue Clients erhalten zuerst einen Snapshot, danach nur Änderungen: Bot-Status, Signale aus der
+      Bot-Schleife, geänderte/entfernte Positionen, neue/geänderte Orders und Kontoänderungen.
+    - Jede Nachricht trägt eine fortlaufende Nummer ('seq'); langsame Clients werden per Snapshot neu synchronisiert.
+    """
+
+    def __init__(self, poll_seconds: float = DASHBOARD_POLL_SECONDS, orders_limit: int = DASHBOARD_ORDERS_LIMIT):
+        self.poll_seconds = poll_seconds
+        self.orders_limit = orders_limit
+        self.bot_status = None
+        self.account = None
+        self.positions = {} # {symbol: position}
+        self.orders = {} # {order_id: order}
+        self.signals = {} # {symbol: letztes Signal}
+        self._subscribers = set()
+        self._seq = 0
+        self._poll_task = None
+        self.stats = {'published': 0, 'resyncs': 0, 'upstream_polls': 0, 'upstream_errors': 0}
+
+    # --- Zustand und Verteilung ---
+    def snapshot(self) -> dict:
+        return {'type': 'snapshot', 'seq': self._seq, 'data': {
+            'bot_status': self.bot_status,
+            'account': self.account,
+            'positions': list(self.positions.values()),
+            'orders': self._recent_orders(),
+            'signals': list(self.signals.values()),
+        }}
+
+    def _recent_orders(self) -> list[dict]:
+        orders = sorted(self.orders.values(), key=lambda o: o.get('submitted_at') or o.get('created_at') or "", reverse=True)
+        return orders[:self.orders_limit]
+
+    def publish(self, event_type: str, data):
+        self._seq += 1
+        message = {'type': event_type, 'seq': self._seq, 'data': data}
+        self.stats['published'] += 1
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Client kommt nicht hinterher: ausstehende Deltas verwerfen, mit Snapshot neu aufsetzen
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot())
+                self.stats['resyncs'] += 1
+
+    def set_bot_status(self, status: dict):
+        if status != self.bot_status:
+            self.bot_status = status
+            self.publish('bot_status', status)
+
+    def publish_signal(self, symbol: str, signal: str, strength: float | None, current_price: float | None = None,
+                       predicted_price: float | None = None):
+        self.apply_signal({'symbol': symbol, 'signal': signal, 'strength': strength, 'current_price': current_price,
+                           'predicted_price': predicted_price, 'at': time.time()})
+
+    def apply_signal(self, entry: dict):
+        self.signals[entry['symbol']] = entry
+        self.publish('signal', entry)
+
+    def apply_orders(self, orders: list[dict]):
+        changed = [o for o in orders if self.orders.get(o['id']) != o]
+        for order in changed:
+            self.orders[order['id']] = order
+        if len(self.orders) > self.orders_limit * 5:
+            keep = {o['id'] for o in self._recent_orders()}
+            self.orders = {i: o for i, o in self.orders.items() if i in keep}
+        if changed:
+            self.publish('orders', {'upsert': changed})
+
+    async def on_order(self, order: dict):
+        """Listener für den ORDER_EXECUTOR: abgeschlossene Orders sofort statt beim nächsten Poll melden."""
+        self.apply_orders([order])
+
+    def apply_positions(self, positions: list[dict]):
+        current = {p['symbol']: p for p in positions}
+        upsert = [p for symbol, p in current.items() if self.positions.get(symbol) != p]
+        remove = [symbol for symbol in self.positions if symbol not in current]
+        self.positions = current
+        if upsert or remove:
+            self.publish('positions', {'upsert': upsert, 'remove': remove})
+
+    def apply_account(self, account: dict):
+        if account != self.account:
+            self.account = account
+            self.publish('account', account)
+
+    # --- Abonnenten ---
+    async def subscribe(self):
+        """Async-Generator für einen Client: Snapshot, danach Deltas; bei Leerlauf Heartbeats."""
+        queue = asyncio.Queue(maxsize=DASHBOARD_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        self._ensure_polling()
+        try:
+            yield self.snapshot()
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=DASHBOARD_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield {'type': 'heartbeat', 'seq': self._seq, 'data': None}
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    # --- Upstream ---
+    def _ensure_polling(self):
+        if alpaca_client and (self._poll_task is None or self._poll_task.done()):
+            self._poll_task = asyncio.create_task(self._poll_upstream())
+
+    async def _poll_upstream(self):
+        while self._subscribers:
+            await self.refresh()
+            await asyncio.sleep(self.poll_seconds)
+
+    async def refresh(self):
+        """Fragt Konto, Positionen und Orders gleichzeitig ab und verteilt die Änderungen."""
+        self.stats['upstream_polls'] += 1
+        orders_key = f"all:{self.orders_limit}:desc"
+        account, positions, orders = await asyncio.gather(
+            RESPONSE_CACHE.get_or_fetch('alpaca_account', 'default', alpaca_client.get_account),
+            RESPONSE_CACHE.get_or_fetch('alpaca_positions', 'default', alpaca_client.list_positions),
+            RESPONSE_CACHE.get_or_fetch('alpaca_orders', orders_key,
+                                        lambda: alpaca_client.list_orders(status='all', limit=self.orders_limit, direction='desc')),
+            return_exceptions=True,
+        )
+        for name, result, apply in (('Konto', account, self.apply_account), ('Positionen', positions, self.apply_positions),
+                                    ('Orders', orders, self.apply_orders)):
+            if isinstance(result, BaseException):
+                self.stats['upstream_errors'] += 1
+                print(f"WARNUNG: Dashboard-Aktualisierung ({name}) fehlgeschlagen: {result}")
+            else:
+                apply(result)
+
+    def get_stats(self) -> dict:
+        return {'subscribers': self.subscriber_count, 'seq': self._seq, 'polling': bool(self._poll_task and not self._poll_task.done()),
+                **self.stats}
+
+# Prozessweiter Hub und Bündelung für /api/v1/dashboard
+DASHBOARD_HUB = DashboardHub()
+DASHBOARD_COALESCER = CoalescingWindow()
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Ausdünnen von Kursreihen für Charts: ein Chart kann nicht mehr Punkte darstellen, als er Pixel breit ist.
+# - lttb_indices: Largest-Triangle-Three-Buckets, behält die Form der Linie (Spitzen und Täler) bei
+# - ohlc_buckets: fasst aufeinanderfolgende Balken zu max_points OHLC-Balken zusammen (Kerzen-Darstellung)
+# Beide erwarten zeitlich aufsteigend sortierte Reihen.
+
+def _bucket_edges(n: int, buckets: int) -> np.ndarray:
+    """Grenzen von 'buckets' annähernd gleich großen, zusammenhängenden Abschnitten über n Punkte."""
+    return np.linspace(0, n, buckets + 1).round().astype(np.int64)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indizes der nach LTTB ausgewählten Punkte (erster und letzter Punkt bleiben immer erhalten).
+    Die Mittelwerte der Folge-Buckets werden vektorisiert berechnet; pro Bucket bleibt ein argmax über die
+    Dreiecksflächen, weil jeder Schritt vom zuvor gewählten Punkt abhängt (max_points Schritte, nicht n).
+    """
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        raise ValueError("LTTB benötigt mindestens 3 Punkte (erster, letzter und ein Bucket).")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Innere Punkte (ohne ersten und letzten) auf max_points - 2 Buckets verteilen
+    edges = _bucket_edges(n - 2, max_points - 2) + 1
+    counts = np.diff(edges)
+    bucket_x_mean = np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts
+    bucket_y_mean = np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts
+    # Der Nachfolger des letzten Buckets ist der letzte Punkt
+    next_x = np.append(bucket_x_mean[1:], x[-1])
+    next_y = np.append(bucket_y_mean[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(edges[:-1], edges[1:])):
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        # Doppelte Dreiecksfläche zwischen vorherigem Punkt, Kandidat und Mittelwert des Folge-Buckets
+        areas = np.abs((x[previous] - next_x[bucket]) * (bucket_y - y[previous])
+                       - (x[previous] - bucket_x) * (next_y[bucket] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def ohlc_buckets(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray,
+                 max_points: int) -> dict:
+    """
+    Fasst die Reihe zu höchstens max_points Balken zusammen: Open des ersten, High-Maximum, Low-Minimum,
+    Close des letzten Balkens, Volumen-Summe. Gibt Arrays plus 'start'/'end' (Indizes in der Eingabe) zurück.
+    """
+    n = len(close)
+    buckets = max(1, min(max_points, n))
+    edges = _bucket_edges(n, buckets)
+    starts, ends = edges[:-1], edges[1:] - 1
+    return {
+        'start': starts,
+        'end': ends,
+        'open': np.asarray(open_, dtype=np.float64)[starts],
+        'high': np.maximum.reduceat(np.asarray(high, dtype=np.float64), starts),
+        'low': np.minimum.reduceat(np.asarray(low, dtype=np.float64), starts),
+        'close': np.asarray(close, dtype=np.float64)[ends],
+        'volume': np.add.reduceat(np.asarray(volume, dtype=np.float64), starts),
+        'count': ends - starts + 1,
+    }
+
+def downsample_history(historical: list[dict], max_points: int, mode: str = "lttb") -> list[dict]:
+    """
+    Dünnt eine FMP-Historie ('historical'-Liste, neueste zuerst) auf höchstens max_points Punkte aus.
+    mode='lttb' liefert ausgewählte Originalpunkte, mode='ohlc' zusammengefasste Balken
+    ({date, end_date, open, high, low, close, volume, count}). Die Reihenfolge der Eingabe bleibt erhalten.
+    """
+    if not historical or (mode == "lttb" and len(historical) <= max_points):
+        return historical
+    # Aufsteigend nach Datum für die Berechnung (FMP liefert absteigend)
+    dates = np.array([p['date'] for p in historical], dtype='datetime64[s]')
+    order = np.argsort(dates, kind='stable')
+    descending = len(order) > 1 and order[0] != 0
+
+    if mode == "lttb":
+        close = np.array([historical[i]['close'] for i in order], dtype=np.float64)
+        selected = order[lttb_indices(dates[order].astype(np.int64), close, max_points)]
+        selected = selected[::-1] if descending else selected
+        return [historical[i] for i in selected]
+
+    fields = {key: np.array([historical[i].get(key) or 0.0 for i in order], dtype=np.float64)
+              for key in ('open', 'high', 'low', 'close', 'volume')}
+    bars = ohlc_buckets(fields['open'], fields['high'], fields['low'], fields['close'], fields['volume'], max_points)
+    result = [
+        {'date': historical[order[start]]['date'], 'end_date': historical[order[end]]['date'],
+         'open': o, 'high': h, 'low': l, 'close': c, 'volume': v, 'count': int(count)}
+        for start, end, o, h, l, c, v, count in zip(bars['start'], bars['end'], bars['open'].tolist(), bars['high'].tolist(),
+                                                    bars['low'].tolist(), bars['close'].tolist(), bars['volume'].tolist(), bars['count'])
+    ]
+    return result[::-1] if descending else result
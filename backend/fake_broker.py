@@ -0,0 +1,256 @@
+import os
+import time
+import uuid
+import heapq
+import zlib
+import random
+import argparse
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from http_clients import TokenBucket
+
+# Lokaler Ersatz für die Alpaca Trading API (v2) für Offline- und Lasttests der Orderausführung.
+# Start als eigener Dienst: python fake_broker.py --port 8010  (dann ALPACA_BASE_URL=http://localhost:8010)
+# oder im Prozess über httpx.ASGITransport(app=create_app()).
+
+FAKE_BROKER_CASH = float(os.getenv("FAKE_BROKER_CASH", "1000000"))
+# Anfragen pro Minute, bevor mit 429 geantwortet wird (wie bei Alpaca)
+FAKE_BROKER_RATE_LIMIT_PER_MINUTE = float(os.getenv("FAKE_BROKER_RATE_LIMIT_PER_MINUTE", "200"))
+# Verzögerung zwischen Annahme und Ausführung einer Market-Order
+FAKE_BROKER_FILL_DELAY_SECONDS = float(os.getenv("FAKE_BROKER_FILL_DELAY_SECONDS", "1.0"))
+# Anteil der Orders, die bei der Ausführung zufällig abgelehnt werden (Fehlerpfade testen)
+FAKE_BROKER_REJECT_RATE = float(os.getenv("FAKE_BROKER_REJECT_RATE", "0"))
+
+TERMINAL_STATUSES = {"filled", "canceled", "expired", "rejected"}
+
+def _iso(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() if ts is not None else None
+
+def _parse_ts(value: str | None) -> float | None:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() if value else None
+
+def fake_price(symbol: str) -> float:
+    """Fester Kurs je Symbol (10 bis 500), damit Tests reproduzierbar sind."""
+    return round(10 + zlib.crc32(symbol.upper().encode()) % 49000 / 100, 2)
+
+class FakeBroker:
+    """
+    Zustand des Fake-Brokers: Konto, Orders und Positionen im Speicher.
+    - Orders werden sofort angenommen ("accepted") und nach fill_delay zum festen Kurs ausgeführt.
+    - client_order_id ist eindeutig; eine zweite Order mit derselben ID wird wie bei Alpaca mit 422 abgelehnt.
+    - Kaufkraft wird bei Annahme reserviert; reicht sie nicht, folgt 403.
+    - Zeitstempel werden auf timestamp_resolution abgerundet; gröbere Werte erzeugen absichtlich Orders mit
+      gleichem submitted_at (wie bei schnell hintereinander gesendeten Orders), an denen Seitenabrufe über
+      'after' nichts überspringen dürfen.
+    """
+
+    def __init__(self, cash: float = FAKE_BROKER_CASH, fill_delay: float = FAKE_BROKER_FILL_DELAY_SECONDS,
+                 reject_rate: float = FAKE_BROKER_REJECT_RATE, prices: dict | None = None, seed: int = 0,
+                 timestamp_resolution: float = 1e-6):
+        self.cash = cash
+        self.prices = dict(prices or {}) # Ausführungskurse je Symbol; fehlende Symbole über fake_price()
+        self.fill_delay = fill_delay
+        self.reject_rate = reject_rate
+        self._random = random.Random(seed)
+        self.orders = {} # {id: order}
+        self.orders_by_client_id = {}
+        self.positions = {} # {symbol: {'qty': float, 'cost': float}}
+        self._pending_fills = [] # Heap aus (fill_at, order_id)
+        self._reserved = 0.0
+        self._reservations = {} # {order_id: reservierter Betrag}, freigegeben bei Ausführung
+        self.timestamp_resolution = timestamp_resolution
+        self.stats = {'requests': 0, 'throttled': 0, 'orders': 0, 'duplicates': 0, 'filled': 0, 'rejected': 0}
+
+    def price(self, symbol: str) -> float:
+        return self.prices.get(symbol, fake_price(symbol))
+
+    def _advance(self):
+        """Führt alle fälligen Orders aus (bei jeder Anfrage, statt mit einem Hintergrund-Task)."""
+        now = time.time()
+        while self._pending_fills and self._pending_fills[0][0] <= now:
+            fill_at, order_id = heapq.heappop(self._pending_fills)
+            order = self.orders[order_id]
+            qty, price = float(order['qty']), self.price(order['symbol'])
+            self._reserved -= self._reservations.pop(order_id, 0.0)
+            if self._random.random() < self.reject_rate:
+                order.update(status="rejected", updated_at=_iso(fill_at))
+                self.stats['rejected'] += 1
+                continue
+            position = self.positions.setdefault(order['symbol'], {'qty': 0.0, 'cost': 0.0})
+            if order['side'] == "buy":
+                self.cash -= qty * price
+                position['qty'] += qty
+                position['cost'] += qty * price
+            else:
+                self.cash += qty * price
+                position['cost'] -= position['cost'] * qty / position['qty'] if position['qty'] else 0.0
+                position['qty'] -= qty
+                if position['qty'] <= 0:
+                    del self.positions[order['symbol']]
+            order.update(status="filled", filled_qty=order['qty'], filled_avg_price=str(price),
+                         filled_at=_iso(fill_at), updated_at=_iso(fill_at))
+            self.stats['filled'] += 1
+
+    def _equity(self) -> float:
+        return self.cash + sum(p['qty'] * self.price(s) for s, p in self.positions.items())
+
+    def account(self) -> dict:
+        equity = self._equity()
+        return {
+            'id': "fake-account", 'account_number': "FAKE0001", 'status': "ACTIVE", 'currency': "USD",
+            'cash': f"{self.cash:.2f}", 'buying_power': f"{self.cash - self._reserved:.2f}",
+            'portfolio_value': f"{equity:.2f}", 'equity': f"{equity:.2f}",
+        }
+
+    def position_list(self) -> list[dict]:
+        positions = []
+        for symbol, position in sorted(self.positions.items()):
+            price = self.price(symbol)
+            market_value = position['qty'] * price
+            unrealized_pl = market_value - position['cost']
+            positions.append({
+                'symbol': symbol, 'qty': f"{position['qty']:g}", 'side': "long", 'asset_class': "us_equity",
+                'avg_entry_price': f"{position['cost'] / position['qty']:.4f}", 'current_price': f"{price:.2f}",
+                'market_value': f"{market_value:.2f}", 'unrealized_pl': f"{unrealized_pl:.2f}",
+                'unrealized_plpc': f"{unrealized_pl / position['cost'] if position['cost'] else 0.0:.6f}",
+            })
+        return positions
+
+    def submit(self, payload: dict) -> dict:
+        symbol, side = str(payload.get('symbol', "")).upper(), payload.get('side')
+        try:
+            qty = float(payload.get('qty'))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail="qty is required")
+        if not symbol or side not in ("buy", "sell") or qty <= 0:
+            raise HTTPException(status_code=422, detail="invalid order request")
+        client_order_id = payload.get('client_order_id') or uuid.uuid4().hex
+        if client_order_id in self.orders_by_client_id:
+            self.stats['duplicates'] += 1
+            raise HTTPException(status_code=422, detail="client_order_id must be unique")
+        if side == "buy" and qty * self.price(symbol) > self.cash - self._reserved:
+            raise HTTPException(status_code=403, detail="insufficient buying power")
+        if side == "sell" and qty > self.positions.get(symbol, {}).get('qty', 0.0):
+            raise HTTPException(status_code=403, detail="insufficient qty available for order")
+
+        now = time.time()
+        submitted_at = now - now % self.timestamp_resolution
+        order = {
+            'id': str(uuid.uuid4()), 'client_order_id': client_order_id, 'symbol': symbol, 'side': side,
+            'qty': payload.get('qty'), 'filled_qty': "0", 'filled_avg_price': None,
+            'type': payload.get('type', "market"), 'time_in_force': payload.get('time_in_force', "day"),
+            'status': "accepted", 'order_class': "", 'legs': None,
+            'created_at': _iso(submitted_at), 'submitted_at': _iso(submitted_at), 'updated_at': _iso(submitted_at),
+            'filled_at': None,
+        }
+        self.orders[order['id']] = order
+        self.orders_by_client_id[client_order_id] = order
+        if side == "buy":
+            self._reservations[order['id']] = qty * self.price(symbol)
+            self._reserved += self._reservations[order['id']]
+        heapq.heappush(self._pending_fills, (submitted_at + self.fill_delay, order['id']))
+        self.stats['orders'] += 1
+        return order
+
+    def list_orders(self, status: str, limit: int, direction: str, after: str | None, until: str | None) -> list[dict]:
+        after_ts, until_ts = _parse_ts(after), _parse_ts(until)
+        selected = []
+        for order in self.orders.values(): # Einfügereihenfolge = aufsteigend nach submitted_at
+            submitted_at = _parse_ts(order['submitted_at'])
+            if after_ts is not None and submitted_at <= after_ts:
+                continue
+            if until_ts is not None and submitted_at >= until_ts:
+                continue
+            is_closed = order['status'] in TERMINAL_STATUSES
+            if (status == "open" and is_closed) or (status == "closed" and not is_closed):
+                continue
+            selected.append(order)
+        if direction == "desc":
+            selected.reverse()
+        return selected[:min(limit, 500)]
+
+def create_app(broker: FakeBroker | None = None, rate_limit_per_minute: float = FAKE_BROKER_RATE_LIMIT_PER_MINUTE) -> FastAPI:
+    broker = broker or FakeBroker()
+    # Kapazität = Minutenkontingent; ausgeschöpft wird es mit der Minutenrate wieder aufgefüllt
+    quota = TokenBucket(rate_limit_per_minute / 60, rate_limit_per_minute)
+    app = FastAPI(title="Fake Alpaca Broker")
+    app.state.broker = broker
+
+    @app.middleware("http")
+    async def rate_limit(request: Request, call_next):
+        broker.stats['requests'] += 1
+        if not quota.try_acquire():
+            broker.stats['throttled'] += 1
+            return JSONResponse(status_code=429, content={"message": "too many requests."})
+        broker._advance()
+        return await call_next(request)
+
+    @app.exception_handler(HTTPException)
+    async def alpaca_error(request: Request, exc: HTTPException):
+        # Alpaca liefert Fehler als {"code": ..., "message": ...}
+        return JSONResponse(status_code=exc.status_code, content={"code": exc.status_code * 10000, "message": exc.detail})
+
+    @app.get("/v2/account")
+    async def get_account():
+        return broker.account()
+
+    @app.get("/v2/positions")
+    async def get_positions():
+        return broker.position_list()
+
+    @app.post("/v2/orders")
+    async def post_order(request: Request):
+        return broker.submit(await request.json())
+
+    @app.get("/v2/orders")
+    async def get_orders(status: str = "open", limit: int = 50, direction: str = "desc",
+                         after: str | None = None, until: str | None = None):
+        return broker.list_orders(status, limit, direction, after, until)
+
+    @app.get("/v2/orders:by_client_order_id")
+    async def get_order_by_client_order_id(client_order_id: str):
+        order = broker.orders_by_client_id.get(client_order_id)
+        if order is None:
+            raise HTTPException(status_code=404, detail="order not found")
+        return order
+
+    @app.get("/v2/orders/{order_id}")
+    async def get_order(order_id: str):
+        order = broker.orders.get(order_id)
+        if order is None:
+            raise HTTPException(status_code=404, detail="order not found")
+        return order
+
+    @app.put("/fake/prices")
+    async def put_prices(prices: dict[str, float]):
+        # Kurse setzen, z.B. passend zu den Daten, mit denen der Bot rechnet
+        broker.prices.update({symbol.upper(): price for symbol, price in prices.items()})
+        return broker.prices
+
+    @app.get("/fake/stats")
+    async def get_stats():
+        return {**broker.stats, 'open_orders': len(broker._pending_fills), 'positions': len(broker.positions)}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Startet den Fake-Broker (Alpaca Trading API v2) für lokale Tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--cash", type=float, default=FAKE_BROKER_CASH)
+    parser.add_argument("--rate-limit-per-minute", type=float, default=FAKE_BROKER_RATE_LIMIT_PER_MINUTE)
+    parser.add_argument("--fill-delay", type=float, default=FAKE_BROKER_FILL_DELAY_SECONDS)
+    parser.add_argument("--timestamp-resolution", type=float, default=1e-6, help="Sekunden; gröber erzeugt gleiche Zeitstempel")
+    parser.add_argument("--reject-rate", type=float, default=FAKE_BROKER_REJECT_RATE)
+    args = parser.parse_args()
+
+    import uvicorn
+    broker = FakeBroker(cash=args.cash, fill_delay=args.fill_delay, reject_rate=args.reject_rate,
+                        timestamp_resolution=args.timestamp_resolution)
+    uvicorn.run(create_app(broker, args.rate_limit_per_minute), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
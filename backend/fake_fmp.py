@@ -0,0 +1,124 @@
+import os
+import zlib
+import math
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from http_clients import TokenBucket
+from fake_broker import fake_price
+
+# Lokaler Ersatz für die von diesem Projekt genutzten Financial-Modeling-Prep-Endpunkte (Offline- und Lasttests
+# der Ingestion). Start als eigener Dienst: python fake_fmp.py --port 8020
+# (dann FMP_BASE_URL=http://localhost:8020/api/v3 und ein beliebiger FMP_API_KEY)
+# oder im Prozess über httpx.ASGITransport(app=create_app()).
+
+# Anfragen pro Minute, bevor mit 429 geantwortet wird
+FAKE_FMP_RATE_LIMIT_PER_MINUTE = float(os.getenv("FAKE_FMP_RATE_LIMIT_PER_MINUTE", "300"))
+FAKE_FMP_HISTORY_DAYS = int(os.getenv("FAKE_FMP_HISTORY_DAYS", "365")) # Länge der erzeugten Historien
+SOCIAL_SENTIMENT_PAGE_SIZE = 100 # Wie bei FMP: 100 stündliche Einträge pro Seite
+
+def _seed(symbol: str) -> int:
+    return zlib.crc32(symbol.upper().encode())
+
+def fake_sentiment(symbol: str, hour: datetime) -> float:
+    """Deterministischer Anteil positiver Beiträge (0.05 bis 0.95) je Symbol und Stunde."""
+    phase = _seed(symbol) % 1000 / 1000 * 2 * math.pi
+    return round(0.5 + 0.45 * math.sin(hour.timestamp() / 86400 / 7 + phase), 4)
+
+class FakeFMP:
+    """
+    Erzeugt reproduzierbare Daten: stündliches Social Sentiment (neueste zuerst, seitenweise) und
+    Tageskurse rund um fake_price(). 'now' ist fest, damit Seiten zwischen Anfragen stabil bleiben.
+    """
+
+    def __init__(self, history_days: int = FAKE_FMP_HISTORY_DAYS, now: datetime | None = None):
+        self.history_days = history_days
+        self.now = (now or datetime.now(timezone.utc)).replace(minute=0, second=0, microsecond=0)
+        self.stats = {'requests': 0, 'throttled': 0, 'sentiment_pages': 0, 'history': 0}
+
+    def social_sentiment(self, symbol: str, page: int) -> list[dict]:
+        total_hours = self.history_days * 24
+        first = page * SOCIAL_SENTIMENT_PAGE_SIZE
+        entries = []
+        for offset in range(first, min(first + SOCIAL_SENTIMENT_PAGE_SIZE, total_hours)):
+            hour = self.now - timedelta(hours=offset)
+            posts = 5 + (_seed(symbol) + offset) % 40
+            sentiment = fake_sentiment(symbol, hour)
+            entries.append({
+                'date': hour.strftime("%Y-%m-%d %H:%M:%S"), 'symbol': symbol.upper(),
+                'stocktwitsPosts': posts, 'twitterPosts': posts // 2, 'stocktwitsComments': posts * 3,
+                'twitterComments': posts, 'stocktwitsLikes': posts * 2, 'twitterLikes': posts * 4,
+                'stocktwitsImpressions': posts * 150, 'twitterImpressions': posts * 300,
+                'stocktwitsSentiment': sentiment, 'twitterSentiment': round(min(1.0, sentiment * 1.05), 4),
+            })
+        self.stats['sentiment_pages'] += 1
+        return entries
+
+    def historical_price_full(self, symbol: str, from_date: str | None, to_date: str | None) -> dict:
+        base = fake_price(symbol)
+        end = datetime.fromisoformat(to_date).date() if to_date else self.now.date()
+        start = datetime.fromisoformat(from_date).date() if from_date else end - timedelta(days=self.history_days)
+        historical = []
+        day = end
+        while day >= start:
+            if day.weekday() < 5:
+                close = round(base * (1 + 0.1 * math.sin(day.toordinal() / 20 + _seed(symbol) % 7)), 2)
+                historical.append({'date': day.isoformat(), 'open': close, 'high': round(close * 1.01, 2),
+                                   'low': round(close * 0.99, 2), 'close': close, 'adjClose': close,
+                                   'volume': 1000000.0, 'unadjustedVolume': 1000000.0, 'change': 0.0,
+                                   'changePercent': 0.0, 'vwap': close, 'label': day.strftime("%B %d, %y"),
+                                   'changeOverTime': 0.0})
+            day -= timedelta(days=1)
+        self.stats['history'] += 1
+        return {'symbol': symbol.upper(), 'historical': historical}
+
+def create_app(fmp: FakeFMP | None = None, rate_limit_per_minute: float = FAKE_FMP_RATE_LIMIT_PER_MINUTE) -> FastAPI:
+    fmp = fmp or FakeFMP()
+    # Kapazität = Minutenkontingent; ausgeschöpft wird es mit der Minutenrate wieder aufgefüllt
+    quota = TokenBucket(rate_limit_per_minute / 60, rate_limit_per_minute)
+    app = FastAPI(title="Fake Financial Modeling Prep")
+    app.state.fmp = fmp
+
+    @app.middleware("http")
+    async def rate_limit(request: Request, call_next):
+        fmp.stats['requests'] += 1
+        if not request.url.path.startswith("/api/"):
+            return await call_next(request)
+        if not request.query_params.get("apikey"):
+            return JSONResponse(status_code=401, content={"Error Message": "Invalid API KEY."})
+        if not quota.try_acquire():
+            fmp.stats['throttled'] += 1
+            return JSONResponse(status_code=429, content={"Error Message": "Limit Reach. Please upgrade your plan."})
+        return await call_next(request)
+
+    @app.get("/api/v4/historical/social-sentiment")
+    async def get_social_sentiment(symbol: str, page: int = 0):
+        return fmp.social_sentiment(symbol, page)
+
+    @app.get("/api/v3/historical-price-full/{symbol}")
+    async def get_historical_price_full(symbol: str, request: Request):
+        # 'from' ist kein gültiger Parametername in Python, daher direkt aus der Query
+        return fmp.historical_price_full(symbol, request.query_params.get("from"), request.query_params.get("to"))
+
+    @app.get("/fake/stats")
+    async def get_stats():
+        return fmp.stats
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Startet einen Fake-FMP-Server (Social Sentiment, Kurshistorie) für lokale Tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8020)
+    parser.add_argument("--rate-limit-per-minute", type=float, default=FAKE_FMP_RATE_LIMIT_PER_MINUTE)
+    parser.add_argument("--history-days", type=int, default=FAKE_FMP_HISTORY_DAYS)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(FakeFMP(args.history_days), args.rate_limit_per_minute), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
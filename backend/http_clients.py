@@ -0,0 +1,318 @@
+import os
+import time
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Konfiguration des gemeinsamen HTTP-Clients
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "15"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_MAX_CONCURRENCY_PER_HOST = int(os.getenv("HTTP_MAX_CONCURRENCY_PER_HOST", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE_SECONDS = float(os.getenv("HTTP_BACKOFF_BASE_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "10"))
+# Längste Retry-After-Wartezeit nach 429, die noch abgewartet wird; bei längerer Sperre wird die 429-Antwort zurückgegeben
+HTTP_RETRY_AFTER_MAX_SECONDS = float(os.getenv("HTTP_RETRY_AFTER_MAX_SECONDS", "60"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+class UpstreamAPIError(Exception):
+    """Fehler einer externen API (Alpaca, FMP, yfinance-Service) mit HTTP-Status und lesbarer Meldung."""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+class AsyncHTTPClient:
+    """
+    Gemeinsamer asynchroner HTTP-Client mit Keep-Alive-Connection-Pool, Begrenzung gleichzeitiger
+    Anfragen pro Host, Timeouts und Wiederholung mit exponentiellem Backoff (bei 429/5xx und Netzwerkfehlern).
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT_SECONDS, max_connections: int = HTTP_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                 max_concurrency_per_host: int = HTTP_MAX_CONCURRENCY_PER_HOST, max_retries: int = HTTP_MAX_RETRIES,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        self.timeout = httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.max_retries = max_retries
+        self.transport = transport # z.B. httpx.ASGITransport, um eine App (Fake-Broker) ohne Netzwerk anzusprechen
+        self._client = None
+        self._host_semaphores = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Lazy erzeugen, damit der Client im laufenden Event-Loop entsteht
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_concurrency_per_host)
+        return self._host_semaphores[host]
+
+    async def request(self, method: str, url: str, retry: bool | None = None, rate_limiter: "TokenBucket | None" = None,
+                      **kwargs) -> httpx.Response:
+        """
+        Führt eine Anfrage aus und gibt die Antwort zurück (auch bei 4xx/5xx nach ausgeschöpften Wiederholungen).
+        retry: Standardmäßig werden nur idempotente Methoden wiederholt.
+        rate_limiter: Jeder Versuch (auch jede Wiederholung) nimmt ein Token; nach 429 wird der Bucket für die
+        Retry-After-Dauer gesperrt, damit auch parallele Aufrufer das Kontingent nicht weiter überziehen.
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = self.max_retries + 1 if retry else 1
+
+        for attempt in range(attempts):
+            is_last_attempt = attempt == attempts - 1
+            if rate_limiter:
+                await rate_limiter.acquire()
+            try:
+                async with self._host_semaphore(url):
+                    response = await self._get_client().request(method, url, **kwargs)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                if is_last_attempt:
+                    raise UpstreamAPIError(504 if isinstance(e, httpx.TimeoutException) else 502,
+                                           f"Keine Antwort von {urlsplit(url).netloc}: {e.__class__.__name__}")
+                await asyncio.sleep(self._backoff_seconds(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and not is_last_attempt:
+                retry_after = self._retry_after_seconds(response)
+                if response.status_code == 429:
+                    # Kontingent erschöpft: nicht vor Ablauf von Retry-After erneut senden
+                    wait_seconds = retry_after if retry_after is not None else self._backoff_seconds(attempt)
+                    if wait_seconds > HTTP_RETRY_AFTER_MAX_SECONDS:
+                        return response
+                    if rate_limiter:
+                        rate_limiter.block_for(wait_seconds) # acquire() im nächsten Versuch wartet mit
+                    else:
+                        await asyncio.sleep(wait_seconds)
+                    continue
+                await asyncio.sleep(min(HTTP_BACKOFF_MAX_SECONDS, retry_after) if retry_after is not None
+                                    else self._backoff_seconds(attempt))
+                continue
+            return response
+
+    async def get_json(self, url: str, rate_limiter: "TokenBucket | None" = None, **kwargs):
+        """GET mit JSON-Antwort; wirft UpstreamAPIError bei 4xx/5xx."""
+        response = await self.request("GET", url, rate_limiter=rate_limiter, **kwargs)
+        raise_for_upstream_status(response)
+        return response.json()
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """
+        Streaming-Anfrage: liefert die Antwort, deren Body schrittweise gelesen wird (aiter_lines/aiter_bytes).
+        Ohne Wiederholung, da ein teilweise gelesener Body nicht transparent neu gestartet werden kann.
+        Wirft UpstreamAPIError bei 4xx/5xx sowie bei Timeouts und Netzwerkfehlern (auch während des Lesens).
+        """
+        try:
+            async with self._host_semaphore(url):
+                async with self._get_client().stream(method.upper(), url, **kwargs) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        raise_for_upstream_status(response)
+                    yield response
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            raise UpstreamAPIError(504 if isinstance(e, httpx.TimeoutException) else 502,
+                                   f"Keine Antwort von {urlsplit(url).netloc}: {e.__class__.__name__}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _backoff_seconds(attempt: int) -> float:
+        # Exponentieller Backoff mit Jitter
+        return min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_BASE_SECONDS * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _retry_after_seconds(response: httpx.Response) -> float | None:
+        """Retry-After-Header in Sekunden (Zahl oder HTTP-Datum), None ohne gültigen Header."""
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                return None
+
+def raise_for_upstream_status(response: httpx.Response):
+    """Wandelt 4xx/5xx-Antworten in UpstreamAPIError mit der Fehlermeldung der API um."""
+    if response.status_code < 400:
+        return
+    message = f"HTTP {response.status_code} von {response.request.url.host}"
+    try:
+        body = response.json()
+        if isinstance(body, dict):
+            # Alpaca: {"message": ...}, FMP: {"Error Message": ...}, FastAPI: {"detail": ...}
+            message = body.get("message") or body.get("Error Message") or body.get("detail") or message
+    except ValueError:
+        message = response.text[:200] or message
+    raise UpstreamAPIError(response.status_code, str(message))
+
+# Prozessweit geteilter Client (ein Connection-Pool für alle Upstreams)
+HTTP_CLIENT = AsyncHTTPClient()
+
+class TokenBucket:
+    """
+    Ratenbegrenzung nach dem Token-Bucket-Verfahren: 'rate' Tokens pro Sekunde, höchstens 'capacity' auf Vorrat.
+    Wartende Aufrufer werden in Ankunftsreihenfolge bedient.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0 # Nach 429: vor diesem Zeitpunkt (monotonic) werden keine Tokens vergeben
+        self._lock = None
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        # Während einer Sperre sammeln sich keine Tokens an; danach beginnt der Vorrat wieder bei null
+        self._tokens = min(self.capacity, self._tokens + max(0.0, now - max(self._updated, self._blocked_until)) * self.rate)
+        self._updated = now
+
+    def block_for(self, seconds: float):
+        """Sperrt den Bucket (z.B. für die Retry-After-Dauer einer 429-Antwort) und leert den Vorrat."""
+        self._refill()
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Nimmt Tokens ohne zu warten; False, wenn nicht genug vorhanden sind."""
+        self._refill()
+        if time.monotonic() < self._blocked_until:
+            return False
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """Wartet, bis genug Tokens vorhanden sind, und nimmt sie."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                wait_seconds = max((tokens - self._tokens) / self.rate, self._blocked_until - time.monotonic())
+                self.waited_seconds += wait_seconds
+                await asyncio.sleep(wait_seconds)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+class AlpacaClient:
+    """Schlanker asynchroner Client für die Alpaca Trading REST API (v2) auf Basis von HTTP_CLIENT."""
+
+    def __init__(self, key_id: str, secret_key: str, base_url: str, http_client: AsyncHTTPClient = HTTP_CLIENT,
+                 rate_limiter: TokenBucket | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"APCA-API-KEY-ID": key_id, "APCA-API-SECRET-KEY": secret_key}
+        self.http = http_client
+        # Alpaca begrenzt die Anfragen pro Konto und Minute; alle Aufrufe teilen sich dieses Budget
+        self.rate_limiter = rate_limiter
+
+    async def _get(self, path: str, params: dict | None = None):
+        return await self.http.get_json(f"{self.base_url}/v2{path}", params=params, headers=self.headers,
+                                        rate_limiter=self.rate_limiter)
+
+    async def get_account(self) -> dict:
+        return await self._get("/account")
+
+    async def list_positions(self) -> list[dict]:
+        return await self._get("/positions")
+
+    async def list_orders(self, status: str = "open", limit: int = 50, direction: str = "desc",
+                          after: str | None = None, until: str | None = None, nested: bool | None = None) -> list[dict]:
+        params = {"status": status, "limit": limit, "direction": direction}
+        if after: params["after"] = after
+        if until: params["until"] = until
+        if nested is not None: params["nested"] = str(nested).lower()
+        return await self._get("/orders", params=params)
+
+    async def get_order(self, order_id: str) -> dict:
+        return await self._get(f"/orders/{order_id}")
+
+    async def get_order_by_client_order_id(self, client_order_id: str) -> dict:
+        return await self._get("/orders:by_client_order_id", params={"client_order_id": client_order_id})
+
+    async def submit_order(self, symbol: str, qty: float, side: str, type: str = "market",
+                           time_in_force: str = "day", client_order_id: str | None = None, **extra) -> dict:
+        payload = {"symbol": symbol, "qty": str(qty), "side": side, "type": type, "time_in_force": time_in_force, **extra}
+        if client_order_id:
+            payload["client_order_id"] = client_order_id
+        # Nur mit client_order_id ist eine Wiederholung idempotent
+        response = await self.http.request("POST", f"{self.base_url}/v2/orders", json=payload, headers=self.headers,
+                                           retry=bool(client_order_id), rate_limiter=self.rate_limiter)
+        raise_for_upstream_status(response)
+        return response.json()
+
+class FMPClient:
+    """Asynchroner Client für Financial Modeling Prep auf Basis von HTTP_CLIENT."""
+
+    BASE_URL = "https://financialmodelingprep.com/api/v3"
+
+    def __init__(self, api_key: str, http_client: AsyncHTTPClient = HTTP_CLIENT, base_url: str | None = None,
+                 rate_limiter: TokenBucket | None = None):
+        self.api_key = api_key
+        self.http = http_client
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        # Einige Endpunkte (z.B. Social Sentiment) gibt es nur unter /api/v4
+        self.v4_base_url = self.base_url.rsplit("/", 1)[0] + "/v4"
+        # FMP begrenzt die Anfragen pro API-Key und Minute; alle Aufrufe teilen sich dieses Budget
+        self.rate_limiter = rate_limiter
+
+    async def _get(self, url: str, params: dict):
+        return await self.http.get_json(url, params={**params, "apikey": self.api_key}, rate_limiter=self.rate_limiter)
+
+    async def get_historical_price_full(self, symbol: str, from_date: str | None = None, to_date: str | None = None) -> dict:
+        params = {}
+        if from_date: params["from"] = from_date
+        if to_date: params["to"] = to_date
+        return await self._get(f"{self.base_url}/historical-price-full/{symbol.upper()}", params)
+
+    async def get_social_sentiment(self, symbol: str, page: int = 0) -> list[dict]:
+        """Stündliche Social-Sentiment-Werte (StockTwits/Twitter) eines Symbols, neueste zuerst, seitenweise."""
+        return await self._get(f"{self.v4_base_url}/historical/social-sentiment", {"symbol": symbol.upper(), "page": page})
+
+# Clients aus der Umgebung (None, wenn die Zugangsdaten fehlen)
+ALPACA_API_KEY_ID = os.getenv("ALPACA_API_KEY_ID")
+ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
+ALPACA_BASE_URL = os.getenv("ALPACA_BASE_URL", "https://paper-api.alpaca.markets") # Standard auf Paper Trading
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+FMP_BASE_URL = os.getenv("FMP_BASE_URL", FMPClient.BASE_URL) # z.B. http://localhost:8020/api/v3 für fake_fmp.py
+# Anfragen pro Minute laut FMP-Tarif (Starter: 300)
+FMP_RATE_LIMIT_PER_MINUTE = float(os.getenv("FMP_RATE_LIMIT_PER_MINUTE", "300"))
+FMP_RATE_LIMIT_BURST = float(os.getenv("FMP_RATE_LIMIT_BURST", "10"))
+# Alpaca erlaubt 200 Anfragen pro Minute; Rate + Vorrat zusammen bleiben standardmäßig innerhalb dieses Budgets
+ALPACA_RATE_LIMIT_PER_MINUTE = float(os.getenv("ALPACA_RATE_LIMIT_PER_MINUTE", "190"))
+ALPACA_RATE_LIMIT_BURST = float(os.getenv("ALPACA_RATE_LIMIT_BURST", "10"))
+
+alpaca_rate_limiter = TokenBucket(ALPACA_RATE_LIMIT_PER_MINUTE / 60, ALPACA_RATE_LIMIT_BURST)
+alpaca_client = AlpacaClient(ALPACA_API_KEY_ID, ALPACA_SECRET_KEY, ALPACA_BASE_URL, rate_limiter=alpaca_rate_limiter) if ALPACA_API_KEY_ID and ALPACA_SECRET_KEY else None
+fmp_rate_limiter = TokenBucket(FMP_RATE_LIMIT_PER_MINUTE / 60, FMP_RATE_LIMIT_BURST)
+fmp_client = FMPClient(FMP_API_KEY, base_url=FMP_BASE_URL, rate_limiter=fmp_rate_limiter) if FMP_API_KEY else None
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import builtins
+import argparse
+import threading
+
+# Misst die Importzeit pro Modul, solange der Prozess startet. Gemessen wird über builtins.__import__: jede
+# import-Anweisung für ein noch nicht geladenes Modul. Die Eigenzeit eines Moduls ist seine Importzeit ohne die
+# darin ausgelösten (gemessenen) Importe; relative Importe und importlib.import_module zählen zum Modul, das sie auslöst.
+# Mit dem Ende der Startphase (mark_ready) wird der Hook wieder entfernt; später nachgeladene Pakete (z.B. torch beim
+# ersten Modellzugriff) ermittelt der Bericht ohne Zeitmessung aus dem Vergleich von sys.modules.
+# Aktiv, sobald main.py startet (IMPORT_PROFILE=false schaltet es ab); Bericht unter /api/v1/startup-report
+# oder ohne Server: python import_profile.py main
+
+IMPORT_PROFILE_ENABLED = os.getenv("IMPORT_PROFILE", "true").lower() in ("1", "true", "yes")
+IMPORT_REPORT_TOP = int(os.getenv("IMPORT_REPORT_TOP", "12")) # Anzahl Module im Startbericht
+
+# Module, deren Ladezustand der Bericht ausweist (ML-Stack und Datenanalyse)
+TRACKED_MODULES = ("torch", "sklearn", "joblib", "pandas", "numpy", "ml_utils", "backtest")
+
+class ImportProfiler:
+    """
+    Erfasst die Eigenzeit aller Importe zwischen install() und mark_ready().
+    mark_ready() beendet die Startphase und entfernt den Hook; danach geladene Pakete erscheinen im Bericht als nachgeladen.
+    """
+
+    def __init__(self):
+        self._original_import = None
+        self._installed = False
+        self._local = threading.local() # Pro Thread: Stapel der Kindzeiten der laufenden Importe
+        self._lock = threading.Lock()
+        self.installed_at = None
+        self.ready_at = None
+        self.self_seconds = {} # {Modul: Eigenzeit}
+        self._startup_modules = None # sys.modules zum Ende der Startphase
+
+    def install(self):
+        if self._installed:
+            return
+        self.installed_at = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+        self._installed = True
+
+    def uninstall(self):
+        # _original_import bleibt gesetzt: Importe, die in anderen Threads noch im Hook laufen, brauchen es weiterhin
+        if self._installed and builtins.__import__ == self._import:
+            builtins.__import__ = self._original_import
+        self._installed = False
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            child_seconds = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self.self_seconds[name] = self.self_seconds.get(name, 0.0) + elapsed - child_seconds
+
+    def mark_ready(self):
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter()
+            self.uninstall()
+            self._startup_modules = set(sys.modules)
+
+    def lazy_imports(self) -> list[dict]:
+        """Nach der Startphase geladene Pakete mit der Anzahl ihrer Module (aus sys.modules, ohne Zeitmessung)."""
+        if self._startup_modules is None:
+            return []
+        packages = {}
+        for name in set(sys.modules) - self._startup_modules:
+            package = name.split(".", 1)[0]
+            packages[package] = packages.get(package, 0) + 1
+        return [{'package': p, 'modules': n} for p, n in sorted(packages.items(), key=lambda item: item[1], reverse=True)]
+
+    def by_package(self) -> dict:
+        """Eigenzeiten, zusammengefasst nach Top-Level-Paket (z.B. alle pandas.*-Module unter 'pandas')."""
+        packages = {}
+        with self._lock:
+            for name, seconds in self.self_seconds.items():
+                package = name.split(".", 1)[0]
+                packages[package] = packages.get(package, 0.0) + seconds
+        return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+    def report(self, top: int = IMPORT_REPORT_TOP) -> dict:
+        packages = self.by_package()
+        import_seconds = sum(packages.values())
+        return {
+            'enabled': self.installed_at is not None,
+            'startup_seconds': round(self.ready_at - self.installed_at, 3) if self.ready_at and self.installed_at else None,
+            'import_seconds': round(import_seconds, 3),
+            'top_packages': [{'package': p, 'seconds': round(s, 4), 'share': round(s / import_seconds, 3) if import_seconds else 0.0}
+                             for p, s in list(packages.items())[:top]],
+            'loaded': {name: name in sys.modules for name in TRACKED_MODULES},
+            'lazy_imports': self.lazy_imports(),
+        }
+
+    def print_startup_report(self, top: int = IMPORT_REPORT_TOP):
+        report = self.report(top)
+        breakdown = ", ".join(f"{p['package']} {p['seconds']:.2f}s" for p in report['top_packages'])
+        not_loaded = [name for name, loaded in report['loaded'].items() if not loaded]
+        print(f"INFO: Start nach {report['startup_seconds']}s, davon Importe {report['import_seconds']:.2f}s: {breakdown}")
+        if not_loaded:
+            print(f"INFO: Nicht geladen (wird bei Bedarf nachgeladen): {', '.join(not_loaded)}")
+
+IMPORT_PROFILER = ImportProfiler()
+
+def main():
+    parser = argparse.ArgumentParser(description="Importiert Module und zeigt die Importzeit pro Paket.")
+    parser.add_argument("modules", nargs="+", help="Zu importierende Module, z.B. main")
+    parser.add_argument("--top", type=int, default=IMPORT_REPORT_TOP)
+    args = parser.parse_args()
+
+    IMPORT_PROFILER.install()
+    for module in args.modules:
+        builtins.__import__(module) # Über den Hook, damit das Modul selbst mitgemessen wird
+    IMPORT_PROFILER.mark_ready()
+    IMPORT_PROFILER.print_startup_report(args.top)
+    for package in IMPORT_PROFILER.report(args.top)['top_packages']:
+        print(f"{package['package']:<24} {package['seconds']:>8.3f}s {package['share'] * 100:>6.1f}%")
+
+if __name__ == "__main__":
+    main()
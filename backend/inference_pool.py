@@ -0,0 +1,161 @@
+import os
+import time
+import zlib
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Anzahl Inferenz-Prozesse (0 = Vorhersagen im Thread-Pool des Backend-Prozesses)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# Torch-Threads pro Inferenz-Prozess; Worker x Threads sollte die Anzahl der Kerne nicht übersteigen
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", "1"))
+
+# --- Funktionen, die in den Worker-Prozessen laufen ---
+
+def _init_worker(torch_threads: int):
+    import torch
+    torch.set_num_threads(max(1, torch_threads))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass # Bereits gesetzt
+
+def _worker_predict(sequences_by_ticker: dict, device_str: str) -> dict:
+    """Lädt die Modelle über die Registry des Workers und sagt alle Sequenzen gebündelt vorher."""
+    from ml_utils import load_model_components_for_ticker, predict_batch_for_tickers
+    components_by_ticker = {}
+    for ticker in sequences_by_ticker:
+        model_components = load_model_components_for_ticker(ticker.upper(), device_str)
+        if model_components:
+            components_by_ticker[ticker] = model_components
+    predictions = predict_batch_for_tickers(components_by_ticker, sequences_by_ticker)
+    return {ticker: (prediction, components_by_ticker[ticker]['config']) for ticker, prediction in predictions.items()}
+
+def _worker_warm_up(tickers: list[str], device_str: str) -> dict:
+    from model_registry import MODEL_REGISTRY
+    return MODEL_REGISTRY.warm_up([t.upper() for t in tickers], device_str, max_workers=1)
+
+class InferencePool:
+    """
+    Pool von Inferenz-Prozessen, damit Torch-Forward-Passes den Event-Loop des Backends nicht blockieren.
+    - Jeder Ticker wird fest einem Worker zugeordnet (CRC32 des Symbols), sodass jedes Modell nur in
+      einem Prozess im Speicher liegt; dort übernimmt die ModelRegistry Caching und Hot Reload.
+    - Stürzt ein Worker ab, wird er neu gestartet und die Anfrage einmal wiederholt.
+    - get_stats() liefert u.a. die Anzahl offener Anfragen (Queue-Tiefe) pro Worker.
+    """
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, torch_threads: int = INFERENCE_WORKER_THREADS):
+        self.workers = max(0, workers)
+        self.torch_threads = torch_threads
+        self._executors = [None] * self.workers
+        self._pending = [0] * self.workers
+        self._worker_restarts = [0] * self.workers
+        self.stats = {'requests': 0, 'completed': 0, 'failed': 0, 'restarts': 0, 'busy_seconds': 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def worker_for(self, ticker: str) -> int:
+        # zlib.crc32 ist (anders als hash()) über Prozesse und Neustarts hinweg stabil
+        return zlib.crc32(ticker.upper().encode()) % self.workers
+
+    def _executor(self, index: int) -> ProcessPoolExecutor:
+        if self._executors[index] is None:
+            # "spawn", damit die Worker keine Threads, Sockets oder DB-Verbindungen des Backends erben
+            self._executors[index] = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(self.torch_threads,),
+            )
+        return self._executors[index]
+
+    def _restart(self, index: int, executor: ProcessPoolExecutor):
+        if self._executors[index] is not executor:
+            return # Bereits von einer anderen Anfrage neu gestartet
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executors[index] = None
+        self._worker_restarts[index] += 1
+        self.stats['restarts'] += 1
+        print(f"WARNUNG: Inferenz-Worker {index} ist abgestürzt und wird neu gestartet.")
+
+    async def _submit(self, index: int, fn, *args):
+        for attempt in range(2):
+            executor = self._executor(index)
+            self._pending[index] += 1
+            started = time.perf_counter()
+            try:
+                return await asyncio.wrap_future(executor.submit(fn, *args))
+            except BrokenProcessPool:
+                self._restart(index, executor)
+                if attempt == 1:
+                    raise
+            finally:
+                self._pending[index] -= 1
+                self.stats['busy_seconds'] += time.perf_counter() - started
+
+    async def predict(self, sequences_by_ticker: dict, device_str: str = "cpu") -> tuple[dict, dict]:
+        """
+        Verteilt die Sequenzen auf die Worker und wartet asynchron auf die Ergebnisse.
+        Gibt (predictions {ticker: np.ndarray}, configs {ticker: Modellkonfiguration}) zurück;
+        Ticker ohne Modell oder mit Fehlern fehlen im Ergebnis.
+        """
+        by_worker = {}
+        for ticker, sequence in sequences_by_ticker.items():
+            by_worker.setdefault(self.worker_for(ticker), {})[ticker] = sequence
+
+        self.stats['requests'] += 1
+        results = await asyncio.gather(
+            *(self._submit(index, _worker_predict, batch, device_str) for index, batch in by_worker.items()),
+            return_exceptions=True,
+        )
+        predictions, configs = {}, {}
+        for (index, batch), result in zip(by_worker.items(), results):
+            if isinstance(result, BaseException):
+                self.stats['failed'] += 1
+                print(f"FEHLER im Inferenz-Worker {index} für {list(batch)}: {result!r}")
+                continue
+            for ticker, (prediction, config) in result.items():
+                predictions[ticker] = prediction
+                configs[ticker] = config
+        self.stats['completed'] += 1
+        return predictions, configs
+
+    async def warm_up(self, tickers: list[str], device_str: str = "cpu") -> dict:
+        """Startet alle Worker und lädt die Modelle der Ticker in den jeweils zuständigen Worker vor."""
+        by_worker = {index: [] for index in range(self.workers)}
+        for ticker in tickers:
+            by_worker[self.worker_for(ticker)].append(ticker)
+        results = await asyncio.gather(
+            *(self._submit(index, _worker_warm_up, batch, device_str) for index, batch in by_worker.items()),
+            return_exceptions=True,
+        )
+        loaded = {}
+        for index, result in zip(by_worker, results):
+            if isinstance(result, BaseException):
+                print(f"FEHLER beim Vorladen im Inferenz-Worker {index}: {result!r}")
+            else:
+                loaded.update(result)
+        print(f"INFO: Inferenz-Pool mit {self.workers} Workern bereit, {sum(loaded.values())}/{len(tickers)} Modelle vorgeladen.")
+        return loaded
+
+    def get_stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'torch_threads_per_worker': self.torch_threads,
+            'queue_depth': sum(self._pending),
+            'per_worker': [
+                {'worker': i, 'running': self._executors[i] is not None, 'pending': self._pending[i], 'restarts': self._worker_restarts[i]}
+                for i in range(self.workers)
+            ],
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+        }
+
+    def shutdown(self):
+        for index, executor in enumerate(self._executors):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executors[index] = None
+
+# Prozessweiter Pool (wird beim ersten Aufruf gestartet)
+INFERENCE_POOL = InferencePool()
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timezone
+
+from response_cache import REDIS_URL
+from bot_control import BOT_COORDINATION
+
+# Ingestion-Läufe (Sentiment, Kurs-Backfill), die über die API gestartet werden, laufen als Hintergrund-Tasks
+# des Workers, der die Anfrage annimmt: der Endpunkt antwortet sofort mit einer Job-ID, Status und Ergebnis liefert
+# GET /api/v1/ingest/jobs/{job_id}. Der Job-Status liegt in Redis (mit TTL), damit jeder Worker ihn beantworten
+# kann, egal welcher den Job ausführt. Der ausführende Worker schreibt regelmäßig einen Herzschlag; bleibt er aus
+# (Worker abgestürzt), wird ein laufender Job als 'lost' gemeldet.
+# BOT_COORDINATION=local: Status nur im Speicher (ein Prozess, ohne Redis).
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "50")) # Jobs, die die Liste zeigt
+INGEST_JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", "86400")) # Aufbewahrung in Redis
+INGEST_JOB_HEARTBEAT_SECONDS = float(os.getenv("INGEST_JOB_HEARTBEAT_SECONDS", "10"))
+INGEST_JOB_KEY_PREFIX = "dbot:ingest:"
+
+class IngestJobRegistry:
+    """Startet Ingestion-Läufe als asyncio-Tasks und hält ihren Status (running, finished, failed, cancelled, lost)."""
+
+    def __init__(self, redis_url: str = REDIS_URL, mode: str = BOT_COORDINATION, history: int = INGEST_JOB_HISTORY,
+                 ttl: int = INGEST_JOB_TTL_SECONDS, heartbeat_seconds: float = INGEST_JOB_HEARTBEAT_SECONDS):
+        self.redis_url = redis_url
+        self.mode = mode
+        self.history = history
+        self.ttl = ttl
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs = {} # BOT_COORDINATION=local: {Job-ID: Status}, in Startreihenfolge
+        self._tasks = {} # {Job-ID: asyncio.Task} der in diesem Worker laufenden Jobs
+        self._redis = None
+
+    def _get_redis(self):
+        if self._redis is None:
+            import redis.asyncio as redis_asyncio
+            self._redis = redis_asyncio.from_url(self.redis_url, socket_timeout=1.0, socket_connect_timeout=1.0, decode_responses=True)
+        return self._redis
+
+    async def _save(self, job: dict):
+        if self.mode == "local":
+            self.jobs[job['job_id']] = job
+            self._prune()
+            return
+        now = time.time()
+        async with self._get_redis().pipeline(transaction=True) as pipe:
+            pipe.set(INGEST_JOB_KEY_PREFIX + "job:" + job['job_id'], json.dumps(job, default=str), ex=self.ttl)
+            pipe.zadd(INGEST_JOB_KEY_PREFIX + "jobs", {job['job_id']: job['started_ts']})
+            pipe.zremrangebyscore(INGEST_JOB_KEY_PREFIX + "jobs", 0, now - self.ttl)
+            pipe.zremrangebyrank(INGEST_JOB_KEY_PREFIX + "jobs", 0, -self.history - 1)
+            await pipe.execute()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] != 'running']
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def start(self, kind: str, coro, params: dict | None = None) -> dict:
+        """
+        Startet coro (z.B. sentiment_ingestion.ingest_sentiments(...)) im Hintergrund und gibt den Job-Status zurück.
+        Ist der Status nicht speicherbar (Redis nicht erreichbar), wird der Job nicht gestartet und der Fehler weitergereicht.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            'job_id': job_id, 'kind': kind, 'status': 'running', 'params': params or {},
+            'worker': self.worker_id, 'started_at': datetime.now(timezone.utc).isoformat(), 'started_ts': now,
+            'heartbeat_ts': now, 'finished_at': None, 'seconds': None, 'result': None, 'error': None,
+        }
+        try:
+            await self._save(job)
+        except Exception:
+            coro.close()
+            raise
+        self._tasks[job_id] = asyncio.create_task(self._run(job, coro))
+        print(f"INFO: Ingestion-Job {kind} gestartet ({job_id}).")
+        return job
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            job['heartbeat_ts'] = time.time()
+            try:
+                await self._save(job)
+            except Exception as e:
+                print(f"WARNUNG: Status des Ingestion-Jobs {job['job_id']} nicht speicherbar: {e}")
+
+    async def _run(self, job: dict, coro):
+        started = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            job['result'] = await coro
+            job['status'] = 'finished'
+        except asyncio.CancelledError:
+            job['status'] = 'cancelled'
+            raise
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            print(f"FEHLER im Ingestion-Job {job['kind']} ({job['job_id']}): {e}")
+        finally:
+            heartbeat.cancel()
+            job['finished_at'] = datetime.now(timezone.utc).isoformat()
+            job['seconds'] = round(time.perf_counter() - started, 3)
+            self._tasks.pop(job['job_id'], None)
+            try:
+                await self._save(job)
+            except Exception as e:
+                print(f"WARNUNG: Ergebnis des Ingestion-Jobs {job['job_id']} nicht speicherbar: {e}")
+
+    def _check_alive(self, job: dict) -> dict:
+        """Laufende Jobs ohne Herzschlag seit drei Intervallen gelten als verloren (Worker beendet oder abgestürzt)."""
+        if job['status'] == 'running' and time.time() - job['heartbeat_ts'] > 3 * self.heartbeat_seconds:
+            job = {**job, 'status': 'lost', 'error': f"Worker {job['worker']} meldet den Job nicht mehr."}
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        if self.mode == "local":
+            job = self.jobs.get(job_id)
+        else:
+            raw = await self._get_redis().get(INGEST_JOB_KEY_PREFIX + "job:" + job_id)
+            job = json.loads(raw) if raw else None
+        return self._check_alive(job) if job else None
+
+    async def list(self, kind: str | None = None) -> list[dict]:
+        """Die letzten history Jobs ohne Ergebnis (neueste zuerst); das Ergebnis liefert get()."""
+        if self.mode == "local":
+            jobs = list(reversed(self.jobs.values()))
+        else:
+            redis = self._get_redis()
+            job_ids = await redis.zrevrange(INGEST_JOB_KEY_PREFIX + "jobs", 0, self.history - 1)
+            raw_jobs = await redis.mget([INGEST_JOB_KEY_PREFIX + "job:" + job_id for job_id in job_ids]) if job_ids else []
+            jobs = [json.loads(raw) for raw in raw_jobs if raw]
+        return [{k: v for k, v in self._check_alive(job).items() if k != 'result'}
+                for job in jobs if kind is None or job['kind'] == kind]
+
+    async def shutdown(self):
+        """Bricht laufende Jobs ab (beim Herunterfahren des Workers; ihr Status wird 'cancelled')."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+INGEST_JOBS = IngestJobRegistry()
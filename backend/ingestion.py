@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import pandas as pd
+from dotenv import load_dotenv
+
+import crud, async_crud
+from database import AsyncSessionLocal
+from http_clients import HTTP_CLIENT, FMPClient, FMP_BASE_URL, fmp_rate_limiter
+
+load_dotenv()
+
+# Basis-URL des yfinance-Service (im Docker-Netzwerk über den Service-Namen erreichbar)
+YFINANCE_SERVICE_URL = os.getenv("YFINANCE_SERVICE_URL", "http://yfinance_service:8001")
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+FETCH_TIMEOUT_SECONDS = 60 # Lange Historien brauchen im yfinance-Service deutlich länger als normale API-Aufrufe
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "20000")) # Zeilen pro Upsert beim Streaming vom yfinance-Service
+
+def yfinance_payload_to_frame(payload: dict) -> pd.DataFrame:
+    """Wandelt die Antwort von yfinance_service /history/{symbol} (format=records oder columnar) in Zeilen für stock_prices um."""
+    raw_df = pd.DataFrame(payload["columns"]) if "columns" in payload else pd.DataFrame(payload.get("data", []))
+    return yfinance_rows_to_frame(raw_df, payload["symbol"])
+
+def yfinance_rows_to_frame(raw_df: pd.DataFrame, symbol: str) -> pd.DataFrame:
+    """Wandelt Zeilen des yfinance-Service (Spalten wie 'Date', 'Close', ...) in Zeilen für stock_prices um."""
+    if raw_df.empty:
+        return pd.DataFrame(columns=crud.STOCK_PRICE_COLUMNS)
+    # Tagesdaten haben die Spalte 'Date', Intraday-Daten 'Datetime'
+    time_column = "Datetime" if "Datetime" in raw_df.columns else "Date"
+    prices_df = pd.DataFrame({
+        'symbol': symbol.upper(),
+        'timestamp': pd.to_datetime(raw_df[time_column], utc=True),
+        'open': raw_df.get("Open"),
+        'high': raw_df.get("High"),
+        'low': raw_df.get("Low"),
+        'close': raw_df["Close"],
+        'adj_close': raw_df.get("Adj Close"),
+        'volume': raw_df.get("Volume"),
+        'source': "yfinance",
+    })
+    return prices_df.dropna(subset=['close'])[crud.STOCK_PRICE_COLUMNS]
+
+def fmp_payload_to_frame(payload: dict, symbol: str) -> pd.DataFrame:
+    """Wandelt die Antwort von FMP /historical-price-full/{symbol} in Zeilen für stock_prices um."""
+    raw_df = pd.DataFrame(payload.get("historical", []))
+    if raw_df.empty:
+        return pd.DataFrame(columns=crud.STOCK_PRICE_COLUMNS)
+    prices_df = pd.DataFrame({
+        'symbol': payload.get("symbol", symbol).upper(),
+        'timestamp': pd.to_datetime(raw_df["date"], utc=True),
+        'open': raw_df.get("open"),
+        'high': raw_df.get("high"),
+        'low': raw_df.get("low"),
+        'close': raw_df["close"],
+        'adj_close': raw_df.get("adjClose"),
+        'volume': raw_df.get("volume"),
+        'source': "FMP",
+    })
+    return prices_df.dropna(subset=['close'])[crud.STOCK_PRICE_COLUMNS]
+
+def _yfinance_params(period: str, interval: str, start: str | None, end: str | None, format: str) -> dict:
+    params = {"period": period, "interval": interval, "format": format}
+    if start: params["start"] = start
+    if end: params["end"] = end
+    return params
+
+async def fetch_price_history(symbol: str, source: str = "yfinance", period: str = "5y", interval: str = "1d",
+                              start: str | None = None, end: str | None = None) -> pd.DataFrame:
+    """Holt die Kurshistorie eines Symbols vom yfinance-Service oder von FMP."""
+    if source == "yfinance":
+        # Spaltenweises JSON ist deutlich kompakter als ein Objekt pro Balken
+        payload = await HTTP_CLIENT.get_json(
+            f"{YFINANCE_SERVICE_URL}/history/{symbol.upper()}",
+            params=_yfinance_params(period, interval, start, end, "columnar"),
+            timeout=FETCH_TIMEOUT_SECONDS,
+        )
+        return yfinance_payload_to_frame(payload)
+    if source == "fmp":
+        if not FMP_API_KEY:
+            raise ValueError("FMP API Key nicht konfiguriert.")
+        payload = await FMPClient(FMP_API_KEY, base_url=FMP_BASE_URL, rate_limiter=fmp_rate_limiter).get_historical_price_full(symbol, from_date=start, to_date=end)
+        return fmp_payload_to_frame(payload, symbol)
+    raise ValueError(f"Unbekannte Datenquelle: {source}")
+
+async def stream_yfinance_history(symbol: str, period: str = "5y", interval: str = "1d", start: str | None = None,
+                                  end: str | None = None, chunk_rows: int = INGEST_CHUNK_ROWS):
+    """
+    Async-Generator: liest die Historie vom yfinance-Service als NDJSON-Stream und liefert sie in
+    DataFrames zu höchstens chunk_rows Zeilen, ohne die gesamte Antwort im Speicher zu halten.
+    """
+    async with HTTP_CLIENT.stream(
+        "GET", f"{YFINANCE_SERVICE_URL}/history/{symbol.upper()}",
+        params=_yfinance_params(period, interval, start, end, "ndjson"),
+        timeout=FETCH_TIMEOUT_SECONDS,
+    ) as response:
+        buffered_rows = []
+        async for line in response.aiter_lines():
+            if line:
+                buffered_rows.append(json.loads(line))
+            if len(buffered_rows) >= chunk_rows:
+                yield yfinance_rows_to_frame(pd.DataFrame(buffered_rows), symbol)
+                buffered_rows = []
+        if buffered_rows:
+            yield yfinance_rows_to_frame(pd.DataFrame(buffered_rows), symbol)
+
+async def ingest_symbol(symbol: str, source: str = "yfinance", period: str = "5y", interval: str = "1d",
+                        start: str | None = None, end: str | None = None) -> dict:
+    """
+    Lädt die Historie eines Symbols und schreibt sie per Bulk-Upsert in die DB. Gibt Statistiken zurück.
+    Vom yfinance-Service wird gestreamt und chunkweise geschrieben; FMP liefert nur vollständige Antworten.
+    """
+    started = time.perf_counter()
+    rows_written = 0
+    write_seconds = 0.0
+
+    async with AsyncSessionLocal() as db:
+        if source == "yfinance":
+            async for prices_df in stream_yfinance_history(symbol, period, interval, start, end):
+                write_started = time.perf_counter()
+                rows_written += await async_crud.bulk_upsert_stock_prices(db, prices_df)
+                write_seconds += time.perf_counter() - write_started
+        else:
+            prices_df = await fetch_price_history(symbol, source, period, interval, start, end)
+            write_started = time.perf_counter()
+            rows_written = await async_crud.bulk_upsert_stock_prices(db, prices_df)
+            write_seconds = time.perf_counter() - write_started
+    total_seconds = time.perf_counter() - started
+
+    return {
+        'symbol': symbol.upper(),
+        'rows': rows_written,
+        'fetch_seconds': round(total_seconds - write_seconds, 3),
+        'write_seconds': round(write_seconds, 3),
+        'rows_per_sec': round(rows_written / write_seconds, 1) if write_seconds > 0 else None,
+    }
+
+async def backfill_symbols(symbols: list[str], source: str = "yfinance", period: str = "5y",
+                           interval: str = "1d", max_concurrency: int = 4,
+                           start: str | None = None, end: str | None = None) -> dict:
+    """
+    Füllt die Historie vieler Symbole parallel auf (höchstens max_concurrency gleichzeitig).
+    Fehler werden pro Symbol gemeldet und brechen den Backfill nicht ab.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    started = time.perf_counter()
+
+    async def run_one(symbol: str) -> dict:
+        async with semaphore:
+            try:
+                return await ingest_symbol(symbol, source, period, interval, start, end)
+            except Exception as e:
+                print(f"FEHLER beim Backfill für {symbol}: {e}")
+                return {'symbol': symbol.upper(), 'rows': 0, 'error': str(e)}
+
+    results = await asyncio.gather(*(run_one(s) for s in symbols))
+    total_seconds = time.perf_counter() - started
+    total_rows = sum(r['rows'] for r in results)
+    return {
+        'symbols': len(symbols),
+        'total_rows': total_rows,
+        'total_seconds': round(total_seconds, 3),
+        'rows_per_sec': round(total_rows / total_seconds, 1) if total_seconds > 0 else None,
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Massen-Import von Kurshistorien in stock_prices.")
+    parser.add_argument("symbols", nargs="+", help="Ticker-Symbole, z.B. AAPL MSFT")
+    parser.add_argument("--source", choices=["yfinance", "fmp"], default="yfinance")
+    parser.add_argument("--period", default="5y", help="Zeitraum für yfinance (z.B. 1y, 5y, max)")
+    parser.add_argument("--interval", default="1d", help="Intervall für yfinance (z.B. 1d, 1h, 1m)")
+    parser.add_argument("--start", help="Nur Kurse ab diesem Datum (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Nur Kurse bis zu diesem Datum (YYYY-MM-DD)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Anzahl gleichzeitig verarbeiteter Symbole")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await backfill_symbols(args.symbols, args.source, args.period, args.interval, args.concurrency, args.start, args.end)
+        finally:
+            await HTTP_CLIENT.aclose()
+
+    report = asyncio.run(run())
+    for result in report['results']:
+        if 'error' in result:
+            print(f"{result['symbol']}: FEHLER {result['error']}")
+        else:
+            print(f"{result['symbol']}: {result['rows']} Zeilen, {result['rows_per_sec']} Zeilen/s (Abruf {result['fetch_seconds']}s)")
+    print(f"Gesamt: {report['total_rows']} Zeilen in {report['total_seconds']}s ({report['rows_per_sec']} Zeilen/s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+import import_profile # Als Erstes: misst die Importzeit aller folgenden Module (Bericht unter /api/v1/startup-report)
+if import_profile.IMPORT_PROFILE_ENABLED:
+    import_profile.IMPORT_PROFILER.install()
+
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 import os
 from fastapi.middleware.cors import CORSMiddleware # Neu
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-import alpaca_trade_api as tradeapi # Neu
-import requests # Neu für FMP
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio # Neu für die Bot-Schleife
+import time
+import traceback
 import pandas as pd # Neu für gleitende Durchschnitte
+import numpy as np
 from datetime import datetime, timedelta, date as py_date # Neu für Datumsmanipulation
 
-import crud, models, schemas # Geändert
-from database import SessionLocal, engine
+import crud, async_crud, models, schemas # Geändert
+import ingestion
+import sentiment_ingestion
+from ingest_jobs import INGEST_JOBS
+from downsampling import downsample_history, lttb_indices, ohlc_buckets
+import price_storage
+import order_mirror
+from window_store import WINDOW_STORE
+from model_registry import MODEL_REGISTRY
+from inference_pool import INFERENCE_POOL
+from order_execution import ORDER_EXECUTOR, client_order_id, cycle_key_for
+from bar_stream import BarStream, MODEL_BAR_SECONDS
+from dashboard_events import DASHBOARD_HUB, DASHBOARD_COALESCER, encode_event
+from bot_control import BOT_CONTROL
+from http_clients import HTTP_CLIENT, UpstreamAPIError, alpaca_client, fmp_client
+from response_cache import RESPONSE_CACHE
+from database import AsyncSessionLocal, engine
 # import security # Nicht mehr benötigt für Benutzer-Auth
-from ml_utils import load_model_components_for_ticker, predict_for_ticker # NEU
+# ml_utils (torch) und backtest werden erst bei Bedarf geladen (Modell-Registry, Bot-Schleife, Backtest),
+# damit reine API-Worker schnell starten und schlank bleiben
+from model_defaults import SEQ_LENGTH_DEFAULT, FORECAST_HORIZON_DEFAULT, INPUT_DIM_MODEL_DEFAULT
 
 # Lade Umgebungsvariablen aus .env (besonders nützlich für lokale Entwicklung außerhalb von Docker)
 load_dotenv()
@@ -21,23 +45,45 @@ load_dotenv()
 
 app = FastAPI()
 
-# Alpaca API-Client Initialisierung
-ALPACA_API_KEY_ID = os.getenv("ALPACA_API_KEY_ID")
-ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-ALPACA_BASE_URL = os.getenv("ALPACA_BASE_URL", "https://paper-api.alpaca.markets") # Standard auf Paper Trading
-FMP_API_KEY = os.getenv("FMP_API_KEY") # Neu
-
-alpaca_api = None
-if ALPACA_API_KEY_ID and ALPACA_SECRET_KEY:
-    alpaca_api = tradeapi.REST(ALPACA_API_KEY_ID, ALPACA_SECRET_KEY, base_url=ALPACA_BASE_URL)
+# Alpaca- und FMP-Clients kommen aus http_clients (asynchron, gemeinsamer Connection-Pool)
+if alpaca_client:
     print("Alpaca API Client erfolgreich initialisiert.")
 else:
     print("WARNUNG: Alpaca API Keys nicht gefunden. Alpaca-Funktionalität ist nicht verfügbar.")
 
-# Einfacher In-Memory-Status für den Bot
+# Zustand der lokalen Bot-Schleife. Ob der Bot laufen soll, steht in Redis (bot_control); gestartet wird die
+# Schleife nur in dem Worker, der die Leader-Lease hält.
 bot_is_running = False
 bot_task = None # Hält die Referenz zur laufenden Bot-Aufgabe
 current_monitoring_symbol = "AAPL" # Standard-Symbol, das der Bot überwacht
+bot_control_task = None
+order_mirror_task = None # Periodischer Abgleich des Order-Spiegels (order_mirror.py)
+
+# Ticker, deren Modelle vorgeladen werden, sobald dieser Worker die Bot-Schleife startet (kommagetrennt, leer = kein Vorladen).
+# Mit MODEL_WARMUP_ON_STARTUP=true schon beim Start jedes Workers (lädt dann auch in reinen API-Workern torch)
+MODEL_WARMUP_SYMBOLS = os.getenv("MODEL_WARMUP_SYMBOLS", "AAPL,MSFT,GOOGL,NVDA,AMZN")
+MODEL_WARMUP_ON_STARTUP = os.getenv("MODEL_WARMUP_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+model_warmup_task = None
+predict_task = None # Batch-Vorhersage im Thread-Pool (siehe _generate_buy_signals)
+
+# Taktung, Parallelität und Zeitlimits (pro Stufe) der Bot-Schleife
+BOT_CYCLE_SECONDS = float(os.getenv("BOT_CYCLE_SECONDS", "60"))
+BOT_SYMBOL_CONCURRENCY = int(os.getenv("BOT_SYMBOL_CONCURRENCY", "8"))
+BOT_MODEL_LOAD_TIMEOUT_SECONDS = float(os.getenv("BOT_MODEL_LOAD_TIMEOUT_SECONDS", "30"))
+BOT_DATA_TIMEOUT_SECONDS = float(os.getenv("BOT_DATA_TIMEOUT_SECONDS", "15"))
+BOT_PREDICT_TIMEOUT_SECONDS = float(os.getenv("BOT_PREDICT_TIMEOUT_SECONDS", "20"))
+BOT_ORDER_TIMEOUT_SECONDS = float(os.getenv("BOT_ORDER_TIMEOUT_SECONDS", "10"))
+# Orders werden nur bei BOT_SUBMIT_ORDERS=true wirklich gesendet, sonst nur protokolliert
+BOT_SUBMIT_ORDERS = os.getenv("BOT_SUBMIT_ORDERS", "false").lower() in ("1", "true", "yes")
+BOT_CASH_BUFFER = float(os.getenv("BOT_CASH_BUFFER", "10000"))
+# 'poll': fester Takt (BOT_CYCLE_SECONDS), 'stream': Bewertung eines Symbols, sobald sein Balken im Kursdaten-Stream schließt
+BOT_MODE = os.getenv("BOT_MODE", "poll")
+# Im Stream-Modus werden Balken, die innerhalb dieses Fensters schließen, gemeinsam bewertet
+BOT_STREAM_BATCH_SECONDS = float(os.getenv("BOT_STREAM_BATCH_SECONDS", "0.25"))
+bar_stream = None # Laufender BarStream im Stream-Modus
+
+# Ziel-Ticker (könnte dynamisch aus DB oder Gemini-ähnlicher Quelle kommen)
+BOT_TARGET_SYMBOLS = ["AAPL", "MSFT", "GOOGL", "NVDA", "AMZN"] # Beispielhafte Top 5 für den Anfang
 
 # CORS-Middleware hinzufügen
 origins = [
@@ -57,24 +103,21 @@ app.add_middleware(
     allow_headers=["*"], # Erlaube alle Header
 )
 
-# Dependency, um eine DB-Session pro Request zu erhalten
-def get_db():
-    db = SessionLocal()
-    try:
+# Dependency, um eine (asynchrone) DB-Session pro Request zu erhalten
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @app.get("/")
 async def read_root():
     return {"message": "Hallo vom Trading-Bot Backend!"}
 
 @app.get("/db_test")
-async def test_db_connection(db: Session = Depends(get_db)):
+async def test_db_connection(db: AsyncSession = Depends(get_db)):
     try:
         # Einfache Testabfrage, da die User-Tabelle nicht mehr existiert
         # result = db.execute(models.User.__table__.select().limit(0)) # Testet ob die Tabelle existiert
-        version_result = db.execute("SELECT version()").scalar_one_or_none()
+        version_result = (await db.execute(text("SELECT version()"))).scalar_one_or_none()
         return {"message": "Datenbankverbindung über SQLAlchemy erfolgreich.", "db_version": version_result}
     except Exception as e:
         return {"error": f"Datenbankfehler: {str(e)}"}
@@ -84,115 +127,612 @@ async def health_check():
     # Hier könnte man auch den DB-Status prüfen
     return {"status": "ok"}
 
+def _format_bot_status(state: dict) -> dict:
+    status_text = "aktiv" if state['running'] else "inaktiv"
+    monitoring_info = f"Überwacht: {state['symbol']}" if state['running'] else "Nicht aktiv."
+    return {"status": status_text, "message": f"Trading Bot ist {status_text}. {monitoring_info}", "leader": state['leader']}
+
+async def _bot_status() -> dict:
+    try:
+        return _format_bot_status(await BOT_CONTROL.get_state())
+    except Exception as e:
+        raise UpstreamAPIError(503, f"Bot-Zustand nicht abrufbar (Redis): {e}")
+
 @app.get("/api/v1/bot-status")
 async def get_bot_status():
-    # Greife auf den globalen Status zu
-    global bot_is_running
-    status_text = "aktiv" if bot_is_running else "inaktiv"
-    monitoring_info = f"Überwacht: {current_monitoring_symbol}" if bot_is_running else "Nicht aktiv."
-    return {"status": status_text, "message": f"Trading Bot ist {status_text}. {monitoring_info}"}
+    try:
+        return await _bot_status()
+    except UpstreamAPIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@app.get("/api/v1/bot/control/stats")
+async def get_bot_control_stats():
+    return BOT_CONTROL.get_stats()
+
+# --- Alpaca-Abfragen (gemeinsam genutzt von den Einzel-Endpunkten und /api/v1/dashboard) ---
+def _require_alpaca():
+    if not alpaca_client:
+        raise UpstreamAPIError(503, "Alpaca API Client nicht initialisiert (API Keys fehlen oder sind ungültig).")
+
+async def _fetch_alpaca_account() -> dict:
+    _require_alpaca()
+    account_info = await RESPONSE_CACHE.get_or_fetch('alpaca_account', 'default', alpaca_client.get_account)
+    return {
+        "id": account_info["id"],
+        "account_number": account_info["account_number"],
+        "currency": account_info["currency"],
+        "cash": account_info["cash"],
+        "portfolio_value": account_info["portfolio_value"],
+        "equity": account_info["equity"],
+        "status": account_info["status"],
+    }
+
+async def _fetch_alpaca_positions() -> list[schemas.AlpacaPosition]:
+    # Aus dem Postgres-Spiegel (order_mirror.py), ohne Alpaca-Anfrage
+    async with AsyncSessionLocal() as db:
+        positions_raw, _ = await async_crud.get_mirrored_positions(db)
+    return [schemas.AlpacaPosition.model_validate(p) for p in positions_raw]
+
+async def _fetch_alpaca_orders(status: str, limit: int, direction: str, symbol: str | None = None,
+                               since: datetime | None = None, until: datetime | None = None,
+                               cursor: str | None = None) -> schemas.AlpacaOrderPage:
+    """Eine Seite Orders aus dem Postgres-Spiegel. status: 'all', 'open', 'closed' oder ein einzelner Status wie 'filled'."""
+    if direction not in ("asc", "desc"):
+        raise UpstreamAPIError(400, "direction muss 'asc' oder 'desc' sein.")
+    try:
+        decoded_cursor = order_mirror.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise UpstreamAPIError(400, str(e))
+    statuses, exclude_statuses = order_mirror.status_filter(status)
+    async with AsyncSessionLocal() as db:
+        orders_raw, next_cursor = await async_crud.get_mirrored_orders(
+            db, symbol, statuses, exclude_statuses, since, until, decoded_cursor, limit, direction,
+        )
+    return schemas.AlpacaOrderPage(orders=[schemas.AlpacaOrder.model_validate(o) for o in orders_raw],
+                                   next_cursor=order_mirror.encode_cursor(next_cursor))
 
 @app.get("/api/v1/alpaca/account")
 async def get_alpaca_account_info():
-    if not alpaca_api:
-        raise HTTPException(status_code=503, detail="Alpaca API Client nicht initialisiert (API Keys fehlen oder sind ungültig).")
     try:
-        account_info = alpaca_api.get_account()
-        # Wandle das Account-Objekt in ein Dictionary um, um es als JSON zurückzugeben
-        # oder verwende Pydantic-Modelle für eine strukturiertere Antwort.
-        return {
-            "id": account_info.id,
-            "account_number": account_info.account_number,
-            "currency": account_info.currency,
-            "cash": account_info.cash,
-            "portfolio_value": account_info.portfolio_value,
-            "equity": account_info.equity,
-            "status": account_info.status,
-        }
-    except tradeapi.rest.APIError as e:
-        raise HTTPException(status_code=e.status_code, detail=str(e))
+        return await _fetch_alpaca_account()
+    except UpstreamAPIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Allgemeiner Fehler beim Abrufen der Alpaca Kontoinformationen: {str(e)}")
 
 @app.get("/api/v1/alpaca/positions", response_model=list[schemas.AlpacaPosition])
 async def get_alpaca_positions():
-    if not alpaca_api:
-        raise HTTPException(status_code=503, detail="Alpaca API Client nicht initialisiert.")
     try:
-        positions_raw = alpaca_api.list_positions()
-        # Konvertiere die rohen Position-Objekte in unser Pydantic-Modell
-        # Die Alpaca-Bibliothek gibt Objekte zurück, deren Attribute direkt zugänglich sind.
-        # Pydantic's from_attributes (oder orm_mode in v1) kann hier helfen.
-        positions_response = [schemas.AlpacaPosition.from_orm(p) for p in positions_raw]
-        return positions_response
-    except tradeapi.rest.APIError as e:
-        # Versuche, eine spezifischere Nachricht aus dem Fehlerobjekt zu extrahieren
-        error_detail = str(e)
-        if hasattr(e, '_error') and isinstance(e._error, dict) and 'message' in e._error:
-            error_detail = e._error['message']
-        raise HTTPException(status_code=e.status_code if hasattr(e, 'status_code') and e.status_code else 400, detail=error_detail)
+        return await _fetch_alpaca_positions()
+    except UpstreamAPIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Allgemeiner Fehler beim Abrufen der Alpaca Positionen: {str(e)}")
 
-@app.get("/api/v1/alpaca/orders", response_model=list[schemas.AlpacaOrder])
-async def get_alpaca_orders(status: str = 'filled', limit: int = 50, direction: str = 'desc'):
-    if not alpaca_api:
-        raise HTTPException(status_code=503, detail="Alpaca API Client nicht initialisiert.")
+@app.get("/api/v1/alpaca/orders", response_model=schemas.AlpacaOrderPage)
+async def get_alpaca_orders(status: str = 'filled', limit: int = Query(50, ge=1, le=500), direction: str = 'desc',
+                            symbol: str | None = None, since: str | None = None, until: str | None = None,
+                            cursor: str | None = None):
+    """
+    Orders aus dem Postgres-Spiegel, seitenweise nach Erstellungszeit (Keyset-Pagination): die Antwort enthält
+    next_cursor, solange weitere Seiten folgen. Filter: symbol, status ('all', 'open', 'closed' oder z.B. 'filled'),
+    since/until (ISO-Zeitpunkte bzw. Daten, UTC, auf created_at).
+    """
     try:
-        # Parameter für list_orders: status, limit, after, until, direction, nested (True/False für legs)
-        orders_raw = alpaca_api.list_orders(
-            status=status,
-            limit=limit,
-            direction=direction
-        )
-        orders_response = [schemas.AlpacaOrder.from_orm(o) for o in orders_raw]
-        return orders_response
-    except tradeapi.rest.APIError as e:
-        error_detail = str(e)
-        if hasattr(e, '_error') and isinstance(e._error, dict) and 'message' in e._error:
-            error_detail = e._error['message']
-        raise HTTPException(status_code=e.status_code if hasattr(e, 'status_code') and e.status_code else 400, detail=error_detail)
+        since_ts, until_ts = _parse_utc(since), _parse_utc(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ungültiges Datum: {e}")
+    if until_ts is not None and len(until) == 10:
+        until_ts += timedelta(days=1) # Reines Datum: ganzer Tag inklusive (until ist exklusiv)
+    try:
+        return await _fetch_alpaca_orders(status, limit, direction, symbol, since_ts, until_ts, cursor)
+    except UpstreamAPIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Allgemeiner Fehler beim Abrufen der Alpaca Orders: {str(e)}")
 
-@app.get("/api/v1/fmp/historical-price/{symbol}", response_model=list[schemas.HistoricalPricePoint])
-async def get_fmp_historical_prices(symbol: str, from_date: str | None = None, to_date: str | None = None):
-    if not FMP_API_KEY:
+DASHBOARD_FIELDS = ("bot_status", "account", "positions", "orders", "predictions")
+
+@app.get("/api/v1/dashboard")
+async def get_dashboard(fields: str | None = None, orders_status: str = 'filled', orders_limit: int = 10):
+    """
+    Alles, was das Dashboard beim Laden braucht, in einer Antwort. Die Teile werden gleichzeitig abgefragt;
+    schlägt ein Upstream fehl, fehlt nur dieser Teil in 'data' und der Grund steht unter 'errors'.
+    'fields' (kommagetrennt) schränkt die Antwort ein. Gleichzeitige Aufrufe teilen sich innerhalb eines kurzen
+    Fensters (DASHBOARD_COALESCE_SECONDS) dieselbe Abfrage pro Teil.
+    """
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(DASHBOARD_FIELDS)
+    unknown = sorted(set(requested) - set(DASHBOARD_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unbekannte Felder: {unknown}. Erlaubt: {list(DASHBOARD_FIELDS)}")
+
+    async def bot_status():
+        return await _bot_status()
+
+    async def orders():
+        return (await _fetch_alpaca_orders(orders_status, orders_limit, 'desc')).orders
+
+    async def predictions():
+        # Letzte Bewertung je Symbol aus der Bot-Schleife (keine zusätzliche Inferenz)
+        return sorted(DASHBOARD_HUB.signals.values(), key=lambda s: s['symbol'])
+
+    fetchers = {
+        "bot_status": ("bot_status", bot_status),
+        "account": ("account", _fetch_alpaca_account),
+        "positions": ("positions", _fetch_alpaca_positions),
+        "orders": (f"orders:{orders_status}:{orders_limit}", orders),
+        "predictions": ("predictions", predictions),
+    }
+    results = await asyncio.gather(
+        *(DASHBOARD_COALESCER.run(fetchers[field][0], fetchers[field][1]) for field in requested),
+        return_exceptions=True,
+    )
+    data, errors = {}, {}
+    for field, result in zip(requested, results):
+        if isinstance(result, UpstreamAPIError):
+            errors[field] = {"status_code": result.status_code, "detail": result.message}
+        elif isinstance(result, Exception):
+            print(f"FEHLER beim Laden von '{field}' für das Dashboard: {result}")
+            errors[field] = {"status_code": 500, "detail": str(result)}
+        else:
+            data[field] = result
+    return {"data": data, "errors": errors}
+
+@app.get("/api/v1/fmp/historical-price/{symbol}", response_model=list[schemas.HistoricalPricePoint] | list[schemas.HistoricalPriceBucket])
+async def get_fmp_historical_prices(symbol: str, from_date: str | None = None, to_date: str | None = None,
+                                    from_: str | None = Query(None, alias="from"), to: str | None = None,
+                                    max_points: int | None = Query(None, ge=3), mode: str = "lttb"):
+    """
+    Kurshistorie von FMP, optional eingeschränkt (from/to bzw. from_date/to_date, YYYY-MM-DD) und für Charts
+    auf höchstens max_points Punkte ausgedünnt: mode='lttb' (Originalpunkte, Form bleibt erhalten) oder
+    mode='ohlc' (zusammengefasste OHLC-Balken).
+    """
+    if not fmp_client:
         raise HTTPException(status_code=503, detail="FMP API Key nicht konfiguriert.")
-    
-    # Standardmäßig die letzten 30 Tage, wenn keine Daten angegeben sind
-    # FMP erwartet YYYY-MM-DD
-    # Diese Logik kann bei Bedarf verfeinert werden
-    # to_date_param = to_date if to_date else datetime.now().strftime('%Y-%m-%d')
-    # from_date_param = from_date if from_date else (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-
-    # Für diesen Endpunkt verwenden wir den "full" Endpunkt, der viele Daten liefert.
-    # Query-Parameter für from/to können hinzugefügt werden, wenn FMP sie für diesen spezifischen Endpunkt unterstützt.
-    # Für /historical-price-full/{symbol} sind from/to nicht die primären Filter, oft wird eine Serie zurückgegeben.
-    # Wir holen die Standardserie und filtern später, falls nötig, oder verwenden einen anderen FMP-Endpunkt.
-    fmp_url = f"https://financialmodelingprep.com/api/v3/historical-price-full/{symbol.upper()}?apikey={FMP_API_KEY}"
-    
+    if mode not in ("lttb", "ohlc"):
+        raise HTTPException(status_code=400, detail="mode muss 'lttb' oder 'ohlc' sein.")
+    from_date, to_date = from_date or from_, to_date or to
+
+    # FMP erwartet YYYY-MM-DD; ohne from/to liefert /historical-price-full/{symbol} die Standardserie
     try:
-        response = requests.get(fmp_url)
-        response.raise_for_status() # Wirft einen Fehler bei 4xx/5xx Statuscodes
-        data = response.json()
+        data = await RESPONSE_CACHE.get_or_fetch(
+            'fmp_history', f"{symbol.upper()}:{from_date or ''}:{to_date or ''}",
+            lambda: fmp_client.get_historical_price_full(symbol, from_date=from_date, to_date=to_date),
+        )
         # FMP gibt oft ein Dictionary mit einem 'historical'-Schlüssel zurück, der eine Liste enthält
-        historical_data = data.get("historical", [])
+        historical_data = data.get("historical", []) if isinstance(data, dict) else []
+        if max_points:
+            historical_data = downsample_history(historical_data, max_points, mode)
         # Validierung gegen Pydantic-Schema geschieht automatisch durch response_model
         return historical_data
-    except requests.exceptions.HTTPError as e:
-        # Versuche, eine spezifischere Fehlermeldung von FMP zu bekommen, falls vorhanden
-        error_detail = f"FMP API Fehler: {e.response.status_code}"
-        try:
-            fmp_error = e.response.json()
-            if "Error Message" in fmp_error:
-                error_detail = fmp_error["Error Message"]
-        except ValueError: # Falls die Antwort kein JSON ist
-            error_detail = e.response.text[:200] # Zeige die ersten 200 Zeichen
-        raise HTTPException(status_code=e.response.status_code, detail=error_detail)
+    except UpstreamAPIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Allgemeiner Fehler beim Abrufen der FMP-Daten für {symbol}: {str(e)}")
 
+def _parse_utc(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    timestamp = pd.Timestamp(value)
+    return (timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp).to_pydatetime()
+
+@app.get("/api/v1/prices/{symbol}", response_model=schemas.PriceSeriesResponse)
+async def get_price_series(symbol: str, from_: str | None = Query(None, alias="from"), to: str | None = None,
+                           max_points: int | None = Query(None, ge=3), resolution: str | None = None, mode: str = "lttb",
+                           db: AsyncSession = Depends(get_db)):
+    """
+    Gespeicherte Kursreihe (from/to als YYYY-MM-DD oder ISO-Zeitstempel). Ohne 'resolution' liest die Abfrage
+    aus der gröbsten Tabelle (Rohdaten, 1h- oder 1d-Rollup), die für max_points noch fein genug ist, statt alle
+    Rohbalken zu laden; was danach noch über max_points liegt, wird wie bei der FMP-Historie ausgedünnt.
+    """
+    if resolution is not None and resolution not in price_storage.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution muss eines von {list(price_storage.RESOLUTIONS)} sein.")
+    if mode not in ("lttb", "ohlc"):
+        raise HTTPException(status_code=400, detail="mode muss 'lttb' oder 'ohlc' sein.")
+    try:
+        start = _parse_utc(from_)
+        end = _parse_utc(to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ungültiges Datum: {e}")
+    if end is not None and len(to) == 10:
+        end += timedelta(days=1, microseconds=-1) # Reines Datum: ganzer Tag inklusive
+
+    resolution, series_df = await price_storage.get_price_series_async(
+        db, symbol, start, end, max_points=max_points, resolution=resolution,
+    )
+    if max_points and len(series_df) > max_points:
+        if mode == "lttb":
+            timestamps = pd.to_datetime(series_df['timestamp'], utc=True).astype('int64').to_numpy()
+            series_df = series_df.iloc[lttb_indices(timestamps, series_df['close'].to_numpy(dtype=np.float64), max_points)]
+        else:
+            bars = ohlc_buckets(series_df['open'], series_df['high'], series_df['low'], series_df['close'],
+                                series_df['volume'].fillna(0.0), max_points)
+            series_df = pd.DataFrame({'timestamp': series_df['timestamp'].to_numpy()[bars['start']],
+                                      **{key: bars[key] for key in ('open', 'high', 'low', 'close', 'volume')}})
+    series_df = series_df.astype(object).where(series_df.notna(), None)
+    return {'symbol': symbol.upper(), 'resolution': resolution, 'points': series_df.to_dict(orient="records")}
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    return RESPONSE_CACHE.get_stats()
+
+@app.post("/api/v1/backtest")
+async def run_model_backtest(request: schemas.BacktestRequest):
+    if not request.symbols:
+        raise HTTPException(status_code=400, detail="Keine Symbole angegeben.")
+    # Rechenintensiv (Prozess-Pool), daher außerhalb des Event-Loops; dort wird auch backtest (torch) geladen
+    return await asyncio.to_thread(_run_backtest, request)
+
+def _run_backtest(request: schemas.BacktestRequest) -> dict:
+    import backtest
+    return backtest.run_backtest(
+        request.symbols,
+        start=request.start,
+        end=request.end,
+        workers=request.workers or backtest.BACKTEST_WORKERS,
+        buy_threshold=request.buy_threshold,
+        sell_threshold=request.sell_threshold,
+        initial_cash=request.initial_cash,
+        cash_buffer=request.cash_buffer,
+        commission=request.commission,
+        include_equity_curve=request.include_equity_curve,
+        resolution=request.resolution or backtest.BACKTEST_RESOLUTION,
+    )
+
+@app.get("/api/v1/models/stats")
+async def get_model_registry_stats():
+    return MODEL_REGISTRY.get_stats()
+
+@app.get("/api/v1/orders/execution/stats")
+async def get_order_execution_stats():
+    if not ORDER_EXECUTOR:
+        raise HTTPException(status_code=503, detail="Alpaca API Client nicht initialisiert.")
+    return ORDER_EXECUTOR.get_stats()
+
+@app.post("/api/v1/alpaca/sync")
+async def sync_alpaca_mirror():
+    # Sofortiger Abgleich des Order-/Positions-Spiegels (sonst periodisch alle ORDER_MIRROR_SYNC_SECONDS)
+    if not order_mirror.ORDER_MIRROR:
+        raise HTTPException(status_code=503, detail="Alpaca API Client nicht initialisiert.")
+    try:
+        return await order_mirror.ORDER_MIRROR.sync()
+    except UpstreamAPIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@app.get("/api/v1/alpaca/sync/stats")
+async def get_alpaca_mirror_stats():
+    if not order_mirror.ORDER_MIRROR:
+        raise HTTPException(status_code=503, detail="Alpaca API Client nicht initialisiert.")
+    return order_mirror.ORDER_MIRROR.get_stats()
+
+@app.get("/api/v1/startup-report")
+async def get_startup_report():
+    # Importzeit pro Paket beim Start sowie seitdem nachgeladene Module (z.B. torch beim ersten Modellzugriff)
+    return import_profile.IMPORT_PROFILER.report()
+
+@app.get("/api/v1/inference/stats")
+async def get_inference_pool_stats():
+    return INFERENCE_POOL.get_stats()
+
+async def _start_ingest_job(kind: str, coro, params: dict) -> dict:
+    # Ohne gespeicherten Status keine Job-ID, die andere Worker nicht auflösen könnten
+    try:
+        return await INGEST_JOBS.start(kind, coro, params=params)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Job-Status nicht speicherbar (Redis): {e}")
+
+@app.post("/api/v1/ingest/sentiment", status_code=202)
+async def ingest_sentiments(request: schemas.SentimentIngestRequest):
+    # Ohne Symbole: alle Symbole, für die Kurse gespeichert sind. Läuft im Hintergrund, Status unter /api/v1/ingest/jobs/{job_id}
+    if not sentiment_ingestion.FMP_API_KEY:
+        raise HTTPException(status_code=503, detail="FMP API Key nicht konfiguriert.")
+    job = await _start_ingest_job("sentiment", sentiment_ingestion.ingest_sentiments(
+        request.symbols, max_concurrency=request.max_concurrency, lookback_days=request.lookback_days,
+    ), params=request.model_dump())
+    return {'job_id': job['job_id'], 'status': job['status']}
+
+@app.get("/api/v1/ingest/jobs")
+async def list_ingest_jobs(kind: str | None = None):
+    try:
+        return await INGEST_JOBS.list(kind)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Job-Status nicht lesbar (Redis): {e}")
+
+@app.get("/api/v1/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    try:
+        job = await INGEST_JOBS.get(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Job-Status nicht lesbar (Redis): {e}")
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unbekannter Ingestion-Job: {job_id}")
+    return job
+
+@app.post("/api/v1/ingest/prices", status_code=202)
+async def backfill_stock_prices(request: schemas.PriceBackfillRequest):
+    # Läuft im Hintergrund, Status und Ergebnis unter /api/v1/ingest/jobs/{job_id}
+    if request.source not in ("yfinance", "fmp"):
+        raise HTTPException(status_code=400, detail=f"Unbekannte Datenquelle: {request.source}")
+    if not request.symbols:
+        raise HTTPException(status_code=400, detail="Keine Symbole angegeben.")
+    job = await _start_ingest_job("prices", ingestion.backfill_symbols(
+        request.symbols,
+        source=request.source,
+        period=request.period,
+        interval=request.interval,
+        max_concurrency=request.max_concurrency,
+        start=request.start,
+        end=request.end,
+    ), params=request.model_dump())
+    return {'job_id': job['job_id'], 'status': job['status']}
+
+async def _load_symbol_components(symbol: str, semaphore: asyncio.Semaphore):
+    """Lädt die Modellkomponenten eines Symbols im Thread-Pool mit Zeitlimit. Gibt None bei Fehlern zurück."""
+    async with semaphore:
+        try:
+            model_components = await asyncio.wait_for(
+                asyncio.to_thread(MODEL_REGISTRY.get, symbol.upper()), # Lädt beim ersten Aufruf den ML-Stack
+                timeout=BOT_MODEL_LOAD_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            # Der Lade-Thread läuft weiter und füllt die Registry für den nächsten Durchlauf
+            print(f"BOT-LOG [{symbol}]: Zeitlimit beim Laden des Modells ({BOT_MODEL_LOAD_TIMEOUT_SECONDS}s) überschritten. Überspringe.")
+            return None
+        except Exception as e:
+            print(f"FEHLER in Bot-Schleife (Pass 1) für Symbol {symbol}: {e}")
+            traceback.print_exc()
+            return None
+    if not model_components:
+        print(f"BOT-LOG [{symbol}]: Keine Modellkomponenten gefunden. Überspringe.")
+    return model_components
+
+async def _sync_window_store(db: AsyncSession, symbols: list[str]) -> bool:
+    """
+    Gleicht den In-Memory-Sequenz-Store mit der DB ab: neue Symbole werden einmalig befüllt,
+    Schreibzugriffe anderer Prozesse periodisch nachgezogen. Gibt False bei Fehler oder Zeitüberschreitung zurück.
+    """
+    async def sync():
+        await WINDOW_STORE.seed_async(db, [s.upper() for s in symbols])
+        if WINDOW_STORE.needs_resync():
+            await WINDOW_STORE.resync_async(db)
+        await db.commit() # Lesetransaktion beenden, damit der nächste Abgleich neue Zeilen sieht
+
+    try:
+        await asyncio.wait_for(sync(), timeout=BOT_DATA_TIMEOUT_SECONDS)
+        return True
+    except asyncio.TimeoutError:
+        print(f"FEHLER: Zeitlimit beim Abgleich des Sequenz-Stores mit der DB ({BOT_DATA_TIMEOUT_SECONDS}s) überschritten (Pass 1).")
+    except Exception as e:
+        print(f"FEHLER beim Abgleich des Sequenz-Stores mit der DB (Pass 1): {e}")
+    try:
+        await db.rollback()
+    except Exception as e:
+        print(f"FEHLER beim Zurücksetzen der Bot-DB-Session: {e}")
+    return False
+
+def _collect_sequences(symbols: list[str], seq_length: int, input_dim: int) -> dict:
+    """Aktuelle Sequenzen (Close + Sentiment, älteste zuerst) aus dem In-Memory-Store, nur vollständige Fenster."""
+    sequences = {} # {symbol: np.ndarray (seq_length, input_dim)}
+    sequences_by_symbol = WINDOW_STORE.get_windows([s.upper() for s in symbols], seq_length)
+    for symbol_to_process in symbols:
+        sequence_data_for_model_np = sequences_by_symbol.get(symbol_to_process.upper())
+        if sequence_data_for_model_np is None:
+            print(f"BOT-LOG [{symbol_to_process}]: Nicht genügend Preisdaten für Sequenzlänge {seq_length}. Überspringe.")
+            continue
+        if sequence_data_for_model_np.shape != (seq_length, input_dim):
+            print(f"BOT-LOG [{symbol_to_process}]: Falsche Form der Sequenzdaten ({sequence_data_for_model_np.shape}). Erwartet ({seq_length}, {input_dim}). Überspringe.")
+            continue
+        sequences[symbol_to_process] = sequence_data_for_model_np
+    return sequences
+
+def _evaluate_signal(symbol_to_process: str, model_config: dict, sequence_data_for_model_np: np.ndarray, predicted_prices_actual):
+    """Bewertet die Vorhersage eines Symbols. Gibt bei einem Kaufsignal {'symbol', 'strength', 'price_for_qty_calc'} zurück."""
+    if predicted_prices_actual is None or len(predicted_prices_actual) == 0:
+        print(f"BOT-LOG [{symbol_to_process}]: Keine Vorhersage vom Modell erhalten.")
+        return None
+
+    current_close_price = sequence_data_for_model_np[-1, 0] # Letzter bekannter Close-Preis
+    # Stärke basierend auf der Vorhersage für den ersten Tag des Horizonts
+    predicted_first_day_price = predicted_prices_actual[0]
+    if current_close_price <= 0:
+        print(f"BOT-LOG [{symbol_to_process}]: Aktueller Preis ist 0, kann Stärke nicht berechnen.")
+        return None
+
+    strength = float((predicted_first_day_price - current_close_price) / current_close_price)
+    print(f"BOT-LOG [{symbol_to_process}]: Aktuell: {current_close_price:.2f}, Vorhersage Tag 1: {predicted_first_day_price:.2f}, Stärke: {strength:.4f}")
+
+    # Hier deine Logik für Kaufsignal basierend auf Stärke
+    model_buy_threshold = model_config.get('prediction_threshold_buy_signal', 0.01) # Beispiel: 1% Anstieg
+    model_sell_threshold = model_config.get('prediction_threshold_sell_signal', 0.01) # Beispiel für Verkauf
+    signal = "buy" if strength > model_buy_threshold else "sell" if strength < -model_sell_threshold else "neutral"
+    DASHBOARD_HUB.publish_signal(symbol_to_process, signal, strength, float(current_close_price), float(predicted_first_day_price))
+    if signal == "buy":
+        print(f"BOT-SIGNAL [{symbol_to_process}]: KAUFSIGNAL (Modell) mit Stärke: {strength:.4f}")
+        return {
+            'symbol': symbol_to_process,
+            'strength': strength, # Positive Stärke für Kauf
+            'price_for_qty_calc': current_close_price
+        }
+    if signal == "sell":
+        print(f"BOT-SIGNAL [{symbol_to_process}]: VERKAUFSSIGNAL (Modell) mit Stärke: {strength:.4f}")
+        # Hier könnte Verkaufslogik implementiert werden
+    else:
+        print(f"BOT-SIGNAL [{symbol_to_process}]: Kein starkes Handelssignal vom Modell (Stärke: {strength:.4f}).")
+    return None
+
+def _plan_buy_orders(active_buy_signals: list[dict], total_positive_strength: float, cash_to_use: float,
+                     held_market_values: dict, cycle_key: int) -> list[dict]:
+    """
+    Verteilt das Kapital proportional zur Signalstärke. Bestehende Positionen zählen auf das Ziel eines Symbols an,
+    es wird nur bis zum Zielwert nachgekauft. Gibt Orders für ORDER_EXECUTOR.submit_orders zurück.
+    """
+    planned_orders = []
+    for buy_signal_info in active_buy_signals:
+        if buy_signal_info['strength'] <= 0: continue # Nur positive Stärken für Kauf
+
+        symbol = buy_signal_info['symbol']
+        strength = buy_signal_info['strength']
+        price_for_qty_calc = buy_signal_info['price_for_qty_calc']
+
+        # Kapitalallokation proportional zur Stärke, abzüglich des bereits gehaltenen Werts
+        target_capital = (strength / total_positive_strength) * cash_to_use
+        held_value = held_market_values.get(symbol, 0.0)
+        capital_for_this_trade = target_capital - held_value
+        print(f"BOT-LOG [{symbol}]: Allokiertes Kapital: {capital_for_this_trade:.2f} (Ziel: {target_capital:.2f}, gehalten: {held_value:.2f}, Stärke: {strength:.4f})")
+
+        if price_for_qty_calc > 0 and capital_for_this_trade > 1.0: # Mindestens 1 USD/EUR für einen Trade
+            qty_to_buy = int(capital_for_this_trade / price_for_qty_calc)
+            if qty_to_buy > 0:
+                print(f"BOT-ORDER [{symbol}]: Beabsichtige KAUF-Order für {qty_to_buy} Aktien zum Preis ~{price_for_qty_calc:.2f}.")
+                planned_orders.append({
+                    'symbol': symbol, 'qty': qty_to_buy, 'side': 'buy',
+                    'client_order_id': client_order_id(symbol, 'buy', cycle_key),
+                })
+            else:
+                print(f"BOT-ORDER [{symbol}]: Nicht genügend allokiertes Kapital für mind. 1 Aktie (Preis: {price_for_qty_calc:.2f}, Kapital: {capital_for_this_trade:.2f}).")
+        else:
+            print(f"BOT-ORDER [{symbol}]: Ungültiger Preis ({price_for_qty_calc:.2f}) oder zu geringes Kapital ({capital_for_this_trade:.2f}) für Order.")
+    return planned_orders
+
+def _predict_batch(components_by_ticker: dict, sequences_by_ticker: dict) -> dict:
+    from ml_utils import predict_batch_for_tickers # Bereits geladen, sobald Modellkomponenten vorliegen
+    return predict_batch_for_tickers(components_by_ticker, sequences_by_ticker)
+
+def _log_abandoned_predict(task: asyncio.Task):
+    # Nach einem Zeitlimit wartet niemand mehr auf das Ergebnis; Fehler trotzdem abholen und melden
+    if not task.cancelled() and task.exception() is not None:
+        print(f"FEHLER bei der Batch-Vorhersage (nach Zeitlimit): {task.exception()}")
+
+async def _generate_buy_signals(db: AsyncSession, target_symbols: list[str], seq_length: int, input_dim: int,
+                                sync_store: bool = True) -> list[dict]:
+    """
+    Pass 1 eines Durchlaufs: Sequenzen aktualisieren, Vorhersagen treffen und Kaufsignale bewerten.
+    sync_store=False überspringt den Abgleich des Sequenz-Stores mit der DB (Stream-Modus: der Stream schreibt
+    geschlossene Balken selbst in den Store).
+    """
+    global predict_task
+    active_buy_signals = [] # Format: [{'symbol': str, 'strength': float, 'price_for_qty_calc': float}]
+
+    # --- PASS 1: Signal-Generierung und Stärke-Bewertung ---
+    print(f"BOT-LOG: Pass 1 - Signal-Generierung für Symbole: {target_symbols}")
+    if not alpaca_client:
+        print("BOT-LOG: Alpaca API nicht initialisiert. Überspringe Signal-Generierung.")
+        predictions_by_symbol, configs_by_symbol, sequences_for_batch = {}, {}, {}
+    elif INFERENCE_POOL.enabled:
+        # Modelle liegen in den Inferenz-Prozessen; hier werden nur die Sequenzen aktualisiert und verschickt
+        if sync_store and not await _sync_window_store(db, target_symbols):
+            print("BOT-LOG: Sequenz-Store nicht aktualisiert, verwende zuletzt bekannte Daten.")
+        sequences_for_batch = _collect_sequences(target_symbols, seq_length, input_dim)
+        predictions_by_symbol, configs_by_symbol = {}, {}
+        if sequences_for_batch:
+            try:
+                predictions_by_symbol, configs_by_symbol = await asyncio.wait_for(
+                    INFERENCE_POOL.predict(sequences_for_batch), timeout=BOT_PREDICT_TIMEOUT_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                print(f"FEHLER: Zeitlimit für die Vorhersage im Inferenz-Pool ({BOT_PREDICT_TIMEOUT_SECONDS}s) überschritten (Pass 1).")
+            except Exception as e:
+                print(f"FEHLER bei der Vorhersage im Inferenz-Pool (Pass 1): {e}")
+    else:
+        # Modelle pro Symbol nebenläufig laden (begrenzt durch die Semaphore), parallel dazu die Sequenzdaten
+        # (Close + vorwärts aufgefülltes Sentiment) im In-Memory-Store mit der DB abgleichen
+        semaphore = asyncio.Semaphore(BOT_SYMBOL_CONCURRENCY)
+        store_synced, *loaded_components = await asyncio.gather(
+            _sync_window_store(db, target_symbols) if sync_store else asyncio.sleep(0, result=True),
+            *(_load_symbol_components(symbol, semaphore) for symbol in target_symbols),
+        )
+        components_for_batch = {s: c for s, c in zip(target_symbols, loaded_components) if c} # {symbol: model_components}
+        configs_by_symbol = {s: c['config'] for s, c in components_for_batch.items()}
+        if not store_synced:
+            print("BOT-LOG: Sequenz-Store nicht aktualisiert, verwende zuletzt bekannte Daten.")
+        sequences_for_batch = _collect_sequences(list(components_for_batch), seq_length, input_dim)
+
+        # Vorhersagen für alle Symbole gesammelt treffen (ein Forward-Pass pro Modellkonfiguration), im Thread-Pool.
+        # Ein Thread lässt sich nicht abbrechen: nach einem Zeitlimit rechnet er weiter, und solange er läuft,
+        # wird keine weitere Vorhersage auf denselben Modellen gestartet.
+        predictions_by_symbol = {}
+        if sequences_for_batch and predict_task is not None and not predict_task.done():
+            print("BOT-LOG: Vorhersage eines früheren Durchlaufs läuft noch, überspringe die Vorhersagen in diesem Durchlauf.")
+        elif sequences_for_batch:
+            predict_task = asyncio.ensure_future(asyncio.to_thread(_predict_batch, components_for_batch, sequences_for_batch))
+            try:
+                # shield: das Zeitlimit beendet nur das Warten, predict_task bleibt bis zum Ende des Threads aktiv
+                predictions_by_symbol = await asyncio.wait_for(asyncio.shield(predict_task), timeout=BOT_PREDICT_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                predict_task.add_done_callback(_log_abandoned_predict)
+                print(f"FEHLER: Zeitlimit für die Batch-Vorhersage ({BOT_PREDICT_TIMEOUT_SECONDS}s) überschritten (Pass 1).")
+            except Exception as e:
+                print(f"FEHLER bei der Batch-Vorhersage (Pass 1): {e}")
+
+    for symbol_to_process, sequence_data_for_model_np in sequences_for_batch.items():
+        try:
+            buy_signal = _evaluate_signal(
+                symbol_to_process, configs_by_symbol.get(symbol_to_process, {}),
+                sequence_data_for_model_np, predictions_by_symbol.get(symbol_to_process),
+            )
+            if buy_signal:
+                active_buy_signals.append(buy_signal)
+        except Exception as e:
+            print(f"FEHLER in Bot-Schleife (Pass 1) für Symbol {symbol_to_process}: {e}")
+            traceback.print_exc()
+    return active_buy_signals
+
+async def _execute_buy_signals(active_buy_signals: list[dict], cycle_key: int, submit_timeout: float = BOT_CYCLE_SECONDS):
+    """Pass 2 eines Durchlaufs: Kapital nach Signalstärke verteilen und Orders über den ORDER_EXECUTOR senden."""
+    # --- Kapitalallokation und Orderplatzierung (Pass 2) ---
+    if active_buy_signals:
+        # Sortiere Signale nach Stärke (optional, aber kann sinnvoll sein)
+        active_buy_signals.sort(key=lambda x: x['strength'], reverse=True)
+
+        total_positive_strength = sum(s['strength'] for s in active_buy_signals if s['strength'] > 0)
+        print(f"BOT-LOG: Pass 2 - Gesamt-Kauf-Signalstärke (positiv): {total_positive_strength:.4f} für {len(active_buy_signals)} Signale.")
+
+        if total_positive_strength > 0.0001: # Nur fortfahren, wenn eine Gesamtstärke vorhanden ist
+            try:
+                if not alpaca_client:
+                    print(f"BOT-LOG: Alpaca API nicht initialisiert. Orderplatzierung übersprungen.")
+                else:
+                    # Konto und Positionen gleichzeitig abrufen (beides zählt auf das Alpaca-Anfragebudget)
+                    account_info, positions = await asyncio.wait_for(
+                        asyncio.gather(alpaca_client.get_account(), alpaca_client.list_positions()),
+                        timeout=BOT_ORDER_TIMEOUT_SECONDS,
+                    )
+                    held_market_values = {p['symbol']: float(p['market_value']) for p in positions}
+                    cash_to_use = float(account_info['cash']) - BOT_CASH_BUFFER
+                    print(f"BOT-LOG: Verfügbares Kapital für Trades (nach Puffer von {BOT_CASH_BUFFER:.0f}): {cash_to_use:.2f} {account_info['currency']}, {len(positions)} offene Positionen")
+
+                    # Symbole mit noch nicht ausgeführter Kauf-Order aus früheren Durchläufen auslassen
+                    pending_symbols = ORDER_EXECUTOR.open_symbols('buy')
+                    if pending_symbols:
+                        print(f"BOT-LOG: Überspringe Symbole mit offener Kauf-Order: {sorted(pending_symbols)}")
+                    signals_to_trade = [s for s in active_buy_signals if s['symbol'] not in pending_symbols]
+
+                    if cash_to_use > 0:
+                        print(f"BOT-LOG: Starte Order-Platzierung basierend auf gewichteter Kapitalallokation.")
+                        planned_orders = _plan_buy_orders(signals_to_trade, total_positive_strength, cash_to_use, held_market_values, cycle_key)
+                        if planned_orders and BOT_SUBMIT_ORDERS:
+                            # Nebenläufig innerhalb des Anfragebudgets; Ausführungen verfolgt der Executor im Hintergrund.
+                            # Was bis zum nächsten Takt nicht gesendet ist, verfällt (veraltetes Signal).
+                            results = await asyncio.wait_for(ORDER_EXECUTOR.submit_orders(planned_orders), timeout=submit_timeout)
+                            DASHBOARD_HUB.apply_orders([r['order'] for r in results if r['ok']])
+                            for result in results:
+                                if result['ok']:
+                                    state = "bereits vorhanden" if result['duplicate'] else "platziert"
+                                    print(f"BOT-ORDER [{result['symbol']}]: Order {state}: {result['client_order_id']} ({result['order'].get('status')})")
+                        elif planned_orders:
+                            print(f"BOT-LOG: {len(planned_orders)} Orders nicht gesendet (BOT_SUBMIT_ORDERS ist deaktiviert).")
+                    else:
+                        print(f"BOT-LOG: Nicht genügend Kapital nach Puffer ({BOT_CASH_BUFFER:.0f} {account_info['currency']}) für Trades verfügbar.")
+            except asyncio.TimeoutError:
+                print(f"FEHLER: Zeitlimit beim Kapitalabruf oder beim Senden der Orders überschritten (Pass 2).")
+            except Exception as e:
+                print(f"FEHLER bei Kapitalabruf oder Order-Vorbereitung (Pass 2): {e}")
+                traceback.print_exc()
+        else:
+            print("BOT-LOG: Keine Kaufsignale mit ausreichender Gesamtstärke gefunden.")
+    else:
+        print("BOT-LOG: Keine aktiven Kaufsignale in diesem Durchlauf gefunden.")
+
 async def bot_loop():
     global bot_is_running
     global current_monitoring_symbol
@@ -204,169 +744,128 @@ async def bot_loop():
     FORECAST_HORIZON = FORECAST_HORIZON_DEFAULT # aus ml_utils
     INPUT_DIM_MODEL = INPUT_DIM_MODEL_DEFAULT # aus ml_utils (Close + Sentiment)
 
-    # Ziel-Ticker (könnte dynamisch aus DB oder Gemini-ähnlicher Quelle kommen)
-    target_symbols = ["AAPL", "MSFT", "GOOGL", "NVDA", "AMZN"] # Beispielhafte Top 5 für den Anfang
+    target_symbols = BOT_TARGET_SYMBOLS
     
-    db_for_loop = SessionLocal() # Eigene DB-Session für die Schleife
+    db_for_loop = AsyncSessionLocal() # Eigene (asynchrone) DB-Session für die Schleife
 
-    while bot_is_running:
-        print(f"BOT-LOG: Starte neuen Strategie-Durchlauf für Symbole: {target_symbols}")
-        active_buy_signals = [] # Format: [{'symbol': str, 'strength': float, 'price_for_qty_calc': float}]
+    try:
+        while bot_is_running:
+            cycle_started = asyncio.get_running_loop().time()
+            # Gleicher Takt -> gleiche client_order_ids, Wiederholungen im selben Durchlauf erzeugen keine Doppel-Orders
+            cycle_key = cycle_key_for(time.time(), BOT_CYCLE_SECONDS)
+            print(f"BOT-LOG: Starte neuen Strategie-Durchlauf für Symbole: {target_symbols}")
+            active_buy_signals = await _generate_buy_signals(db_for_loop, target_symbols, SEQ_LENGTH, INPUT_DIM_MODEL)
+            await _execute_buy_signals(active_buy_signals, cycle_key)
 
-        # --- PASS 1: Signal-Generierung und Stärke-Bewertung ---
-        print(f"BOT-LOG: Pass 1 - Signal-Generierung für Symbole: {target_symbols}")
-        for symbol_to_process in target_symbols:
-            try:
-                if not alpaca_api:
-                    print(f"BOT-LOG [{symbol_to_process}]: Alpaca API nicht initialisiert. Überspringe.")
-                    await asyncio.sleep(5) # Kurze Pause bevor nächstes Symbol
-                    continue
-
-                # Lade Modellkomponenten für den aktuellen Ticker
-                model_components = load_model_components_for_ticker(symbol_to_process.upper())
-                if not model_components:
-                    print(f"BOT-LOG [{symbol_to_process}]: Keine Modellkomponenten gefunden. Überspringe.")
-                    continue
-                
-                # Aktuelle Sequenzdaten (Close + Sentiment) aus der DB holen
-                # Annahme: crud-Funktionen geben Daten in korrekter Reihenfolge (älteste zuerst)
-                latest_prices_db = crud.get_latest_stock_prices_for_sequence(db_for_loop, symbol_to_process.upper(), SEQ_LENGTH)
-                latest_sentiments_db = crud.get_latest_sentiments_for_sequence(db_for_loop, symbol_to_process.upper(), SEQ_LENGTH)
-
-                # Daten aufbereiten (in DataFrame umwandeln, mergen, sicherstellen, dass SEQ_LENGTH Punkte vorhanden sind)
-                if len(latest_prices_db) < SEQ_LENGTH or len(latest_sentiments_db) < SEQ_LENGTH:
-                    print(f"BOT-LOG [{symbol_to_process}]: Nicht genügend Preis- ({len(latest_prices_db)}) oder Sentiment-Daten ({len(latest_sentiments_db)}) für Sequenzlänge {SEQ_LENGTH}. Überspringe.")
-                    continue
-
-                # Konvertiere zu DataFrames und merge sie basierend auf dem Datum
-                # Die DB-Abfragen geben neueste zuerst zurück, also umkehren für chronologische Reihenfolge
-                df_prices = pd.DataFrame(latest_prices_db, columns=['timestamp', 'Close']).iloc[::-1]
-                df_sentiments = pd.DataFrame(latest_sentiments_db, columns=['date', 'Sentiment']).iloc[::-1]
-
-                df_prices['date'] = pd.to_datetime(df_prices['timestamp']).dt.date
-                df_sentiments['date'] = pd.to_datetime(df_sentiments['date']) # Ist schon ein Datum
-
-                # Merge basierend auf dem Datum
-                # Wir brauchen ein tägliches Sentiment, das zum Close-Preis passt.
-                # Wenn Sentiment seltener ist, muss man entscheiden, wie man es zuordnet (z.B. ffill)
-                merged_df = pd.merge(df_prices, df_sentiments, on='date', how='left')
-                merged_df['Sentiment'] = merged_df['Sentiment'].fillna(0) # Fehlendes Sentiment als neutral (0)
-
-                if len(merged_df) < SEQ_LENGTH:
-                    print(f"BOT-LOG [{symbol_to_process}]: Nicht genügend gemergte Datenpunkte ({len(merged_df)}) für Sequenzlänge {SEQ_LENGTH}. Überspringe.")
-                    continue
-                
-                # Nimm die letzten SEQ_LENGTH Datenpunkte für das Modell
-                sequence_data_for_model_np = merged_df[['Close', 'Sentiment']].tail(SEQ_LENGTH).values.astype(np.float32)
-                
-                if sequence_data_for_model_np.shape[0] != SEQ_LENGTH or sequence_data_for_model_np.shape[1] != INPUT_DIM_MODEL:
-                    print(f"BOT-LOG [{symbol_to_process}]: Falsche Form der Sequenzdaten ({sequence_data_for_model_np.shape}). Erwartet ({SEQ_LENGTH}, {INPUT_DIM_MODEL}). Überspringe.")
-                    continue
-
-                # Vorhersage treffen
-                predicted_prices_actual = predict_for_ticker(model_components, sequence_data_for_model_np)
-
-                if predicted_prices_actual is not None and len(predicted_prices_actual) > 0:
-                    current_close_price = sequence_data_for_model_np[-1, 0] # Letzter bekannter Close-Preis
-                    # Stärke basierend auf der Vorhersage für den ersten Tag des Horizonts
-                    predicted_first_day_price = predicted_prices_actual[0]
-                    
-                    if current_close_price > 0:
-                        strength = (predicted_first_day_price - current_close_price) / current_close_price
-                        print(f"BOT-LOG [{symbol_to_process}]: Aktuell: {current_close_price:.2f}, Vorhersage Tag 1: {predicted_first_day_price:.2f}, Stärke: {strength:.4f}")
-
-                        # Hier deine Logik für Kaufsignal basierend auf Stärke
-                        model_buy_threshold = model_components['config'].get('prediction_threshold_buy_signal', 0.01) # Beispiel: 1% Anstieg
-                        if strength > model_buy_threshold: # Stelle sicher, dass diese if-Anweisung korrekt eingerückt ist
-                            print(f"BOT-SIGNAL [{symbol_to_process}]: KAUFSIGNAL (Modell) mit Stärke: {strength:.4f}") # 4 Leerzeichen mehr als das 'if'
-                            active_buy_signals.append({ # Exakt gleiche Einrückung wie die print-Zeile darüber
-                                'symbol': symbol_to_process,
-                                'strength': strength, # Positive Stärke für Kauf
-                                'price_for_qty_calc': current_close_price
-                            }) # Stelle sicher, dass diese Einrückung mit der print-Zeile darüber übereinstimmt
-                        elif strength < -model_components['config'].get('prediction_threshold_sell_signal', 0.01): # Beispiel für Verkauf
-                            print(f"BOT-SIGNAL [{symbol_to_process}]: VERKAUFSSIGNAL (Modell) mit Stärke: {strength:.4f}")
-                            # Hier könnte Verkaufslogik implementiert werden
-                        else:
-                            print(f"BOT-SIGNAL [{symbol_to_process}]: Kein starkes Handelssignal vom Modell (Stärke: {strength:.4f}).")
-                    else:
-                        print(f"BOT-LOG [{symbol_to_process}]: Aktueller Preis ist 0, kann Stärke nicht berechnen.")
-                else:
-                    print(f"BOT-LOG [{symbol_to_process}]: Keine Vorhersage vom Modell erhalten.")
+            # Feste Taktung: die Dauer des Durchlaufs wird von der Wartezeit abgezogen
+            cycle_seconds = asyncio.get_running_loop().time() - cycle_started
+            wait_seconds = max(0.0, BOT_CYCLE_SECONDS - cycle_seconds)
+            print(f"BOT-LOG: Strategie-Durchlauf beendet nach {cycle_seconds:.2f}s. Warte {wait_seconds:.0f} Sekunden bis zum nächsten Durchlauf.")
+            await asyncio.sleep(wait_seconds)
+    finally:
+        await db_for_loop.close() # Schließe die DB-Session, wenn die Schleife endet (auch bei Abbruch durch Lease-Verlust)
+        print("INFO: Bot-Schleife beendet.")
+
+async def stream_bot_loop():
+    """
+    Stream-Modus: statt im festen Takt zu pollen, werden Trades aus dem Kursdaten-Stream zu Balken aggregiert
+    (bar_stream) und ein Symbol wird bewertet, sobald sein Balken schließt. Balken, die kurz nacheinander
+    schließen (typisch: alle Symbole zum Tageswechsel), werden gemeinsam vorhergesagt und allokiert.
+    Die Balken haben immer das Modell-Intervall (Tagesbalken), unabhängig von STREAM_BAR_SECONDS der CLI.
+    Der Stream schreibt geschlossene Balken direkt in den Sequenz-Store; mit der DB abgeglichen wird nur
+    periodisch in Ruhephasen (Schreibzugriffe anderer Prozesse, z.B. Sentiment-Ingestion).
+    """
+    global bar_stream
+    print(f"INFO: Bot im Stream-Modus gestartet für {BOT_TARGET_SYMBOLS}.")
+    db_for_loop = AsyncSessionLocal()
+    closed_bars = asyncio.Queue()
 
+    async def on_bar_close(bars):
+        closed_bars.put_nowait(bars)
+
+    # Sequenz-Store vorab befüllen; danach schreibt der Stream neue Balken direkt hinein
+    await _sync_window_store(db_for_loop, BOT_TARGET_SYMBOLS)
+    bar_stream = BarStream(BOT_TARGET_SYMBOLS, on_bar_close=on_bar_close, bar_seconds=MODEL_BAR_SECONDS)
+    stream_task = asyncio.create_task(bar_stream.run())
+    try:
+        while bot_is_running:
+            try:
+                bars = await asyncio.wait_for(closed_bars.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                if WINDOW_STORE.needs_resync():
+                    await _sync_window_store(db_for_loop, BOT_TARGET_SYMBOLS)
+                continue # bot_is_running erneut prüfen
+            # Kurz sammeln, was im selben Moment schließt
+            await asyncio.sleep(BOT_STREAM_BATCH_SECONDS)
+            while not closed_bars.empty():
+                bars += closed_bars.get_nowait()
+            symbols = sorted({bar['symbol'] for bar in bars})
+            # Gemessen an der Ereigniszeit des Streams (bei Replays im Zeitraffer ungleich der Wanduhr)
+            bar_close_latency = bar_stream.aggregator.event_time_ns() / 1e9 - max(bar['end'].timestamp() for bar in bars)
+            print(f"BOT-LOG: Balken geschlossen für {symbols} (Verzögerung nach Balkenende: {bar_close_latency:.2f}s).")
+            # Balkenbeginn als Takt-Schlüssel: ein Balken -> höchstens eine Order pro Symbol und Seite
+            cycle_key = int(max(bar['timestamp'].timestamp() for bar in bars))
+            if WINDOW_STORE.invalidated_symbols():
+                # Nachgefüllte Lücken (Backfill) erst aus der DB übernehmen, sonst fehlen diese Symbole in der Bewertung
+                await _sync_window_store(db_for_loop, BOT_TARGET_SYMBOLS)
+            try:
+                active_buy_signals = await _generate_buy_signals(db_for_loop, symbols, SEQ_LENGTH_DEFAULT, INPUT_DIM_MODEL_DEFAULT,
+                                                                 sync_store=False)
+                await _execute_buy_signals(active_buy_signals, cycle_key)
             except Exception as e:
-                print(f"FEHLER in Bot-Schleife (Pass 1) für Symbol {symbol_to_process}: {e}")
-                import traceback
+                print(f"FEHLER bei der Bewertung geschlossener Balken für {symbols}: {e}")
                 traceback.print_exc()
-            await asyncio.sleep(2) # Kurze Pause zwischen der Verarbeitung der Symbole in Pass 1
-
-        # --- Kapitalallokation und Orderplatzierung (Pass 2) ---
-        if active_buy_signals:
-            # Sortiere Signale nach Stärke (optional, aber kann sinnvoll sein)
-            active_buy_signals.sort(key=lambda x: x['strength'], reverse=True)
-            
-            total_positive_strength = sum(s['strength'] for s in active_buy_signals if s['strength'] > 0)
-            print(f"BOT-LOG: Pass 2 - Gesamt-Kauf-Signalstärke (positiv): {total_positive_strength:.4f} für {len(active_buy_signals)} Signale.")
-
-            if total_positive_strength > 0.0001: # Nur fortfahren, wenn eine Gesamtstärke vorhanden ist
-                try:
-                    if not alpaca_api:
-                        print(f"BOT-LOG: Alpaca API nicht initialisiert. Orderplatzierung übersprungen.")
-                    else:
-                        account_info = alpaca_api.get_account()
-                        cash_buffer = 10000 
-                        cash_to_use = float(account_info.cash) - cash_buffer
-                        print(f"BOT-LOG: Verfügbares Kapital für Trades (nach Puffer von {cash_buffer}): {cash_to_use:.2f} {account_info.currency}")
-
-                        if cash_to_use > 0:
-                            print(f"BOT-LOG: Starte Order-Platzierung basierend auf gewichteter Kapitalallokation.")
-                            for buy_signal_info in active_buy_signals:
-                                if buy_signal_info['strength'] <= 0: continue # Nur positive Stärken für Kauf
-
-                                symbol = buy_signal_info['symbol']
-                                strength = buy_signal_info['strength']
-                                price_for_qty_calc = buy_signal_info['price_for_qty_calc']
-
-                                # Kapitalallokation proportional zur Stärke
-                                capital_for_this_trade = (strength / total_positive_strength) * cash_to_use
-                                print(f"BOT-LOG [{symbol}]: Allokiertes Kapital: {capital_for_this_trade:.2f} (Stärke: {strength:.4f})")
-
-                                if price_for_qty_calc > 0 and capital_for_this_trade > 1.0: # Mindestens 1 USD/EUR für einen Trade
-                                    qty_to_buy = int(capital_for_this_trade / price_for_qty_calc)
-                                    if qty_to_buy > 0:
-                                        print(f"BOT-ORDER [{symbol}]: Beabsichtige KAUF-Order für {qty_to_buy} Aktien zum Preis ~{price_for_qty_calc:.2f}.")
-                                        # Hier die tatsächliche Orderplatzierung (auskommentiert für Sicherheit):
-                                        # try:
-                                        #     order = alpaca_api.submit_order(
-                                        #         symbol=symbol, qty=qty_to_buy, side='buy', type='market', time_in_force='day'
-                                        #     )
-                                        #     print(f"BOT-ORDER [{symbol}]: Order platziert: {order.id}")
-                                        # except Exception as order_err:
-                                        #     print(f"FEHLER bei Orderplatzierung für {symbol}: {order_err}")
-                                    else:
-                                        print(f"BOT-ORDER [{symbol}]: Nicht genügend allokiertes Kapital für mind. 1 Aktie (Preis: {price_for_qty_calc:.2f}, Kapital: {capital_for_this_trade:.2f}).")
-                                else:
-                                    print(f"BOT-ORDER [{symbol}]: Ungültiger Preis ({price_for_qty_calc:.2f}) oder zu geringes Kapital ({capital_for_this_trade:.2f}) für Order.")
-                                await asyncio.sleep(1) # Kleine Pause zwischen (simulierten) Orderplatzierungen
-                        else:
-                            print(f"BOT-LOG: Nicht genügend Kapital nach Puffer ({cash_buffer} {account_info.currency}) für Trades verfügbar.")
-                except Exception as e:
-                    print(f"FEHLER bei Kapitalabruf oder Order-Vorbereitung (Pass 2): {e}")
-                    import traceback
-                    traceback.print_exc()
-            else:
-                print("BOT-LOG: Keine Kaufsignale mit ausreichender Gesamtstärke gefunden.")
-        else:
-            print("BOT-LOG: Keine aktiven Kaufsignale in diesem Durchlauf gefunden.")
+    finally:
+        stream_task.cancel()
+        await asyncio.gather(stream_task, return_exceptions=True)
+        await db_for_loop.close()
+        print("INFO: Stream-Modus des Bots beendet.")
+
+# --- Push-Kanal für das Dashboard ---
+# Alle Dashboards teilen sich einen serverseitigen Zustand (DASHBOARD_HUB): Alpaca wird nur einmal abgefragt,
+# egal wie viele Clients verbunden sind. Beide Endpunkte senden zuerst einen Snapshot, danach nur Änderungen.
+@app.websocket("/api/v1/ws/dashboard")
+async def dashboard_websocket(websocket: WebSocket):
+    await websocket.accept()
+    events = DASHBOARD_HUB.subscribe()
+    try:
+        async for message in events:
+            await websocket.send_text(encode_event(message))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await events.aclose()
 
-        print(f"BOT-LOG: Strategie-Durchlauf beendet. Warte 60 Sekunden bis zum nächsten Durchlauf.")
-        await asyncio.sleep(60)  # Warte 60 Sekunden bis zum nächsten kompletten Durchlauf der Strategie
+@app.get("/api/v1/events/dashboard")
+async def dashboard_event_stream():
+    """Server-Sent Events als Alternative zum WebSocket (z.B. hinter Proxies ohne WebSocket-Unterstützung)."""
+    async def event_source():
+        async for message in DASHBOARD_HUB.subscribe():
+            yield f"id: {message['seq']}\nevent: {message['type']}\ndata: {encode_event(message)}\n\n"
+    return StreamingResponse(event_source(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    db_for_loop.close() # Schließe die DB-Session, wenn die Schleife endet
-    print("INFO: Bot-Schleife beendet.")
+@app.get("/api/v1/events/stats")
+async def get_dashboard_event_stats():
+    return {**DASHBOARD_HUB.get_stats(), 'coalescing': DASHBOARD_COALESCER.stats}
+
+@app.get("/api/v1/stream/stats")
+async def get_stream_stats():
+    if bar_stream is None:
+        raise HTTPException(status_code=404, detail="Kursdaten-Stream läuft nicht (BOT_MODE=stream und Bot starten).")
+    return bar_stream.get_stats()
 
 @app.on_event("startup")
 async def startup_event():
+    global bot_control_task, order_mirror_task
+    # Jeder Worker nimmt an der Leader-Wahl teil; nur der Leader führt die Bot-Schleife aus
+    bot_control_task = asyncio.create_task(BOT_CONTROL.run(
+        _start_local_bot, _stop_local_bot, _local_bot_running,
+        on_state=lambda state: DASHBOARD_HUB.set_bot_status(_format_bot_status(state)),
+    ))
+    if ORDER_EXECUTOR:
+        # Abgeschlossene Orders sofort an die Dashboards melden
+        ORDER_EXECUTOR.listeners.append(DASHBOARD_HUB.on_order)
     # Erstelle Tabellen, falls sie nicht existieren
     # Diese Zeile sollte hier sein, nachdem alle Modelle importiert wurden.
     try:
@@ -375,12 +874,47 @@ async def startup_event():
     except Exception as e:
         print(f"FEHLER beim Erstellen der Datenbanktabellen: {e}")
 
-    # Lade alle Modelle beim Start des Bots vor (optional, kann auch on-demand in bot_loop geschehen)
-    # initial_target_symbols = ["AAPL", "MSFT", "GOOGL", "NVDA", "AMZN"] # Beispiel
-    # print("INFO: Lade Modelle beim Start vor...")
-    # for symbol in initial_target_symbols:
-    #     load_model_components_for_ticker(symbol.upper())
-    # print("INFO: Vorladen der Modelle abgeschlossen.")
+    # create_all legt Indizes nur für neue Tabellen an; für bestehende Tabellen werden sie hier nachgezogen
+    try:
+        sentiment_ingestion.ensure_sentiment_key(engine) # Bereinigt vorher doppelte Sentiment-Zeilen
+        for table in (models.StockPrice.__table__, models.StockSentiment.__table__):
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"FEHLER beim Anlegen der Indizes: {e}")
+
+    # Zeit-Partitionen für stock_prices (DEFAULT-Partition, aktueller und kommende Zeiträume)
+    try:
+        price_storage.init_storage(engine)
+    except Exception as e:
+        print(f"FEHLER beim Anlegen der Kurs-Partitionen: {e}")
+
+    if order_mirror.ORDER_MIRROR:
+        if ORDER_EXECUTOR:
+            ORDER_EXECUTOR.listeners.append(order_mirror.ORDER_MIRROR.on_order)
+        if order_mirror.ORDER_MIRROR.sync_seconds > 0:
+            # Abgleichen nur im Leader-Worker (dem mit der Bot-Lease), die übrigen lesen nur den Spiegel
+            order_mirror_task = asyncio.create_task(order_mirror.ORDER_MIRROR.run(should_sync=lambda: BOT_CONTROL.is_leader))
+
+    if MODEL_WARMUP_ON_STARTUP:
+        _start_model_warmup()
+
+    if import_profile.IMPORT_PROFILE_ENABLED:
+        import_profile.IMPORT_PROFILER.mark_ready()
+        import_profile.IMPORT_PROFILER.print_startup_report()
+
+def _start_model_warmup():
+    """Lädt die Modelle einmalig parallel im Hintergrund vor, damit der erste Bot-Durchlauf nicht auf das Laden wartet."""
+    global model_warmup_task
+    warmup_symbols = [s.strip().upper() for s in MODEL_WARMUP_SYMBOLS.split(",") if s.strip()]
+    if model_warmup_task is not None or not warmup_symbols:
+        return
+    print(f"INFO: Lade Modelle vor: {warmup_symbols}")
+    if INFERENCE_POOL.enabled:
+        # Startet die Inferenz-Prozesse und lädt die Modelle direkt dort
+        model_warmup_task = asyncio.create_task(INFERENCE_POOL.warm_up(warmup_symbols))
+    else:
+        model_warmup_task = asyncio.create_task(MODEL_REGISTRY.warm_up_async(warmup_symbols))
 
 # --- ALLES AB HIER ENTFERNEN ---
 #                                active_buy_signals.append({
@@ -466,32 +1000,79 @@ async def startup_event():
 #    print("INFO: Bot-Schleife beendet.")
 # --- BIS HIER ENTFERNEN ---
 
-@app.post("/api/v1/bot/start")
-async def start_bot(background_tasks: BackgroundTasks, symbol: str | None = None):
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Lokale Bot-Schleife beenden und die Lease freigeben, damit ein anderer Worker sofort übernimmt
+    if bot_control_task:
+        bot_control_task.cancel()
+    if order_mirror_task:
+        order_mirror_task.cancel()
+    _stop_local_bot(lease_lost=True)
+    await INGEST_JOBS.shutdown()
+    await BOT_CONTROL.aclose()
+    # Keep-Alive-Verbindungen des gemeinsamen HTTP-Clients sauber schließen
+    await HTTP_CLIENT.aclose()
+    await RESPONSE_CACHE.aclose()
+    INFERENCE_POOL.shutdown()
+
+def _local_bot_task_alive() -> bool:
+    return bot_task is not None and not bot_task.done()
+
+def _local_bot_running() -> bool:
+    return bot_is_running and _local_bot_task_alive()
+
+def _start_local_bot(symbol: str):
+    """Startet die Bot-Schleife in diesem Worker (nur vom Leader aufgerufen, siehe bot_control)."""
     global bot_is_running, bot_task, current_monitoring_symbol
-    if bot_is_running:
-        raise HTTPException(status_code=400, detail="Bot läuft bereits.")
-    
-    # Das `symbol` Argument vom Frontend wird hier für die `current_monitoring_symbol` verwendet,
-    # aber die `bot_loop` verwendet jetzt ihre eigene `target_symbols` Liste.
-    if symbol: 
-        current_monitoring_symbol = symbol.upper()
+    current_monitoring_symbol = symbol
     bot_is_running = True
-    # Starte die bot_loop als Hintergrundaufgabe
-    bot_task = asyncio.create_task(bot_loop())
-    # background_tasks.add_task(bot_loop) # Alternative mit FastAPI BackgroundTasks
-    return {"message": f"Bot erfolgreich gestartet. Überwacht: {current_monitoring_symbol}"}
+    _start_model_warmup() # Erst der Worker mit der Bot-Schleife lädt den ML-Stack
+    if _local_bot_task_alive():
+        return # Gestoppte Schleife ist noch im letzten Durchlauf: einfach weiterlaufen lassen
+    # Starte die bot_loop (bzw. im Stream-Modus die stream_bot_loop) als Hintergrundaufgabe
+    bot_task = asyncio.create_task(stream_bot_loop() if BOT_MODE == "stream" else bot_loop())
+
+def _stop_local_bot(lease_lost: bool = False):
+    """
+    Normaler Stopp: die Schleife beendet den laufenden Durchlauf und endet dann. Bei Verlust der Lease wird
+    sofort abgebrochen, damit der neue Leader nicht parallel handelt.
+    """
+    global bot_is_running
+    if bot_is_running:
+        print("INFO: Bot-Schleife wird gestoppt...")
+    bot_is_running = False
+    if lease_lost and _local_bot_task_alive():
+        bot_task.cancel()
+
+@app.post("/api/v1/bot/start")
+async def start_bot(background_tasks: BackgroundTasks, symbol: str | None = None):
+    try:
+        state = await BOT_CONTROL.get_state()
+        if state['running']:
+            raise HTTPException(status_code=400, detail="Bot läuft bereits.")
+        # Das `symbol` Argument vom Frontend wird hier für die `current_monitoring_symbol` verwendet,
+        # aber die `bot_loop` verwendet jetzt ihre eigene `target_symbols` Liste.
+        symbol = symbol.upper() if symbol else state['symbol']
+        # Nur der Soll-Zustand wird gesetzt; der Leader-Worker startet die Schleife (sofort bzw. beim nächsten Takt)
+        await BOT_CONTROL.set_desired(True, symbol)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Bot-Zustand nicht speicherbar (Redis): {e}")
+    DASHBOARD_HUB.set_bot_status(_format_bot_status({**state, 'running': True, 'symbol': symbol}))
+    return {"message": f"Bot erfolgreich gestartet. Überwacht: {symbol}"}
 
 @app.post("/api/v1/bot/stop")
 async def stop_bot():
-    global bot_is_running, bot_task
-    if not bot_is_running:
-        raise HTTPException(status_code=400, detail="Bot läuft nicht.")
-    bot_is_running = False
-    if bot_task:
-        # Hier könnte man versuchen, die Task sauber zu beenden,
-        # aber für eine einfache Schleife reicht es, bot_is_running zu setzen.
-        # bot_task.cancel() # Könnte verwendet werden, erfordert aber Fehlerbehandlung in der Schleife
-        pass
+    try:
+        state = await BOT_CONTROL.get_state()
+        if not state['running']:
+            raise HTTPException(status_code=400, detail="Bot läuft nicht.")
+        await BOT_CONTROL.set_desired(False)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Bot-Zustand nicht speicherbar (Redis): {e}")
+    DASHBOARD_HUB.set_bot_status(_format_bot_status({**state, 'running': False}))
     print("INFO: Bot-Stopp-Anfrage erhalten. Bot wird gestoppt...")
     return {"message": "Bot erfolgreich gestoppt."}
\ No newline at end of file
@@ -1,4 +1,9 @@
 import os
+import copy
+import time
+import hashlib
+import argparse
+from contextlib import contextmanager
 import torch
 import torch.nn as nn
 import joblib
@@ -12,14 +17,22 @@ from datetime import datetime, timedelta
 BASE_MODEL_DIR = "/app/trained_models" # Angepasst für dbot Struktur
 
 # Standard-Modellparameter (können durch geladene Konfiguration überschrieben werden)
-SEQ_LENGTH_DEFAULT = 60
-FORECAST_HORIZON_DEFAULT = 7
-INPUT_DIM_MODEL_DEFAULT = 2  # Close-Preis + Sentiment-Score
-D_MODEL_DEFAULT = 64
-NHEAD_DEFAULT = 4
-NUM_ENCODER_LAYERS_DEFAULT = 2
-DIM_FEEDFORWARD_DEFAULT = 256
-DROPOUT_MODEL_DEFAULT = 0.1
+from model_defaults import (
+    SEQ_LENGTH_DEFAULT, FORECAST_HORIZON_DEFAULT, INPUT_DIM_MODEL_DEFAULT, D_MODEL_DEFAULT, NHEAD_DEFAULT,
+    NUM_ENCODER_LAYERS_DEFAULT, DIM_FEEDFORWARD_DEFAULT, DROPOUT_MODEL_DEFAULT,
+)
+
+# Optimierter CPU-Inferenzpfad (opt-in): "eager" (Standard), "script" (TorchScript) oder
+# "int8" (TorchScript mit dynamischer int8-Quantisierung der Linear-Layer)
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "eager")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0")) # Intra-Op-Threads für torch (0 = torch-Standard)
+# Maximale Abweichung des optimierten Modells vom Eager-Modell (im skalierten Raum), sonst bleibt es beim Eager-Modell
+INFERENCE_MAX_DRIFT = float(os.getenv("INFERENCE_MAX_DRIFT", "0.01"))
+INFERENCE_DRIFT_SAMPLES = 32
+INFERENCE_MODES = ("eager", "script", "int8")
+
+if INFERENCE_THREADS > 0:
+    torch.set_num_threads(INFERENCE_THREADS)
 
 class TransformerForecastModel(nn.Module):
     def __init__(self, input_dim, d_model, nhead, num_encoder_layers, dim_feedforward, forecast_horizon, seq_length, dropout=0.1):
@@ -43,50 +56,159 @@ class TransformerForecastModel(nn.Module):
         return prediction
 
 
-LOADED_MODELS_CACHE = {} # Cache für geladene Modelle
+def model_file_paths(ticker_symbol: str) -> tuple[str, str, str]:
+    """Pfade zu Modellgewichten, Scaler und Konfiguration eines Tickers."""
+    return (
+        os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_transformer_model.pth"),
+        os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_scaler.pkl"),
+        os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_model_config.json"),
+    )
+
+def load_model_components_from_disk(ticker_symbol: str, device_str: str = "cpu", inference_mode: str = INFERENCE_MODE):
+    """
+    Lädt das trainierte Modell, den Scaler und die Konfiguration eines Tickers direkt von der Platte (ohne Cache).
+    Mit inference_mode "script"/"int8" wird zusätzlich ein optimiertes Modell vorbereitet (siehe prepare_inference_model).
+    Wirft FileNotFoundError, wenn eine der Dateien fehlt.
+    """
+    model_path, scaler_path, config_path = model_file_paths(ticker_symbol)
+    missing = [p for p in (model_path, scaler_path, config_path) if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Modell, Scaler oder Konfigurationsdatei für {ticker_symbol} nicht gefunden: {missing}")
+
+    with open(config_path, 'r') as f_cfg:
+        model_cfg = json.load(f_cfg)
+
+    scaler = joblib.load(scaler_path)
+
+    model = TransformerForecastModel(
+        input_dim=model_cfg.get('input_dim_model', INPUT_DIM_MODEL_DEFAULT),
+        d_model=model_cfg.get('d_model', D_MODEL_DEFAULT),
+        nhead=model_cfg.get('nhead', NHEAD_DEFAULT),
+        num_encoder_layers=model_cfg.get('num_encoder_layers', NUM_ENCODER_LAYERS_DEFAULT),
+        dim_feedforward=model_cfg.get('dim_feedforward', DIM_FEEDFORWARD_DEFAULT),
+        forecast_horizon=model_cfg.get('forecast_horizon', FORECAST_HORIZON_DEFAULT),
+        seq_length=model_cfg.get('sequence_length', SEQ_LENGTH_DEFAULT), # Wichtig für pos_encoder
+        dropout=model_cfg.get('dropout_model', DROPOUT_MODEL_DEFAULT)
+    ).to(device_str)
+    model.load_state_dict(torch.load(model_path, map_location=device_str))
+    model.eval()
+
+    components = {'model': model, 'scaler': scaler, 'config': model_cfg, 'device': device_str}
+    if inference_mode != "eager":
+        prepare_inference_model(components, ticker_symbol, inference_mode)
+    return components
 
 def load_model_components_for_ticker(ticker_symbol: str, device_str: str = "cpu"):
     """
     Lädt das trainierte Modell, den Scaler und die Konfiguration für einen bestimmten Ticker.
+    Die Komponenten kommen aus der Modell-Registry (LRU-Cache mit Speicherbudget, lädt geänderte Dateien neu).
     """
-    if ticker_symbol in LOADED_MODELS_CACHE:
-        # print(f"DEBUG: Verwende gecachte Modellkomponenten für {ticker_symbol}")
-        return LOADED_MODELS_CACHE[ticker_symbol]
+    from model_registry import MODEL_REGISTRY # Lokal importiert, da model_registry auf ml_utils aufbaut
+    return MODEL_REGISTRY.get(ticker_symbol, device_str)
 
-    model_path = os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_transformer_model.pth")
-    scaler_path = os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_scaler.pkl")
-    config_path = os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_model_config.json")
+# --- Optimierte CPU-Inferenz ---
 
-    if not all(os.path.exists(p) for p in [model_path, scaler_path, config_path]):
-        print(f"WARNUNG: Modell, Scaler oder Konfigurationsdatei für {ticker_symbol} nicht gefunden in {BASE_MODEL_DIR}.")
-        return None
+@contextmanager
+def _mha_fastpath_disabled():
+    """Schaltet den Fast-Path von TransformerEncoder/MultiheadAttention vorübergehend ab."""
+    fastpath_toggle = hasattr(torch.backends, 'mha') and hasattr(torch.backends.mha, 'set_fastpath_enabled')
+    if fastpath_toggle:
+        fastpath_before = torch.backends.mha.get_fastpath_enabled()
+        torch.backends.mha.set_fastpath_enabled(False)
+    try:
+        yield
+    finally:
+        if fastpath_toggle:
+            torch.backends.mha.set_fastpath_enabled(fastpath_before)
 
+def compiled_model_path(ticker_symbol: str, inference_mode: str) -> str:
+    """Pfad des kompilierten Modells, abgelegt neben den Modelldateien."""
+    return os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_transformer_model.{inference_mode}.pt")
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f_in:
+        for block in iter(lambda: f_in.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _example_inputs(config: dict, n_samples: int, seed: int = 0) -> torch.Tensor:
+    """Reproduzierbare Eingaben im skalierten Wertebereich [0, 1] (Kompilierung und Drift-Prüfung)."""
+    generator = torch.Generator().manual_seed(seed)
+    shape = (n_samples, config.get('sequence_length', SEQ_LENGTH_DEFAULT), config.get('input_dim_model', INPUT_DIM_MODEL_DEFAULT))
+    return torch.rand(shape, generator=generator)
+
+def compile_model_for_inference(model: nn.Module, config: dict, inference_mode: str = "script") -> torch.jit.ScriptModule:
+    """
+    Kompiliert ein Eager-Modell per TorchScript (Trace + Freeze).
+    "int8" quantisiert vorher die Linear-Layer dynamisch; deren Gewichte passen nicht zum Fast-Path
+    des TransformerEncoders, daher wird in diesem Fall ohne Fast-Path getraced.
+    """
+    example_input = _example_inputs(config, 1)
+    with torch.inference_mode():
+        if inference_mode == "int8":
+            quantized_model = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+            with _mha_fastpath_disabled():
+                traced_model = torch.jit.trace(quantized_model, example_input)
+        else:
+            traced_model = torch.jit.trace(model, example_input)
+    return torch.jit.freeze(traced_model.eval())
+
+def check_inference_drift(eager_model: nn.Module, optimized_model, config: dict,
+                          n_samples: int = INFERENCE_DRIFT_SAMPLES) -> float:
+    """Maximale absolute Abweichung (skalierte Vorhersage) zwischen optimiertem und Eager-Modell."""
+    inputs = _example_inputs(config, n_samples, seed=1)
+    with torch.inference_mode():
+        return float((optimized_model(inputs) - eager_model(inputs)).abs().max())
+
+def prepare_inference_model(model_components: dict, ticker_symbol: str, inference_mode: str = INFERENCE_MODE) -> dict:
+    """
+    Ergänzt die Modellkomponenten um ein optimiertes Modell ('inference_model'), sofern es die Drift-Prüfung
+    gegen das Eager-Modell besteht. Das kompilierte Modell wird neben den Modelldateien gecacht und über den
+    Hash der .pth-Datei, den Modus und die torch-Version wiedererkannt.
+    Bei Fehlern oder zu großer Abweichung bleibt es beim Eager-Modell.
+    """
+    if inference_mode == "eager":
+        return model_components
+    if inference_mode not in INFERENCE_MODES:
+        print(f"WARNUNG: Unbekannter INFERENCE_MODE '{inference_mode}'. Verwende Eager-Modell.")
+        return model_components
+    if model_components['device'] != "cpu":
+        return model_components # Optimierter Pfad ist für CPU-Hosts gedacht
+
+    model_path = os.path.join(BASE_MODEL_DIR, f"{ticker_symbol}_transformer_model.pth")
+    artifact_path = compiled_model_path(ticker_symbol, inference_mode)
     try:
-        with open(config_path, 'r') as f_cfg:
-            model_cfg = json.load(f_cfg)
-
-        scaler = joblib.load(scaler_path)
-
-        model = TransformerForecastModel(
-            input_dim=model_cfg.get('input_dim_model', INPUT_DIM_MODEL_DEFAULT),
-            d_model=model_cfg.get('d_model', D_MODEL_DEFAULT),
-            nhead=model_cfg.get('nhead', NHEAD_DEFAULT),
-            num_encoder_layers=model_cfg.get('num_encoder_layers', NUM_ENCODER_LAYERS_DEFAULT),
-            dim_feedforward=model_cfg.get('dim_feedforward', DIM_FEEDFORWARD_DEFAULT),
-            forecast_horizon=model_cfg.get('forecast_horizon', FORECAST_HORIZON_DEFAULT),
-            seq_length=model_cfg.get('sequence_length', SEQ_LENGTH_DEFAULT), # Wichtig für pos_encoder
-            dropout=model_cfg.get('dropout_model', DROPOUT_MODEL_DEFAULT)
-        ).to(device_str)
-        model.load_state_dict(torch.load(model_path, map_location=device_str))
-        model.eval()
-
-        components = {'model': model, 'scaler': scaler, 'config': model_cfg, 'device': device_str}
-        LOADED_MODELS_CACHE[ticker_symbol] = components
-        print(f"INFO: Modellkomponenten für {ticker_symbol} erfolgreich geladen.")
-        return components
+        source_info = json.dumps({'model_sha256': _file_sha256(model_path), 'mode': inference_mode, 'torch': torch.__version__})
+        optimized_model = None
+        if os.path.exists(artifact_path):
+            extra_files = {'source.json': ''}
+            cached_model = torch.jit.load(artifact_path, map_location="cpu", _extra_files=extra_files)
+            if extra_files['source.json'].decode() == source_info:
+                optimized_model = cached_model
+        if optimized_model is None:
+            started = time.perf_counter()
+            optimized_model = compile_model_for_inference(model_components['model'], model_components['config'], inference_mode)
+            try:
+                tmp_path = artifact_path + ".tmp"
+                torch.jit.save(optimized_model, tmp_path, _extra_files={'source.json': source_info})
+                os.replace(tmp_path, artifact_path)
+            except OSError as e:
+                print(f"WARNUNG: Kompiliertes Modell für {ticker_symbol} konnte nicht gespeichert werden: {e}")
+            print(f"INFO: Modell für {ticker_symbol} kompiliert ({inference_mode}) in {time.perf_counter() - started:.2f}s.")
+
+        drift = check_inference_drift(model_components['model'], optimized_model, model_components['config'])
+        if drift > INFERENCE_MAX_DRIFT:
+            print(f"WARNUNG: Optimiertes Modell ({inference_mode}) für {ticker_symbol} weicht um {drift:.5f} ab "
+                  f"(erlaubt {INFERENCE_MAX_DRIFT}). Verwende Eager-Modell.")
+            return model_components
+        model_components['inference_model'] = optimized_model
+        model_components['inference_mode'] = inference_mode
+        model_components['inference_drift'] = drift
+        model_components['inference_nbytes'] = os.path.getsize(artifact_path) if os.path.exists(artifact_path) else 0
     except Exception as e:
-        print(f"FEHLER beim Laden der Modellkomponenten für {ticker_symbol}: {e}")
-        return None
+        print(f"WARNUNG: Optimierter Inferenzpfad für {ticker_symbol} nicht verfügbar ({e}). Verwende Eager-Modell.")
+    return model_components
 
 def predict_for_ticker(model_components, latest_sequence_data_np: np.ndarray) -> np.ndarray | None:
     """
@@ -94,7 +216,7 @@ def predict_for_ticker(model_components, latest_sequence_data_np: np.ndarray) ->
     latest_sequence_data_np: Shape (SEQ_LENGTH, INPUT_DIM_MODEL), unskaliert.
     """
     if not model_components: return None
-    model = model_components['model']
+    model = model_components.get('inference_model') or model_components['model']
     scaler = model_components['scaler']
     config = model_components['config']
     device = model_components['device']
@@ -102,7 +224,7 @@ def predict_for_ticker(model_components, latest_sequence_data_np: np.ndarray) ->
     try:
         scaled_sequence = scaler.transform(latest_sequence_data_np)
         input_tensor = torch.from_numpy(scaled_sequence).unsqueeze(0).float().to(device)
-        with torch.no_grad():
+        with torch.inference_mode():
             prediction_scaled = model(input_tensor).squeeze().cpu().numpy() # (forecast_horizon,)
 
         dummy_array_for_inverse = np.zeros((config.get('forecast_horizon', FORECAST_HORIZON_DEFAULT), scaler.n_features_in_))
@@ -111,4 +233,134 @@ def predict_for_ticker(model_components, latest_sequence_data_np: np.ndarray) ->
         return prediction_actual_price
     except Exception as e:
         print(f"FEHLER bei der Vorhersage: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def _model_group_key(model_components) -> tuple:
+    """Schlüssel, unter dem Modelle mit identischer Architektur gemeinsam ausgeführt werden können."""
+    config = model_components['config']
+    return (
+        config.get('input_dim_model', INPUT_DIM_MODEL_DEFAULT),
+        config.get('d_model', D_MODEL_DEFAULT),
+        config.get('nhead', NHEAD_DEFAULT),
+        config.get('num_encoder_layers', NUM_ENCODER_LAYERS_DEFAULT),
+        config.get('dim_feedforward', DIM_FEEDFORWARD_DEFAULT),
+        config.get('forecast_horizon', FORECAST_HORIZON_DEFAULT),
+        config.get('sequence_length', SEQ_LENGTH_DEFAULT),
+        model_components['device'],
+        model_components.get('inference_mode', "eager"),
+    )
+
+def scaler_affine_params(model_components):
+    """
+    Liefert (scale, offset) mit scaler.transform(x) == x * scale + offset.
+    Gilt für alle featureweise affinen Scaler (MinMax, Standard, Robust, MaxAbs).
+    Das Ergebnis wird in den Modellkomponenten zwischengespeichert.
+    """
+    if 'scaler_affine' not in model_components:
+        scaler = model_components['scaler']
+        n_features = scaler.n_features_in_
+        offset = scaler.transform(np.zeros((1, n_features)))[0]
+        scale = np.diag(scaler.transform(np.eye(n_features))) - offset
+        model_components['scaler_affine'] = (scale.astype(np.float64), offset.astype(np.float64))
+    return model_components['scaler_affine']
+
+def _forward_stacked_models(models: list, input_tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Führt mehrere Modelle gleicher Architektur in einem vektorisierten Forward-Pass aus.
+    input_tensor: Shape (n_models, SEQ_LENGTH, INPUT_DIM_MODEL), Ergebnis: (n_models, forecast_horizon).
+    """
+    if len(models) == 1:
+        return models[0](input_tensor)
+
+    from torch.func import stack_module_state, functional_call
+    params, buffers = stack_module_state(models)
+    # Architektur-Vorlage ohne eigenen Speicher, die Gewichte kommen aus den gestapelten Parametern
+    base_model = copy.deepcopy(models[0]).to('meta')
+
+    def single_forward(p, b, x):
+        return functional_call(base_model, (p, b), (x.unsqueeze(0),)).squeeze(0)
+
+    # Der Fast-Path des TransformerEncoders hat keine vmap-Batching-Regel und würde pro Modell iterieren
+    with _mha_fastpath_disabled():
+        return torch.vmap(single_forward)(params, buffers, input_tensor)
+
+def predict_batch_for_tickers(components_by_ticker: dict, sequences_by_ticker: dict) -> dict:
+    """
+    Batch-Variante von predict_for_ticker für viele Ticker in einem Durchlauf.
+    components_by_ticker: {ticker: model_components}
+    sequences_by_ticker: {ticker: np.ndarray (SEQ_LENGTH, INPUT_DIM_MODEL), unskaliert}
+    Ticker mit gleicher Modellkonfiguration werden gruppiert und pro Gruppe in einem
+    gestapelten Forward-Pass ausgeführt; Skalierung und Rückskalierung erfolgen als Array-Operationen.
+    Gibt {ticker: np.ndarray (forecast_horizon,)} zurück; Ticker mit Fehlern fehlen im Ergebnis.
+    """
+    groups = {}
+    for ticker, sequence in sequences_by_ticker.items():
+        model_components = components_by_ticker.get(ticker)
+        if not model_components:
+            continue
+        groups.setdefault(_model_group_key(model_components), []).append(ticker)
+
+    predictions = {}
+    for group_key, tickers in groups.items():
+        device = group_key[-2]
+        try:
+            raw_batch = np.stack([np.asarray(sequences_by_ticker[t], dtype=np.float64) for t in tickers]) # (n, seq, features)
+            affine = [scaler_affine_params(components_by_ticker[t]) for t in tickers]
+            scales = np.stack([a[0] for a in affine]) # (n, features)
+            offsets = np.stack([a[1] for a in affine])
+
+            scaled_batch = raw_batch * scales[:, None, :] + offsets[:, None, :]
+            input_tensor = torch.from_numpy(scaled_batch).float().to(device)
+            with torch.inference_mode():
+                if group_key[-1] != "eager":
+                    # Kompilierte Modelle lassen sich nicht stapeln, laufen aber einzeln schneller als eager
+                    prediction_tensor = torch.cat([
+                        components_by_ticker[t]['inference_model'](input_tensor[i:i + 1]) for i, t in enumerate(tickers)
+                    ])
+                else:
+                    prediction_tensor = _forward_stacked_models([components_by_ticker[t]['model'] for t in tickers], input_tensor)
+                prediction_scaled = prediction_tensor.cpu().numpy() # (n, forecast_horizon)
+
+            # Rückskalierung für das erste Feature (Close-Preis), analog zu predict_for_ticker
+            prediction_actual = (prediction_scaled - offsets[:, :1]) / scales[:, :1]
+            for i, ticker in enumerate(tickers):
+                predictions[ticker] = prediction_actual[i]
+        except Exception as e:
+            print(f"FEHLER bei der Batch-Vorhersage für {tickers}: {e}. Falle auf Einzelvorhersagen zurück.")
+            for ticker in tickers:
+                prediction = predict_for_ticker(components_by_ticker[ticker], sequences_by_ticker[ticker])
+                if prediction is not None:
+                    predictions[ticker] = prediction
+    return predictions
+
+def main():
+    """Vergleicht Latenz und Abweichung des optimierten Inferenzpfads mit dem Eager-Modell."""
+    parser = argparse.ArgumentParser(description="Benchmark und Drift-Prüfung des optimierten CPU-Inferenzpfads.")
+    parser.add_argument("tickers", nargs="+", help="Ticker-Symbole mit trainierten Modellen, z.B. AAPL MSFT")
+    parser.add_argument("--mode", choices=INFERENCE_MODES[1:], default="script")
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS, help="Intra-Op-Threads (0 = torch-Standard)")
+    parser.add_argument("--runs", type=int, default=200, help="Anzahl gemessener Vorhersagen")
+    args = parser.parse_args()
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    for ticker in args.tickers:
+        components = load_model_components_from_disk(ticker.upper(), "cpu", args.mode)
+        if 'inference_model' not in components:
+            print(f"{ticker.upper()}: kein optimiertes Modell verfügbar (siehe Warnungen oben).")
+            continue
+        example_input = _example_inputs(components['config'], 1)
+        timings = {}
+        with torch.inference_mode():
+            for name, model in (("eager", components['model']), (args.mode, components['inference_model'])):
+                for _ in range(10):
+                    model(example_input) # Aufwärmen
+                started = time.perf_counter()
+                for _ in range(args.runs):
+                    model(example_input)
+                timings[name] = (time.perf_counter() - started) / args.runs * 1000
+        print(f"{ticker.upper()}: eager {timings['eager']:.3f} ms, {args.mode} {timings[args.mode]:.3f} ms "
+              f"(x{timings['eager'] / timings[args.mode]:.2f}), max. Abweichung {components['inference_drift']:.6f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# Standard-Modellparameter (können durch geladene Konfiguration überschrieben werden).
+# Eigenes Modul ohne torch-Import, damit z.B. window_store und main sie nutzen können, ohne den ML-Stack zu laden;
+# ml_utils stellt sie weiterhin unter denselben Namen bereit.
+SEQ_LENGTH_DEFAULT = 60
+FORECAST_HORIZON_DEFAULT = 7
+INPUT_DIM_MODEL_DEFAULT = 2  # Close-Preis + Sentiment-Score
+D_MODEL_DEFAULT = 64
+NHEAD_DEFAULT = 4
+NUM_ENCODER_LAYERS_DEFAULT = 2
+DIM_FEEDFORWARD_DEFAULT = 256
+DROPOUT_MODEL_DEFAULT = 0.1
@@ -0,0 +1,192 @@
+import os
+import time
+import pickle
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Speicherbudget für alle geladenen Modelle inkl. Scaler; darüber werden die am längsten ungenutzten verdrängt
+MODEL_REGISTRY_MAX_BYTES = int(float(os.getenv("MODEL_REGISTRY_MAX_MB", "512")) * 1024 * 1024)
+# Wie oft (höchstens) pro Modell geprüft wird, ob die Dateien auf der Platte geändert wurden
+MODEL_RELOAD_CHECK_SECONDS = float(os.getenv("MODEL_RELOAD_CHECK_SECONDS", "10"))
+MODEL_WARMUP_WORKERS = int(os.getenv("MODEL_WARMUP_WORKERS", "4"))
+
+def _file_stats(paths) -> tuple | None:
+    """(mtime_ns, size) je Datei oder None, wenn eine Datei fehlt."""
+    try:
+        return tuple((st.st_mtime_ns, st.st_size) for st in (os.stat(p) for p in paths))
+    except FileNotFoundError:
+        return None
+
+def _file_digest(paths) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f_in:
+            for block in iter(lambda: f_in.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+def _components_nbytes(components: dict) -> int:
+    """Speicherbedarf von Modell (Parameter + Buffer) und Scaler in Bytes."""
+    model = components['model']
+    tensor_bytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    try:
+        scaler_bytes = len(pickle.dumps(components['scaler'], protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        scaler_bytes = 0
+    # Kompilierte Modelle (TorchScript, ggf. int8) werden über die Größe ihres Artefakts geschätzt
+    return tensor_bytes + scaler_bytes + components.get('inference_nbytes', 0)
+
+class _RegistryEntry:
+    __slots__ = ("components", "nbytes", "file_stats", "digest", "checked_at", "loaded_at")
+
+    def __init__(self, components: dict, nbytes: int, file_stats: tuple, digest: str):
+        self.components = components
+        self.nbytes = nbytes
+        self.file_stats = file_stats
+        self.digest = digest
+        self.checked_at = time.monotonic()
+        self.loaded_at = time.time()
+
+class ModelRegistry:
+    """
+    Cache für Modellkomponenten (Modell, Scaler, Konfiguration) pro Ticker und Device.
+    - LRU-Verdrängung, sobald der geschätzte Speicherbedarf max_bytes übersteigt
+      (das zuletzt angefragte Modell bleibt immer geladen).
+    - Hot Reload: Ändern sich mtime/Größe der Dateien und auch deren Hash, wird das Modell beim nächsten
+      Zugriff neu geladen und der Eintrag in einem Schritt ersetzt. Schlägt das Laden fehl
+      (z.B. weil das Training gerade schreibt), bleibt das bisherige Modell aktiv.
+    - warm_up lädt eine Ticker-Liste parallel in einem Thread-Pool.
+    """
+
+    def __init__(self, max_bytes: int = MODEL_REGISTRY_MAX_BYTES, check_interval: float = MODEL_RELOAD_CHECK_SECONDS):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._entries = OrderedDict() # {(ticker, device): _RegistryEntry}, älteste Nutzung zuerst
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.stats = {'hits': 0, 'loads': 0, 'reloads': 0, 'evictions': 0, 'load_errors': 0}
+
+    def _load_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def get(self, ticker_symbol: str, device_str: str = "cpu"):
+        """Liefert die Modellkomponenten eines Tickers oder None, wenn keine (gültigen) Dateien existieren."""
+        key = (ticker_symbol, device_str)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if time.monotonic() - entry.checked_at < self.check_interval:
+                    self.stats['hits'] += 1
+                    return entry.components
+
+        # Erstes Laden oder fällige Prüfung auf geänderte Dateien; pro Ticker lädt nur ein Thread
+        with self._load_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.checked_at < self.check_interval:
+                return entry.components
+            return self._refresh(key, entry)
+
+    def _refresh(self, key: tuple, entry: _RegistryEntry | None):
+        import ml_utils # Erst beim ersten Modellzugriff: lädt torch (API-Worker ohne Bot bleiben schlank)
+        ticker_symbol, device_str = key
+        paths = ml_utils.model_file_paths(ticker_symbol)
+        file_stats = _file_stats(paths)
+
+        digest = None
+        if entry is not None:
+            if file_stats is None or file_stats == entry.file_stats:
+                # Unverändert (oder Dateien vorübergehend weg): weiter das geladene Modell verwenden
+                entry.checked_at = time.monotonic()
+                self.stats['hits'] += 1
+                return entry.components
+            digest = _file_digest(paths)
+            if digest == entry.digest:
+                # Nur der Zeitstempel hat sich geändert (z.B. erneut kopiert)
+                entry.file_stats, entry.checked_at = file_stats, time.monotonic()
+                self.stats['hits'] += 1
+                return entry.components
+        elif file_stats is None:
+            print(f"WARNUNG: Modell, Scaler oder Konfigurationsdatei für {ticker_symbol} nicht gefunden.")
+            return None
+
+        try:
+            digest = digest or _file_digest(paths)
+            components = ml_utils.load_model_components_from_disk(ticker_symbol, device_str)
+            if _file_stats(paths) != file_stats:
+                raise RuntimeError("Dateien wurden während des Ladens geändert")
+        except Exception as e:
+            self.stats['load_errors'] += 1
+            if entry is not None:
+                print(f"WARNUNG: Neuladen des Modells für {ticker_symbol} fehlgeschlagen ({e}). Verwende bisheriges Modell.")
+                entry.checked_at = time.monotonic() # Nächster Versuch nach Ablauf des Prüfintervalls
+                return entry.components
+            print(f"FEHLER beim Laden der Modellkomponenten für {ticker_symbol}: {e}")
+            return None
+
+        new_entry = _RegistryEntry(components, _components_nbytes(components), file_stats, digest)
+        with self._lock:
+            self._entries[key] = new_entry # Atomarer Austausch; laufende Vorhersagen behalten ihre alte Referenz
+            self._entries.move_to_end(key)
+            self._evict_locked(keep=key)
+        if entry is not None:
+            self.stats['reloads'] += 1
+            print(f"INFO: Geänderte Modelldateien für {ticker_symbol} erkannt, Modell neu geladen.")
+        else:
+            self.stats['loads'] += 1
+            print(f"INFO: Modellkomponenten für {ticker_symbol} erfolgreich geladen ({new_entry.nbytes / 1024 / 1024:.1f} MB).")
+        return components
+
+    def _evict_locked(self, keep: tuple):
+        total_bytes = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total_bytes -= self._entries.pop(key).nbytes
+            self.stats['evictions'] += 1
+            print(f"INFO: Modell für {key[0]} aus dem Speicher verdrängt (Budget {self.max_bytes / 1024 / 1024:.0f} MB).")
+
+    def warm_up(self, ticker_symbols: list[str], device_str: str = "cpu", max_workers: int = MODEL_WARMUP_WORKERS) -> dict:
+        """Lädt die Modelle mehrerer Ticker parallel vor. Gibt {ticker: True/False} zurück."""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="model-warmup") as pool:
+            results = dict(zip(ticker_symbols, pool.map(lambda t: self.get(t, device_str) is not None, ticker_symbols)))
+        print(f"INFO: Modell-Warm-up: {sum(results.values())}/{len(results)} Modelle in {time.perf_counter() - started:.2f}s geladen.")
+        return results
+
+    async def warm_up_async(self, ticker_symbols: list[str], device_str: str = "cpu", max_workers: int = MODEL_WARMUP_WORKERS) -> dict:
+        return await asyncio.to_thread(self.warm_up, ticker_symbols, device_str, max_workers)
+
+    def invalidate(self, ticker_symbol: str | None = None):
+        """Entfernt ein Modell (oder alle) aus dem Cache; der nächste Zugriff lädt neu."""
+        with self._lock:
+            for key in list(self._entries):
+                if ticker_symbol is None or key[0] == ticker_symbol:
+                    del self._entries[key]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries = [
+                {'ticker': key[0], 'device': key[1], 'mb': round(e.nbytes / 1024 / 1024, 2),
+                 'inference_mode': e.components.get('inference_mode', "eager"),
+                 'loaded_at': e.loaded_at, 'digest': e.digest[:12]}
+                for key, e in self._entries.items()
+            ]
+            total_bytes = sum(e.nbytes for e in self._entries.values())
+        return {
+            'models': len(entries),
+            'total_mb': round(total_bytes / 1024 / 1024, 2),
+            'budget_mb': round(self.max_bytes / 1024 / 1024, 2),
+            'counters': dict(self.stats),
+            'entries': entries, # Älteste Nutzung zuerst
+        }
+
+# Prozessweite Registry
+MODEL_REGISTRY = ModelRegistry()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date, Index, Numeric
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func # für server_default=func.now()
 from database import Base # Geändert
@@ -9,9 +10,11 @@ from database import Base # Geändert
 
 class StockPrice(Base):
     __tablename__ = "stock_prices"
-    id = Column(Integer, primary_key=True, index=True)
-    symbol = Column(String, index=True, nullable=False)
-    timestamp = Column(DateTime(timezone=True), index=True, nullable=False) # Oder Date, wenn nur Tagesdaten
+    # Primärschlüssel (symbol, timestamp): eindeutiger Schlüssel für Upserts (ON CONFLICT) bei der Massen-Ingestion,
+    # zugleich Index für die "letzte N Kurse pro Symbol"-Abfragen. Ohne Surrogat-ID, da jeder eindeutige
+    # Schlüssel einer partitionierten Tabelle die Partitionsspalte enthalten muss.
+    symbol = Column(String, primary_key=True)
+    timestamp = Column(DateTime(timezone=True), primary_key=True) # Oder Date, wenn nur Tagesdaten
     open = Column(Float, nullable=True)
     high = Column(Float, nullable=True)
     low = Column(Float, nullable=True)
@@ -20,11 +23,92 @@ class StockPrice(Base):
     volume = Column(Float, nullable=True) # Float, da Volumen sehr groß sein kann
     source = Column(String, nullable=True, default="FMP") # Quelle der Daten, z.B. FMP
 
+    # Nach Zeit partitioniert (Partitionen legt price_storage.py an)
+    __table_args__ = {'postgresql_partition_by': 'RANGE (timestamp)'}
+
+class StockPriceRollupMixin:
+    """OHLCV-Verdichtung von stock_prices auf feste Zeiteinheiten (gepflegt von price_storage.py)."""
+    symbol = Column(String, primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True) # Beginn der Einheit (UTC)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    volume = Column(Float, nullable=True)
+    bar_count = Column(Integer, nullable=False) # Anzahl verdichteter Rohbalken
+
+class StockPriceHourly(StockPriceRollupMixin, Base):
+    __tablename__ = "stock_prices_1h"
+
+class StockPriceDaily(StockPriceRollupMixin, Base):
+    __tablename__ = "stock_prices_1d"
+
+DEFAULT_SENTIMENT_SOURCE = "GeminiNews"
+
 class StockSentiment(Base):
     __tablename__ = "stock_sentiments"
     id = Column(Integer, primary_key=True, index=True)
-    symbol = Column(String, index=True, nullable=False)
+    symbol = Column(String, nullable=False) # Abgedeckt durch den Index auf (symbol, date, source)
     date = Column(Date, index=True, nullable=False) # Sentiment ist oft tagesbasiert
     sentiment_score = Column(Float, nullable=False) # z.B. -1 bis 1
-    source = Column(String, nullable=True, default="GeminiNews") # Quelle, z.B. Gemini, NewsAPI
-    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # Quelle, z.B. Gemini, NewsAPI. NOT NULL, da der eindeutige Index NULL-Quellen nicht als gleich ansieht
+    source = Column(String, nullable=False, default=DEFAULT_SENTIMENT_SOURCE, server_default=DEFAULT_SENTIMENT_SOURCE)
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Eindeutiger Schlüssel für Upserts (ON CONFLICT) bei der Massen-Ingestion, zugleich Index für
+    # Abfragen nach Symbol, sortiert bzw. begrenzt nach Datum
+    __table_args__ = (Index('uq_stock_sentiments_symbol_date_source', 'symbol', 'date', 'source', unique=True),)
+
+class AlpacaOrderMirror(Base):
+    """
+    Lokale Kopie der Alpaca-Orders (gepflegt von order_mirror.py). Filter- und Sortierspalten sind eigene
+    Spalten, die vollständige API-Antwort liegt in 'raw' (daraus werden die Endpunkte bedient).
+    """
+    __tablename__ = "alpaca_orders"
+    id = Column(String, primary_key=True) # Alpaca-Order-ID
+    client_order_id = Column(String, nullable=False)
+    symbol = Column(String, nullable=False)
+    side = Column(String, nullable=False)
+    type = Column(String, nullable=True)
+    status = Column(String, nullable=False)
+    qty = Column(Numeric, nullable=True) # Numeric statt Float: Alpaca liefert Dezimalstrings
+    filled_qty = Column(Numeric, nullable=True)
+    filled_avg_price = Column(Numeric, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    submitted_at = Column(DateTime(timezone=True), nullable=True) # Wasserstand der inkrementellen Synchronisation
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    filled_at = Column(DateTime(timezone=True), nullable=True)
+    raw = Column(JSONB, nullable=False)
+    synced_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Keyset-Pagination nach (created_at, id), ohne und mit Filter auf Symbol bzw. Status
+    __table_args__ = (
+        Index('ix_alpaca_orders_created_at_id', 'created_at', 'id'),
+        Index('ix_alpaca_orders_symbol_created_at_id', 'symbol', 'created_at', 'id'),
+        Index('ix_alpaca_orders_status_created_at_id', 'status', 'created_at', 'id'),
+        Index('ix_alpaca_orders_submitted_at', 'submitted_at'),
+        Index('uq_alpaca_orders_client_order_id', 'client_order_id', unique=True),
+    )
+
+class AlpacaPositionMirror(Base):
+    """Letzter Stand der offenen Alpaca-Positionen (wird bei jeder Synchronisation vollständig ersetzt)."""
+    __tablename__ = "alpaca_positions"
+    symbol = Column(String, primary_key=True)
+    side = Column(String, nullable=True)
+    qty = Column(Numeric, nullable=False)
+    avg_entry_price = Column(Numeric, nullable=True)
+    market_value = Column(Numeric, nullable=True)
+    unrealized_pl = Column(Numeric, nullable=True)
+    raw = Column(JSONB, nullable=False)
+    synced_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AlpacaSyncState(Base):
+    """
+    Fortschritt der inkrementellen Synchronisation (eine Zeile pro Abgleich, z.B. 'orders').
+    Der Wasserstand wird nur von order_mirror.sync_new_orders nach einem vollständigen Durchlauf fortgeschrieben,
+    nicht von einzeln gespiegelten Orders (Listener), die früher eingereichte, noch fehlende Orders überholen können.
+    """
+    __tablename__ = "alpaca_sync_state"
+    name = Column(String, primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
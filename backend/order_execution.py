@@ -0,0 +1,261 @@
+import os
+import time
+import asyncio
+import argparse
+from collections import deque
+from datetime import datetime, timedelta
+
+from http_clients import UpstreamAPIError, alpaca_client
+
+# Gleichzeitig laufende Order-Anfragen; das eigentliche Budget begrenzt der Token-Bucket des AlpacaClient
+ORDER_SUBMIT_CONCURRENCY = int(os.getenv("ORDER_SUBMIT_CONCURRENCY", "16"))
+# Abstand der Abfragen des Ausführungsstatus (eine Listen-Anfrage pro 500 Orders, nicht eine pro Order)
+ORDER_FILL_POLL_SECONDS = float(os.getenv("ORDER_FILL_POLL_SECONDS", "2"))
+# Danach wird eine offene Order einzeln abgefragt und nicht weiter verfolgt
+ORDER_TRACK_MAX_SECONDS = float(os.getenv("ORDER_TRACK_MAX_SECONDS", "900"))
+ORDER_ID_PREFIX = os.getenv("ORDER_ID_PREFIX", "dbot")
+ORDER_HISTORY_SIZE = 1000 # Zuletzt abgeschlossene Orders für Status-Abfragen
+
+TERMINAL_STATUSES = {"filled", "canceled", "expired", "rejected"}
+ORDERS_PAGE_SIZE = 500 # Maximum von Alpaca für list_orders
+
+def client_order_id(symbol: str, side: str, cycle_key: int) -> str:
+    """
+    Deterministische ID einer Order-Absicht: gleiches Symbol, gleiche Seite, gleicher Durchlauf -> gleiche ID.
+    Wiederholungen (HTTP-Retry, Neustart mitten im Durchlauf) erzeugen so keine doppelte Order.
+    """
+    return f"{ORDER_ID_PREFIX}-{cycle_key}-{side}-{symbol.upper()}"
+
+def cycle_key_for(timestamp: float, cycle_seconds: float) -> int:
+    """Beginn des Taktfensters (Unix-Sekunden), in das der Zeitpunkt fällt."""
+    return int(timestamp // cycle_seconds * cycle_seconds)
+
+def _parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def _is_duplicate_error(e: UpstreamAPIError) -> bool:
+    return e.status_code == 422 and "client_order_id" in e.message.lower()
+
+class OrderExecutor:
+    """
+    Ausführung von Orders über den AlpacaClient.
+    - submit_orders() sendet nebenläufig (Semaphore) innerhalb des Anfragebudgets des Token-Buckets.
+    - Jede Order trägt eine deterministische client_order_id. Meldet Alpaca die ID als vergeben oder bleibt
+      nach einem Timeout offen, ob die Order angekommen ist, wird die bestehende Order abgefragt statt neu gesendet.
+    - Ausführungen werden im Hintergrund verfolgt: ein Task fragt periodisch die abgeschlossenen Orders
+      seit der ältesten offenen Order ab (seitenweise) und meldet Endzustände an registrierte Listener.
+    """
+
+    def __init__(self, client=alpaca_client, max_concurrency: int = ORDER_SUBMIT_CONCURRENCY,
+                 poll_seconds: float = ORDER_FILL_POLL_SECONDS, track_max_seconds: float = ORDER_TRACK_MAX_SECONDS):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.poll_seconds = poll_seconds
+        self.track_max_seconds = track_max_seconds
+        self._semaphore = None
+        self._open = {} # {order_id: order}, noch nicht abgeschlossene Orders
+        self._tracked_since = {} # {order_id: time.monotonic() beim Start der Verfolgung}
+        self._tracker_task = None
+        self.recent = deque(maxlen=ORDER_HISTORY_SIZE)
+        self.listeners = [] # async callback(order) bei Endzustand
+        self._listener_tasks = set() # Laufende Listener-Aufrufe (der Event-Loop hält Tasks nur schwach referenziert)
+        self.stats = {'submitted': 0, 'duplicates': 0, 'errors': 0, 'filled': 0, 'canceled': 0,
+                      'expired': 0, 'rejected': 0, 'untracked': 0, 'polls': 0, 'submit_seconds': 0.0}
+
+    # --- Senden ---
+    async def submit_orders(self, orders: list[dict]) -> list[dict]:
+        """
+        Sendet Orders ({'symbol', 'qty', 'side', 'client_order_id'[, 'type', 'time_in_force']}) nebenläufig.
+        Gibt pro Order {'symbol', 'client_order_id', 'ok', 'duplicate', 'order' | 'error'} zurück.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._submit_one(order) for order in orders))
+        self.stats['submit_seconds'] += time.perf_counter() - started
+        return results
+
+    async def _submit_one(self, request: dict) -> dict:
+        symbol, order_id = request['symbol'], request['client_order_id']
+        result = {'symbol': symbol, 'client_order_id': order_id, 'ok': False, 'duplicate': False}
+        async with self._semaphore:
+            try:
+                order = await self.client.submit_order(
+                    symbol=symbol, qty=request['qty'], side=request['side'], type=request.get('type', "market"),
+                    time_in_force=request.get('time_in_force', "day"), client_order_id=order_id,
+                )
+                self.stats['submitted'] += 1
+            except UpstreamAPIError as e:
+                order = await self._existing_order(order_id) if _is_duplicate_error(e) or e.status_code >= 500 else None
+                if order is None:
+                    self.stats['errors'] += 1
+                    print(f"FEHLER bei Orderplatzierung für {symbol} ({order_id}): {e.message}")
+                    return {**result, 'error': e.message}
+                # Order existiert bereits (frühere Übertragung oder Wiederholung nach Timeout)
+                self.stats['duplicates'] += 1
+                result['duplicate'] = True
+                if order.get('status') in TERMINAL_STATUSES:
+                    return {**result, 'ok': True, 'order': order} # Bereits abgeschlossen und gemeldet
+        self._track(order)
+        return {**result, 'ok': True, 'order': order}
+
+    async def _existing_order(self, order_id: str) -> dict | None:
+        try:
+            return await self.client.get_order_by_client_order_id(order_id)
+        except UpstreamAPIError:
+            return None
+
+    # --- Ausführungen verfolgen ---
+    def _track(self, order: dict):
+        if order.get('status') in TERMINAL_STATUSES:
+            self._finish(order)
+            return
+        self._open[order['id']] = order
+        self._tracked_since.setdefault(order['id'], time.monotonic())
+        if self._tracker_task is None or self._tracker_task.done():
+            self._tracker_task = asyncio.create_task(self._track_fills())
+
+    def _finish(self, order: dict):
+        self._open.pop(order['id'], None)
+        self._tracked_since.pop(order['id'], None)
+        if order.get('status') in self.stats:
+            self.stats[order['status']] += 1
+        self.recent.append(order)
+        for listener in self.listeners:
+            task = asyncio.create_task(listener(order))
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_done)
+
+    def _listener_done(self, task: asyncio.Task):
+        self._listener_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"WARNUNG: Order-Listener fehlgeschlagen: {task.exception()}")
+
+    async def _track_fills(self):
+        while self._open:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.poll_fills()
+            except Exception as e:
+                print(f"WARNUNG: Abfrage der Order-Ausführungen fehlgeschlagen: {e}")
+
+    async def poll_fills(self):
+        """Gleicht die offenen Orders mit den seitdem abgeschlossenen Orders ab."""
+        if not self._open:
+            return
+        self.stats['polls'] += 1
+        # 'after' ist exklusiv; eine Mikrosekunde vor der ältesten offenen Order beginnen
+        after = min((order['submitted_at'] for order in self._open.values()), key=_parse_iso)
+        after = (_parse_iso(after) - timedelta(microseconds=1)).isoformat()
+        while self._open:
+            page = await self.client.list_orders(status="closed", limit=ORDERS_PAGE_SIZE, direction="asc", after=after)
+            for order in page:
+                if order['id'] in self._open:
+                    self._finish(order)
+            if len(page) < ORDERS_PAGE_SIZE:
+                break
+            # Nächste Seite ebenfalls knapp vor der letzten Order beginnen: Orders mit demselben Zeitstempel können
+            # auf beiden Seiten der Seitengrenze liegen. Doppelt gelieferte sind bereits aus _open entfernt.
+            next_after = _parse_iso(page[-1]['submitted_at']) - timedelta(microseconds=1)
+            if next_after <= _parse_iso(after):
+                print(f"WARNUNG: Mehr als {ORDERS_PAGE_SIZE} Orders mit demselben Zeitstempel, übrige werden nach {self.track_max_seconds:.0f}s einzeln abgefragt.")
+                break
+            after = next_after.isoformat()
+
+        # Zu lange offene Orders einzeln abfragen und danach nicht weiter verfolgen
+        now = time.monotonic()
+        for order_id in [i for i, since in self._tracked_since.items() if now - since > self.track_max_seconds]:
+            try:
+                order = await self.client.get_order(order_id)
+            except UpstreamAPIError:
+                order = self._open[order_id]
+            if order.get('status') in TERMINAL_STATUSES:
+                self._finish(order)
+            else:
+                self._open.pop(order_id, None)
+                self._tracked_since.pop(order_id, None)
+                self.stats['untracked'] += 1
+                print(f"WARNUNG: Order {order.get('client_order_id')} nach {self.track_max_seconds:.0f}s noch offen ({order.get('status')}), Verfolgung beendet.")
+
+    async def wait_until_settled(self, timeout: float | None = None):
+        """Wartet, bis keine verfolgte Order mehr offen ist und alle Listener gelaufen sind (z.B. in Lasttests)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (self._open or self._listener_tasks) and (deadline is None or time.monotonic() < deadline):
+            await asyncio.sleep(min(0.1, self.poll_seconds))
+        return not self._open and not self._listener_tasks
+
+    # --- Status ---
+    def open_symbols(self, side: str | None = None) -> set[str]:
+        return {o['symbol'] for o in self._open.values() if side is None or o.get('side') == side}
+
+    def get_stats(self) -> dict:
+        limiter = getattr(self.client, 'rate_limiter', None)
+        return {
+            'open_orders': len(self._open),
+            'open_symbols': sorted(self.open_symbols()),
+            'rate_limit': None if limiter is None else {
+                'per_minute': round(limiter.rate * 60, 1), 'burst': limiter.capacity,
+                'available_tokens': round(limiter.available, 2), 'waited_seconds': round(limiter.waited_seconds, 2),
+            },
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+            'recent': list(self.recent)[-20:],
+        }
+
+# Prozessweiter Executor (None ohne Alpaca-Zugangsdaten)
+ORDER_EXECUTOR = OrderExecutor() if alpaca_client else None
+
+async def _load_test(args):
+    """Lasttest gegen den Fake-Broker: Durchsatz beim Senden, Zeit bis zur Ausführung, Idempotenz bei Wiederholung."""
+    import httpx
+    from http_clients import AsyncHTTPClient, AlpacaClient, TokenBucket
+    from fake_broker import FakeBroker, create_app
+
+    if args.base_url:
+        http_client, base_url = AsyncHTTPClient(), args.base_url
+    else:
+        broker = FakeBroker(cash=args.cash, fill_delay=args.fill_delay, timestamp_resolution=args.timestamp_resolution)
+        app = create_app(broker, rate_limit_per_minute=args.rate_limit_per_minute)
+        http_client, base_url = AsyncHTTPClient(transport=httpx.ASGITransport(app=app)), "http://fake-broker"
+    limiter = TokenBucket(args.rate_limit_per_minute * 0.95 / 60, max(1.0, args.rate_limit_per_minute * 0.05))
+    client = AlpacaClient("fake", "fake", base_url, http_client=http_client, rate_limiter=limiter)
+    executor = OrderExecutor(client, max_concurrency=args.concurrency, poll_seconds=args.poll_seconds)
+
+    cycle_key = cycle_key_for(time.time(), 60)
+    orders = [
+        {'symbol': f"T{i:05d}", 'qty': 1, 'side': "buy", 'client_order_id': client_order_id(f"T{i:05d}", "buy", cycle_key)}
+        for i in range(args.orders)
+    ]
+    started = time.perf_counter()
+    results = await executor.submit_orders(orders)
+    submit_seconds = time.perf_counter() - started
+    settled = await executor.wait_until_settled(timeout=args.fill_delay + args.poll_seconds * 5 + 30)
+    settle_seconds = time.perf_counter() - started
+
+    # Derselbe Durchlauf noch einmal: alle Orders müssen als bereits vorhanden erkannt werden
+    replay = await executor.submit_orders(orders)
+    await http_client.aclose()
+    if not args.base_url:
+        print(f"Fake-Broker: {broker.stats}")
+
+    print(f"Orders: {len(orders)}, angenommen: {sum(r['ok'] for r in results)}, Fehler: {sum(not r['ok'] for r in results)}")
+    print(f"Senden: {submit_seconds:.2f}s ({len(orders) / submit_seconds:.0f} Orders/s), alle ausgeführt: {settled} nach {settle_seconds:.2f}s")
+    print(f"Wiederholung: {sum(r['duplicate'] for r in replay)}/{len(replay)} als bereits vorhanden erkannt")
+    stats = executor.get_stats()
+    stats.pop('recent')
+    print(f"Executor: {stats}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest der Orderausführung gegen den Fake-Broker.")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--rate-limit-per-minute", type=float, default=60000, help="Kontingent des Fake-Brokers (Alpaca: 200)")
+    parser.add_argument("--concurrency", type=int, default=ORDER_SUBMIT_CONCURRENCY)
+    parser.add_argument("--poll-seconds", type=float, default=0.5)
+    parser.add_argument("--fill-delay", type=float, default=1.0)
+    parser.add_argument("--timestamp-resolution", type=float, default=0.01,
+                        help="Zeitstempel-Auflösung des Fake-Brokers; grob, damit Seitengrenzen auf gleiche Zeitstempel fallen")
+    parser.add_argument("--cash", type=float, default=1e9)
+    parser.add_argument("--base-url", default=None, help="Laufender Fake-Broker statt In-Process-App")
+    asyncio.run(_load_test(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
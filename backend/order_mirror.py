@@ -0,0 +1,257 @@
+import os
+import time
+import base64
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+import async_crud
+from database import AsyncSessionLocal, async_engine
+from http_clients import alpaca_client
+from order_execution import TERMINAL_STATUSES
+
+# Spiegel der Alpaca-Orders und -Positionen in Postgres (Tabellen alpaca_orders, alpaca_positions).
+# Die Lese-Endpunkte und das Dashboard lesen nur noch den Spiegel und verbrauchen kein Alpaca-Kontingent.
+# Abgleich (periodisch im Backend, per POST /api/v1/alpaca/sync oder: python order_mirror.py):
+# 1. Neue Orders: Alpaca filtert Orders nur nach Einreichungszeit ('after'), daher ist der Wasserstand der späteste
+#    submitted_at-Zeitpunkt des letzten vollständigen Abgleichs (Tabelle alpaca_sync_state); abgefragt wird
+#    aufsteigend ab dort, seitenweise bis zur letzten Seite. Nicht max(submitted_at) des Spiegels: der Listener
+#    schreibt abgeschlossene Orders sofort und würde damit früher eingereichte, noch nicht gespiegelte überholen.
+# 2. Geänderte Orders: Orders, die im Spiegel noch nicht abgeschlossen sind, werden aus der Liste offener Orders
+#    bzw. einzeln nachgeladen. Abgeschlossene Orders ändern sich nicht mehr.
+# 3. Positionen: der aktuelle Bestand ersetzt den gespiegelten (eine Anfrage).
+# Abgeschlossene Orders der Orderausführung werden zusätzlich sofort übernommen (Listener am ORDER_EXECUTOR).
+
+load_dotenv()
+
+ORDER_MIRROR_SYNC_SECONDS = float(os.getenv("ORDER_MIRROR_SYNC_SECONDS", "30")) # 0 = kein periodischer Abgleich im Backend
+ORDER_MIRROR_BACKFILL_DAYS = int(os.getenv("ORDER_MIRROR_BACKFILL_DAYS", "365")) # Rückblick beim ersten Abgleich
+ORDER_MIRROR_MAX_PAGES = int(os.getenv("ORDER_MIRROR_MAX_PAGES", "200")) # Obergrenze pro Abgleich (darüber bleibt der Wasserstand stehen)
+ORDER_MIRROR_MAX_REFRESH = int(os.getenv("ORDER_MIRROR_MAX_REFRESH", "100")) # Offene Orders, die pro Abgleich geprüft werden
+ORDER_MIRROR_PAGE_SIZE = 500 # Maximum von Alpaca für list_orders
+# Der Wasserstand wird um diese Zeit zurückgesetzt, damit Orders mit gleichem Zeitstempel nicht verloren gehen
+ORDER_MIRROR_OVERLAP_SECONDS = 1.0
+
+# 'replaced' ist bei Alpaca ebenfalls ein Endzustand (die Order lebt unter neuer ID weiter)
+SETTLED_STATUSES = TERMINAL_STATUSES | {"replaced"}
+
+# Nur ein Prozess gleicht gleichzeitig ab (Sperre auf Sitzungsebene, bis zum Ende des Abgleichs)
+SYNC_TRY_LOCK_SQL = text("SELECT pg_try_advisory_lock(hashtext('alpaca_order_mirror'))")
+SYNC_UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('alpaca_order_mirror'))")
+
+def status_filter(status: str) -> tuple:
+    """Übersetzt den status-Parameter der Endpunkte in (statuses, exclude_statuses) für async_crud.get_mirrored_orders."""
+    if status == "all":
+        return None, None
+    if status == "open":
+        return None, SETTLED_STATUSES
+    if status == "closed":
+        return SETTLED_STATUSES, None
+    return [status], None
+
+def encode_cursor(cursor: tuple | None) -> str | None:
+    """(created_at, id) der letzten Order einer Seite als undurchsichtiger Cursor."""
+    if cursor is None:
+        return None
+    created_at, order_id = cursor
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{order_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(value: str) -> tuple:
+    """Gegenstück zu encode_cursor. Wirft ValueError bei ungültigem Cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        created_at, order_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), order_id
+    except Exception:
+        raise ValueError("Ungültiger Cursor.")
+
+def _submitted_at(orders: list[dict]) -> datetime:
+    """Spätester Einreichungszeitpunkt der Orders (created_at, falls submitted_at fehlt)."""
+    return max(pd.Timestamp(o.get('submitted_at') or o['created_at']) for o in orders).to_pydatetime(warn=False)
+
+class OrderMirror:
+    """Gleicht den Postgres-Spiegel inkrementell mit Alpaca ab (siehe Modulkommentar)."""
+
+    def __init__(self, client, sync_seconds: float = ORDER_MIRROR_SYNC_SECONDS,
+                 backfill_days: int = ORDER_MIRROR_BACKFILL_DAYS, max_pages: int = ORDER_MIRROR_MAX_PAGES,
+                 max_refresh: int = ORDER_MIRROR_MAX_REFRESH, session_factory=AsyncSessionLocal, engine=async_engine):
+        self.client = client
+        self.sync_seconds = sync_seconds
+        self.backfill_days = backfill_days
+        self.max_pages = max_pages
+        self.max_refresh = max_refresh
+        self.session_factory = session_factory
+        self.engine = engine
+        self._sync_lock = asyncio.Lock()
+        self.last_report = None
+        self.stats = {'syncs': 0, 'skipped': 0, 'errors': 0, 'api_requests': 0, 'orders_written': 0,
+                      'listener_writes': 0, 'last_sync_at': None, 'last_error': None}
+
+    async def _list_orders(self, **params) -> list[dict]:
+        self.stats['api_requests'] += 1
+        return await self.client.list_orders(limit=ORDER_MIRROR_PAGE_SIZE, **params)
+
+    async def _write_orders(self, orders: list[dict]) -> int:
+        if not orders:
+            return 0
+        async with self.session_factory() as db:
+            written = await async_crud.upsert_mirrored_orders(db, orders)
+        self.stats['orders_written'] += written
+        return written
+
+    async def _list_orders_after(self, status: str, after: datetime, stop_after: datetime | None = None) -> tuple[list[dict], bool]:
+        """
+        Alle Orders mit submitted_at > after (aufsteigend, seitenweise, höchstens max_pages Seiten); mit stop_after endet
+        die Abfrage, sobald eine Seite darüber hinausreicht. Gibt (Orders, vollständig) zurück.
+        """
+        orders, pages = [], 0
+        while pages < self.max_pages:
+            page = await self._list_orders(status=status, direction="asc", after=after.isoformat())
+            pages += 1
+            orders.extend(page)
+            if len(page) < ORDER_MIRROR_PAGE_SIZE:
+                return orders, True
+            # Nächste Seite ab der letzten Order (knapp davor, da 'after' exklusiv ist und Zeitstempel gleich sein können)
+            last = _submitted_at(page)
+            if stop_after is not None and last > stop_after:
+                return orders, True
+            if last - timedelta(microseconds=1) <= after:
+                print(f"WARNUNG: Order-Spiegel: mehr als {ORDER_MIRROR_PAGE_SIZE} Orders mit demselben Zeitstempel, Abgleich unvollständig.")
+                return orders, False
+            after = last - timedelta(microseconds=1)
+        print(f"WARNUNG: Order-Spiegel: Obergrenze von {self.max_pages} Seiten erreicht, Wasserstand bleibt stehen (ORDER_MIRROR_MAX_PAGES erhöhen).")
+        return orders, False
+
+    async def sync_new_orders(self) -> dict:
+        """Holt alle seit dem Wasserstand eingereichten Orders."""
+        async with self.session_factory() as db:
+            watermark = await async_crud.get_order_sync_watermark(db)
+        if watermark is None:
+            after = datetime.now(timezone.utc) - timedelta(days=self.backfill_days)
+        else:
+            after = watermark - timedelta(seconds=ORDER_MIRROR_OVERLAP_SECONDS)
+        orders, complete = await self._list_orders_after("all", after)
+        written = await self._write_orders(orders)
+        if complete and orders:
+            # Erst nach einem vollständigen Durchlauf und nur mit den Orders dieses Durchlaufs fortschreiben
+            latest = _submitted_at(orders)
+            if watermark is None or latest > watermark:
+                async with self.session_factory() as db:
+                    await async_crud.set_order_sync_watermark(db, latest)
+                watermark = latest
+        return {'orders': written, 'complete': complete, 'watermark': watermark.isoformat() if watermark else None}
+
+    async def refresh_unsettled_orders(self) -> dict:
+        """
+        Aktualisiert gespiegelte Orders, die beim letzten Abgleich noch offen waren: offene aus der Liste offener
+        Orders, inzwischen abgeschlossene aus der Liste abgeschlossener Orders ab der ältesten von ihnen; was dort
+        (wegen der Seitengrenze) fehlt, wird einzeln geladen.
+        """
+        async with self.session_factory() as db:
+            unsettled = await async_crud.get_unsettled_orders(db, SETTLED_STATUSES, self.max_refresh)
+        if not unsettled:
+            return {'checked': 0, 'fetched_individually': 0}
+        overlap = timedelta(seconds=ORDER_MIRROR_OVERLAP_SECONDS)
+        open_orders, _ = await self._list_orders_after("open", min(unsettled.values()) - overlap, max(unsettled.values()))
+        changed = {o['id']: o for o in open_orders if o['id'] in unsettled}
+        closed_since = [unsettled[order_id] for order_id in unsettled if order_id not in changed]
+        if closed_since:
+            closed_orders, _ = await self._list_orders_after("closed", min(closed_since) - overlap, max(closed_since))
+            changed.update((o['id'], o) for o in closed_orders if o['id'] in unsettled)
+        missing_ids = [order_id for order_id in unsettled if order_id not in changed]
+        self.stats['api_requests'] += len(missing_ids)
+        fetched = await asyncio.gather(*(self.client.get_order(order_id) for order_id in missing_ids), return_exceptions=True)
+        for order_id, result in zip(missing_ids, fetched):
+            if isinstance(result, Exception):
+                print(f"WARNUNG: Order-Spiegel: Order {order_id} nicht abrufbar: {result}")
+            else:
+                changed[order_id] = result
+        await self._write_orders(list(changed.values()))
+        return {'checked': len(unsettled), 'fetched_individually': len(missing_ids)}
+
+    async def sync_positions(self) -> int:
+        self.stats['api_requests'] += 1
+        positions = await self.client.list_positions()
+        async with self.session_factory() as db:
+            return await async_crud.replace_mirrored_positions(db, positions)
+
+    async def sync(self) -> dict:
+        """Ein vollständiger Abgleich (neue Orders, offene Orders, Positionen). Läuft bereits einer, wird übersprungen."""
+        if self._sync_lock.locked():
+            self.stats['skipped'] += 1
+            return {'skipped': True, 'reason': "Abgleich läuft bereits in diesem Prozess."}
+        async with self._sync_lock, self.engine.connect() as lock_conn:
+            if not (await lock_conn.execute(SYNC_TRY_LOCK_SQL)).scalar():
+                self.stats['skipped'] += 1
+                return {'skipped': True, 'reason': "Abgleich läuft bereits in einem anderen Prozess."}
+            started, requests_before = time.perf_counter(), self.stats['api_requests']
+            try:
+                report = {
+                    # Zuerst die bisher offenen Orders, damit gerade neu gespiegelte nicht sofort erneut abgefragt werden
+                    'unsettled_orders': await self.refresh_unsettled_orders(),
+                    'new_orders': await self.sync_new_orders(),
+                    'positions': await self.sync_positions(),
+                }
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(e)
+                raise
+            finally:
+                await lock_conn.execute(SYNC_UNLOCK_SQL)
+        self.stats['syncs'] += 1
+        self.stats['last_sync_at'] = datetime.now(timezone.utc).isoformat()
+        self.last_report = {**report, 'api_requests': self.stats['api_requests'] - requests_before,
+                            'seconds': round(time.perf_counter() - started, 3)}
+        return self.last_report
+
+    async def on_order(self, order: dict):
+        """Listener für den ORDER_EXECUTOR: abgeschlossene Orders sofort spiegeln (ohne zusätzliche API-Anfrage)."""
+        try:
+            await self._write_orders([order])
+            self.stats['listener_writes'] += 1
+        except Exception as e:
+            print(f"WARNUNG: Order {order.get('id')} konnte nicht gespiegelt werden: {e}")
+
+    async def run(self, should_sync=None):
+        """
+        Periodischer Abgleich im Hintergrund (alle sync_seconds).
+        should_sync: optionale Funktion, die entscheidet, ob dieser Prozess abgleicht (z.B. nur der Bot-Leader),
+        damit mehrere Worker das Alpaca-Kontingent nicht mehrfach verbrauchen.
+        """
+        while True:
+            if should_sync is None or should_sync():
+                try:
+                    await self.sync()
+                except Exception as e:
+                    print(f"FEHLER beim Abgleich des Order-Spiegels: {e}")
+            await asyncio.sleep(self.sync_seconds)
+
+    def get_stats(self) -> dict:
+        return {'sync_seconds': self.sync_seconds, **self.stats, 'last_report': self.last_report}
+
+# Prozessweiter Spiegel (None ohne Alpaca-Zugangsdaten; gespiegelte Daten bleiben trotzdem lesbar)
+ORDER_MIRROR = OrderMirror(alpaca_client) if alpaca_client else None
+
+async def _run_cli(args):
+    if not ORDER_MIRROR:
+        raise SystemExit("FEHLER: Alpaca API Keys nicht gefunden.")
+    ORDER_MIRROR.backfill_days = args.backfill_days
+    while True:
+        report = await ORDER_MIRROR.sync()
+        print(report)
+        if not args.loop:
+            return
+        await asyncio.sleep(ORDER_MIRROR.sync_seconds or 30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gleicht den Postgres-Spiegel der Alpaca-Orders und -Positionen ab.")
+    parser.add_argument("--loop", action="store_true", help=f"Dauerhaft alle ORDER_MIRROR_SYNC_SECONDS ({ORDER_MIRROR_SYNC_SECONDS:g}s) abgleichen")
+    parser.add_argument("--backfill-days", type=int, default=ORDER_MIRROR_BACKFILL_DAYS, help="Rückblick, solange der Spiegel leer ist")
+    asyncio.run(_run_cli(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+import os
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Speicherlayout der Kursdaten:
+# - stock_prices ist nach Zeit partitioniert (RANGE auf timestamp, eine Partition pro Monat bzw. Jahr, dazu eine
+#   DEFAULT-Partition als Auffangbecken). Partitionen werden vor jedem Schreiben bei Bedarf angelegt; Zeilen, die
+#   schon in der DEFAULT-Partition liegen, werden dabei in die neue Partition verschoben.
+# - stock_prices_1h / stock_prices_1d enthalten OHLCV-Rollups. Nach jedem Schreiben werden nur die betroffenen
+#   Tage der geschriebenen Symbole neu verdichtet (1h aus den Rohdaten, 1d aus 1h).
+# - get_price_series bedient Chart-Abfragen aus der gröbsten Tabelle, die für max_points noch fein genug ist.
+# Bestehende (unpartitionierte) Tabellen funktionieren weiter (der Start legt den eindeutigen Index für die Upserts an);
+# Umstellung mit: python price_storage.py migrate
+
+STOCK_PRICE_PARTITION_INTERVAL = os.getenv("STOCK_PRICE_PARTITION_INTERVAL", "month") # month | year
+STOCK_PRICE_PARTITIONS_AHEAD = int(os.getenv("STOCK_PRICE_PARTITIONS_AHEAD", "3")) # Im Voraus angelegte Partitionen
+STOCK_PRICE_ROLLUPS = os.getenv("STOCK_PRICE_ROLLUPS", "true").lower() == "true"
+DEFAULT_PARTITION = "stock_prices_default"
+
+# Auflösung -> (Tabelle, Zeitspalte, Sekunden pro Punkt); von fein nach grob
+RESOLUTIONS = {
+    'raw': ("stock_prices", "timestamp", None),
+    '1h': ("stock_prices_1h", "bucket", 3600),
+    '1d': ("stock_prices_1d", "bucket", 86400),
+}
+
+# Prozess-Cache der vorhandenen Partitionen (Name) und der Tabellenart, damit nicht vor jedem Schreiben
+# der Katalog gelesen wird. Partitionsnamen einer Transaktion werden in session.info vorgemerkt und erst nach
+# deren Commit übernommen: nach einem Rollback gibt es die angelegten Partitionen nicht.
+_known_partitions = set()
+_partitioned = None
+_PENDING_PARTITIONS = 'stock_prices_partitions'
+
+# --- Partitionen ---
+
+def partition_range(ts: datetime, interval: str = STOCK_PRICE_PARTITION_INTERVAL) -> tuple[str, datetime, datetime]:
+    """Name, Beginn (inklusive) und Ende (exklusive) der Partition, in die ts fällt (UTC)."""
+    ts = pd.Timestamp(ts).tz_convert("UTC") if pd.Timestamp(ts).tzinfo else pd.Timestamp(ts).tz_localize("UTC")
+    if interval == "year":
+        lo = datetime(ts.year, 1, 1, tzinfo=timezone.utc)
+        return f"stock_prices_p{ts.year}", lo, lo.replace(year=ts.year + 1)
+    lo = datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+    hi = lo.replace(year=ts.year + 1, month=1) if ts.month == 12 else lo.replace(month=ts.month + 1)
+    return f"stock_prices_p{ts.year}_{ts.month:02d}", lo, hi
+
+def partitions_between(start: datetime, end: datetime) -> list[tuple[str, datetime, datetime]]:
+    partitions = []
+    name, lo, hi = partition_range(start)
+    end = pd.Timestamp(end).tz_convert("UTC") if pd.Timestamp(end).tzinfo else pd.Timestamp(end).tz_localize("UTC")
+    while lo <= end:
+        partitions.append((name, lo, hi))
+        name, lo, hi = partition_range(hi)
+    return partitions
+
+IS_PARTITIONED_SQL = text("SELECT relkind = 'p' FROM pg_class WHERE relname = 'stock_prices' AND relkind IN ('r', 'p')")
+EXISTING_PARTITIONS_SQL = text("""
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = 'stock_prices'
+""")
+# Serialisiert das Anlegen von Partitionen zwischen Workern (bis zum Ende der Transaktion)
+PARTITION_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('stock_prices_partitions'))")
+
+# Unpartitionierte Tabellen (mit Surrogat-ID) brauchen für die Upserts einen eigenen eindeutigen Index
+LEGACY_UNIQUE_INDEX = "uq_stock_prices_symbol_timestamp"
+LEGACY_UNIQUE_INDEX_EXISTS_SQL = text(f"SELECT to_regclass('{LEGACY_UNIQUE_INDEX}') IS NOT NULL")
+# Behält pro (symbol, timestamp) die zuletzt eingefügte Zeile
+DEDUPLICATE_LEGACY_PRICES_SQL = text("""
+    DELETE FROM stock_prices sp USING stock_prices newer
+    WHERE sp.symbol = newer.symbol AND sp.timestamp = newer.timestamp AND sp.ctid < newer.ctid
+""")
+
+def _create_partition_statements(name: str, lo: datetime, hi: datetime) -> list:
+    bounds = f"FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    moved = "timestamp >= :lo AND timestamp < :hi"
+    return [
+        (text(f"CREATE TABLE {name} (LIKE stock_prices INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"), {}),
+        # Bereits in der DEFAULT-Partition gelandete Zeilen mitnehmen, sonst schlägt ATTACH fehl
+        (text(f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {moved} RETURNING *) INSERT INTO {name} SELECT * FROM moved"),
+         {'lo': lo, 'hi': hi}),
+        (text(f"ALTER TABLE stock_prices ATTACH PARTITION {name} FOR VALUES {bounds}"), {}),
+    ]
+
+def _missing_partitions(start, end) -> list:
+    if start is None or end is None or pd.isna(start) or pd.isna(end):
+        return []
+    return [p for p in partitions_between(start, end) if p[0] not in _known_partitions]
+
+def _partitions_to_create(session: Session, existing: set, missing: list) -> list:
+    """Fehlende Partitionen, die noch nicht im Katalog stehen; merkt alle Namen für den Commit vor."""
+    to_create = [p for p in missing if p[0] not in existing]
+    session.info.setdefault(_PENDING_PARTITIONS, set()).update(existing, (p[0] for p in to_create))
+    return to_create
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed_partitions(session: Session):
+    _known_partitions.update(session.info.pop(_PENDING_PARTITIONS, ()))
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_partitions(session: Session):
+    session.info.pop(_PENDING_PARTITIONS, None)
+
+def ensure_partitions(db: Session, start: datetime, end: datetime) -> list[str]:
+    """Legt fehlende Partitionen für [start, end] an (in der laufenden Transaktion). Gibt die neuen Namen zurück."""
+    global _partitioned
+    missing = _missing_partitions(start, end)
+    if missing and _partitioned is None:
+        _partitioned = bool(db.execute(IS_PARTITIONED_SQL).scalar())
+    if not missing or not _partitioned:
+        return []
+    db.execute(PARTITION_LOCK_SQL)
+    existing = set(db.execute(EXISTING_PARTITIONS_SQL).scalars())
+    created = []
+    for name, lo, hi in _partitions_to_create(db, existing, missing):
+        for statement, params in _create_partition_statements(name, lo, hi):
+            db.execute(statement, params)
+        created.append(name)
+    return created
+
+async def ensure_partitions_async(db: AsyncSession, start: datetime, end: datetime) -> list[str]:
+    """Asynchrone Variante von ensure_partitions."""
+    global _partitioned
+    missing = _missing_partitions(start, end)
+    if missing and _partitioned is None:
+        _partitioned = bool((await db.execute(IS_PARTITIONED_SQL)).scalar())
+    if not missing or not _partitioned:
+        return []
+    await db.execute(PARTITION_LOCK_SQL)
+    existing = set((await db.execute(EXISTING_PARTITIONS_SQL)).scalars())
+    created = []
+    for name, lo, hi in _partitions_to_create(db.sync_session, existing, missing):
+        for statement, params in _create_partition_statements(name, lo, hi):
+            await db.execute(statement, params)
+        created.append(name)
+    return created
+
+def ensure_legacy_unique_key(db: Session):
+    """
+    Legt auf einer unpartitionierten stock_prices-Tabelle den eindeutigen Index auf (symbol, timestamp) an, den
+    ON CONFLICT in den Upserts benötigt (bereinigt vorher Duplikate). Die partitionierte Tabelle hat dafür ihren
+    Primärschlüssel.
+    """
+    db.execute(PARTITION_LOCK_SQL) # Nur ein Worker bereinigt und legt an
+    if db.execute(LEGACY_UNIQUE_INDEX_EXISTS_SQL).scalar():
+        return
+    deleted = db.execute(DEDUPLICATE_LEGACY_PRICES_SQL).rowcount
+    if deleted:
+        print(f"INFO: {deleted} doppelte Kurszeilen entfernt.")
+    db.execute(text(f"CREATE UNIQUE INDEX {LEGACY_UNIQUE_INDEX} ON stock_prices (symbol, timestamp)"))
+    print(f"INFO: Eindeutiger Index {LEGACY_UNIQUE_INDEX} auf stock_prices angelegt.")
+
+def init_storage(engine):
+    """
+    Beim Start: DEFAULT-Partition und Partitionen um das aktuelle Datum anlegen; auf einer unpartitionierten
+    Tabelle stattdessen den eindeutigen Schlüssel für die Upserts sicherstellen.
+    """
+    global _partitioned
+    with Session(engine) as db:
+        _partitioned = bool(db.execute(IS_PARTITIONED_SQL).scalar())
+        if not _partitioned:
+            ensure_legacy_unique_key(db)
+            db.commit()
+            print("WARNUNG: stock_prices ist nicht partitioniert. Umstellung mit: python price_storage.py migrate")
+            return
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF stock_prices DEFAULT"))
+        now = datetime.now(timezone.utc)
+        _, _, ahead_end = partition_range(now)
+        for _ in range(STOCK_PRICE_PARTITIONS_AHEAD):
+            _, _, ahead_end = partition_range(ahead_end)
+        created = ensure_partitions(db, now - timedelta(days=1), ahead_end - timedelta(seconds=1))
+        db.commit()
+        if created:
+            print(f"INFO: Partitionen für stock_prices angelegt: {created}")
+
+def migrate_to_partitioned(engine, keep_legacy: bool = False) -> int:
+    """
+    Baut eine bestehende, unpartitionierte stock_prices-Tabelle in eine partitionierte um (eine Transaktion):
+    Altbestand umbenennen, neue Tabelle samt Partitionen anlegen, Daten kopieren, Altbestand löschen.
+    Gibt die Anzahl kopierter Zeilen zurück.
+    """
+    global _partitioned
+    import models
+    columns = "symbol, timestamp, open, high, low, close, adj_close, volume, source"
+    with Session(engine) as db:
+        if db.execute(IS_PARTITIONED_SQL).scalar() is not False:
+            print("INFO: stock_prices ist bereits partitioniert (oder existiert nicht).")
+            return 0
+        db.execute(text("ALTER TABLE stock_prices RENAME TO stock_prices_legacy"))
+        for index_name in db.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'stock_prices_legacy'")).scalars():
+            db.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "legacy_{index_name}"'))
+        models.StockPrice.__table__.create(db.connection())
+        db.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF stock_prices DEFAULT"))
+        start, end = db.execute(text("SELECT min(timestamp), max(timestamp) FROM stock_prices_legacy")).one()
+        _known_partitions.clear()
+        _partitioned = True
+        if start is not None:
+            ensure_partitions(db, start, end)
+        copied = db.execute(text(
+            f"INSERT INTO stock_prices ({columns}) SELECT {columns} FROM stock_prices_legacy ON CONFLICT DO NOTHING"
+        )).rowcount
+        if not keep_legacy:
+            db.execute(text("DROP TABLE stock_prices_legacy"))
+        db.commit()
+    print(f"INFO: stock_prices partitioniert ({STOCK_PRICE_PARTITION_INTERVAL}), {copied} Zeilen übernommen.")
+    return copied
+
+# --- Rollups ---
+
+def _rollup_sql(target: str, source: str, ts_column: str, unit: str, from_raw: bool) -> str:
+    open_expr = "COALESCE(src.open, src.close)" if from_raw else "src.open"
+    high_expr = "COALESCE(src.high, src.close)" if from_raw else "src.high"
+    low_expr = "COALESCE(src.low, src.close)" if from_raw else "src.low"
+    count_expr = "count(*)" if from_raw else "sum(src.bar_count)"
+    return f"""
+        INSERT INTO {target} (symbol, bucket, open, high, low, close, volume, bar_count)
+        SELECT src.symbol, date_trunc('{unit}', src.{ts_column}, 'UTC') AS bucket,
+               (array_agg({open_expr} ORDER BY src.{ts_column} ASC))[1],
+               max({high_expr}), min({low_expr}),
+               (array_agg(src.close ORDER BY src.{ts_column} DESC))[1],
+               sum(src.volume), {count_expr}
+        FROM unnest(CAST(:symbols AS text[]), CAST(:lo AS timestamptz[]), CAST(:hi AS timestamptz[])) AS r(symbol, lo, hi)
+        JOIN {source} src ON src.symbol = r.symbol AND src.{ts_column} >= r.lo AND src.{ts_column} < r.hi
+        GROUP BY 1, 2
+        ON CONFLICT (symbol, bucket) DO UPDATE SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+            close = EXCLUDED.close, volume = EXCLUDED.volume, bar_count = EXCLUDED.bar_count
+    """
+
+# Reihenfolge wichtig: 1d wird aus den eben aktualisierten 1h-Rollups verdichtet
+ROLLUP_REFRESH_SQL = [
+    text(_rollup_sql("stock_prices_1h", "stock_prices", "timestamp", "hour", from_raw=True)),
+    text(_rollup_sql("stock_prices_1d", "stock_prices_1h", "bucket", "day", from_raw=False)),
+]
+
+def affected_ranges(prices_df: pd.DataFrame) -> dict:
+    """Pro Symbol der betroffene Zeitraum, auf ganze UTC-Tage erweitert (damit 1h- und 1d-Buckets vollständig sind)."""
+    timestamps = pd.to_datetime(prices_df['timestamp'], utc=True)
+    bounds = timestamps.groupby(prices_df['symbol'].values).agg(['min', 'max'])
+    return {
+        'symbols': list(bounds.index),
+        'lo': list(bounds['min'].dt.floor('D').dt.to_pydatetime()),
+        'hi': list((bounds['max'].dt.floor('D') + pd.Timedelta(days=1)).dt.to_pydatetime()),
+    }
+
+def refresh_rollups(db: Session, ranges: dict):
+    """Verdichtet die Rollups für die betroffenen Symbole und Tage neu (in der laufenden Transaktion)."""
+    if STOCK_PRICE_ROLLUPS and ranges['symbols']:
+        for statement in ROLLUP_REFRESH_SQL:
+            db.execute(statement, ranges)
+
+async def refresh_rollups_async(db: AsyncSession, ranges: dict):
+    """Asynchrone Variante von refresh_rollups."""
+    if STOCK_PRICE_ROLLUPS and ranges['symbols']:
+        for statement in ROLLUP_REFRESH_SQL:
+            await db.execute(statement, ranges)
+
+def rebuild_rollups(engine, symbols: list[str] | None = None) -> int:
+    """Verdichtet die Rollups für alle (bzw. die angegebenen) Symbole über die gesamte Historie neu."""
+    with Session(engine) as db:
+        bounds = db.execute(text(
+            "SELECT symbol, min(timestamp), max(timestamp) FROM stock_prices "
+            "WHERE CAST(:symbols AS text[]) IS NULL OR symbol = ANY(CAST(:symbols AS text[])) GROUP BY symbol"
+        ), {'symbols': [s.upper() for s in symbols] if symbols else None}).all()
+        for symbol, start, end in bounds:
+            refresh_rollups(db, affected_ranges(pd.DataFrame({'symbol': [symbol, symbol], 'timestamp': [start, end]})))
+            db.commit()
+    return len(bounds)
+
+# --- Abfragen ---
+
+SERIES_SQL = """
+    SELECT {ts_column} AS timestamp, {open_column} AS open, {high_column} AS high, {low_column} AS low, close, volume
+    FROM {table}
+    WHERE symbol = :symbol
+      AND (CAST(:start AS timestamptz) IS NULL OR {ts_column} >= CAST(:start AS timestamptz))
+      AND (CAST(:end AS timestamptz) IS NULL OR {ts_column} <= CAST(:end AS timestamptz))
+    ORDER BY {ts_column} ASC
+"""
+RAW_COUNT_SQL = text("""
+    SELECT count(*) FROM (
+        SELECT 1 FROM stock_prices WHERE symbol = :symbol
+          AND (CAST(:start AS timestamptz) IS NULL OR timestamp >= CAST(:start AS timestamptz))
+          AND (CAST(:end AS timestamptz) IS NULL OR timestamp <= CAST(:end AS timestamptz))
+        LIMIT :limit
+    ) limited
+""")
+SPAN_SQL = text("SELECT min(bucket), max(bucket) FROM stock_prices_1d WHERE symbol = :symbol")
+
+def series_sql(resolution: str):
+    table, ts_column, _ = RESOLUTIONS[resolution]
+    raw = resolution == 'raw'
+    return text(SERIES_SQL.format(
+        table=table, ts_column=ts_column,
+        open_column="COALESCE(open, close)" if raw else "open",
+        high_column="COALESCE(high, close)" if raw else "high",
+        low_column="COALESCE(low, close)" if raw else "low",
+    ))
+
+def _resolution_for(raw_count: int, span: tuple, start, end, max_points: int) -> str:
+    """
+    Gröbste Tabelle, die für max_points noch nötig ist: Rohdaten, wenn sie hineinpassen, sonst 1h, wenn die
+    Spanne in Stunden hineinpasst, sonst 1d (die Tagesreihe kann danach noch per LTTB ausgedünnt werden).
+    """
+    if raw_count <= max_points or not STOCK_PRICE_ROLLUPS:
+        return 'raw'
+    start, end = start or span[0], end or span[1]
+    if start is None or end is None:
+        return 'raw' # Noch keine Rollups vorhanden
+    span_seconds = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    return '1h' if span_seconds / RESOLUTIONS['1h'][2] <= max_points else '1d'
+
+def _series_frame(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+
+def get_price_series(db: Session, symbol: str, start: datetime | None = None, end: datetime | None = None,
+                     max_points: int | None = None, resolution: str | None = None) -> tuple[str, pd.DataFrame]:
+    """
+    OHLCV-Reihe eines Symbols aus Rohdaten oder Rollup. Ohne 'resolution' wird sie anhand von max_points gewählt
+    (ohne max_points: Rohdaten). Gibt (Auflösung, DataFrame [timestamp, open, high, low, close, volume]) zurück.
+    """
+    params = {'symbol': symbol.upper(), 'start': start, 'end': end}
+    if resolution is None and max_points:
+        raw_count = db.execute(RAW_COUNT_SQL, {**params, 'limit': max_points + 1}).scalar()
+        span = db.execute(SPAN_SQL, params).one() if raw_count > max_points else (None, None)
+        resolution = _resolution_for(raw_count, span, start, end, max_points)
+    resolution = resolution or 'raw'
+    rows = db.execute(series_sql(resolution), params).all()
+    if not rows and resolution != 'raw':
+        # Rollups (noch) leer, z.B. vor dem ersten Neuaufbau: auf Rohdaten ausweichen
+        resolution = 'raw'
+        rows = db.execute(series_sql(resolution), params).all()
+    return resolution, _series_frame(rows)
+
+async def get_price_series_async(db: AsyncSession, symbol: str, start: datetime | None = None, end: datetime | None = None,
+                                 max_points: int | None = None, resolution: str | None = None) -> tuple[str, pd.DataFrame]:
+    """Asynchrone Variante von get_price_series."""
+    params = {'symbol': symbol.upper(), 'start': start, 'end': end}
+    if resolution is None and max_points:
+        raw_count = (await db.execute(RAW_COUNT_SQL, {**params, 'limit': max_points + 1})).scalar()
+        span = (await db.execute(SPAN_SQL, params)).one() if raw_count > max_points else (None, None)
+        resolution = _resolution_for(raw_count, span, start, end, max_points)
+    resolution = resolution or 'raw'
+    rows = (await db.execute(series_sql(resolution), params)).all()
+    if not rows and resolution != 'raw':
+        resolution = 'raw'
+        rows = (await db.execute(series_sql(resolution), params)).all()
+    return resolution, _series_frame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitionierung und Rollups der Kurstabelle stock_prices verwalten.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Unpartitionierte stock_prices-Tabelle umbauen")
+    migrate_parser.add_argument("--keep-legacy", action="store_true", help="Alte Tabelle als stock_prices_legacy behalten")
+    partitions_parser = subparsers.add_parser("partitions", help="Partitionen für einen Zeitraum anlegen")
+    partitions_parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    partitions_parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+    rollups_parser = subparsers.add_parser("rollups", help="Rollups vollständig neu verdichten")
+    rollups_parser.add_argument("symbols", nargs="*", help="Nur diese Symbole (Standard: alle)")
+    args = parser.parse_args()
+
+    import models
+    from database import engine
+    models.Base.metadata.create_all(bind=engine)
+    if args.command == "migrate":
+        migrate_to_partitioned(engine, keep_legacy=args.keep_legacy)
+        rebuild_rollups(engine)
+    elif args.command == "partitions":
+        with Session(engine) as db:
+            created = ensure_partitions(db, pd.Timestamp(args.start, tz="UTC"), pd.Timestamp(args.end, tz="UTC"))
+            db.commit()
+        print(f"INFO: {len(created)} Partitionen angelegt: {created}")
+    else:
+        count = rebuild_rollups(engine, args.symbols or None)
+        print(f"INFO: Rollups für {count} Symbole neu verdichtet.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import os
+import time
+import uuid
+import zlib
+import asyncio
+from collections import OrderedDict
+
+import msgpack
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+CACHE_KEY_PREFIX = "dbot:cache:"
+CACHE_LRU_MAX_ENTRIES = int(os.getenv("CACHE_LRU_MAX_ENTRIES", "512")) # In-Process-Fallback ohne Redis
+CACHE_REDIS_RETRY_SECONDS = float(os.getenv("CACHE_REDIS_RETRY_SECONDS", "30")) # Pause nach Redis-Ausfall
+CACHE_COMPRESS_MIN_BYTES = 1024 # Größere Payloads werden zusätzlich mit zlib komprimiert
+CACHE_LOCK_TTL_SECONDS = 10 # Maximale Dauer eines Upstream-Abrufs, den andere Worker abwarten
+CACHE_LOCK_WAIT_SECONDS = 5
+
+# Pro Endpunkt: (frisch in Sekunden, zusätzlich als "stale" auslieferbar in Sekunden)
+CACHE_TTLS = {
+    'fmp_history': (int(os.getenv("CACHE_TTL_FMP_HISTORY", "3600")), int(os.getenv("CACHE_SWR_FMP_HISTORY", "86400"))),
+    'alpaca_account': (int(os.getenv("CACHE_TTL_ALPACA_ACCOUNT", "5")), int(os.getenv("CACHE_SWR_ALPACA_ACCOUNT", "30"))),
+    'alpaca_positions': (int(os.getenv("CACHE_TTL_ALPACA_POSITIONS", "5")), int(os.getenv("CACHE_SWR_ALPACA_POSITIONS", "30"))),
+    'alpaca_orders': (int(os.getenv("CACHE_TTL_ALPACA_ORDERS", "10")), int(os.getenv("CACHE_SWR_ALPACA_ORDERS", "60"))),
+}
+DEFAULT_TTL = (30, 60)
+
+def _encode(value, fresh_until: float, stale_until: float) -> bytes:
+    packed = msgpack.packb([fresh_until, stale_until, value], use_bin_type=True)
+    if len(packed) >= CACHE_COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(packed, 6)
+    return b"m" + packed
+
+def _decode(blob: bytes):
+    body = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    fresh_until, stale_until, value = msgpack.unpackb(body, raw=False)
+    return value, fresh_until, stale_until
+
+class ResponseCache:
+    """
+    Cache für Upstream-Antworten (FMP, Alpaca) in Redis mit In-Process-LRU als Fallback.
+    - TTL pro Namespace (CACHE_TTLS), danach Stale-While-Revalidate: abgelaufene Werte werden noch
+      ausgeliefert, während im Hintergrund genau ein Abruf den Wert erneuert.
+    - Request Coalescing: gleichzeitige Misses im Prozess teilen sich einen Abruf; zwischen Workern
+      verhindert eine kurze Redis-Sperre doppelte Abrufe.
+    - Werte werden kompakt als MessagePack (ggf. zlib-komprimiert) gespeichert.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL, lru_max_entries: int = CACHE_LRU_MAX_ENTRIES):
+        self.redis_url = redis_url
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._lru = OrderedDict()
+        self._lru_max_entries = lru_max_entries
+        self._inflight = {} # {key: asyncio.Task}
+        self.stats = {}
+
+    # --- Zähler ---
+    def _count(self, namespace: str, event: str):
+        namespace_stats = self.stats.setdefault(namespace, {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0})
+        namespace_stats[event] += 1
+
+    def get_stats(self) -> dict:
+        return {
+            'backend': 'redis' if self._redis_available() and self._redis is not None else 'lru',
+            'lru_entries': len(self._lru),
+            'namespaces': self.stats,
+        }
+
+    # --- Speicher-Backends ---
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _get_redis(self):
+        if self._redis is None:
+            import redis.asyncio as redis_asyncio
+            self._redis = redis_asyncio.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception):
+        if self._redis_available():
+            print(f"WARNUNG: Redis nicht erreichbar ({error}). Verwende In-Process-LRU-Cache für {CACHE_REDIS_RETRY_SECONDS}s.")
+        self._redis_down_until = time.monotonic() + CACHE_REDIS_RETRY_SECONDS
+
+    async def _load(self, key: str):
+        if self._redis_available():
+            try:
+                blob = await self._get_redis().get(CACHE_KEY_PREFIX + key)
+                return _decode(blob) if blob else None
+            except Exception as e:
+                self._mark_redis_down(e)
+        blob = self._lru.get(key)
+        if blob is None:
+            return None
+        self._lru.move_to_end(key)
+        return _decode(blob)
+
+    async def _store(self, key: str, value, ttl: int, stale_ttl: int):
+        now = time.time()
+        blob = _encode(value, now + ttl, now + ttl + stale_ttl)
+        if self._redis_available():
+            try:
+                await self._get_redis().set(CACHE_KEY_PREFIX + key, blob, ex=max(1, int(ttl + stale_ttl)))
+                return
+            except Exception as e:
+                self._mark_redis_down(e)
+        self._lru[key] = blob
+        self._lru.move_to_end(key)
+        while len(self._lru) > self._lru_max_entries:
+            self._lru.popitem(last=False)
+
+    async def _acquire_fetch_lock(self, key: str) -> str | None:
+        """Redis-Sperre, damit nur ein Worker den Upstream abfragt. Gibt ein Token zurück oder None."""
+        if not self._redis_available():
+            return "local"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self._get_redis().set(CACHE_KEY_PREFIX + "lock:" + key, token, nx=True, ex=CACHE_LOCK_TTL_SECONDS)
+            return token if acquired else None
+        except Exception as e:
+            self._mark_redis_down(e)
+            return "local"
+
+    async def _release_fetch_lock(self, key: str, token: str):
+        if token == "local" or not self._redis_available():
+            return
+        try:
+            lock_key = CACHE_KEY_PREFIX + "lock:" + key
+            if (await self._get_redis().get(lock_key)) == token.encode():
+                await self._get_redis().delete(lock_key)
+        except Exception as e:
+            self._mark_redis_down(e)
+
+    # --- Öffentliche API ---
+    async def get_or_fetch(self, namespace: str, key: str, fetch):
+        """
+        Liefert den gecachten Wert für (namespace, key) oder ruft 'fetch' (async, ohne Argumente) auf.
+        Fehler von 'fetch' werden weitergereicht und nicht gecacht.
+        """
+        full_key = f"{namespace}:{key}"
+        ttl, stale_ttl = CACHE_TTLS.get(namespace, DEFAULT_TTL)
+        entry = await self._load(full_key)
+        now = time.time()
+
+        if entry is not None:
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self._count(namespace, 'hits')
+                return value
+            if now < stale_until:
+                self._count(namespace, 'stale_hits')
+                self._start_fetch(namespace, full_key, fetch, ttl, stale_ttl) # Hintergrund-Aktualisierung
+                return value
+
+        self._count(namespace, 'misses')
+        if full_key in self._inflight:
+            self._count(namespace, 'coalesced')
+        return await asyncio.shield(self._start_fetch(namespace, full_key, fetch, ttl, stale_ttl))
+
+    def _start_fetch(self, namespace: str, full_key: str, fetch, ttl: int, stale_ttl: int) -> asyncio.Future:
+        """Startet höchstens einen Abruf pro Schlüssel; weitere Aufrufer erhalten denselben Task."""
+        task = self._inflight.get(full_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(namespace, full_key, fetch, ttl, stale_ttl))
+            self._inflight[full_key] = task
+
+            def on_done(finished):
+                self._inflight.pop(full_key, None)
+                if not finished.cancelled():
+                    finished.exception() # Fehler gilt als abgerufen, auch wenn niemand (mehr) wartet
+            task.add_done_callback(on_done)
+        return task
+
+    async def _fetch_and_store(self, namespace: str, full_key: str, fetch, ttl: int, stale_ttl: int):
+        token = await self._acquire_fetch_lock(full_key)
+        if token is None:
+            # Ein anderer Worker ruft gerade ab: kurz auf dessen Ergebnis warten
+            deadline = time.monotonic() + CACHE_LOCK_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                entry = await self._load(full_key)
+                if entry is not None and time.time() < entry[1]:
+                    return entry[0]
+        try:
+            value = await fetch()
+        except Exception:
+            self._count(namespace, 'errors')
+            raise
+        finally:
+            if token is not None:
+                await self._release_fetch_lock(full_key, token)
+        await self._store(full_key, value, ttl, stale_ttl)
+        return value
+
+    async def invalidate(self, namespace: str, key: str):
+        full_key = f"{namespace}:{key}"
+        self._lru.pop(full_key, None)
+        if self._redis_available():
+            try:
+                await self._get_redis().delete(CACHE_KEY_PREFIX + full_key)
+            except Exception as e:
+                self._mark_redis_down(e)
+
+    async def aclose(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+# Prozessweiter Cache
+RESPONSE_CACHE = ResponseCache()
@@ -43,6 +43,10 @@ class AlpacaOrder(BaseModel):
     class Config:
         from_attributes = True
 
+class AlpacaOrderPage(BaseModel):
+    orders: list[AlpacaOrder]
+    next_cursor: str | None = None # Für die nächste Seite als ?cursor= übergeben; None = letzte Seite
+
 class HistoricalPricePoint(BaseModel):
     date: str # Behalte es als String, da FMP es so liefert
     open: float
@@ -58,6 +62,30 @@ class HistoricalPricePoint(BaseModel):
     label: str
     changeOverTime: float
 
+class HistoricalPriceBucket(BaseModel):
+    # Zusammengefasster Balken (max_points mit mode='ohlc') über die Tage date bis end_date
+    date: str
+    end_date: str
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    count: int
+
+class PriceSeriesPoint(BaseModel):
+    timestamp: datetime # Bei Rollups: Beginn der Stunde bzw. des Tages (UTC)
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float | None = None
+
+class PriceSeriesResponse(BaseModel):
+    symbol: str
+    resolution: str # 'raw', '1h' oder '1d': Tabelle, aus der die Reihe stammt
+    points: list[PriceSeriesPoint]
+
 # --- Schemas für neue Modelle ---
 class StockPriceBase(BaseModel):
     symbol: str
@@ -74,7 +102,6 @@ class StockPriceCreate(StockPriceBase):
     pass
 
 class StockPriceInDB(StockPriceBase):
-    id: int
     class Config:
         from_attributes = True
 
@@ -82,11 +109,38 @@ class StockSentimentBase(BaseModel):
     symbol: str
     date: date
     sentiment_score: float
-    source: str | None = "GeminiNews"
+    source: str = "GeminiNews" # Entspricht models.DEFAULT_SENTIMENT_SOURCE
 class StockSentimentCreate(StockSentimentBase):
     pass
 class StockSentimentInDB(StockSentimentBase):
     id: int
     fetched_at: datetime
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+# --- Schemas für die Massen-Ingestion ---
+class PriceBackfillRequest(BaseModel):
+    symbols: list[str]
+    source: str = "yfinance" # "yfinance" oder "fmp"
+    period: str = "5y"
+    interval: str = "1d"
+    start: str | None = None # Optional: nur Kurse ab diesem Datum (YYYY-MM-DD)
+    end: str | None = None # Optional: nur Kurse bis zu diesem Datum (YYYY-MM-DD)
+    max_concurrency: int = 4
+
+class SentimentIngestRequest(BaseModel):
+    symbols: list[str] | None = None # Ohne Angabe alle Symbole aus stock_prices
+    max_concurrency: int = 8
+    lookback_days: int = 120 # Erstbefüllung: so viele Tage zurück
+
+class BacktestRequest(BaseModel):
+    symbols: list[str]
+    start: str | None = None # YYYY-MM-DD, ohne Angabe gesamte Historie
+    end: str | None = None
+    buy_threshold: float | None = None # Überschreibt prediction_threshold_buy_signal aus der Modellkonfiguration
+    sell_threshold: float | None = None # Überschreibt prediction_threshold_sell_signal
+    initial_cash: float = 100000.0
+    cash_buffer: float = 10000.0
+    commission: float = 0.0 # Anteil des Ordervolumens, z.B. 0.001 = 0,1%
+    workers: int | None = None # Anzahl Prozesse, Standard BACKTEST_WORKERS
+    resolution: str | None = None # 'raw', '1h' oder '1d', Standard BACKTEST_RESOLUTION
+    include_equity_curve: bool = True
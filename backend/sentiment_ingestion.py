@@ -0,0 +1,295 @@
+import os
+import time
+import asyncio
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+
+import async_crud
+from database import AsyncSessionLocal
+from http_clients import HTTP_CLIENT, FMPClient, FMP_BASE_URL, fmp_rate_limiter
+
+load_dotenv()
+
+# Massen-Ingestion von Sentiment-Werten in stock_sentiments (Tageswerte aus FMP Social Sentiment).
+# - Pro Symbol werden die Seiten (neueste zuerst) nur so weit zurück gelesen, bis das zuletzt gespeicherte
+#   Datum erreicht ist; ältere, bereits vorhandene Tage werden übersprungen. Der letzte gespeicherte Tag wird
+#   neu geschrieben, da er beim letzten Lauf noch unvollständig gewesen sein kann.
+# - Abrufe laufen parallel (Semaphore) und teilen sich das FMP-Minutenbudget (TokenBucket im FMPClient).
+# - Ein einzelner Schreib-Task sammelt die Tageswerte aller Symbole und schreibt sie in Batches per Upsert.
+# Als geplanter Job: python sentiment_ingestion.py --every-minutes 60 (ohne Symbole: alle Symbole aus stock_prices)
+# Lokal testen mit fake_fmp.py und FMP_BASE_URL=http://localhost:8020/api/v3.
+
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+SENTIMENT_SOURCE = "FMPSocial"
+SENTIMENT_LOOKBACK_DAYS = int(os.getenv("SENTIMENT_LOOKBACK_DAYS", "120")) # Erstbefüllung: so weit zurück
+SENTIMENT_MAX_PAGES = int(os.getenv("SENTIMENT_MAX_PAGES", "50")) # Obergrenze je Symbol und Lauf
+SENTIMENT_CONCURRENCY = int(os.getenv("SENTIMENT_CONCURRENCY", "8"))
+SENTIMENT_WRITE_BATCH_ROWS = int(os.getenv("SENTIMENT_WRITE_BATCH_ROWS", "2000"))
+SENTIMENT_PROGRESS_SECONDS = float(os.getenv("SENTIMENT_PROGRESS_SECONDS", "10"))
+
+# Doppelte (symbol, date, source) aus der Zeit vor dem eindeutigen Index entfernen (jüngster Abruf bleibt)
+DEDUPLICATE_SENTIMENTS_SQL = text("""
+    DELETE FROM stock_sentiments ss
+    USING stock_sentiments newer
+    WHERE ss.symbol = newer.symbol AND ss.date = newer.date AND ss.source = newer.source
+      AND (ss.fetched_at, ss.id) < (newer.fetched_at, newer.id)
+""")
+
+SET_DEFAULT_SENTIMENT_SOURCE_SQL = text("UPDATE stock_sentiments SET source = :source WHERE source IS NULL")
+
+def ensure_sentiment_key(engine):
+    """
+    Legt den eindeutigen Index auf (symbol, date, source) an, den die Upserts benötigen (bereinigt vorher Duplikate).
+    Bestehende Tabellen mit nullbarer Quelle werden vorher umgestellt: NULL wird zur Standardquelle, die Spalte
+    NOT NULL, da der Index Zeilen ohne Quelle nicht als gleich erkennt und ON CONFLICT sie doppelt einfügt.
+    """
+    import models
+    with engine.begin() as connection:
+        source_column = next(c for c in inspect(connection).get_columns("stock_sentiments") if c['name'] == 'source')
+        if source_column['nullable']:
+            for index in models.StockSentiment.__table__.indexes:
+                # Neu aufbauen: nach dem Auffüllen der Quelle kann der alte Index verletzt sein
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+            updated = connection.execute(SET_DEFAULT_SENTIMENT_SOURCE_SQL, {'source': models.DEFAULT_SENTIMENT_SOURCE}).rowcount
+            if updated:
+                print(f"INFO: {updated} Sentiment-Zeilen ohne Quelle auf '{models.DEFAULT_SENTIMENT_SOURCE}' gesetzt.")
+            connection.execute(text(
+                f"ALTER TABLE stock_sentiments ALTER COLUMN source SET DEFAULT '{models.DEFAULT_SENTIMENT_SOURCE}', "
+                "ALTER COLUMN source SET NOT NULL"
+            ))
+        for index in models.StockSentiment.__table__.indexes:
+            if index.unique and not connection.dialect.has_index(connection, "stock_sentiments", index.name):
+                deleted = connection.execute(DEDUPLICATE_SENTIMENTS_SQL).rowcount
+                if deleted:
+                    print(f"INFO: {deleted} doppelte Sentiment-Zeilen entfernt.")
+                index.create(bind=connection)
+
+def social_sentiment_to_frame(entries: list[dict], symbol: str) -> pd.DataFrame:
+    """
+    Verdichtet stündliche FMP-Social-Sentiment-Einträge zu Tageswerten für stock_sentiments.
+    StockTwits/Twitter liefern den Anteil positiver Beiträge (0 bis 1); pro Stunde zählt der Mittelwert der
+    vorhandenen Quellen, pro Tag der nach Beitragszahl gewichtete Mittelwert, skaliert auf -1 bis 1.
+    """
+    columns = ['symbol', 'date', 'sentiment_score', 'source']
+    raw_df = pd.DataFrame(entries)
+    if raw_df.empty:
+        return pd.DataFrame(columns=columns)
+    sentiment_columns = [c for c in ('stocktwitsSentiment', 'twitterSentiment') if c in raw_df.columns]
+    post_columns = [c for c in ('stocktwitsPosts', 'twitterPosts') if c in raw_df.columns]
+    # 0 bedeutet bei FMP "keine Beiträge", nicht "ausschließlich negativ"
+    hourly = raw_df[sentiment_columns].apply(pd.to_numeric, errors='coerce').replace(0, np.nan).mean(axis=1)
+    weights = raw_df[post_columns].apply(pd.to_numeric, errors='coerce').fillna(0).sum(axis=1).clip(lower=1) if post_columns else 1.0
+    daily_df = pd.DataFrame({
+        'date': pd.to_datetime(raw_df['date']).dt.date,
+        'weighted': hourly * weights,
+        'weight': np.where(hourly.notna(), weights, 0.0),
+    }).groupby('date').sum()
+    daily_df = daily_df[daily_df['weight'] > 0]
+    return pd.DataFrame({
+        'symbol': symbol.upper(),
+        'date': daily_df.index,
+        'sentiment_score': (2 * daily_df['weighted'] / daily_df['weight'] - 1).clip(-1, 1).round(6).to_numpy(),
+        'source': SENTIMENT_SOURCE,
+    })[columns]
+
+async def fetch_symbol_sentiment(client: FMPClient, symbol: str, since: date,
+                                 max_pages: int = SENTIMENT_MAX_PAGES) -> tuple[pd.DataFrame, int, int]:
+    """
+    Liest die Social-Sentiment-Seiten eines Symbols, bis Einträge vor 'since' erreicht sind (oder keine Seiten mehr kommen).
+    Gibt (Tageswerte ab since, Anzahl abgerufener Seiten, wegen max_pages nicht erreichte Tage) zurück.
+    """
+    entries = []
+    oldest = None # Ältester gelesener Tag; None, wenn die Historie vollständig gelesen wurde
+    pages = 0
+    while pages < max_pages:
+        page_entries = await client.get_social_sentiment(symbol, pages)
+        pages += 1
+        if not page_entries:
+            oldest = None
+            break
+        entries.extend(page_entries)
+        oldest = pd.to_datetime(page_entries[-1]['date']).date()
+        if oldest < since:
+            break
+    daily_df = social_sentiment_to_frame(entries, symbol)
+    # Bei Abbruch wegen max_pages ist der älteste gelesene Tag evtl. unvollständig und zählt zum Rückstand
+    missing_days = (oldest - since).days + 1 if oldest is not None and oldest >= since else 0
+    if missing_days:
+        daily_df = daily_df[daily_df['date'] > oldest]
+    return daily_df[daily_df['date'] >= since], pages, missing_days
+
+class SentimentIngestionRun:
+    """
+    Ein Lauf über viele Symbole: begrenzt parallele Abrufe, ein Schreib-Task mit Batches und laufende
+    Fortschrittsmeldungen (Durchsatz und Rückstand). report() fasst den Lauf zusammen.
+    """
+
+    def __init__(self, client: FMPClient, symbols: list[str], max_concurrency: int = SENTIMENT_CONCURRENCY,
+                 lookback_days: int = SENTIMENT_LOOKBACK_DAYS, write_batch_rows: int = SENTIMENT_WRITE_BATCH_ROWS,
+                 progress_seconds: float = SENTIMENT_PROGRESS_SECONDS):
+        self.client = client
+        self.symbols = list(dict.fromkeys(s.upper() for s in symbols))
+        self.max_concurrency = max(1, max_concurrency)
+        self.lookback_days = lookback_days
+        self.write_batch_rows = write_batch_rows
+        self.progress_seconds = progress_seconds
+        self.today = datetime.now(timezone.utc).date()
+        self.since_by_symbol = {}
+        self.results = {}
+        self.stats = {'requests': 0, 'rows_written': 0, 'days_skipped': 0, 'batches': 0, 'write_seconds': 0.0}
+        self._queue = asyncio.Queue(maxsize=self.max_concurrency * 4) # Begrenzt den Vorsprung der Abrufe vor der DB
+        self._started = None
+
+    def _backlog_days(self, symbols) -> int:
+        """Fehlende Tage (bis heute) über die angegebenen Symbole."""
+        return sum((self.today - self.since_by_symbol[s]).days + 1 for s in symbols)
+
+    async def _fetch_one(self, symbol: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                daily_df, pages, missing_days = await fetch_symbol_sentiment(self.client, symbol, self.since_by_symbol[symbol])
+                self.stats['requests'] += pages
+                await self._queue.put(daily_df)
+                if missing_days:
+                    print(f"WARNUNG: Sentiment für {symbol} nach {pages} Seiten abgebrochen, {missing_days} ältere Tage fehlen "
+                          f"(SENTIMENT_MAX_PAGES erhöhen).")
+                self.results[symbol] = {'symbol': symbol, 'days': len(daily_df), 'pages': pages, 'missing_days': missing_days,
+                                        'seconds': round(time.perf_counter() - started, 3)}
+            except Exception as e:
+                print(f"FEHLER bei der Sentiment-Ingestion für {symbol}: {e}")
+                self.results[symbol] = {'symbol': symbol, 'days': 0, 'error': str(e)}
+
+    async def _write_batches(self, db):
+        pending, pending_rows = [], 0
+        while True:
+            daily_df = await self._queue.get()
+            if daily_df is not None and not daily_df.empty:
+                pending.append(daily_df)
+                pending_rows += len(daily_df)
+            if pending and (daily_df is None or pending_rows >= self.write_batch_rows):
+                write_started = time.perf_counter()
+                self.stats['rows_written'] += await async_crud.bulk_upsert_stock_sentiments(db, pd.concat(pending, ignore_index=True))
+                self.stats['write_seconds'] += time.perf_counter() - write_started
+                self.stats['batches'] += 1
+                pending, pending_rows = [], 0
+            if daily_df is None:
+                return
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_seconds)
+            print(f"INFO: Sentiment-Ingestion {self.progress_line()}")
+
+    def progress_line(self) -> str:
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        pending = [s for s in self.symbols if s not in self.results]
+        return (f"{len(self.results)}/{len(self.symbols)} Symbole, {self.stats['requests']} Anfragen "
+                f"({self.stats['requests'] / elapsed:.1f}/s), {self.stats['rows_written']} Tage geschrieben "
+                f"({self.stats['rows_written'] / elapsed:.1f}/s), Rückstand {len(pending)} Symbole / {self._backlog_days(pending)} Tage")
+
+    async def run(self) -> dict:
+        self._started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            latest_dates = await async_crud.get_latest_sentiment_dates(db, self.symbols, SENTIMENT_SOURCE)
+            first_day = self.today - timedelta(days=self.lookback_days)
+            for symbol in self.symbols:
+                latest = latest_dates.get(symbol)
+                self.since_by_symbol[symbol] = max(latest, first_day) if latest else first_day
+                if latest and latest > first_day:
+                    self.stats['days_skipped'] += (latest - first_day).days
+            self.stats['backlog_days_before'] = self._backlog_days(self.symbols)
+
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            writer = asyncio.create_task(self._write_batches(db))
+            progress = asyncio.create_task(self._report_progress())
+            fetching = asyncio.gather(*(self._fetch_one(s, semaphore) for s in self.symbols))
+            try:
+                await asyncio.wait({fetching, writer}, return_when=asyncio.FIRST_COMPLETED)
+                if writer.done():
+                    writer.result() # Schreibfehler (z.B. DB weg): Lauf abbrechen statt Abrufe auflaufen zu lassen
+                await self._queue.put(None) # Schreib-Task: Rest schreiben und beenden
+                await writer
+            finally:
+                progress.cancel()
+                fetching.cancel()
+                writer.cancel()
+        return self.report()
+
+    def report(self) -> dict:
+        total_seconds = time.perf_counter() - self._started
+        results = [self.results[s] for s in self.symbols if s in self.results]
+        failed = [r['symbol'] for r in results if 'error' in r]
+        return {
+            'symbols': len(self.symbols),
+            'failed': failed,
+            'requests': self.stats['requests'],
+            'rows_written': self.stats['rows_written'],
+            'days_skipped': self.stats['days_skipped'],
+            'batches': self.stats['batches'],
+            'total_seconds': round(total_seconds, 3),
+            'write_seconds': round(self.stats['write_seconds'], 3),
+            'requests_per_sec': round(self.stats['requests'] / total_seconds, 1) if total_seconds > 0 else None,
+            'rows_per_sec': round(self.stats['rows_written'] / total_seconds, 1) if total_seconds > 0 else None,
+            # Rückstand: fehlende Tage vor dem Lauf bzw. danach (fehlgeschlagene Symbole und wegen max_pages nicht erreichte Tage)
+            'backlog_days_before': self.stats['backlog_days_before'],
+            'backlog_days_after': self._backlog_days(failed) + sum(r.get('missing_days', 0) for r in results),
+            'results': results,
+        }
+
+async def ingest_sentiments(symbols: list[str] | None = None, max_concurrency: int = SENTIMENT_CONCURRENCY,
+                            lookback_days: int = SENTIMENT_LOOKBACK_DAYS, client: FMPClient | None = None) -> dict:
+    """Ein Ingestion-Lauf; ohne Symbole über alle Symbole, für die Kurse gespeichert sind."""
+    if client is None:
+        if not FMP_API_KEY:
+            raise ValueError("FMP API Key nicht konfiguriert.")
+        client = FMPClient(FMP_API_KEY, base_url=FMP_BASE_URL, rate_limiter=fmp_rate_limiter)
+    if not symbols:
+        async with AsyncSessionLocal() as db:
+            symbols = await async_crud.get_price_symbols(db)
+    return await SentimentIngestionRun(client, symbols, max_concurrency, lookback_days).run()
+
+def print_report(report: dict):
+    for result in report['results']:
+        if 'error' in result:
+            print(f"{result['symbol']}: FEHLER {result['error']}")
+    print(f"Gesamt: {report['symbols']} Symbole, {report['requests']} Anfragen ({report['requests_per_sec']}/s), "
+          f"{report['rows_written']} Tage geschrieben ({report['rows_per_sec']}/s, {report['batches']} Batches), "
+          f"{report['days_skipped']} vorhandene Tage übersprungen, Rückstand {report['backlog_days_before']} -> "
+          f"{report['backlog_days_after']} Tage, {report['total_seconds']}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Massen-Import von Sentiment-Werten (FMP Social Sentiment) in stock_sentiments.")
+    parser.add_argument("symbols", nargs="*", help="Ticker-Symbole (Standard: alle Symbole aus stock_prices)")
+    parser.add_argument("--concurrency", type=int, default=SENTIMENT_CONCURRENCY, help="Gleichzeitig abgerufene Symbole")
+    parser.add_argument("--lookback-days", type=int, default=SENTIMENT_LOOKBACK_DAYS, help="Erstbefüllung: Tage zurück")
+    parser.add_argument("--every-minutes", type=float, help="Als Dauerjob in diesem Abstand wiederholen")
+    args = parser.parse_args()
+
+    from database import engine
+    ensure_sentiment_key(engine)
+
+    async def run():
+        try:
+            while True:
+                try:
+                    print_report(await ingest_sentiments(args.symbols, args.concurrency, args.lookback_days))
+                except Exception as e:
+                    if not args.every_minutes:
+                        raise
+                    print(f"FEHLER im Sentiment-Ingestion-Lauf: {e}")
+                if not args.every_minutes:
+                    return
+                await asyncio.sleep(args.every_minutes * 60)
+        finally:
+            await HTTP_CLIENT.aclose()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import json
+import time
+import zlib
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+
+# Lokaler Ersatz für den Alpaca Market Data Stream (v2) zum Testen der Streaming-Ingestion.
+# Spricht dasselbe Protokoll (connected -> auth -> subscribe -> Nachrichten-Arrays) und sendet entweder
+# synthetische Trades (Random Walk) oder spielt eine Trade-Datei (symbol, timestamp, price[, size]) zeitgerafft ab.
+# Start: python stream_replay.py --port 8765 [--speed 60] [--file trades.parquet]
+# Dann: ALPACA_STREAM_URL=ws://localhost:8765
+
+def _iso(timestamp_ns: int) -> str:
+    return pd.Timestamp(timestamp_ns, unit='ns', tz='UTC').strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def _start_price(symbol: str) -> float:
+    return 20.0 + zlib.crc32(symbol.encode()) % 480
+
+class SyntheticTrades:
+    """Random-Walk-Trades für beliebige Symbole; die simulierte Uhr läuft 'speed'-mal so schnell wie die Wanduhr."""
+
+    def __init__(self, trades_per_second: float, speed: float, volatility: float = 0.0005, seed: int = 0):
+        self.trades_per_second = trades_per_second
+        self.speed = speed
+        self.volatility = volatility
+        self._rng = np.random.default_rng(seed)
+        self._prices = {}
+        self._started_ns = time.time_ns()
+        self._started_monotonic = time.monotonic()
+
+    def now_ns(self) -> int:
+        return self._started_ns + int((time.monotonic() - self._started_monotonic) * self.speed * 1e9)
+
+    async def batches(self, symbols: list[str]):
+        """Liefert alle 50 ms (Wanduhr) eine Liste von Trade-Nachrichten."""
+        tick_seconds = 0.05
+        while True:
+            await asyncio.sleep(tick_seconds)
+            count = self._rng.poisson(self.trades_per_second * tick_seconds * len(symbols))
+            if not count:
+                continue
+            now_ns = self.now_ns()
+            offsets = np.sort(self._rng.integers(0, int(tick_seconds * self.speed * 1e9), count))
+            messages = []
+            for offset_ns, symbol_index in zip(offsets, self._rng.integers(0, len(symbols), count)):
+                symbol = symbols[symbol_index]
+                price = self._prices.get(symbol, _start_price(symbol)) * float(np.exp(self._rng.normal(0, self.volatility)))
+                self._prices[symbol] = price
+                messages.append({"T": "t", "S": symbol, "p": round(price, 2), "s": int(self._rng.integers(1, 500)),
+                                 "t": _iso(now_ns - int(tick_seconds * self.speed * 1e9) + int(offset_ns)), "x": "V", "z": "C"})
+            yield messages
+
+class FileTrades:
+    """Spielt aufgezeichnete Trades ab; Abstände zwischen den Zeitstempeln werden durch 'speed' geteilt."""
+
+    def __init__(self, path: str, speed: float, batch_size: int = 500):
+        trades_df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        trades_df['timestamp'] = pd.to_datetime(trades_df['timestamp'], utc=True)
+        self.trades_df = trades_df.sort_values('timestamp').reset_index(drop=True)
+        self.speed = speed
+        self.batch_size = batch_size
+
+    async def batches(self, symbols: list[str]):
+        trades_df = self.trades_df[self.trades_df['symbol'].isin(symbols)]
+        if trades_df.empty:
+            return
+        timestamps_ns = trades_df['timestamp'].astype('int64').to_numpy()
+        first_ns, started = timestamps_ns[0], time.monotonic()
+        for start in range(0, len(trades_df), self.batch_size):
+            chunk = trades_df.iloc[start:start + self.batch_size]
+            due_seconds = (timestamps_ns[start] - first_ns) / 1e9 / self.speed
+            await asyncio.sleep(max(0.0, due_seconds - (time.monotonic() - started)))
+            sizes = chunk['size'] if 'size' in chunk else [1] * len(chunk)
+            yield [{"T": "t", "S": s, "p": float(p), "s": int(v), "t": _iso(int(t)), "x": "V", "z": "C"}
+                   for s, p, v, t in zip(chunk['symbol'], chunk['price'], sizes, timestamps_ns[start:start + self.batch_size])]
+
+def make_handler(source_factory):
+    import websockets
+
+    async def handler(ws, *_):
+        try:
+            await _serve_connection(ws, source_factory)
+        except websockets.ConnectionClosed:
+            pass # Client hat die Verbindung beendet
+    return handler
+
+async def _serve_connection(ws, source_factory):
+    await ws.send(json.dumps([{"T": "success", "msg": "connected"}]))
+    auth = json.loads(await ws.recv())
+    if auth.get("action") != "auth":
+        await ws.send(json.dumps([{"T": "error", "code": 401, "msg": "not authenticated"}]))
+        return
+    await ws.send(json.dumps([{"T": "success", "msg": "authenticated"}]))
+    subscribe = json.loads(await ws.recv())
+    symbols = [s.upper() for s in subscribe.get("trades", []) or subscribe.get("bars", [])]
+    await ws.send(json.dumps([{"T": "subscription", "trades": subscribe.get("trades", []), "bars": subscribe.get("bars", [])}]))
+    if subscribe.get("bars"):
+        # Balken-Kanal: Trades werden serverseitig zu Minutenbalken zusammengefasst
+        from bar_stream import BarAggregator
+        aggregator = BarAggregator(bar_seconds=60, grace_seconds=0)
+    else:
+        aggregator = None
+    async for messages in source_factory().batches(symbols):
+        if aggregator is not None:
+            bars = []
+            for m in messages:
+                bars += aggregator.add(m["S"], pd.Timestamp(m["t"]).value, m["p"], m["p"], m["p"], m["p"], m["s"])
+            messages = [{"T": "b", "S": b['symbol'], "t": b['timestamp'].strftime('%Y-%m-%dT%H:%M:%SZ'), "o": b['open'],
+                         "h": b['high'], "l": b['low'], "c": b['close'], "v": b['volume'], "n": b['trades']} for b in bars]
+            if not messages:
+                continue
+        await ws.send(json.dumps(messages))
+
+async def serve(host: str, port: int, source_factory):
+    import websockets
+    async with websockets.serve(make_handler(source_factory), host, port, max_size=None):
+        print(f"INFO: Stream-Replay-Server läuft auf ws://{host}:{port}")
+        await asyncio.Future()
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokaler Replay-Server im Protokoll des Alpaca Market Data Streams.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0, help="Zeitraffer-Faktor (60 = eine Minute pro Sekunde)")
+    parser.add_argument("--trades-per-second", type=float, default=5.0, help="Synthetische Trades pro Symbol und Sekunde (Wanduhr)")
+    parser.add_argument("--file", default=None, help="Trades aus CSV/Parquet (Spalten symbol, timestamp, price[, size]) statt synthetisch")
+    args = parser.parse_args()
+
+    if args.file:
+        source_factory = lambda: FileTrades(args.file, args.speed)
+    else:
+        source_factory = lambda: SyntheticTrades(args.trades_per_second, args.speed)
+    asyncio.run(serve(args.host, args.port, source_factory))
+
+if __name__ == "__main__":
+    main()
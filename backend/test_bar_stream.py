@@ -0,0 +1,77 @@
+import pandas as pd
+
+from bar_stream import BarAggregator, NS_PER_SECOND
+
+def _ns(timestamp: str) -> int:
+    return pd.Timestamp(timestamp).value
+
+def _trade(aggregator: BarAggregator, symbol: str, timestamp: str, price: float, volume: float = 1) -> list[dict]:
+    return aggregator.add(symbol, _ns(timestamp), price, price, price, price, volume)
+
+def test_trades_are_grouped_into_bars():
+    aggregator = BarAggregator(bar_seconds=60, grace_seconds=3600)
+    assert _trade(aggregator, "AAPL", "2024-03-01T15:00:05Z", 10.0) == []
+    assert _trade(aggregator, "AAPL", "2024-03-01T15:00:20Z", 12.0, 2) == []
+    assert _trade(aggregator, "AAPL", "2024-03-01T15:00:50Z", 9.0) == []
+    assert _trade(aggregator, "MSFT", "2024-03-01T15:00:30Z", 50.0) == []
+
+    # Ein Trade aus dem nächsten Intervall schließt nur den Balken seines Symbols
+    [bar] = _trade(aggregator, "AAPL", "2024-03-01T15:01:01Z", 11.0)
+
+    assert bar['symbol'] == "AAPL"
+    assert bar['timestamp'] == pd.Timestamp("2024-03-01T15:00:00Z")
+    assert bar['end'] == pd.Timestamp("2024-03-01T15:01:00Z")
+    assert (bar['open'], bar['high'], bar['low'], bar['close']) == (10.0, 12.0, 9.0, 9.0)
+    assert (bar['volume'], bar['trades']) == (4, 3)
+    assert aggregator.stats['bars'] == 1
+
+def test_bars_close_once_the_watermark_passes_end_plus_grace():
+    aggregator = BarAggregator(bar_seconds=60, grace_seconds=2)
+    _trade(aggregator, "AAPL", "2024-03-01T15:00:30Z", 10.0)
+    assert _trade(aggregator, "MSFT", "2024-03-01T15:01:01Z", 50.0) == []
+
+    # Die Ereigniszeit eines anderen Symbols schließt den AAPL-Balken nach Ablauf der Karenzzeit
+    [bar] = _trade(aggregator, "MSFT", "2024-03-01T15:01:02.5Z", 51.0)
+    assert bar['symbol'] == "AAPL"
+
+    aggregator.watermark_ns += 60 * NS_PER_SECOND
+    [bar] = aggregator.close_due()
+    assert bar['symbol'] == "MSFT" and (bar['open'], bar['close']) == (50.0, 51.0)
+
+def test_late_trades_for_closed_bars_are_dropped():
+    aggregator = BarAggregator(bar_seconds=60, grace_seconds=3600)
+    _trade(aggregator, "AAPL", "2024-03-01T15:00:30Z", 10.0)
+    _trade(aggregator, "AAPL", "2024-03-01T15:01:30Z", 11.0)
+
+    assert _trade(aggregator, "AAPL", "2024-03-01T15:00:59Z", 99.0) == []
+    assert aggregator.stats['late_trades'] == 1
+    [bar] = _trade(aggregator, "AAPL", "2024-03-01T15:02:00Z", 12.0)
+    assert bar['high'] == 11.0
+
+def test_input_bars_advance_the_watermark_to_their_end():
+    aggregator = BarAggregator(bar_seconds=300, grace_seconds=0)
+    start = _ns("2024-03-01T15:00:00Z")
+    for minute in range(5):
+        closed = aggregator.add("AAPL", start + minute * 60 * NS_PER_SECOND, 10, 11, 9, 10, 100, trades=4,
+                                end_ns=start + (minute + 1) * 60 * NS_PER_SECOND)
+    [bar] = closed # Der letzte Minutenbalken füllt das Intervall: kein Warten auf den nächsten Trade
+    assert (bar['volume'], bar['trades']) == (500, 20)
+
+def test_daily_bars_follow_the_session_timezone():
+    aggregator = BarAggregator(grace_seconds=3600, session_tz="America/New_York")
+    _trade(aggregator, "AAPL", "2024-03-08T20:00:00Z", 10.0)
+    [friday] = _trade(aggregator, "AAPL", "2024-03-10T15:00:00Z", 11.0)
+    [dst_start] = _trade(aggregator, "AAPL", "2024-03-11T04:30:00Z", 12.0)
+
+    assert friday['timestamp'] == pd.Timestamp("2024-03-08T05:00:00Z")
+    assert friday['end'] - friday['timestamp'] == pd.Timedelta(hours=24)
+    # Umstellung auf Sommerzeit: der Tag in New York hat 23 Stunden
+    assert dst_start['timestamp'] == pd.Timestamp("2024-03-10T05:00:00Z")
+    assert dst_start['end'] == pd.Timestamp("2024-03-11T04:00:00Z")
+
+def test_daily_bar_at_end_of_daylight_saving_has_25_hours():
+    aggregator = BarAggregator(grace_seconds=3600, session_tz="America/New_York")
+    _trade(aggregator, "AAPL", "2024-11-03T12:00:00Z", 10.0)
+    [bar] = _trade(aggregator, "AAPL", "2024-11-04T06:00:00Z", 11.0)
+    assert bar['timestamp'] == pd.Timestamp("2024-11-03T04:00:00Z")
+    assert bar['end'] - bar['timestamp'] == pd.Timedelta(hours=25)
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from bot_control import BotController
+
+fakeredis = pytest.importorskip("fakeredis")
+
+pytestmark = pytest.mark.anyio
+
+class LocalBot:
+    """Stellt die lokale Bot-Schleife eines Workers dar (Callbacks für BotController.run)."""
+
+    def __init__(self):
+        self.running = False
+        self.starts = 0
+        self.stopped_by_lease = 0
+
+    def on_start(self, symbol: str):
+        self.running = True
+        self.starts += 1
+
+    def on_stop(self, lease_lost: bool):
+        if self.running and lease_lost:
+            self.stopped_by_lease += 1
+        self.running = False
+
+    def is_running(self) -> bool:
+        return self.running
+
+def _controller(server, **kwargs) -> BotController:
+    controller = BotController(lease_ttl=1.0, renew_seconds=0.1, **kwargs)
+    controller._redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    return controller
+
+async def _run(controller: BotController, bot: LocalBot) -> asyncio.Task:
+    return asyncio.create_task(controller.run(bot.on_start, bot.on_stop, bot.is_running))
+
+async def _stop(*tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def test_only_one_worker_runs_the_bot():
+    server = fakeredis.FakeServer()
+    workers = [(_controller(server), LocalBot()) for _ in range(3)]
+    tasks = [await _run(c, b) for c, b in workers]
+    await workers[0][0].set_desired(True, "MSFT")
+    await asyncio.sleep(0.5)
+
+    assert sum(b.running for _, b in workers) == 1
+    assert sum(c.is_leader for c, _ in workers) == 1
+    assert (await workers[1][0].get_state())['symbol'] == "MSFT"
+    await _stop(*tasks)
+
+async def test_released_lease_is_taken_over():
+    server = fakeredis.FakeServer()
+    first, second = (_controller(server), LocalBot()), (_controller(server), LocalBot())
+    first_task = await _run(*first)
+    await first[0].set_desired(True)
+    await asyncio.sleep(0.3)
+    second_task = await _run(*second)
+    await asyncio.sleep(0.3)
+    assert first[1].running and not second[1].running
+
+    await _stop(first_task)
+    await first[0].release()
+    await asyncio.sleep(0.3)
+
+    assert second[0].is_leader and second[1].running
+    await _stop(second_task)
+
+async def test_stop_request_reaches_the_leader():
+    server = fakeredis.FakeServer()
+    controller, bot = _controller(server), LocalBot()
+    task = await _run(controller, bot)
+    await controller.set_desired(True)
+    await asyncio.sleep(0.2)
+    assert bot.running
+
+    await controller.set_desired(False)
+    await asyncio.sleep(0.2)
+
+    assert not bot.running and bot.stopped_by_lease == 0
+    assert controller.is_leader # Gestoppt, aber weiterhin Inhaber der Lease
+    await _stop(task)
+
+async def test_leader_stops_before_lease_expires_when_redis_hangs():
+    server = fakeredis.FakeServer()
+    controller, bot = _controller(server), LocalBot()
+    task = await _run(controller, bot)
+    await controller.set_desired(True)
+    await asyncio.sleep(0.3)
+    assert bot.running
+
+    class HangingRedis:
+        def __getattr__(self, name):
+            async def hang(*args, **kwargs):
+                await asyncio.sleep(30)
+            return hang
+
+    loop = asyncio.get_running_loop()
+    cut_at = loop.time()
+    controller._redis = HangingRedis()
+    while bot.running and loop.time() - cut_at < 3:
+        await asyncio.sleep(0.01)
+
+    # Die Lease gilt ab dem Abbruch noch höchstens lease_ttl; der Timer stoppt vorher, ohne auf Redis zu warten
+    assert not bot.running
+    assert loop.time() - cut_at < controller.lease_ttl
+    assert bot.stopped_by_lease == 1 and not controller.is_leader
+    controller._redis = None
+    await _stop(task)
+
+async def test_local_mode_runs_without_redis():
+    controller, bot = BotController(mode="local", renew_seconds=0.05), LocalBot()
+    task = await _run(controller, bot)
+    await controller.set_desired(True, "NVDA")
+    await asyncio.sleep(0.1)
+
+    assert bot.running
+    assert (await controller.get_state())['leader'] == controller.instance_id
+    await _stop(task)
@@ -0,0 +1,63 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from http_clients import AsyncHTTPClient, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+def _throttling_client(rejections: int, retry_after: str | None) -> tuple[AsyncHTTPClient, list]:
+    """Client gegen eine App, die die ersten 'rejections' Anfragen mit 429 ablehnt; gibt auch die Ankunftszeiten zurück."""
+    app, arrivals = FastAPI(), []
+
+    @app.get("/quote")
+    async def quote():
+        arrivals.append(time.monotonic())
+        if len(arrivals) <= rejections:
+            headers = {"Retry-After": retry_after} if retry_after is not None else {}
+            return JSONResponse(status_code=429, content={"message": "too many requests."}, headers=headers)
+        return {"ok": True}
+
+    return AsyncHTTPClient(max_retries=3, transport=httpx.ASGITransport(app=app)), arrivals
+
+async def test_every_attempt_takes_a_token():
+    http_client, arrivals = _throttling_client(rejections=2, retry_after="0")
+    bucket = TokenBucket(rate_per_second=20, capacity=3)
+
+    assert await http_client.get_json("http://upstream/quote", rate_limiter=bucket) == {"ok": True}
+
+    assert len(arrivals) == 3
+    assert bucket.available < 1 # Alle drei Versuche haben ein Token verbraucht
+
+async def test_retry_after_blocks_the_shared_bucket():
+    http_client, arrivals = _throttling_client(rejections=1, retry_after="0.3")
+    bucket = TokenBucket(rate_per_second=1000, capacity=10)
+    started = time.monotonic()
+
+    async def other_caller():
+        await asyncio.sleep(0.05) # Nach der 429-Antwort
+        await bucket.acquire()
+        return time.monotonic()
+
+    result, other_at = await asyncio.gather(http_client.get_json("http://upstream/quote", rate_limiter=bucket), other_caller())
+
+    assert result == {"ok": True}
+    assert arrivals[1] - arrivals[0] >= 0.3 # Wiederholung erst nach Retry-After
+    assert other_at - started >= 0.3 # Auch andere Aufrufer warten die Sperre ab
+
+async def test_retry_after_is_honoured_without_a_bucket():
+    http_client, arrivals = _throttling_client(rejections=1, retry_after="0.2")
+    await http_client.get_json("http://upstream/quote")
+    assert arrivals[1] - arrivals[0] >= 0.2
+
+async def test_long_retry_after_returns_the_429(monkeypatch):
+    monkeypatch.setattr("http_clients.HTTP_RETRY_AFTER_MAX_SECONDS", 1.0)
+    http_client, arrivals = _throttling_client(rejections=1, retry_after="120")
+
+    response = await http_client.request("GET", "http://upstream/quote", rate_limiter=TokenBucket(100, 10))
+
+    assert response.status_code == 429 and len(arrivals) == 1
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from ingest_jobs import IngestJobRegistry
+
+fakeredis = pytest.importorskip("fakeredis")
+
+pytestmark = pytest.mark.anyio
+
+def _registry(server, **kwargs) -> IngestJobRegistry:
+    registry = IngestJobRegistry(mode="redis", **kwargs)
+    registry._redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    return registry
+
+async def _ingest(release: asyncio.Event, report: dict):
+    await release.wait()
+    return report
+
+async def _wait_for_status(registry: IngestJobRegistry, job_id: str, status: str) -> dict:
+    for _ in range(100):
+        job = await registry.get(job_id)
+        if job['status'] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} erreicht Status {status} nicht: {job}")
+
+async def test_job_started_on_one_worker_is_visible_on_another():
+    server = fakeredis.FakeServer()
+    worker_a, worker_b = _registry(server), _registry(server)
+    release = asyncio.Event()
+    job = await worker_a.start("prices", _ingest(release, {'rows': 42}), params={'symbols': ["AAPL"]})
+
+    assert (await worker_b.get(job['job_id']))['status'] == "running"
+    [listed] = await worker_b.list("prices")
+    assert listed['job_id'] == job['job_id'] and 'result' not in listed
+
+    release.set()
+    finished = await _wait_for_status(worker_b, job['job_id'], "finished")
+    assert finished['result'] == {'rows': 42} and finished['worker'] == worker_a.worker_id
+    assert await worker_b.list("sentiment") == []
+
+async def test_failed_and_cancelled_jobs_are_recorded():
+    server = fakeredis.FakeServer()
+    worker, other = _registry(server), _registry(server)
+
+    async def broken():
+        raise RuntimeError("FMP nicht erreichbar")
+    failed = await worker.start("sentiment", broken())
+    running = await worker.start("prices", _ingest(asyncio.Event(), {}))
+
+    assert (await _wait_for_status(other, failed['job_id'], "failed"))['error'] == "FMP nicht erreichbar"
+    await worker.shutdown()
+    assert (await other.get(running['job_id']))['status'] == "cancelled"
+
+async def test_running_job_without_heartbeat_is_reported_lost():
+    server = fakeredis.FakeServer()
+    worker, other = _registry(server, heartbeat_seconds=0.02), _registry(server, heartbeat_seconds=0.02)
+    job = await worker.start("prices", _ingest(asyncio.Event(), {}))
+    await asyncio.sleep(0.1)
+    assert (await other.get(job['job_id']))['status'] == "running" # Herzschlag läuft
+
+    worker._tasks[job['job_id']].cancel()
+    worker._save = lambda job: asyncio.sleep(0) # Abgestürzter Worker: der letzte Stand bleibt "running"
+    await asyncio.sleep(0.1)
+
+    lost = await other.get(job['job_id'])
+    assert lost['status'] == "lost" and worker.worker_id in lost['error']
+
+async def test_job_is_not_started_when_its_state_cannot_be_stored():
+    server = fakeredis.FakeServer()
+    registry = _registry(server)
+    server.connected = False
+    started = []
+
+    async def ingest():
+        started.append(True)
+    with pytest.raises(Exception):
+        await registry.start("prices", ingest())
+    await asyncio.sleep(0)
+    assert not started and not registry._tasks
+
+async def test_local_mode_keeps_jobs_in_memory():
+    registry, release = IngestJobRegistry(mode="local", history=2), asyncio.Event()
+    jobs = [await registry.start("prices", _ingest(release, {'n': i})) for i in range(3)]
+    release.set()
+    await asyncio.sleep(0.05)
+
+    assert [j['job_id'] for j in await registry.list()] == [j['job_id'] for j in jobs[:0:-1]]
+    assert await registry.get(jobs[0]['job_id']) is None # Älter als history
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import torch
+from sklearn.preprocessing import MinMaxScaler
+
+from ml_utils import TransformerForecastModel, predict_batch_for_tickers, predict_for_ticker
+
+def _components(seed: int, d_model: int = 16, forecast_horizon: int = 3, seq_length: int = 10, input_dim: int = 5) -> dict:
+    torch.manual_seed(seed)
+    config = {'input_dim_model': input_dim, 'd_model': d_model, 'nhead': 2, 'num_encoder_layers': 1,
+              'dim_feedforward': 32, 'forecast_horizon': forecast_horizon, 'sequence_length': seq_length}
+    model = TransformerForecastModel(input_dim, d_model, 2, 1, 32, forecast_horizon, seq_length).eval()
+    rng = np.random.default_rng(seed)
+    scaler = MinMaxScaler().fit(rng.uniform(50, 150, size=(200, input_dim)) * (seed + 1))
+    return {'model': model, 'scaler': scaler, 'config': config, 'device': "cpu"}
+
+def _sequences(components_by_ticker: dict) -> dict:
+    rng = np.random.default_rng(42)
+    return {ticker: rng.uniform(50, 150, size=(c['config']['sequence_length'], c['config']['input_dim_model']))
+            for ticker, c in components_by_ticker.items()}
+
+def _assert_matches_single_predictions(components_by_ticker: dict, sequences_by_ticker: dict):
+    predictions = predict_batch_for_tickers(components_by_ticker, sequences_by_ticker)
+    assert set(predictions) == set(components_by_ticker)
+    for ticker, components in components_by_ticker.items():
+        expected = predict_for_ticker(components, sequences_by_ticker[ticker])
+        assert predictions[ticker].shape == expected.shape
+        np.testing.assert_allclose(predictions[ticker], expected, rtol=1e-4, atol=1e-3)
+
+def test_batch_matches_single_predictions_for_matching_configs():
+    components_by_ticker = {f"T{i}": _components(i) for i in range(4)}
+    _assert_matches_single_predictions(components_by_ticker, _sequences(components_by_ticker))
+
+def test_batch_matches_single_predictions_for_differing_configs():
+    components_by_ticker = {
+        "AAPL": _components(0), "MSFT": _components(1),
+        "NVDA": _components(2, d_model=8), "AMZN": _components(3, forecast_horizon=5),
+        "TSLA": _components(4, seq_length=6),
+    }
+    _assert_matches_single_predictions(components_by_ticker, _sequences(components_by_ticker))
+
+def test_tickers_without_components_are_skipped():
+    components_by_ticker = {"AAPL": _components(0)}
+    sequences_by_ticker = _sequences({"AAPL": components_by_ticker["AAPL"], "MSFT": _components(1)})
+    assert set(predict_batch_for_tickers(components_by_ticker, sequences_by_ticker)) == {"AAPL"}
@@ -0,0 +1,95 @@
+import gc
+import asyncio
+import itertools
+import time
+
+import pytest
+
+import fake_broker
+import order_execution
+from order_execution import OrderExecutor, client_order_id, cycle_key_for
+
+pytestmark = pytest.mark.anyio
+
+def _orders(count: int, cycle_key: int = 1_700_000_000) -> list[dict]:
+    return [{'symbol': f"T{i:03d}", 'qty': 1, 'side': "buy", 'client_order_id': client_order_id(f"T{i:03d}", "buy", cycle_key)}
+            for i in range(count)]
+
+def test_client_order_id_is_deterministic_per_cycle():
+    key = cycle_key_for(1_700_000_123.4, 60)
+    assert key == 1_700_000_100
+    assert client_order_id("aapl", "buy", key) == client_order_id("AAPL", "buy", cycle_key_for(1_700_000_159.9, 60))
+    assert client_order_id("AAPL", "buy", key) != client_order_id("AAPL", "buy", cycle_key_for(1_700_000_160.0, 60))
+
+async def test_submitted_orders_are_tracked_until_filled(alpaca, broker):
+    executor = OrderExecutor(alpaca, poll_seconds=0.02)
+    finished = []
+    async def listener(order):
+        finished.append(order)
+    executor.listeners.append(listener)
+
+    results = await executor.submit_orders(_orders(5))
+
+    assert all(r['ok'] and not r['duplicate'] for r in results)
+    assert await executor.wait_until_settled(timeout=5)
+    assert executor.stats['filled'] == 5
+    assert {o['status'] for o in executor.recent} == {"filled"}
+    assert len(finished) == 5
+    assert broker.stats['orders'] == 5
+
+async def test_slow_listeners_finish_and_failures_are_contained(alpaca, broker, capsys):
+    executor = OrderExecutor(alpaca, poll_seconds=0.02)
+    mirrored = []
+    async def slow_listener(order):
+        await asyncio.sleep(0.1)
+        gc.collect() # Ohne gehaltene Referenz könnte der Task hier eingesammelt werden
+        mirrored.append(order['id'])
+    async def broken_listener(order):
+        raise RuntimeError("Spiegel nicht erreichbar")
+    executor.listeners += [slow_listener, broken_listener]
+
+    await executor.submit_orders(_orders(4))
+
+    assert await executor.wait_until_settled(timeout=5)
+    assert len(mirrored) == 4 and not executor._listener_tasks
+    assert capsys.readouterr().out.count("Spiegel nicht erreichbar") == 4
+
+async def test_resubmitting_a_cycle_does_not_duplicate_orders(alpaca, broker):
+    executor = OrderExecutor(alpaca, poll_seconds=0.02)
+    orders = _orders(3)
+    await executor.submit_orders(orders)
+    await executor.wait_until_settled(timeout=5)
+
+    replay = await executor.submit_orders(orders)
+
+    assert all(r['ok'] and r['duplicate'] for r in replay)
+    assert broker.stats['orders'] == 3
+    assert executor.stats['duplicates'] == 3
+
+async def test_rejected_submission_is_reported(alpaca, broker):
+    executor = OrderExecutor(alpaca)
+    broker.cash = 1.0 # Keine Kaufkraft: 403 vom Broker
+    [result] = await executor.submit_orders(_orders(1))
+    assert not result['ok']
+    assert "buying power" in result['error']
+    assert executor.stats['errors'] == 1
+    assert not executor.open_symbols()
+
+async def test_poll_fills_pages_through_tied_timestamps(alpaca, broker, monkeypatch):
+    # Je 3 Orders mit demselben submitted_at, Seiten zu 5: Gruppen liegen über Seitengrenzen hinweg
+    monkeypatch.setattr(order_execution, "ORDERS_PAGE_SIZE", 5)
+    counter, base = itertools.count(), time.time()
+    monkeypatch.setattr(fake_broker.time, "time", lambda: base + next(counter) // 3 * 0.001)
+    orders = [broker.submit({'symbol': f"S{i}", 'qty': "1", 'side': "buy"}) for i in range(23)]
+    monkeypatch.undo()
+    monkeypatch.setattr(order_execution, "ORDERS_PAGE_SIZE", 5)
+    broker._pending_fills = [(0, order_id) for _, order_id in broker._pending_fills] # Alle sofort fällig
+
+    executor = OrderExecutor(alpaca, poll_seconds=60)
+    for order in orders:
+        executor._open[order['id']] = order
+        executor._tracked_since[order['id']] = time.monotonic()
+    await executor.poll_fills()
+
+    assert not executor._open
+    assert executor.stats['filled'] == 23
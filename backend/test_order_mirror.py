@@ -0,0 +1,88 @@
+import time
+
+import pandas as pd
+import pytest
+
+import async_crud
+import order_mirror
+from order_mirror import OrderMirror, SYNC_TRY_LOCK_SQL, SYNC_UNLOCK_SQL, status_filter
+
+pytestmark = pytest.mark.anyio
+
+def _submit(broker, count: int) -> list[dict]:
+    return [broker.submit({'symbol': f"M{i}", 'qty': "2", 'side': "buy"}) for i in range(count)]
+
+def _fill_all(broker):
+    # Sofort fällig, mit aktuellem updated_at (der Spiegel übernimmt nur neuere Stände)
+    now = time.time()
+    broker._pending_fills = [(now, order_id) for _, order_id in broker._pending_fills]
+
+async def _mirrored(session_factory, status: str = "all") -> dict:
+    statuses, exclude_statuses = status_filter(status)
+    async with session_factory() as db:
+        orders, _ = await async_crud.get_mirrored_orders(db, statuses=statuses, exclude_statuses=exclude_statuses, limit=500)
+    return {o['id']: o['status'] for o in orders}
+
+@pytest.fixture
+def mirror(alpaca, mirror_db):
+    engine, session_factory = mirror_db
+    return OrderMirror(alpaca, sync_seconds=0, session_factory=session_factory, engine=engine)
+
+async def test_sync_mirrors_orders_and_positions(mirror, broker, mirror_db):
+    _, session_factory = mirror_db
+    orders = _submit(broker, 3)
+    _fill_all(broker)
+
+    report = await mirror.sync()
+
+    assert report['new_orders']['complete'] and report['new_orders']['orders'] == 3
+    assert report['positions'] == 3
+    assert await _mirrored(session_factory) == {o['id']: "filled" for o in orders}
+    async with session_factory() as db:
+        positions, synced_at = await async_crud.get_mirrored_positions(db)
+        watermark = await async_crud.get_order_sync_watermark(db)
+    assert {p['symbol'] for p in positions} == {"M0", "M1", "M2"} and synced_at is not None
+    assert watermark == max(pd.Timestamp(o['submitted_at']) for o in orders)
+
+async def test_unsettled_orders_are_refreshed(mirror, broker, mirror_db):
+    _, session_factory = mirror_db
+    broker.fill_delay = 3600
+    orders = _submit(broker, 4)
+    await mirror.sync()
+    assert set((await _mirrored(session_factory, "open")).values()) == {"accepted"}
+
+    _fill_all(broker)
+    report = await mirror.sync()
+
+    assert report['unsettled_orders']['checked'] == 4
+    assert report['unsettled_orders']['fetched_individually'] == 0
+    assert await _mirrored(session_factory, "closed") == {o['id']: "filled" for o in orders}
+    assert await _mirrored(session_factory, "open") == {}
+
+async def test_watermark_waits_for_a_complete_pass(mirror, broker, mirror_db, monkeypatch):
+    _, session_factory = mirror_db
+    monkeypatch.setattr(order_mirror, "ORDER_MIRROR_PAGE_SIZE", 2)
+    orders = _submit(broker, 5)
+    mirror.max_pages = 1
+
+    partial = await mirror.sync_new_orders()
+
+    assert not partial['complete'] and partial['watermark'] is None
+    async with session_factory() as db:
+        assert await async_crud.get_order_sync_watermark(db) is None
+
+    mirror.max_pages = 10
+    complete = await mirror.sync_new_orders()
+
+    assert complete['complete'] and complete['watermark'] is not None
+    assert set(await _mirrored(session_factory)) == {o['id'] for o in orders}
+
+async def test_sync_is_skipped_while_another_process_holds_the_lock(mirror, mirror_db):
+    engine, _ = mirror_db
+    async with engine.connect() as other_process:
+        assert (await other_process.execute(SYNC_TRY_LOCK_SQL)).scalar()
+        report = await mirror.sync()
+        await other_process.execute(SYNC_UNLOCK_SQL)
+
+    assert report['skipped'] and mirror.stats['skipped'] == 1
+    assert mirror.stats['api_requests'] == 0
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+import pytest
+
+from sentiment_ingestion import fetch_symbol_sentiment, social_sentiment_to_frame
+
+pytestmark = pytest.mark.anyio
+
+def test_hourly_entries_are_weighted_into_daily_scores():
+    entries = [
+        {'date': "2024-03-01 15:00:00", 'stocktwitsSentiment': 1.0, 'twitterSentiment': 1.0, 'stocktwitsPosts': 3, 'twitterPosts': 0},
+        {'date': "2024-03-01 14:00:00", 'stocktwitsSentiment': 0.0, 'twitterSentiment': 0.5, 'stocktwitsPosts': 0, 'twitterPosts': 1},
+        {'date': "2024-02-29 10:00:00", 'stocktwitsSentiment': 0, 'twitterSentiment': 0, 'stocktwitsPosts': 0, 'twitterPosts': 0},
+    ]
+    daily_df = social_sentiment_to_frame(entries, "aapl")
+
+    # 0 heißt "keine Beiträge": der 29.02. entfällt, die 0.0 von StockTwits zählt in der zweiten Stunde nicht
+    assert len(daily_df) == 1
+    [row] = daily_df.to_dict('records')
+    assert row['symbol'] == "AAPL" and str(row['date']) == "2024-03-01"
+    assert row['sentiment_score'] == pytest.approx(2 * (3 * 1.0 + 1 * 0.5) / 4 - 1)
+
+async def test_fetch_reads_pages_until_since(fmp, fmp_client):
+    since = (fmp.now - timedelta(days=3)).date()
+    daily_df, pages, missing_days = await fetch_symbol_sentiment(fmp_client, "MSFT", since)
+
+    assert missing_days == 0
+    assert list(daily_df['date']) == sorted(since + timedelta(days=d) for d in range(4))
+    assert daily_df['sentiment_score'].between(-1, 1).all()
+    assert pages == fmp.stats['sentiment_pages'] < 30 # Nicht die gesamte Historie
+
+async def test_fetch_reports_backlog_when_max_pages_is_reached(fmp, fmp_client):
+    since = (fmp.now - timedelta(days=20)).date()
+    daily_df, pages, missing_days = await fetch_symbol_sentiment(fmp_client, "MSFT", since, max_pages=1)
+
+    assert pages == 1 and missing_days > 0
+    assert daily_df['date'].min() > since + timedelta(days=missing_days - 1)
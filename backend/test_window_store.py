@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import crud
+from window_store import RollingWindowStore
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+class PriceTable:
+    """Kurse "in der DB" für crud.get_model_input_rows (ohne Sentiment)."""
+
+    def __init__(self):
+        self.rows = {} # {(symbol, timestamp): close}
+
+    def write(self, store: RollingWindowStore, symbol: str, days: list[int]):
+        timestamps = [START + timedelta(days=d) for d in days]
+        closes = [float(d) for d in days]
+        self.rows.update(((symbol, t), c) for t, c in zip(timestamps, closes))
+        store.on_prices([symbol] * len(days), timestamps, closes) # Wie crud nach dem Commit
+
+    def model_input_rows(self, db, symbols, length, since_by_symbol=None):
+        rows = []
+        for symbol in symbols:
+            timestamps = sorted(t for s, t in self.rows if s == symbol)[-length:]
+            rows += [(symbol, t, self.rows[(symbol, t)], None, None) for t in timestamps]
+        return rows
+
+@pytest.fixture
+def table(monkeypatch):
+    table = PriceTable()
+    monkeypatch.setattr(crud, "get_model_input_rows", table.model_input_rows)
+    return table
+
+def _closes(store: RollingWindowStore, symbol: str = "AAPL") -> list[float]:
+    window = store.get_window(symbol, store.capacity)
+    return None if window is None else window[:, 0].tolist()
+
+def test_new_prices_and_corrections_update_the_window(table):
+    store = RollingWindowStore(capacity=5)
+    table.write(store, "AAPL", list(range(10)))
+    store.seed(None, ["AAPL"])
+    assert _closes(store) == [5, 6, 7, 8, 9]
+
+    table.write(store, "AAPL", [10])
+    store.on_prices(["AAPL"], [START + timedelta(days=8)], [80.0]) # Upsert eines gespeicherten Kurses
+    table.write(store, "AAPL", [2]) # Älter als das Fenster: ohne Wirkung
+
+    assert _closes(store) == [6, 7, 80, 9, 10]
+    assert not store.invalidated_symbols()
+
+def test_backfilled_gap_inside_the_window_triggers_a_reseed(table):
+    store = RollingWindowStore(capacity=5)
+    table.write(store, "AAPL", [0, 1, 2, 4, 5, 6])
+    store.seed(None, ["AAPL"])
+    assert _closes(store) == [1, 2, 4, 5, 6]
+
+    table.write(store, "AAPL", [3]) # Nachträglicher Backfill in die Lücke
+
+    assert store.invalidated_symbols() == ["AAPL"]
+    assert _closes(store) is None # Keine Vorhersage auf einem lückenhaften Fenster
+    store.seed(None, ["AAPL"])
+    assert _closes(store) == [2, 3, 4, 5, 6]
+    assert not store.invalidated_symbols() and store.stats == {'invalidated': 1, 'reseeded': 1}
+
+def test_reseed_keeps_prices_that_are_not_yet_in_the_db(table):
+    store = RollingWindowStore(capacity=5)
+    table.write(store, "AAPL", [0, 1, 3, 4])
+    store.seed(None, ["AAPL"])
+    store.on_prices(["AAPL"], [START + timedelta(days=5)], [5.0]) # Stream-Balken vor dem DB-Flush
+    table.write(store, "AAPL", [2])
+
+    store.seed(None, ["AAPL"])
+
+    assert _closes(store) == [1, 2, 3, 4, 5]
+
+def test_invalidation_during_a_seed_is_not_lost(table, monkeypatch):
+    store = RollingWindowStore(capacity=5)
+    table.write(store, "AAPL", [0, 1, 3, 4, 6, 7])
+    store.seed(None, ["AAPL"])
+    table.write(store, "AAPL", [5])
+
+    read_rows = table.model_input_rows
+    def read_then_backfill(*args, **kwargs):
+        rows = read_rows(*args, **kwargs)
+        table.write(store, "AAPL", [2]) # Geschrieben, nachdem der seed gelesen hat
+        return rows
+    monkeypatch.setattr(crud, "get_model_input_rows", read_then_backfill)
+    store.seed(None, ["AAPL"])
+    assert store.invalidated_symbols() == ["AAPL"]
+
+    monkeypatch.setattr(crud, "get_model_input_rows", read_rows)
+    store.seed(None, ["AAPL"])
+    assert _closes(store) == [3, 4, 5, 6, 7]
+    assert not store.invalidated_symbols()
+
+def test_partially_filled_window_reseeds_older_rows(table):
+    store = RollingWindowStore(capacity=5)
+    table.write(store, "AAPL", [3, 4])
+    store.seed(None, ["AAPL"])
+    table.write(store, "AAPL", [1]) # Puffer nicht voll: der Kurs gehört ins Fenster
+
+    store.seed(None, ["AAPL", "MSFT"])
+
+    assert store.get_window("AAPL", 3)[:, 0].tolist() == [1, 3, 4]
+    assert np.array_equal(store.get_window("AAPL", 3)[:, 1], np.zeros(3))
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import joblib
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.preprocessing import MinMaxScaler
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler
+
+import crud
+import ml_utils
+from database import SessionLocal
+from ml_utils import (
+    TransformerForecastModel, model_file_paths,
+    SEQ_LENGTH_DEFAULT, FORECAST_HORIZON_DEFAULT, INPUT_DIM_MODEL_DEFAULT, D_MODEL_DEFAULT, NHEAD_DEFAULT,
+    NUM_ENCODER_LAYERS_DEFAULT, DIM_FEEDFORWARD_DEFAULT, DROPOUT_MODEL_DEFAULT,
+)
+
+# Training der Modelle, die ml_utils.load_model_components_for_ticker lädt ({T}_transformer_model.pth,
+# {T}_scaler.pkl, {T}_model_config.json).
+# 1. Export: Kurs- und Sentiment-Historie je Symbol einmal aus Postgres in {T}.npy (float64, Spalten
+#    [Close, Sentiment]); Folgeläufe holen nur den Rand neu und hängen an.
+# 2. Training: die Datei wird per mmap geöffnet, Trainingsfenster sind Views (sliding_window_view) auf das Array;
+#    kopiert wird erst beim Zusammenstellen eines Batches (eine Fancy-Index-Operation pro Batch).
+# 3. Fine-Tuning (--fine-tune): vorhandenes Modell und Scaler weitertrainieren, nur mit den Fenstern, deren
+#    Zielwerte nach dem letzten Training hinzugekommen sind; ohne neue Daten wird das Symbol übersprungen.
+
+TRAIN_DATA_DIR = os.getenv("TRAIN_DATA_DIR", "/app/training_data")
+TRAIN_RESOLUTION = os.getenv("TRAIN_RESOLUTION", "1d") # Wie BACKTEST_RESOLUTION: ein Balken pro Tag
+TRAIN_EPOCHS = int(os.getenv("TRAIN_EPOCHS", "20"))
+TRAIN_FINE_TUNE_EPOCHS = int(os.getenv("TRAIN_FINE_TUNE_EPOCHS", "3"))
+TRAIN_BATCH_SIZE = int(os.getenv("TRAIN_BATCH_SIZE", "256"))
+TRAIN_LEARNING_RATE = float(os.getenv("TRAIN_LEARNING_RATE", "1e-3"))
+TRAIN_FINE_TUNE_LEARNING_RATE = float(os.getenv("TRAIN_FINE_TUNE_LEARNING_RATE", "2e-4"))
+TRAIN_LOADER_WORKERS = int(os.getenv("TRAIN_LOADER_WORKERS", "2"))
+TRAIN_VALIDATION_SHARE = 0.1 # Jüngster Anteil der Fenster (chronologisch) zur Validierung
+EXPORT_OVERLAP_ROWS = int(os.getenv("TRAIN_EXPORT_OVERLAP_ROWS", "200")) # Rand, der beim Anhängen neu geholt wird (nachgetragenes Sentiment)
+
+# --- Export ---
+
+def history_paths(symbol: str, data_dir: str = TRAIN_DATA_DIR) -> tuple[str, str]:
+    return os.path.join(data_dir, f"{symbol}.npy"), os.path.join(data_dir, f"{symbol}.meta.json")
+
+def _write_npy(path: str, parts: list[np.ndarray]) -> int:
+    """Schreibt die Teile hintereinander in eine neue .npy-Datei (atomar über eine Temp-Datei). Gibt die Zeilenzahl zurück."""
+    rows = sum(len(p) for p in parts)
+    tmp_path = path + ".tmp.npy"
+    target = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float64, shape=(rows, INPUT_DIM_MODEL_DEFAULT))
+    offset = 0
+    for part in parts:
+        target[offset:offset + len(part)] = part
+        offset += len(part)
+    target.flush()
+    del target
+    os.replace(tmp_path, path)
+    return rows
+
+def export_history(db, symbol: str, data_dir: str = TRAIN_DATA_DIR, resolution: str = TRAIN_RESOLUTION,
+                   full: bool = False) -> dict:
+    """
+    Exportiert die Modell-Eingaben (Close, Sentiment) eines Symbols nach {data_dir}/{symbol}.npy.
+    Ist schon ein Export vorhanden, werden nur die letzten EXPORT_OVERLAP_ROWS Zeilen und alles danach neu
+    abgefragt (Sentiment kann nachträglich für vergangene Tage eingetragen werden).
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    npy_path, meta_path = history_paths(symbol, data_dir)
+    meta = None
+    if not full and os.path.exists(npy_path) and os.path.exists(meta_path):
+        with open(meta_path) as f_meta:
+            meta = json.load(f_meta)
+        if meta.get('resolution') != resolution:
+            meta = None
+
+    keep_rows, since = 0, None
+    if meta and meta['timestamps']:
+        keep_rows = max(0, meta['rows'] - EXPORT_OVERLAP_ROWS)
+        since = pd.Timestamp(meta['timestamps'][keep_rows]) if keep_rows < meta['rows'] else None
+    history_df = crud.get_model_input_history(db, symbol, since, None, resolution=resolution)
+    new_values = history_df[['close', 'sentiment_score']].to_numpy(dtype=np.float64)
+    new_timestamps = [ts.isoformat() for ts in history_df['timestamp']]
+
+    parts = [new_values]
+    timestamps = new_timestamps
+    if keep_rows:
+        parts.insert(0, np.load(npy_path, mmap_mode="r")[:keep_rows])
+        timestamps = meta['timestamps'][:keep_rows] + new_timestamps
+    rows = _write_npy(npy_path, parts)
+    meta = {'symbol': symbol, 'resolution': resolution, 'rows': rows, 'timestamps': timestamps,
+            'exported_at': datetime.now(timezone.utc).isoformat()}
+    with open(meta_path, "w") as f_meta:
+        json.dump(meta, f_meta)
+    return {'rows': rows, 'fetched_rows': len(new_values), 'last_timestamp': timestamps[-1] if timestamps else None}
+
+# --- Datensatz ---
+
+class WindowDataset(Dataset):
+    """
+    Trainingsfenster über eine per mmap geöffnete .npy-Datei: Eingabe sind seq_length Zeilen (skaliert),
+    Ziel die skalierten Schlusskurse der folgenden horizon Zeilen.
+    __getitem__ erwartet eine Liste von Fenster-Indizes (BatchSampler) und liefert einen ganzen Batch.
+    Die Datei wird erst im jeweiligen DataLoader-Worker geöffnet, damit nur der Pfad übertragen wird.
+    """
+
+    def __init__(self, npy_path: str, window_indices: np.ndarray, seq_length: int, horizon: int,
+                 scale: np.ndarray, offset: np.ndarray):
+        self.npy_path = npy_path
+        self.window_indices = window_indices
+        self.seq_length = seq_length
+        self.horizon = horizon
+        self.scale = scale.astype(np.float32)
+        self.offset = offset.astype(np.float32)
+        self._inputs = None
+        self._targets = None
+
+    def _open(self):
+        values = np.load(self.npy_path, mmap_mode="r")
+        # Views ohne Kopie: (n_fenster, seq_length, features) bzw. (n_fenster, horizon)
+        self._inputs = sliding_window_view(values[:-self.horizon], (self.seq_length, values.shape[1]))[:, 0]
+        self._targets = sliding_window_view(values[self.seq_length:, 0], self.horizon)
+
+    def __len__(self):
+        return len(self.window_indices)
+
+    def __getitem__(self, batch_positions):
+        if self._inputs is None:
+            self._open()
+        indices = self.window_indices[np.asarray(batch_positions)]
+        inputs = self._inputs[indices].astype(np.float32) * self.scale + self.offset
+        targets = self._targets[indices].astype(np.float32) * self.scale[0] + self.offset[0]
+        return torch.from_numpy(inputs), torch.from_numpy(targets)
+
+def _loader(dataset: WindowDataset, batch_size: int, shuffle: bool, workers: int) -> DataLoader:
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    batches = BatchSampler(sampler, batch_size, drop_last=False)
+    # Worker lohnen sich erst, wenn es genug Batches gibt (z.B. nicht beim Fine-Tuning auf wenigen neuen Tagen)
+    workers = workers if len(batches) > workers else 0
+    return DataLoader(dataset, sampler=batches, batch_size=None, num_workers=workers)
+
+# --- Training ---
+
+def _run_epoch(model: nn.Module, loader: DataLoader, loss_fn, optimizer=None) -> float:
+    model.train(optimizer is not None)
+    total_loss, total_count = 0.0, 0
+    with torch.set_grad_enabled(optimizer is not None):
+        for inputs, targets in loader:
+            loss = loss_fn(model(inputs), targets)
+            if optimizer is not None:
+                optimizer.zero_grad()
+                loss.backward()
+                nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                optimizer.step()
+            total_loss += loss.item() * len(inputs)
+            total_count += len(inputs)
+    return total_loss / total_count if total_count else float("nan")
+
+def _save_artifacts(symbol: str, model: nn.Module, scaler, config: dict):
+    """Schreibt die drei Dateien atomar; die Konfiguration zuletzt, da die Modell-Registry alle drei vergleicht."""
+    model_path, scaler_path, config_path = model_file_paths(symbol)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    torch.save(model.state_dict(), model_path + ".tmp")
+    joblib.dump(scaler, scaler_path + ".tmp")
+    with open(config_path + ".tmp", "w") as f_cfg:
+        json.dump(config, f_cfg, indent=2)
+    for path in (model_path, scaler_path, config_path):
+        os.replace(path + ".tmp", path)
+
+def train_symbol(symbol: str, data_dir: str = TRAIN_DATA_DIR, fine_tune: bool = False, epochs: int | None = None,
+                 batch_size: int = TRAIN_BATCH_SIZE, workers: int = TRAIN_LOADER_WORKERS,
+                 seq_length: int = SEQ_LENGTH_DEFAULT, horizon: int = FORECAST_HORIZON_DEFAULT) -> dict:
+    """
+    Trainiert das Modell eines Symbols auf dem Export in data_dir und schreibt die Artefakte nach BASE_MODEL_DIR.
+    fine_tune: vorhandenes Modell (samt Scaler und Konfiguration) nur mit den neuen Fenstern weitertrainieren.
+    """
+    npy_path, meta_path = history_paths(symbol, data_dir)
+    values = np.load(npy_path, mmap_mode="r")
+    with open(meta_path) as f_meta:
+        meta = json.load(f_meta)
+
+    if fine_tune:
+        components = ml_utils.load_model_components_from_disk(symbol, "cpu", "eager")
+        model, scaler, config = components['model'], components['scaler'], dict(components['config'])
+        seq_length = config.get('sequence_length', SEQ_LENGTH_DEFAULT)
+        horizon = config.get('forecast_horizon', FORECAST_HORIZON_DEFAULT)
+        lr, epochs = TRAIN_FINE_TUNE_LEARNING_RATE, epochs or TRAIN_FINE_TUNE_EPOCHS
+    else:
+        # Scaler nur auf dem Trainingsanteil anpassen (chronologisch, ohne die Validierungsfenster)
+        fit_rows = max(seq_length + horizon, int(len(values) * (1 - TRAIN_VALIDATION_SHARE)))
+        scaler = MinMaxScaler().fit(values[:fit_rows])
+        config = {
+            'input_dim_model': INPUT_DIM_MODEL_DEFAULT, 'd_model': D_MODEL_DEFAULT, 'nhead': NHEAD_DEFAULT,
+            'num_encoder_layers': NUM_ENCODER_LAYERS_DEFAULT, 'dim_feedforward': DIM_FEEDFORWARD_DEFAULT,
+            'forecast_horizon': horizon, 'sequence_length': seq_length, 'dropout_model': DROPOUT_MODEL_DEFAULT,
+            'prediction_threshold_buy_signal': 0.01, 'prediction_threshold_sell_signal': 0.01,
+        }
+        model = TransformerForecastModel(
+            input_dim=config['input_dim_model'], d_model=config['d_model'], nhead=config['nhead'],
+            num_encoder_layers=config['num_encoder_layers'], dim_feedforward=config['dim_feedforward'],
+            forecast_horizon=horizon, seq_length=seq_length, dropout=config['dropout_model'],
+        )
+        lr, epochs = TRAIN_LEARNING_RATE, epochs or TRAIN_EPOCHS
+
+    n_windows = len(values) - seq_length - horizon + 1
+    if n_windows < 2:
+        raise ValueError(f"Nicht genügend Daten ({len(values)} Zeilen, benötigt {seq_length + horizon + 1}).")
+    if fine_tune:
+        # Nur Fenster, deren letzter Zielwert nach dem letzten Training liegt. Maßgeblich ist der Zeitstempel, nicht
+        # die Zeilennummer: ein neu aufgebauter oder nach hinten aufgefüllter Export verschiebt die Zeilen.
+        first_window = n_windows
+        if config.get('trained_until'):
+            timestamps = pd.to_datetime(meta['timestamps'], utc=True)
+            first_new_row = int(timestamps.searchsorted(pd.Timestamp(config['trained_until']), side="right"))
+            first_window = max(0, first_new_row - seq_length - horizon + 1)
+        if first_window >= n_windows:
+            return {'symbol': symbol, 'skipped': True, 'rows': len(values)}
+        train_indices, val_indices = np.arange(first_window, n_windows), np.arange(0)
+    else:
+        split = max(1, int(n_windows * (1 - TRAIN_VALIDATION_SHARE)))
+        train_indices, val_indices = np.arange(split), np.arange(split, n_windows)
+
+    scale, offset = ml_utils.scaler_affine_params({'scaler': scaler})
+    def make_dataset(indices):
+        return WindowDataset(npy_path, indices, seq_length, horizon, scale, offset)
+    train_loader = _loader(make_dataset(train_indices), batch_size, True, workers)
+    val_loader = _loader(make_dataset(val_indices), batch_size, False, workers) if len(val_indices) else None
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    loss_fn = nn.MSELoss()
+    started = time.perf_counter()
+    best_state, best_loss, train_loss, val_loss = None, float("inf"), float("nan"), None
+    for _ in range(epochs):
+        train_loss = _run_epoch(model, train_loader, loss_fn, optimizer)
+        if val_loader is not None:
+            val_loss = _run_epoch(model, val_loader, loss_fn)
+            if val_loss < best_loss: # Bestes Modell nach Validierungsfehler behalten
+                best_loss = val_loss
+                best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+    if best_state is not None:
+        model.load_state_dict(best_state)
+        val_loss = best_loss
+    model.eval()
+
+    config.update({
+        'trained_until': meta['timestamps'][-1],
+        'trained_at': datetime.now(timezone.utc).isoformat(), 'resolution': meta['resolution'],
+        'train_loss': round(train_loss, 6), 'val_loss': round(val_loss, 6) if val_loss is not None else config.get('val_loss'),
+    })
+    _save_artifacts(symbol, model, scaler, config)
+    return {'symbol': symbol, 'rows': len(values), 'windows': len(train_indices), 'epochs': epochs,
+            'train_loss': config['train_loss'], 'val_loss': config['val_loss'],
+            'seconds': round(time.perf_counter() - started, 3), 'fine_tune': fine_tune}
+
+def run_training(symbols: list[str], data_dir: str = TRAIN_DATA_DIR, fine_tune: bool = False, full_export: bool = False,
+                 resolution: str = TRAIN_RESOLUTION, **train_kwargs) -> list[dict]:
+    """Exportiert und trainiert mehrere Symbole nacheinander. Fehler werden pro Symbol gemeldet."""
+    results = []
+    with SessionLocal() as db:
+        for symbol in dict.fromkeys(s.upper() for s in symbols):
+            try:
+                started = time.perf_counter()
+                export = export_history(db, symbol, data_dir, resolution, full=full_export)
+                export_seconds = time.perf_counter() - started
+                # Ohne vorhandenes Modell bleibt nur das vollständige Training
+                has_model = all(os.path.exists(p) for p in model_file_paths(symbol))
+                result = train_symbol(symbol, data_dir, fine_tune=fine_tune and has_model, **train_kwargs)
+                results.append({**result, 'fetched_rows': export['fetched_rows'], 'export_seconds': round(export_seconds, 3)})
+            except Exception as e:
+                print(f"FEHLER beim Training für {symbol}: {e}")
+                results.append({'symbol': symbol, 'error': str(e)})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Trainiert die Vorhersagemodelle je Symbol aus der gespeicherten Historie.")
+    parser.add_argument("symbols", nargs="*", help="Ticker-Symbole (Standard: alle Symbole aus stock_prices)")
+    parser.add_argument("--fine-tune", action="store_true", help="Vorhandene Modelle nur mit den neuen Daten weitertrainieren")
+    parser.add_argument("--full-export", action="store_true", help="Historie vollständig neu aus Postgres exportieren")
+    parser.add_argument("--data-dir", default=TRAIN_DATA_DIR, help="Verzeichnis der .npy-Exporte")
+    parser.add_argument("--model-dir", default=ml_utils.BASE_MODEL_DIR, help="Zielverzeichnis der Modelldateien")
+    parser.add_argument("--resolution", choices=["raw", "1h", "1d"], default=TRAIN_RESOLUTION)
+    parser.add_argument("--epochs", type=int, help=f"Standard: {TRAIN_EPOCHS} bzw. {TRAIN_FINE_TUNE_EPOCHS} beim Fine-Tuning")
+    parser.add_argument("--batch-size", type=int, default=TRAIN_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=TRAIN_LOADER_WORKERS, help="DataLoader-Worker")
+    parser.add_argument("--seq-length", type=int, default=SEQ_LENGTH_DEFAULT)
+    parser.add_argument("--horizon", type=int, default=FORECAST_HORIZON_DEFAULT)
+    args = parser.parse_args()
+    ml_utils.BASE_MODEL_DIR = args.model_dir
+
+    symbols = args.symbols
+    if not symbols:
+        with SessionLocal() as db:
+            symbols = crud.get_price_symbols(db)
+    started = time.perf_counter()
+    results = run_training(
+        symbols, args.data_dir, fine_tune=args.fine_tune, full_export=args.full_export, resolution=args.resolution,
+        epochs=args.epochs, batch_size=args.batch_size, workers=args.workers, seq_length=args.seq_length, horizon=args.horizon,
+    )
+    for result in results:
+        if 'error' in result:
+            print(f"{result['symbol']}: FEHLER {result['error']}")
+        elif result.get('skipped'):
+            print(f"{result['symbol']}: keine neuen Daten, übersprungen")
+        else:
+            mode = "Fine-Tuning" if result['fine_tune'] else "Training"
+            print(f"{result['symbol']}: {mode} auf {result['windows']} Fenstern ({result['rows']} Zeilen, {result['fetched_rows']} neu "
+                  f"exportiert), Loss {result['train_loss']} / Val {result['val_loss']}, {result['seconds']}s")
+    print(f"Gesamt: {len(results)} Symbole in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
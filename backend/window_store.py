@@ -0,0 +1,256 @@
+import os
+import time
+import threading
+import numpy as np
+from datetime import date, datetime, timedelta, timezone
+
+from model_defaults import SEQ_LENGTH_DEFAULT
+
+# Wie oft (in Sekunden) der Store gegen die DB abgeglichen wird, um Schreibzugriffe
+# anderer Prozesse (z.B. Ingestion-CLI) nachzuziehen
+WINDOW_STORE_RESYNC_SECONDS = float(os.getenv("WINDOW_STORE_RESYNC_SECONDS", "300"))
+
+NS_PER_DAY = 86_400 * 10**9
+NO_SENTIMENT_DAY = np.iinfo(np.int64).min # Markierung für "kein Sentiment bekannt" (neutral 0)
+
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def _to_ns(timestamp) -> int:
+    """Wandelt datetime/pd.Timestamp/np.datetime64 in Nanosekunden seit Epoche (UTC) um."""
+    if isinstance(timestamp, datetime) and timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return int(np.datetime64(timestamp, 'ns').astype(np.int64))
+
+def _from_ns(timestamp_ns: int) -> datetime:
+    return EPOCH_UTC + timedelta(microseconds=timestamp_ns // 1000)
+
+def _to_day(day) -> int:
+    """Wandelt ein Datum in Tage seit Epoche um."""
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+def _from_day(day: int) -> date:
+    return date(1970, 1, 1) + timedelta(days=day)
+
+class _SymbolWindow:
+    """Ringpuffer über die letzten 'capacity' Zeilen (Close, Sentiment) eines Symbols."""
+    __slots__ = ('capacity', 'values', 'timestamps_ns', 'sentiment_days', 'head', 'count',
+                 'price_high_water_ns', 'latest_sentiment', 'latest_sentiment_day')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.values = np.zeros((capacity, 2), dtype=np.float32) # Spalten: Close, Sentiment
+        self.timestamps_ns = np.zeros(capacity, dtype=np.int64)
+        self.sentiment_days = np.full(capacity, NO_SENTIMENT_DAY, dtype=np.int64) # Datum des Sentiments je Zeile
+        self.head = 0 # Nächste Schreibposition
+        self.count = 0
+        self.price_high_water_ns = None # Zeitstempel des neuesten Kurses
+        self.latest_sentiment = 0.0
+        self.latest_sentiment_day = None # Datum des neuesten Sentiments
+
+    def append_price(self, timestamp_ns: int, close: float) -> bool:
+        """
+        Hängt einen Kurs an bzw. korrigiert einen gespeicherten. Gibt False zurück, wenn der Kurs älter als der neueste
+        ist, aber in das Fenster fällt, ohne einen gespeicherten zu treffen (nachgefüllte Lücke): er lässt sich nicht
+        einsortieren, da das zugehörige Sentiment fehlt, das Fenster muss neu aus der DB befüllt werden.
+        """
+        if self.price_high_water_ns is not None and timestamp_ns <= self.price_high_water_ns:
+            # Korrektur eines bereits gespeicherten Kurses (z.B. durch Upsert)
+            # Solange der Puffer nicht voll ist, sind genau die Plätze [0, count) belegt
+            matches = np.nonzero(self.timestamps_ns[:self.count] == timestamp_ns)[0]
+            self.values[matches, 0] = close
+            # Älter als die älteste Zeile eines vollen Puffers: liegt außerhalb des Fensters
+            return len(matches) > 0 or (self.count == self.capacity and timestamp_ns < self.timestamps_ns[self.head])
+        row_day = timestamp_ns // NS_PER_DAY
+        use_sentiment = self.latest_sentiment_day is not None and self.latest_sentiment_day <= row_day
+        self.values[self.head] = (close, self.latest_sentiment if use_sentiment else 0.0)
+        self.sentiment_days[self.head] = self.latest_sentiment_day if use_sentiment else NO_SENTIMENT_DAY
+        self.timestamps_ns[self.head] = timestamp_ns
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.price_high_water_ns = timestamp_ns
+        return True
+
+    def apply_sentiment(self, day: int, score: float):
+        # Forward-Fill: alle Zeilen ab diesem Tag, deren Sentiment nicht jünger ist, übernehmen den Wert
+        row_days = self.timestamps_ns // NS_PER_DAY
+        mask = (row_days >= day) & (self.sentiment_days <= day)
+        if self.count < self.capacity:
+            mask[self.count:] = False
+        self.values[mask, 1] = score
+        self.sentiment_days[mask] = day
+        if self.latest_sentiment_day is None or day >= self.latest_sentiment_day:
+            self.latest_sentiment_day = day
+            self.latest_sentiment = score
+
+    def prices(self) -> list[tuple[int, float]]:
+        """Gespeicherte (Zeitstempel in ns, Close), älteste zuerst."""
+        indices = (self.head - self.count + np.arange(self.count)) % self.capacity
+        return list(zip(self.timestamps_ns[indices].tolist(), self.values[indices, 0].tolist()))
+
+    def window(self, length: int) -> np.ndarray | None:
+        if length > self.count:
+            return None
+        indices = (self.head - length + np.arange(length)) % self.capacity
+        return self.values[indices] # Fancy Indexing liefert eine chronologisch sortierte Kopie
+
+class RollingWindowStore:
+    """
+    In-Memory-Store der letzten Modelleingaben (Close + Sentiment) pro Symbol.
+    Wird einmalig aus der DB befüllt (seed) und danach inkrementell über die crud-Schreibfunktionen
+    aktualisiert. Über die High-Water-Marks pro Symbol lässt sich nach einem Neustart oder bei
+    Schreibzugriffen anderer Prozesse günstig nachsynchronisieren (resync).
+    Kurse, die in eine Lücke innerhalb des Fensters fallen (z.B. nachträglicher Backfill), machen das Fenster des
+    Symbols ungültig: es liefert keine Sequenz mehr, bis der nächste seed es aus der DB neu befüllt.
+    """
+
+    def __init__(self, capacity: int = SEQ_LENGTH_DEFAULT):
+        self.capacity = capacity
+        self._windows = {}
+        self._invalidated = {} # {symbol: Zähler}; der Zähler erkennt Invalidierungen während eines laufenden seed
+        self._lock = threading.Lock()
+        self.last_sync_monotonic = None
+        self.stats = {'invalidated': 0, 'reseeded': 0}
+
+    def tracked_symbols(self) -> list[str]:
+        with self._lock:
+            return list(self._windows)
+
+    def high_water_marks(self) -> dict:
+        """Gibt {symbol: (neuester Kurs-Zeitstempel in ns, neuestes Sentiment-Datum in Tagen)} zurück."""
+        with self._lock:
+            return {s: (w.price_high_water_ns, w.latest_sentiment_day) for s, w in self._windows.items()}
+
+    def invalidated_symbols(self) -> list[str]:
+        with self._lock:
+            return list(self._invalidated)
+
+    def get_window(self, symbol: str, length: int | None = None) -> np.ndarray | None:
+        """
+        Liefert die letzten 'length' Zeilen (älteste zuerst) als (length, 2)-Array oder None, falls zu wenig Daten
+        vorliegen oder das Fenster ungültig ist.
+        """
+        with self._lock:
+            window = self._windows.get(symbol.upper())
+            if window is None or symbol.upper() in self._invalidated:
+                return None
+            return window.window(length or self.capacity)
+
+    def get_windows(self, symbols: list[str], length: int | None = None) -> dict:
+        """Wie get_window für viele Symbole; Symbole mit zu wenig Daten fehlen im Ergebnis."""
+        result = {}
+        for symbol in symbols:
+            window = self.get_window(symbol, length)
+            if window is not None:
+                result[symbol] = window
+        return result
+
+    def on_prices(self, symbols, timestamps, closes):
+        """Übernimmt neu geschriebene Kurse; nicht verfolgte Symbole werden ignoriert."""
+        with self._lock:
+            for symbol, timestamp, close in zip(symbols, timestamps, closes):
+                symbol = str(symbol).upper()
+                window = self._windows.get(symbol)
+                if window is not None and not window.append_price(_to_ns(timestamp), float(close)):
+                    self._invalidate(symbol)
+
+    def _invalidate(self, symbol: str):
+        if symbol not in self._invalidated:
+            print(f"INFO: Nachgefüllter Kurs im Fenster von {symbol}, Fenster wird neu aus der DB befüllt.")
+            self.stats['invalidated'] += 1
+        self._invalidated[symbol] = self._invalidated.get(symbol, 0) + 1
+
+    def on_sentiment(self, symbol: str, day: date, score: float):
+        """Übernimmt einen neu geschriebenen Sentiment-Wert; nicht verfolgte Symbole werden ignoriert."""
+        with self._lock:
+            window = self._windows.get(symbol.upper())
+            if window is not None:
+                window.apply_sentiment(_to_day(day), float(score))
+
+    def seed(self, db, symbols: list[str]):
+        """
+        Befüllt den Store für neue Symbole aus der DB, ebenso ungültige Fenster verfolgter Symbole.
+        Die übrigen verfolgten Symbole bleiben unverändert.
+        """
+        import crud
+        new_symbols, invalidated = self._untracked(symbols)
+        if new_symbols:
+            self._apply_seed(new_symbols, invalidated, crud.get_model_input_rows(db, new_symbols, self.capacity))
+
+    async def seed_async(self, db, symbols: list[str]):
+        """Wie seed, mit einer AsyncSession."""
+        import async_crud
+        new_symbols, invalidated = self._untracked(symbols)
+        if new_symbols:
+            self._apply_seed(new_symbols, invalidated, await async_crud.get_model_input_rows(db, new_symbols, self.capacity))
+
+    def resync(self, db, symbols: list[str] | None = None):
+        """Zieht Kurse nach der High-Water-Mark und Sentiments ab dem letzten bekannten Datum aus der DB nach."""
+        import crud
+        since_prices, since_sentiments = self._resync_bounds(symbols)
+        if since_prices:
+            self._apply_resync(
+                crud.get_model_input_rows(db, list(since_prices), self.capacity, since_by_symbol=since_prices),
+                crud.get_sentiments_since(db, since_sentiments),
+            )
+
+    async def resync_async(self, db, symbols: list[str] | None = None):
+        """Wie resync, mit einer AsyncSession."""
+        import async_crud
+        since_prices, since_sentiments = self._resync_bounds(symbols)
+        if since_prices:
+            self._apply_resync(
+                await async_crud.get_model_input_rows(db, list(since_prices), self.capacity, since_by_symbol=since_prices),
+                await async_crud.get_sentiments_since(db, since_sentiments),
+            )
+
+    def _untracked(self, symbols: list[str]) -> tuple[list[str], dict]:
+        """Zu befüllende Symbole (neu oder ungültig) und die Zähler der ungültigen zu Beginn des seed."""
+        with self._lock:
+            symbols = [s.upper() for s in symbols]
+            invalidated = {s: self._invalidated[s] for s in symbols if s in self._invalidated}
+            return [s for s in symbols if s not in self._windows or s in invalidated], invalidated
+
+    def _apply_seed(self, new_symbols: list[str], invalidated: dict, rows):
+        with self._lock:
+            previous = {s: self._windows[s] for s in invalidated if s in self._windows}
+            for symbol in new_symbols:
+                self._windows[symbol] = _SymbolWindow(self.capacity)
+            self._apply_rows(rows)
+            for symbol, old_window in previous.items():
+                # Kurse, die nur im Speicher liegen (z.B. Stream-Balken vor dem DB-Flush), bleiben erhalten
+                window = self._windows[symbol]
+                for timestamp_ns, close in old_window.prices():
+                    if window.price_high_water_ns is None or timestamp_ns > window.price_high_water_ns:
+                        window.append_price(timestamp_ns, close)
+                # Erneut invalidiert, während die DB gelesen wurde: der nächste seed befüllt noch einmal
+                if self._invalidated.get(symbol) == invalidated[symbol]:
+                    del self._invalidated[symbol]
+                    self.stats['reseeded'] += 1
+
+    def _resync_bounds(self, symbols: list[str] | None):
+        marks = self.high_water_marks()
+        symbols = [s.upper() for s in (symbols or marks) if s.upper() in marks]
+        since_prices = {s: (_from_ns(marks[s][0]) if marks[s][0] is not None else None) for s in symbols}
+        since_sentiments = {s: _from_day(marks[s][1]) for s in symbols if marks[s][1] is not None}
+        return since_prices, since_sentiments
+
+    def _apply_resync(self, price_rows, sentiment_rows):
+        with self._lock:
+            self._apply_rows(price_rows)
+            for symbol, day, score in sentiment_rows:
+                self._windows[symbol].apply_sentiment(_to_day(day), float(score))
+        self.last_sync_monotonic = time.monotonic()
+
+    def needs_resync(self) -> bool:
+        return self.last_sync_monotonic is None or time.monotonic() - self.last_sync_monotonic >= WINDOW_STORE_RESYNC_SECONDS
+
+    def _apply_rows(self, rows):
+        # Zeilen kommen chronologisch je Symbol; das mitgelieferte Sentiment wird ab seinem Datum vorwärts aufgefüllt
+        for symbol, timestamp, close, sentiment_score, sentiment_date in rows:
+            window = self._windows[symbol]
+            window.append_price(_to_ns(timestamp), float(close))
+            if sentiment_date is not None:
+                window.apply_sentiment(_to_day(sentiment_date), float(sentiment_score))
+
+# Prozessweiter Store, der von crud (Schreibpfade) und bot_loop (Lesepfad) gemeinsam genutzt wird
+WINDOW_STORE = RollingWindowStore()
@@ -2,22 +2,17 @@ import { useState, useEffect } from 'react';
 import Clock from '../components/Clock';
 import PriceChart from '../components/PriceChart'; // Neu importieren
 
+// Mehr Punkte als Pixel bringen im Chart nichts; der Server dünnt die Historie entsprechend aus
+const CHART_MAX_POINTS = 300;
+
 export default function HomePage() {
   const [botStatus, setBotStatus] = useState(null);
-  const [loadingBotStatus, setLoadingBotStatus] = useState(true);
-  const [errorBotStatus, setErrorBotStatus] = useState(null);
-
   const [alpacaAccount, setAlpacaAccount] = useState(null);
-  const [loadingAlpaca, setLoadingAlpaca] = useState(true);
-  const [errorAlpaca, setErrorAlpaca] = useState(null);
-
   const [alpacaPositions, setAlpacaPositions] = useState([]);
-  const [loadingPositions, setLoadingPositions] = useState(true);
-  const [errorPositions, setErrorPositions] = useState(null);
-
   const [alpacaOrders, setAlpacaOrders] = useState([]);
-  const [loadingOrders, setLoadingOrders] = useState(true);
-  const [errorOrders, setErrorOrders] = useState(null);
+  const [botSignals, setBotSignals] = useState({}); // {symbol: letztes Signal aus der Bot-Schleife}
+  const [loadingDashboard, setLoadingDashboard] = useState(true);
+  const [errorDashboard, setErrorDashboard] = useState(null);
 
   const [historicalData, setHistoricalData] = useState([]);
   const [loadingHistorical, setLoadingHistorical] = useState(true);
@@ -26,83 +21,54 @@ export default function HomePage() {
 
   const backendBaseUrl = process.env.NEXT_PUBLIC_BACKEND_BASE_URL || 'http://localhost:8000';
 
+  // Ein einziges Abo für Bot-Status, Konto, Positionen, Orders und Signale (Server-Sent Events).
+  // Das Backend fragt Alpaca zentral ab und schickt nach einem Snapshot nur noch Änderungen;
+  // EventSource verbindet sich nach einem Abbruch selbst neu und erhält dann einen frischen Snapshot.
   useEffect(() => {
-    async function fetchBotStatus() {
-      try {
-        const response = await fetch(`${backendBaseUrl}/api/v1/bot-status`);
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const data = await response.json();
-        setBotStatus(data);
-      } catch (e) {
-        setErrorBotStatus(e.message);
-      } finally {
-        setLoadingBotStatus(false);
-      }
-    }
-
-    async function fetchAlpacaAccount() {
-      try {
-        const response = await fetch(`${backendBaseUrl}/api/v1/alpaca/account`);
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(`HTTP error! status: ${response.status} - ${errorData.detail || response.statusText}`);
-        }
-        const data = await response.json();
-        setAlpacaAccount(data);
-      } catch (e) {
-        setErrorAlpaca(e.message);
-      } finally {
-        setLoadingAlpaca(false);
-      }
-    }
+    const source = new EventSource(`${backendBaseUrl}/api/v1/events/dashboard`);
+    const on = (type, handler) => source.addEventListener(type, (event) => handler(JSON.parse(event.data).data));
 
-    async function fetchAlpacaPositions() {
-      try {
-        const response = await fetch(`${backendBaseUrl}/api/v1/alpaca/positions`);
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(`HTTP error! status: ${response.status} - ${errorData.detail || response.statusText}`);
-        }
-        const data = await response.json();
-        setAlpacaPositions(data);
-      } catch (e) {
-        setErrorPositions(e.message);
-      } finally {
-        setLoadingPositions(false);
-      }
-    }
+    on('snapshot', (data) => {
+      setBotStatus(data.bot_status);
+      setAlpacaAccount(data.account);
+      setAlpacaPositions(data.positions);
+      setAlpacaOrders(data.orders);
+      setBotSignals(Object.fromEntries(data.signals.map((s) => [s.symbol, s])));
+      setLoadingDashboard(false);
+      setErrorDashboard(null);
+    });
+    on('bot_status', setBotStatus);
+    on('account', setAlpacaAccount);
+    on('signal', (signal) => setBotSignals((prev) => ({ ...prev, [signal.symbol]: signal })));
+    on('positions', ({ upsert, remove }) => setAlpacaPositions((prev) => {
+      const bySymbol = Object.fromEntries(prev.map((p) => [p.symbol, p]));
+      remove.forEach((symbol) => delete bySymbol[symbol]);
+      upsert.forEach((p) => { bySymbol[p.symbol] = p; });
+      return Object.values(bySymbol);
+    }));
+    on('orders', ({ upsert }) => setAlpacaOrders((prev) => {
+      const ids = new Set(upsert.map((o) => o.id));
+      return [...upsert, ...prev.filter((o) => !ids.has(o.id))];
+    }));
+    source.onerror = () => setErrorDashboard('Verbindung zum Backend unterbrochen, verbinde neu...');
 
-    async function fetchAlpacaOrders() {
-      try {
-        const response = await fetch(`${backendBaseUrl}/api/v1/alpaca/orders?status=filled&limit=10`); // Lade die letzten 10 gefüllten Orders
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(`HTTP error! status: ${response.status} - ${errorData.detail || response.statusText}`);
-        }
-        const data = await response.json();
-        setAlpacaOrders(data);
-      } catch (e) {
-        setErrorOrders(e.message);
-      } finally {
-        setLoadingOrders(false);
-      }
-    }
+    return () => source.close();
+  }, [backendBaseUrl]);
 
+  useEffect(() => {
     async function fetchHistoricalData(symbol) {
       if (!symbol) return;
       setLoadingHistorical(true);
       setErrorHistorical(null);
       try {
-        // Optional: from/to Parameter hinzufügen, z.B. &from_date=YYYY-MM-DD&to_date=YYYY-MM-DD
-        const response = await fetch(`${backendBaseUrl}/api/v1/fmp/historical-price/${symbol}`);
+        // Serverseitig auf Chart-Auflösung ausgedünnt (LTTB); optional from/to im Format YYYY-MM-DD
+        const response = await fetch(`${backendBaseUrl}/api/v1/fmp/historical-price/${symbol}?max_points=${CHART_MAX_POINTS}`);
         if (!response.ok) {
           const errorData = await response.json();
           throw new Error(`HTTP error! status: ${response.status} - ${errorData.detail || response.statusText}`);
         }
         const data = await response.json();
-        setHistoricalData(data.slice(0, 30)); // Zeige z.B. die letzten 30 Datenpunkte
+        setHistoricalData([...data].reverse()); // FMP liefert neueste zuerst, der Chart erwartet aufsteigende Daten
       } catch (e) {
         setErrorHistorical(e.message);
       } finally {
@@ -110,13 +76,15 @@ export default function HomePage() {
       }
     }
 
-    fetchBotStatus();
-    fetchAlpacaAccount();
-    fetchAlpacaPositions();
-    fetchAlpacaOrders();
-    fetchHistoricalData(selectedSymbolForChart); // Lade Daten für das initial ausgewählte Symbol
+    fetchHistoricalData(selectedSymbolForChart); // Lade Daten für das ausgewählte Symbol
   }, [selectedSymbolForChart]); // Führe erneut aus, wenn selectedSymbolForChart sich ändert
 
+  // Die letzten 10 ausgeführten Orders, neueste zuerst
+  const filledOrders = alpacaOrders
+    .filter((order) => order.status === 'filled')
+    .sort((a, b) => new Date(b.filled_at) - new Date(a.filled_at))
+    .slice(0, 10);
+
   const handleStartBot = async () => {
     try {
       // Sende das aktuell ausgewählte Symbol mit
@@ -129,12 +97,7 @@ export default function HomePage() {
       }
       const data = await response.json();
       alert(data.message); // Einfache Benachrichtigung
-      // Bot-Status neu laden, um die Änderung anzuzeigen
-      setLoadingBotStatus(true);
-      // Um den Status sofort zu aktualisieren, könnten wir den State direkt setzen
-      // oder warten, bis fetchBotStatus die neuen Daten holt.
-      // Für eine bessere UX wäre es gut, den Status direkt optimistischer zu aktualisieren.
-      fetchBotStatus(); 
+      // Der neue Bot-Status kommt über das Event-Abo
     } catch (e) {
       alert(`Fehler beim Starten des Bots: ${e.message}`);
     }
@@ -149,18 +112,17 @@ export default function HomePage() {
       }
       const data = await response.json();
       alert(data.message); // Einfache Benachrichtigung
-      setLoadingBotStatus(true);
-      fetchBotStatus(); // Bot-Status neu laden
     } catch (e) {
       alert(`Fehler beim Stoppen des Bots: ${e.message}`);
     }
   };
 
   // Frühes Return, wenn noch Daten geladen werden
-  if (loadingBotStatus || loadingAlpaca || loadingPositions || loadingOrders /* || loadingHistorical - Ladezustand wird pro Karte behandelt */) {
+  if (loadingDashboard /* loadingHistorical - Ladezustand wird pro Karte behandelt */) {
     return (
       <main className="min-h-screen flex flex-col items-center justify-center p-4">
         <p className="text-xl">Lade Dashboard Daten...</p>
+        {errorDashboard && <p className="text-red-400 mt-2">{errorDashboard}</p>}
       </main>
     );
   }
@@ -178,9 +140,8 @@ export default function HomePage() {
 
       <section className="mb-8 p-6 bg-gray-800 rounded-lg shadow-lg">
         <h2 className="text-xl font-semibold mb-2">Bot Status</h2>
-        {loadingBotStatus && <p>Lade Bot-Status...</p>}
-        {errorBotStatus && <p className="text-red-400">Fehler beim Laden des Status: {errorBotStatus}</p>}
-        {!loadingBotStatus && botStatus && (
+        {errorDashboard && <p className="text-red-400">{errorDashboard}</p>}
+        {botStatus && (
           <div>
             <p>Status: <span className={`font-semibold ${botStatus.status === 'aktiv' ? 'text-green-400' : 'text-yellow-400'}`}>{botStatus.status}</span></p>
             <p>Nachricht: {botStatus.message}</p>
@@ -207,8 +168,7 @@ export default function HomePage() {
       {/* Alpaca Kontoinformationen anzeigen */}
       <section className="mb-8 p-6 bg-gray-800 rounded-lg shadow-lg">
         <h2 className="text-xl font-semibold mb-2">Alpaca Konto</h2>
-        {loadingAlpaca && <p>Lade Alpaca Kontoinformationen...</p>}
-        {errorAlpaca && <p className="text-red-400">Fehler: {errorAlpaca}</p>}
+        {!alpacaAccount && <p className="text-gray-400">Keine Kontoinformationen verfügbar.</p>}
         {alpacaAccount && (
           <div className="grid grid-cols-2 gap-x-4 gap-y-2">
             <p>Kontostatus:</p><p className="font-semibold text-blue-400">{alpacaAccount.status}</p>
@@ -245,23 +205,14 @@ export default function HomePage() {
             <p className="text-gray-400">Keine historischen Daten für {selectedSymbolForChart} gefunden.</p>
           )}
           {historicalData.length > 0 && (
-            <div className="h-64 bg-gray-700 rounded p-2 text-xs overflow-y-auto">
-              {historicalData.map(item => (
-                <div key={item.date} className="grid grid-cols-2 gap-x-2">
-                  <span>{item.date}:</span>
-                  <span className="text-right">{parseFloat(item.close).toLocaleString('de-DE', { style: 'currency', currency: 'USD' })}</span>
-                </div>
-              ))}
-            </div>
+            <PriceChart data={historicalData} currency={alpacaAccount?.currency || 'USD'} />
           )}
         </div> {/* Dieses schließende div hat gefehlt */}
 
         {/* Platzhalter-Karte 2: Aktuelle Positionen */}
         <div className="bg-gray-800 p-6 rounded-lg shadow-lg">
           <h2 className="text-xl font-semibold mb-4">Aktuelle Positionen</h2>
-          {loadingPositions && <p>Lade Positionen...</p>}
-          {errorPositions && <p className="text-red-400">Fehler: {errorPositions}</p>}
-          {!loadingPositions && !errorPositions && alpacaPositions.length === 0 && (
+          {alpacaPositions.length === 0 && (
             <p className="text-gray-400">Keine offenen Positionen.</p>
           )}
           {alpacaPositions.length > 0 && (
@@ -290,14 +241,12 @@ export default function HomePage() {
         {/* Platzhalter-Karte 3: Handelsverlauf / Logs */}
         <div className="bg-gray-800 p-6 rounded-lg shadow-lg">
           <h2 className="text-xl font-semibold mb-4">Handelsverlauf / Logs</h2>
-          {loadingOrders && <p>Lade Handelsverlauf...</p>}
-          {errorOrders && <p className="text-red-400">Fehler: {errorOrders}</p>}
-          {!loadingOrders && !errorOrders && alpacaOrders.length === 0 && (
+          {filledOrders.length === 0 && (
             <p className="text-gray-400">Kein Handelsverlauf gefunden.</p>
           )}
-          {alpacaOrders.length > 0 && (
+          {filledOrders.length > 0 && (
             <div className="space-y-2 max-h-64 overflow-y-auto text-xs">
-              {alpacaOrders.map((order) => (
+              {filledOrders.map((order) => (
                 <div key={order.id} className="p-2 bg-gray-700 rounded">
                   <div className="flex justify-between items-center font-semibold">
                     <span>{order.symbol}</span>
@@ -318,6 +267,27 @@ export default function HomePage() {
           )}
         </div>
 
+        {/* Karte 4: Letzte Signale der Bot-Schleife */}
+        <div className="bg-gray-800 p-6 rounded-lg shadow-lg">
+          <h2 className="text-xl font-semibold mb-4">Bot-Signale</h2>
+          {Object.keys(botSignals).length === 0 && (
+            <p className="text-gray-400">Noch keine Signale in diesem Bot-Lauf.</p>
+          )}
+          {Object.keys(botSignals).length > 0 && (
+            <div className="space-y-2 max-h-64 overflow-y-auto text-sm">
+              {Object.values(botSignals).sort((a, b) => a.symbol.localeCompare(b.symbol)).map((signal) => (
+                <div key={signal.symbol} className="p-2 bg-gray-700 rounded flex justify-between items-center">
+                  <span className="font-semibold">{signal.symbol}</span>
+                  <span className={signal.signal === 'buy' ? 'text-green-400' : signal.signal === 'sell' ? 'text-red-400' : 'text-gray-300'}>
+                    {signal.signal.toUpperCase()} ({(signal.strength * 100).toFixed(2)}%)
+                  </span>
+                  <span className="text-gray-500 text-xs">{new Date(signal.at * 1000).toLocaleTimeString('de-DE')}</span>
+                </div>
+              ))}
+            </div>
+          )}
+        </div>
+
         {/* Weitere Karten können hier hinzugefügt werden */}
       </section>
     </main>
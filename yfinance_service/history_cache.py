@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+import pandas as pd
+import yfinance as yf
+
+# Verzeichnis für den persistenten Kurs-Cache (ein Parquet-File pro Symbol und Intervall)
+HISTORY_CACHE_DIR = os.getenv("HISTORY_CACHE_DIR", "/data/history_cache")
+# Innerhalb dieses Zeitfensters wird ohne Upstream-Abruf direkt von der Platte ausgeliefert
+TAIL_REFRESH_SECONDS = float(os.getenv("HISTORY_TAIL_REFRESH_SECONDS", "60"))
+
+# Zeiträume, die yfinance als "letzte N Handelstage" interpretiert
+TRADING_DAY_PERIODS = {"1d": 1, "5d": 5}
+PERIOD_OFFSETS = {
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+CACHEABLE_PERIODS = set(TRADING_DAY_PERIODS) | set(PERIOD_OFFSETS) | {"ytd", "max"}
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+def _lock_for(key: str) -> threading.Lock:
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+def _paths(symbol: str, interval: str) -> tuple[str, str]:
+    base = os.path.join(HISTORY_CACHE_DIR, f"{symbol}_{interval}")
+    return base + ".parquet", base + ".json"
+
+def period_start(period: str, now: pd.Timestamp) -> pd.Timestamp | None:
+    """Beginn des angefragten Zeitraums; None bedeutet 'gesamte Historie'."""
+    if period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=now.year, month=1, day=1, tz=now.tz)
+    if period in PERIOD_OFFSETS:
+        return now - PERIOD_OFFSETS[period]
+    # Handelstag-Zeiträume werden beim Zuschneiden behandelt, für die Abdeckung reichen großzügige 10 Tage
+    return now - pd.DateOffset(days=10)
+
+def _slice_period(hist_df: pd.DataFrame, period: str) -> pd.DataFrame:
+    if hist_df.empty or period == "max":
+        return hist_df
+    if period in TRADING_DAY_PERIODS:
+        trading_days = hist_df.index.normalize().unique()
+        first_day = trading_days[-TRADING_DAY_PERIODS[period]:][0]
+        return hist_df[hist_df.index.normalize() >= first_day]
+    start = period_start(period, pd.Timestamp.now(tz=hist_df.index.tz))
+    return hist_df[hist_df.index >= start]
+
+def _write_atomic(hist_df: pd.DataFrame, meta: dict, parquet_path: str, meta_path: str):
+    """Schreibt Daten und Metadaten zuerst in temporäre Dateien und ersetzt dann atomar (os.replace)."""
+    os.makedirs(HISTORY_CACHE_DIR, exist_ok=True)
+    tmp_parquet, tmp_meta = parquet_path + ".tmp", meta_path + ".tmp"
+    hist_df.to_parquet(tmp_parquet)
+    with open(tmp_meta, "w") as f_meta:
+        json.dump(meta, f_meta)
+    os.replace(tmp_parquet, parquet_path)
+    os.replace(tmp_meta, meta_path)
+
+def _read_cache(parquet_path: str, meta_path: str):
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return None, None
+    try:
+        with open(meta_path, "r") as f_meta:
+            meta = json.load(f_meta)
+        return pd.read_parquet(parquet_path), meta
+    except Exception as e:
+        print(f"WARNUNG: Cache-Datei {parquet_path} nicht lesbar ({e}), wird neu aufgebaut.")
+        return None, None
+
+def _merge(cached_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+    if cached_df is None or cached_df.empty:
+        return new_df.sort_index()
+    if new_df.empty:
+        return cached_df
+    if new_df.index.tz is not None and cached_df.index.tz is not None:
+        new_df = new_df.tz_convert(cached_df.index.tz)
+    merged = pd.concat([cached_df, new_df])
+    # Neuere Abrufe gewinnen (z.B. der noch laufende Tagesbalken)
+    merged = merged[~merged.index.duplicated(keep="last")]
+    return merged.sort_index()
+
+def get_history(symbol: str, period: str, interval: str) -> pd.DataFrame:
+    """
+    Liefert die Kurshistorie wie yf.Ticker(symbol).history(period, interval), aber aus dem lokalen Cache.
+    Vom Upstream wird nur der Bereich ab dem letzten gecachten Balken nachgeladen; reicht die gecachte
+    Abdeckung nicht bis zum Beginn des Zeitraums zurück, wird einmalig der volle Zeitraum geladen.
+    Blockierend (yfinance + Dateizugriffe), daher im Thread-Pool aufrufen.
+    """
+    symbol = symbol.upper()
+    if period not in CACHEABLE_PERIODS:
+        return yf.Ticker(symbol).history(period=period, interval=interval)
+
+    parquet_path, meta_path = _paths(symbol, interval)
+    with _lock_for(f"{symbol}_{interval}"):
+        cached_df, meta = _read_cache(parquet_path, meta_path)
+        ticker = yf.Ticker(symbol)
+
+        covered_since = None
+        if meta is not None:
+            covered_since = "max" if meta.get("covered_since") == "max" else pd.Timestamp(meta["covered_since"])
+        tz = cached_df.index.tz if cached_df is not None and not cached_df.empty else "UTC"
+        requested_start = period_start(period, pd.Timestamp.now(tz=tz))
+        covers_period = cached_df is not None and not cached_df.empty and (
+            covered_since == "max" or (requested_start is not None and covered_since <= requested_start)
+        )
+
+        try:
+            if not covers_period:
+                fetched_df = ticker.history(period=period, interval=interval)
+                if fetched_df.empty:
+                    return fetched_df
+                if period == "max" or covered_since == "max":
+                    new_covered_since = "max"
+                elif covered_since is None:
+                    new_covered_since = requested_start.isoformat()
+                else:
+                    new_covered_since = min(covered_since, requested_start).isoformat()
+                hist_df = _merge(cached_df, fetched_df)
+                _write_atomic(hist_df, {"covered_since": new_covered_since, "last_fetch": time.time()}, parquet_path, meta_path)
+            elif time.time() - meta.get("last_fetch", 0) >= TAIL_REFRESH_SECONDS:
+                # Nur den Rest ab dem letzten gecachten Balken (inklusive, da dieser noch offen sein kann) nachladen
+                tail_df = ticker.history(start=cached_df.index[-1], interval=interval)
+                hist_df = _merge(cached_df, tail_df)
+                _write_atomic(hist_df, {**meta, "last_fetch": time.time()}, parquet_path, meta_path)
+            else:
+                hist_df = cached_df
+        except Exception as e:
+            if cached_df is None or cached_df.empty:
+                raise
+            print(f"WARNUNG: Nachladen für {symbol} ({interval}) fehlgeschlagen ({e}), liefere Cache aus.")
+            hist_df = cached_df
+
+    return _slice_period(hist_df, period)
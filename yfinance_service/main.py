@@ -1,56 +1,133 @@
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
 import yfinance as yf
+import asyncio
+import json
 import pandas as pd
 from datetime import datetime, timedelta
 
+import history_cache
+
 app = FastAPI(
     title="yFinance Data Service",
     description="Provides historical stock data using yfinance.",
     version="0.1.0"
 )
 
+# Antworten ab 1 KB werden gzip-komprimiert, wenn der Client es unterstützt (auch Streaming-Antworten)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+HISTORY_FORMATS = ("records", "columnar", "arrow", "ndjson")
+NDJSON_CHUNK_ROWS = 5000 # Zeilen pro Chunk beim NDJSON-Streaming
+
 @app.get("/")
 async def read_root_yfinance():
     return {"message": "yFinance Data Service is running."}
 
+def _stringify_time_columns(hist_df: pd.DataFrame) -> pd.DataFrame:
+    """Wandelt Datetime- und Timedelta-Spalten in Strings um (ISO 8601 mit Zeitzone)."""
+    for col in hist_df.columns:
+        if pd.api.types.is_datetime64_any_dtype(hist_df[col]):
+            # Für Datetime-Spalten (wie der Index, der jetzt eine Spalte ist)
+            hist_df[col] = hist_df[col].dt.strftime('%Y-%m-%dT%H:%M:%S%z') # ISO 8601 mit Zeitzone
+        elif pd.api.types.is_timedelta64_dtype(hist_df[col]):
+            hist_df[col] = hist_df[col].astype(str) # Timedeltas als Strings
+    return hist_df
+
+def _parse_bound(value: str | None, tz, end_of_day: bool = False) -> pd.Timestamp | None:
+    if not value:
+        return None
+    bound = pd.Timestamp(value)
+    bound = bound.tz_localize(tz) if bound.tzinfo is None else bound.tz_convert(tz)
+    # Reine Datumsangaben als Ende schließen den ganzen Tag ein
+    if end_of_day and len(value) == 10:
+        bound = bound + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    return bound
+
+def _columnar_body(hist_df: pd.DataFrame, meta: dict) -> str:
+    # Eine Liste pro Spalte statt eines Objekts pro Zeile (NaN -> null)
+    columns = {col: hist_df[col].astype(object).where(hist_df[col].notna(), None).tolist() for col in hist_df.columns}
+    return json.dumps({**meta, "columns": columns})
+
+def _arrow_body(hist_df: pd.DataFrame) -> bytes:
+    import pyarrow as pa
+    table = pa.Table.from_pandas(hist_df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _ndjson_chunks(hist_df: pd.DataFrame):
+    # Chunkweise serialisieren, damit nie die gesamte Antwort als ein String im Speicher liegt
+    for start in range(0, len(hist_df), NDJSON_CHUNK_ROWS):
+        chunk = _stringify_time_columns(hist_df.iloc[start:start + NDJSON_CHUNK_ROWS].copy())
+        yield chunk.to_json(orient="records", lines=True).rstrip("\n") + "\n"
+
 @app.get("/history/{symbol}")
 async def get_historical_data(
     symbol: str,
     period: str = Query("5y", description="Period for historical data (e.g., 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)"),
-    interval: str = Query("1d", description="Data interval (e.g., 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo)")
+    interval: str = Query("1d", description="Data interval (e.g., 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo)"),
+    start: str | None = Query(None, description="Only bars at or after this date/time (e.g., 2024-01-01)"),
+    end: str | None = Query(None, description="Only bars at or before this date/time (a plain date includes the whole day)"),
+    format: str = Query("records", description="Response format: records (JSON objects), columnar (one JSON array per column), arrow (Arrow IPC stream), ndjson (streamed JSON lines)"),
 ):
+    if format not in HISTORY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}'. Use one of: {', '.join(HISTORY_FORMATS)}.")
+    try:
+        # Angaben mit Offset (z.B. ...+02:00) werden umgerechnet, reine Datumsangaben als UTC gelesen
+        start_utc = _parse_bound(start, "UTC")
+        _parse_bound(end, "UTC")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid start/end: {e}")
     try:
-        ticker = yf.Ticker(symbol.upper())
-        # yfinance gibt einen Pandas DataFrame zurück
-        hist_df = ticker.history(period=period, interval=interval)
+        # Liegt 'start' vor dem Beginn des Zeitraums, wird die gesamte Historie herangezogen
+        if start_utc is not None and period != "max" and period in history_cache.CACHEABLE_PERIODS:
+            period_start = history_cache.period_start(period, pd.Timestamp.now(tz="UTC"))
+            if start_utc < period_start:
+                period = "max"
+
+        # yfinance gibt einen Pandas DataFrame zurück; der lokale Parquet-Cache lädt nur fehlende Balken nach.
+        # Blockierende Aufrufe laufen im Thread-Pool, damit der Event-Loop frei bleibt.
+        hist_df = await asyncio.to_thread(history_cache.get_history, symbol, period, interval)
+
+        if not hist_df.empty and (start or end):
+            start_bound = _parse_bound(start, hist_df.index.tz)
+            end_bound = _parse_bound(end, hist_df.index.tz, end_of_day=True)
+            if start_bound is not None:
+                hist_df = hist_df[hist_df.index >= start_bound]
+            if end_bound is not None:
+                hist_df = hist_df[hist_df.index <= end_bound]
 
         if hist_df.empty:
             raise HTTPException(status_code=404, detail=f"No historical data found for symbol {symbol} with period {period} and interval {interval}.")
 
-        # Konvertiere den DataFrame in ein JSON-freundliches Format (Liste von Dictionaries)
-        # Stelle sicher, dass der Index (Datum) eine Spalte wird und als String formatiert ist
-        hist_df.reset_index(inplace=True)
-        
-        # Konvertiere Timestamp-Spalten in ISO-Format Strings
-        for col in hist_df.columns:
-            if pd.api.types.is_datetime64_any_dtype(hist_df[col]):
-                # Für Datetime-Spalten (wie der Index, der jetzt eine Spalte ist)
-                hist_df[col] = hist_df[col].dt.strftime('%Y-%m-%dT%H:%M:%S%z') # ISO 8601 mit Zeitzone
-            elif pd.api.types.is_timedelta64_dtype(hist_df[col]):
-                 hist_df[col] = hist_df[col].astype(str) # Timedeltas als Strings
+        # Stelle sicher, dass der Index (Datum) eine Spalte wird
+        hist_df = hist_df.reset_index()
+        meta = {"symbol": symbol.upper(), "period": period, "interval": interval, "data_count": len(hist_df)}
+
+        if format == "arrow":
+            # Zeitstempel bleiben in Arrow als native Timestamp-Spalte erhalten
+            body = await asyncio.to_thread(_arrow_body, hist_df)
+            return Response(content=body, media_type="application/vnd.apache.arrow.stream",
+                            headers={"X-Data-Count": str(len(hist_df))})
+        if format == "ndjson":
+            return StreamingResponse(_ndjson_chunks(hist_df), media_type="application/x-ndjson",
+                                     headers={"X-Data-Count": str(len(hist_df))})
+
+        hist_df = _stringify_time_columns(hist_df)
+        if format == "columnar":
+            body = await asyncio.to_thread(_columnar_body, hist_df, meta)
+            return Response(content=body, media_type="application/json")
 
+        # Standard: Liste von Dictionaries (ein Objekt pro Balken)
         # Ersetze NaN/NaT durch None für JSON-Kompatibilität
         hist_df = hist_df.where(pd.notnull(hist_df), None)
-        
         data_list = hist_df.to_dict(orient="records")
-        
-        return {
-            "symbol": symbol.upper(),
-            "period": period,
-            "interval": interval,
-            "data_count": len(data_list),
-            "data": data_list
-        }
+        return {**meta, "data": data_list}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching data for {symbol} from yfinance: {str(e)}")
 